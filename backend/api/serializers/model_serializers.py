@@ -41,6 +41,7 @@ from metering_billing.serializers.serializer_utils import (
     AddOnUUIDField,
     BalanceAdjustmentUUIDField,
     ConvertEmptyStringToNullMixin,
+    FastReadListSerializer,
     FeatureUUIDField,
     InvoiceUUIDField,
     MetricUUIDField,
@@ -304,6 +305,7 @@ class SubscriptionRecordSerializer(
 ):
     class Meta:
         model = SubscriptionRecord
+        list_serializer_class = FastReadListSerializer
         fields = (
             "subscription_id",
             "start_date",
@@ -473,6 +475,7 @@ class InvoiceSerializer(
 ):
     class Meta:
         model = Invoice
+        list_serializer_class = FastReadListSerializer
         fields = (
             "invoice_id",
             "invoice_number",
@@ -599,6 +602,7 @@ class CustomerSerializer(
 ):
     class Meta:
         model = Customer
+        list_serializer_class = FastReadListSerializer
         fields = (
             "customer_id",
             "email",
@@ -1609,6 +1613,7 @@ class PlanSerializer(
 class EventSerializer(TimezoneFieldMixin, serializers.ModelSerializer):
     class Meta:
         model = Event
+        list_serializer_class = FastReadListSerializer
         fields = (
             "event_name",
             "properties",
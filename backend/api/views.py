@@ -8,7 +8,6 @@ import re
 import uuid
 from decimal import Decimal
 from functools import reduce
-from itertools import chain
 from typing import Optional
 
 import posthog
@@ -48,6 +47,7 @@ from rest_framework.decorators import (
     permission_classes,
 )
 from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
@@ -94,6 +94,8 @@ from metering_billing.auth.auth_utils import (
     PermissionPolicyMixin,
     fast_api_key_validation_and_cache,
 )
+from metering_billing.catalog_cache import CatalogCacheMixin, cache_catalog_response
+from metering_billing.db_router import replica_reads
 from metering_billing.exceptions import (
     DuplicateCustomer,
     ServerError,
@@ -120,6 +122,7 @@ from metering_billing.models import (
     Tag,
 )
 from metering_billing.permissions import HasUserAPIKey, ValidOrganization
+from metering_billing.revenue_ledger import earned_revenue_per_day
 from metering_billing.serializers.model_serializers import (
     DraftInvoiceSerializer,
     MetricDetailSerializer,
@@ -146,9 +149,8 @@ from metering_billing.utils import (
     convert_to_datetime,
     convert_to_decimal,
     dates_bwn_two_dts,
-    make_all_dates_times_strings,
-    make_all_decimals_floats,
     now_utc,
+    run_with_time_budget,
 )
 from metering_billing.utils.enums import (
     CUSTOMER_BALANCE_ADJUSTMENT_STATUS,
@@ -170,6 +172,8 @@ SVIX_CONNECTOR = settings.SVIX_CONNECTOR
 IDEMPOTENCY_ID_NAMESPACE = settings.IDEMPOTENCY_ID_NAMESPACE
 logger = logging.getLogger("django.server")
 USE_KAFKA = settings.USE_KAFKA
+DASHBOARD_QUERY_WORKERS = settings.DASHBOARD_QUERY_WORKERS
+DASHBOARD_QUERY_TIME_BUDGET = settings.DASHBOARD_QUERY_TIME_BUDGET
 if USE_KAFKA:
     kafka_producer = Producer()
 else:
@@ -182,10 +186,50 @@ class EmptySerializer(serializers.Serializer):
     pass
 
 
+class KeysetPagination(CursorPagination):
+    """
+    Keyset pagination for list endpoints. It's only applied when a page size is requested, so that clients relying on the full list keep getting it.
+    """
+
+    page_size = None
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+    cursor_query_param = "c"
+
+    @classmethod
+    def get_schema_parameters(cls):
+        return [
+            OpenApiParameter(
+                name=cls.page_size_query_param,
+                type=int,
+                location=OpenApiParameter.QUERY,
+                description="If specified, results are returned in pages of this size along with the cursors of the next and previous pages.",
+            ),
+            OpenApiParameter(
+                name=cls.cursor_query_param,
+                type=str,
+                location=OpenApiParameter.QUERY,
+                description=cls.cursor_query_description,
+            ),
+        ]
+
+    def get_list_response(self, queryset, request, view, serialize):
+        page = self.paginate_queryset(queryset, request, view=view)
+        if page is None:
+            return Response(serialize(queryset))
+        return self.get_paginated_response(serialize(page))
+
+
+class CustomerCursorPagination(KeysetPagination):
+    # (organization, customer_id) is unique, so its index serves the pagination
+    ordering = "customer_id"
+
+
 class CustomerViewSet(PermissionPolicyMixin, viewsets.ModelViewSet):
     lookup_field = "customer_id"
     http_method_names = ["get", "post", "head"]
     queryset = Customer.objects.all()
+    keyset_pagination_class = CustomerCursorPagination
 
     def get_queryset(self):
         now = now_utc()
@@ -261,6 +305,17 @@ class CustomerViewSet(PermissionPolicyMixin, viewsets.ModelViewSet):
             return default
         return CustomerSerializer
 
+    @extend_schema(
+        parameters=CustomerCursorPagination.get_schema_parameters(),
+    )
+    def list(self, request, *args, **kwargs):
+        return self.keyset_pagination_class().get_list_response(
+            self.filter_queryset(self.get_queryset()),
+            request,
+            self,
+            lambda x: self.get_serializer(x, many=True).data,
+        )
+
     @extend_schema(responses=CustomerSerializer)
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -357,6 +412,7 @@ class CustomerViewSet(PermissionPolicyMixin, viewsets.ModelViewSet):
     @action(
         detail=True, methods=["get"], url_path="cost_analysis", url_name="cost_analysis"
     )
+    @replica_reads()
     def cost_analysis(self, request, customer_id=None):
         organization = request.organization
         serializer = self.get_serializer(data=request.query_params)
@@ -366,8 +422,6 @@ class CustomerViewSet(PermissionPolicyMixin, viewsets.ModelViewSet):
             serializer.validated_data.get(key, None)
             for key in ["start_date", "end_date"]
         )
-        start_time = convert_to_datetime(start_date, date_behavior="min")
-        end_time = convert_to_datetime(end_date, date_behavior="max")
         per_day_dict = {}
         for period in dates_bwn_two_dts(start_date, end_date):
             period = convert_to_date(period)
@@ -379,12 +433,21 @@ class CustomerViewSet(PermissionPolicyMixin, viewsets.ModelViewSet):
         cost_metrics = Metric.objects.filter(
             organization=organization, is_cost_metric=True, status=METRIC_STATUS.ACTIVE
         ).prefetch_related("numeric_filters", "categorical_filters")
-        for metric in cost_metrics:
-            usage_ret = metric.get_daily_total_usage(
+        usage_per_metric, incomplete_metrics = run_with_time_budget(
+            lambda metric: metric.get_daily_total_usage(
                 start_date,
                 end_date,
                 customer=customer,
-            ).get(customer, {})
+            ),
+            cost_metrics,
+            max_workers=DASHBOARD_QUERY_WORKERS,
+            time_budget=DASHBOARD_QUERY_TIME_BUDGET,
+            statement_timeout=DASHBOARD_QUERY_TIME_BUDGET,
+        )
+        for metric in cost_metrics:
+            if metric not in usage_per_metric:
+                continue
+            usage_ret = usage_per_metric[metric].get(customer, {})
             for date, usage in usage_ret.items():
                 date = convert_to_date(date)
                 usage = convert_to_decimal(usage)
@@ -402,32 +465,12 @@ class CustomerViewSet(PermissionPolicyMixin, viewsets.ModelViewSet):
                     ] += usage
         for date, items in per_day_dict.items():
             items["cost_data"] = [v for k, v in items["cost_data"].items()]
-        subscriptions = (
-            SubscriptionRecord.objects.filter(
-                Q(start_date__range=[start_time, end_time])
-                | Q(end_date__range=[start_time, end_time])
-                | (Q(start_date__lte=start_time) & Q(end_date__gte=end_time)),
-                organization=organization,
-                customer=customer,
-            )
-            .select_related("billing_plan")
-            .select_related("customer")
-            .prefetch_related("billing_plan__recurring_charges")
-            .prefetch_related("billing_plan__plan_components")
-            .prefetch_related("billing_plan__plan_components__billable_metric")
-            .prefetch_related("billing_plan__plan_components__tiers")
-            .prefetch_related("billing_records")
-            .prefetch_related("billing_records__component")
-            .prefetch_related("billing_records__recurring_charge")
-            .prefetch_related("billing_records__component__billable_metric")
-            .prefetch_related("billing_records__component__tiers")
-        )
-        for subscription in subscriptions:
-            earned_revenue = subscription.calculate_earned_revenue_per_day()
-            for date, earned_revenue in earned_revenue.items():
-                date = convert_to_date(date)
-                if date in per_day_dict:
-                    per_day_dict[date]["revenue"] += earned_revenue
+        earned_revenue = earned_revenue_per_day(
+            organization, start_date, end_date, customer=customer
+        )
+        for date, earned_revenue in earned_revenue.items():
+            if date in per_day_dict:
+                per_day_dict[date]["revenue"] += earned_revenue
         return_dict = {
             "per_day": [v for k, v in per_day_dict.items()],
         }
@@ -452,12 +495,12 @@ class CustomerViewSet(PermissionPolicyMixin, viewsets.ModelViewSet):
             return_dict["markup"] = convert_to_decimal(
                 (total_revenue - total_cost) / total_cost
             )
+        return_dict["incomplete_metrics"] = [
+            "metric_" + metric.metric_id.hex for metric in incomplete_metrics
+        ]
         serializer = CostAnalysisSerializer(data=return_dict)
         serializer.is_valid(raise_exception=True)
-        ret = serializer.validated_data
-        ret = make_all_decimals_floats(ret)
-        ret = make_all_dates_times_strings(ret)
-        return Response(ret, status=status.HTTP_200_OK)
+        return Response(serializer.validated_data, status=status.HTTP_200_OK)
 
     def perform_create(self, serializer):
         try:
@@ -500,7 +543,7 @@ class CustomerViewSet(PermissionPolicyMixin, viewsets.ModelViewSet):
         return response
 
 
-class PlanViewSet(PermissionPolicyMixin, viewsets.ModelViewSet):
+class PlanViewSet(CatalogCacheMixin, PermissionPolicyMixin, viewsets.ModelViewSet):
     serializer_class = PlanSerializer
     lookup_field = "plan_id"
     http_method_names = ["get", "head"]
@@ -714,6 +757,7 @@ class PlanViewSet(PermissionPolicyMixin, viewsets.ModelViewSet):
     @extend_schema(
         parameters=[ListPlansFilterSerializer, ListPlanVersionsFilterSerializer],
     )
+    @cache_catalog_response
     def list(self, request, *args, **kwargs):
         queryset = self.filter_queryset(self.get_queryset())
 
@@ -733,10 +777,15 @@ class PlanViewSet(PermissionPolicyMixin, viewsets.ModelViewSet):
     @extend_schema(
         parameters=[ListPlanVersionsFilterSerializer],
     )
+    @cache_catalog_response
     def retrieve(self, request, *args, **kwargs):
         return super().retrieve(request, *args, **kwargs)
 
 
+class SubscriptionCursorPagination(KeysetPagination):
+    ordering = ("-start_date", "-id")
+
+
 class SubscriptionViewSet(
     PermissionPolicyMixin,
     mixins.CreateModelMixin,
@@ -925,32 +974,38 @@ class SubscriptionViewSet(
             if plan:
                 args.append(Q(billing_plan__plan=plan))
 
-            qs = qs.filter(*args)
-            qs = self._prefetch_qs(qs)
+            # the matching base subscriptions and their addons, in a single query
+            base_pks = qs.filter(*args).values("pk")
             qs = SubscriptionRecord.objects.filter(
-                pk__in=[
-                    sr.pk
-                    for sr in chain(
-                        qs, *[r.addon_subscription_records.all() for r in qs]
-                    )
-                ]
+                Q(pk__in=base_pks) | Q(parent__in=base_pks),
+                organization=organization,
             )
 
-            if serializer.validated_data.get("subscription_filters"):
-                for filter in serializer.validated_data["subscription_filters"]:
-                    qs = qs.filter(
-                        subscription_filters__contains=[
-                            [filter["property_name"], filter["value"]]
-                        ]
-                    )
+            if subscription_filters:
+                qs = qs.filter(
+                    subscription_filters__contains=[
+                        [filter["property_name"], filter["value"]]
+                        for filter in subscription_filters
+                    ]
+                )
+            if self.action == "list":
+                qs = self._prefetch_qs(qs)
 
         return qs
 
     @extend_schema(
-        parameters=[ListSubscriptionRecordFilter],
+        parameters=[
+            ListSubscriptionRecordFilter,
+            *SubscriptionCursorPagination.get_schema_parameters(),
+        ],
     )
     def list(self, request, *args, **kwargs):
-        return super().list(request)
+        return SubscriptionCursorPagination().get_list_response(
+            self.filter_queryset(self.get_queryset()),
+            request,
+            self,
+            lambda x: self.get_serializer(x, many=True).data,
+        )
 
     @extend_schema(
         responses=SubscriptionRecordSerializer,
@@ -1720,9 +1775,6 @@ class CustomerBalanceAdjustmentViewSet(
         qs = qs.filter(amount__gt=0)
         qs = qs.select_related("customer", "pricing_unit", "amount_paid_currency")
         qs = qs.prefetch_related("drawdowns")
-        qs = qs.annotate(
-            total_drawdowns=Sum("drawdowns__amount"),
-        )
         if self.action == "list":
             args = []
             serializer = CustomerBalanceAdjustmentFilterSerializer(
@@ -24,7 +24,7 @@ import django_heroku
 import jwt
 import posthog
 import sentry_sdk
-from decouple import config
+from decouple import Csv, config
 from dotenv import load_dotenv
 from kafka import KafkaConsumer
 from kafka.admin import KafkaAdminClient, NewTopic
@@ -116,6 +116,44 @@ VESSEL_API_KEY = config("VESSEL_API_KEY", default=None)
 # Partial startup
 USE_WEBHOOKS = not config("NO_WEBHOOKS", default=False, cast=bool)
 USE_KAFKA = not config("NO_EVENTS", default=False, cast=bool)
+RATE_COUNTERS_ENABLED = config("RATE_COUNTERS_ENABLED", default=False, cast=bool)
+ALERT_COUNTERS_ENABLED = config("ALERT_COUNTERS_ENABLED", default=False, cast=bool)
+EVENT_CATALOG_ENABLED = config("EVENT_CATALOG_ENABLED", default=False, cast=bool)
+# Usage alert refreshes
+ALERT_REFRESH_BATCH_SIZE = config("ALERT_REFRESH_BATCH_SIZE", default=200, cast=int)
+ALERT_REFRESH_TIME_BUDGET = config("ALERT_REFRESH_TIME_BUDGET", default=120, cast=float)
+# Dashboard queries
+DASHBOARD_QUERY_WORKERS = config("DASHBOARD_QUERY_WORKERS", default=8, cast=int)
+DASHBOARD_QUERY_TIME_BUDGET = config(
+    "DASHBOARD_QUERY_TIME_BUDGET", default=20, cast=float
+)
+# Backtests
+BACKTEST_WORKERS = config("BACKTEST_WORKERS", default=4, cast=int)
+# Webhooks
+WEBHOOK_OUTBOX_ENABLED = config("WEBHOOK_OUTBOX_ENABLED", default=False, cast=bool)
+WEBHOOK_DISPATCH_BATCH_SIZE = config(
+    "WEBHOOK_DISPATCH_BATCH_SIZE", default=100, cast=int
+)
+WEBHOOK_DISPATCH_CONCURRENCY = config(
+    "WEBHOOK_DISPATCH_CONCURRENCY", default=8, cast=int
+)
+# Invoice PDFs
+INVOICE_PDF_BATCH_ENABLED = config(
+    "INVOICE_PDF_BATCH_ENABLED", default=False, cast=bool
+)
+INVOICE_PDF_BATCH_SIZE = config("INVOICE_PDF_BATCH_SIZE", default=100, cast=int)
+INVOICE_PDF_UPLOAD_CONCURRENCY = config(
+    "INVOICE_PDF_UPLOAD_CONCURRENCY", default=8, cast=int
+)
+# Catalog response cache
+CATALOG_CACHE_ENABLED = config("CATALOG_CACHE_ENABLED", default=False, cast=bool)
+CATALOG_CACHE_TIMEOUT = config("CATALOG_CACHE_TIMEOUT", default=300, cast=int)
+# Serializers
+FAST_READ_SERIALIZERS = config("FAST_READ_SERIALIZERS", default=False, cast=bool)
+# Event search
+EVENT_SEARCH_MAX_WINDOW_DAYS = config(
+    "EVENT_SEARCH_MAX_WINDOW_DAYS", default=31, cast=int
+)
 
 if SENTRY_DSN != "":
     if not DEBUG:
@@ -228,6 +266,7 @@ MIDDLEWARE = [
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "metering_billing.middleware.OrganizationInsertMiddleware",
+    "metering_billing.middleware.TimezoneResolverMiddleware",
     "simple_history.middleware.HistoryRequestMiddleware",
 ]
 
@@ -287,6 +326,20 @@ else:
         }
     }
 
+# Read replicas, see metering_billing/db_router.py
+DATABASE_REPLICA_URLS = config("DATABASE_REPLICA_URLS", default="", cast=Csv())
+for i, replica_url in enumerate(DATABASE_REPLICA_URLS):
+    DATABASES[f"replica_{i}"] = dj_database_url.parse(
+        replica_url,
+        engine="django.db.backends.postgresql",
+        conn_max_age=600,
+    )
+    # no test database can be created on a replica, tests read the primary's through it
+    DATABASES[f"replica_{i}"]["TEST"] = {"MIRROR": "default"}
+DATABASE_ROUTERS = ["metering_billing.db_router.ReplicaRouter"]
+REPLICA_MAX_LAG_SECONDS = config("REPLICA_MAX_LAG_SECONDS", default=30, cast=float)
+REPLICA_LAG_CHECK_INTERVAL = config("REPLICA_LAG_CHECK_INTERVAL", default=5, cast=int)
+
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
 
@@ -536,6 +589,8 @@ VITE_APP_DIR = BASE_DIR / "src"
 ### AWS S3 ###
 AWS_ACCESS_KEY_ID = config("AWS_ACCESS_KEY_ID", default="")
 AWS_SECRET_ACCESS_KEY = config("AWS_SECRET_ACCESS_KEY", default="")
+# point this at a local S3 compatible server (e.g. minio) for development and tests
+AWS_S3_ENDPOINT_URL = config("AWS_S3_ENDPOINT_URL", default=None)
 
 
 STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
@@ -561,7 +616,13 @@ REST_FRAMEWORK = {
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
     "EXCEPTION_HANDLER": "drf_standardized_errors.handler.exception_handler",
     "COERCE_DECIMAL_TO_STRING": False,
+    "DEFAULT_RENDERER_CLASSES": [
+        "metering_billing.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
 }
+# how Decimals are rendered in JSON responses, either "float" or "string"
+JSON_DECIMAL_POLICY = config("JSON_DECIMAL_POLICY", default="float")
 
 DRF_STANDARDIZED_ERRORS = {
     # class responsible for handling the exceptions. Can be subclassed to change
@@ -49,6 +49,7 @@ from metering_billing.views.model_views import (
 from metering_billing.views.payment_processor_views import PaymentProcesorView
 from metering_billing.views.views import (
     ChangeUserOrganizationView,
+    EventVolumeView,
     ImportCustomersView,
     ImportPaymentObjectsView,
     ImportSubscriptionsView,
@@ -166,6 +167,11 @@ urlpatterns = [
         PeriodEventsView.as_view(),
         name="period_events",
     ),
+    path(
+        "app/event_volume/",
+        EventVolumeView.as_view(),
+        name="event_volume",
+    ),
     path(
         "app/period_metric_revenue/",
         PeriodMetricRevenueView.as_view(),
@@ -0,0 +1,212 @@
+"""
+Running usage counters for usage alerts, so thresholds are detected while events are
+ingested instead of on the next periodic refresh. There is one counter per billing record
+an alert watches (a subscription record, metric and billing period). The periodic alert
+refresh seeds each counter with the exact usage, and the event tail (event_tail.py)
+increments it with the events inserted after the seed, whichever service ingested them,
+and fires the alert webhook as soon as it crosses the threshold. Counters that haven't
+been seeded yet are left alone until the next refresh.
+
+Only COUNT and SUM counter metrics can be kept as running totals, alerts on other
+aggregations are only evaluated by the periodic refresh.
+"""
+from decimal import Decimal
+
+from dateutil import parser
+from django.conf import settings
+from django.core.cache import cache
+
+from metering_billing.aggregation.event_filters import (
+    event_passes_filters,
+    event_usage,
+    property_as_text,
+)
+from metering_billing.utils import now_utc
+from metering_billing.utils.enums import METRIC_AGGREGATION, METRIC_TYPE
+
+from .rate_counters import RATE_COUNTER_SCALE
+
+ALERT_COUNTERS_ENABLED = settings.ALERT_COUNTERS_ENABLED
+
+SUPPORTED_AGGREGATIONS = [METRIC_AGGREGATION.COUNT, METRIC_AGGREGATION.SUM]
+# keep counters around for a day after their billing period ends
+ALERT_COUNTER_GRACE_PERIOD = 24 * 60 * 60
+
+
+def alert_counter_supported(metric) -> bool:
+    return (
+        ALERT_COUNTERS_ENABLED
+        and metric.metric_type == METRIC_TYPE.COUNTER
+        and metric.usage_aggregation_type in SUPPORTED_AGGREGATIONS
+    )
+
+
+def _counter_key(billing_record) -> str:
+    return "alert_counter:{}".format(billing_record.billing_record_id.hex)
+
+
+def _seeded_at_key(billing_record) -> str:
+    return "alert_counter:{}:seeded_at".format(billing_record.billing_record_id.hex)
+
+
+def _counter_timeout(billing_record) -> int:
+    remaining = (billing_record.end_date - now_utc()).total_seconds()
+    return max(int(remaining), 0) + ALERT_COUNTER_GRACE_PERIOD
+
+
+def seed_alert_counter(billing_record, usage) -> None:
+    """
+    Sets the counter of the billing record to its exact usage, as computed by the periodic alert refresh. Only events inserted after the seed are added to it.
+    """
+    if billing_record is None or not alert_counter_supported(
+        billing_record.component.billable_metric
+    ):
+        return
+    cache.set_many(
+        {
+            _counter_key(billing_record): int(Decimal(usage) * RATE_COUNTER_SCALE),
+            _seeded_at_key(billing_record): now_utc(),
+        },
+        timeout=_counter_timeout(billing_record),
+    )
+
+
+def alert_counter_event_names() -> dict:
+    """
+    Names of the events counted by the alert counters, per organization pk.
+    """
+    from metering_billing.models import UsageAlert
+
+    if not ALERT_COUNTERS_ENABLED:
+        return {}
+    event_names = {}
+    for organization_pk, event_name in UsageAlert.objects.filter(
+        metric__metric_type=METRIC_TYPE.COUNTER,
+        metric__usage_aggregation_type__in=SUPPORTED_AGGREGATIONS,
+    ).values_list("organization_id", "metric__event_name"):
+        event_names.setdefault(organization_pk, set()).add(event_name)
+    return event_names
+
+
+def _event_matches_subscription(event, subscription_record, billing_record) -> bool:
+    if event["cust_id"] != subscription_record.customer.customer_id:
+        return False
+    if not (
+        billing_record.start_date <= event["time_created"] <= billing_record.end_date
+    ):
+        return False
+    properties = event.get("properties") or {}
+    for key, value in subscription_record.subscription_filters or []:
+        if property_as_text(properties.get(key)) != value:
+            return False
+    return True
+
+
+def record_alert_events(organization, events_list: list) -> None:
+    """
+    Increments the alert counters with a batch of inserted events and fires the alerts whose threshold was crossed by it. Events inserted before a counter was seeded are already part of it and are skipped.
+    """
+    from metering_billing.models import BillingRecord, UsageAlertResult
+    from metering_billing.webhooks import usage_alert_webhook
+
+    if not ALERT_COUNTERS_ENABLED:
+        return
+    now = now_utc()
+    events = []
+    for event in events_list:
+        time_created = event["time_created"]
+        if isinstance(time_created, str):
+            time_created = parser.isoparse(time_created)
+        events.append({**event, "time_created": time_created})
+    alert_results = list(
+        UsageAlertResult.objects.filter(
+            organization=organization,
+            alert__metric__metric_type=METRIC_TYPE.COUNTER,
+            alert__metric__usage_aggregation_type__in=SUPPORTED_AGGREGATIONS,
+            alert__metric__event_name__in={x["event_name"] for x in events},
+            subscription_record__customer__customer_id__in={
+                x["cust_id"] for x in events
+            },
+            subscription_record__start_date__lte=now,
+            subscription_record__end_date__gte=now,
+        )
+        .select_related("alert", "alert__metric", "subscription_record__customer")
+        .prefetch_related(
+            "alert__metric__numeric_filters", "alert__metric__categorical_filters"
+        )
+    )
+    if len(alert_results) == 0:
+        return
+    billing_records = {
+        (x.subscription_id, x.component.billable_metric_id): x
+        for x in BillingRecord.objects.filter(
+            subscription__in={x.subscription_record_id for x in alert_results},
+            component__billable_metric__in={x.alert.metric_id for x in alert_results},
+            start_date__lte=now,
+            end_date__gt=now,
+        ).select_related("component")
+    }
+    alerts_per_counter = {}
+    for alert_result in alert_results:
+        billing_record = billing_records.get(
+            (alert_result.subscription_record_id, alert_result.alert.metric_id)
+        )
+        if billing_record is None:
+            continue
+        alerts_per_counter.setdefault(billing_record, []).append(alert_result)
+    # counters that weren't seeded yet are picked up by the next periodic refresh
+    seeded_at = cache.get_many([_seeded_at_key(x) for x in alerts_per_counter])
+    increments = {}
+    for billing_record, counter_alert_results in alerts_per_counter.items():
+        counter_seeded_at = seeded_at.get(_seeded_at_key(billing_record))
+        if counter_seeded_at is None:
+            continue
+        metric = counter_alert_results[0].alert.metric
+        subscription_record = counter_alert_results[0].subscription_record
+        increment = Decimal(0)
+        for event in events:
+            if event["event_name"] != metric.event_name:
+                continue
+            if event["inserted_at"] <= counter_seeded_at:
+                continue
+            if not _event_matches_subscription(
+                event, subscription_record, billing_record
+            ):
+                continue
+            properties = event.get("properties") or {}
+            if not event_passes_filters(metric, properties):
+                continue
+            increment += event_usage(metric, properties) or 0
+        if increment != 0:
+            increments[billing_record] = increment
+    for billing_record, increment in increments.items():
+        try:
+            new_value = (
+                Decimal(
+                    cache.incr(
+                        _counter_key(billing_record),
+                        int(increment * RATE_COUNTER_SCALE),
+                    )
+                )
+                / RATE_COUNTER_SCALE
+            )
+        except ValueError:
+            # expired since we checked
+            continue
+        previous_value = new_value - increment
+        for alert_result in alerts_per_counter[billing_record]:
+            threshold = alert_result.alert.threshold
+            if (
+                previous_value < threshold <= new_value
+                and alert_result.last_run_value < threshold
+            ):
+                alert_result.last_run_value = new_value
+                alert_result.last_run_timestamp = now
+                alert_result.triggered_count = alert_result.triggered_count + 1
+                alert_result.save()
+                usage_alert_webhook(
+                    alert_result.alert,
+                    alert_result,
+                    alert_result.subscription_record,
+                    organization,
+                )
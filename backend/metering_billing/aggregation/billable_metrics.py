@@ -1,5 +1,7 @@
 import abc
 import datetime
+import hashlib
+import json
 import logging
 import uuid
 from collections import namedtuple
@@ -10,9 +12,12 @@ import sqlparse
 from dateutil.relativedelta import relativedelta
 from django.apps import apps
 from django.conf import settings
+from django.core.cache import cache
 from django.db import connection
+from django.db.models import Max
 from jinja2 import Template
 
+from metering_billing.db_router import read_connection
 from metering_billing.exceptions import MetricValidationFailed
 from metering_billing.utils import (
     convert_to_date,
@@ -35,6 +40,15 @@ from .rate_query_templates import RATE_TOTAL_PER_DAY
 
 EVENT_NAME_NAMESPACE = settings.EVENT_NAME_NAMESPACE
 
+# a day is considered closed (and its custom metric results final) once late events
+# can no longer land in it, same lag the continuous aggregates are refreshed with
+CUSTOM_METRIC_CLOSED_LAG = relativedelta(days=1)
+CUSTOM_METRIC_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+# continuous aggregates are refreshed every 30 minutes up to 1 day ago, so days that
+# ended before this lag are final and their daily totals can be cached
+DAILY_USAGE_CACHE_LAG = relativedelta(days=1, minutes=30)
+DAILY_USAGE_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
 logger = logging.getLogger("django.server")
 
 Metric = apps.get_app_config("metering_billing").get_model(model_name="Metric")
@@ -119,9 +133,11 @@ class MetricHandler(abc.ABC):
     @staticmethod
     @abc.abstractmethod
     def get_billing_record_daily_billable_usage(
-        metric: Metric, billing_record: BillingRecord
+        metric: Metric,
+        billing_record: BillingRecord,
+        since: Optional[datetime.date] = None,
     ) -> dict[datetime.date, Decimal]:
-        """This method should return the same quantity as get_billing_record_total_billable_usage, but split up per day. This allows for calculations of the amount due per day, which is useful for prorating and accounting integrations."""
+        """This method should return the same quantity as get_billing_record_total_billable_usage, but split up per day. This allows for calculations of the amount due per day, which is useful for prorating and accounting integrations. If since is given only the days after it are needed, and handlers whose daily usage doesn't depend on earlier days can skip querying them."""
         pass
 
     @staticmethod
@@ -140,12 +156,207 @@ class MetricHandler(abc.ABC):
         from metering_billing.models import Customer, Organization
 
         organization = Organization.objects.get(id=metric.organization.id)
+        nil_uuid = uuid.UUID("00000000-0000-0000-0000-000000000000")
+        watermark = now_utc() - DAILY_USAGE_CACHE_LAG
+        if customer is None:
+            per_customer = MetricHandler._get_daily_total_usage_all_customers(
+                metric,
+                organization,
+                start_date,
+                end_date,
+                top_n,
+                query_template,
+                watermark,
+            )
+        else:
+            per_customer = MetricHandler._get_daily_total_usage_of_customer(
+                metric,
+                organization,
+                start_date,
+                end_date,
+                customer,
+                query_template,
+                watermark,
+            )
         all_results = {}
+        for uuidv5_customer_id, day_usage in per_customer.items():
+            all_results[uuid.UUID(uuidv5_customer_id)] = day_usage
+        customer_ids_minus_other = set(all_results.keys()) - {nil_uuid}
+        customers = Customer.objects.filter(
+            uuidv5_customer_id__in=customer_ids_minus_other
+        )
+        all_results_with_customer_objects = {}
+        for customer in customers:
+            all_results_with_customer_objects[customer] = all_results[
+                customer.uuidv5_customer_id
+            ]
+        if nil_uuid in all_results:
+            all_results_with_customer_objects["Other"] = all_results[nil_uuid]
+        return all_results_with_customer_objects
+
+    @staticmethod
+    def _get_daily_total_usage_of_customer(
+        metric: Metric,
+        organization: Organization,
+        start_date,
+        end_date,
+        customer: Customer,
+        query_template,
+        watermark,
+    ) -> dict[str, dict[datetime.date, Decimal]]:
+        # closed days are served from the cache, so we only query the runs of days
+        # that aren't cached
+        scope = str(customer.uuidv5_customer_id)
+        dates = list(dates_bwn_two_dts(start_date, end_date))
+        cache_keys = {
+            MetricHandler._daily_usage_cache_key(metric, scope, date): date
+            for date in dates
+            if MetricHandler._day_is_final(start_date, end_date, date, watermark)
+        }
+        per_day = {
+            cache_keys[key]: day_usage
+            for key, day_usage in cache.get_many(list(cache_keys)).items()
+        }
+        query_dates = [date for date in dates if date not in per_day]
+        query_dates_set = set(query_dates)
+        for date in query_dates:
+            per_day[date] = {}
+        for run_dates in MetricHandler._consecutive_runs(query_dates):
+            run_start = start_date
+            if run_dates[0] != dates[0]:
+                run_start = datetime.datetime.combine(
+                    run_dates[0], datetime.time.min, tzinfo=datetime.timezone.utc
+                )
+            run_end = end_date
+            if run_dates[-1] != dates[-1]:
+                run_end = datetime.datetime.combine(
+                    run_dates[-1], datetime.time.max, tzinfo=datetime.timezone.utc
+                )
+            results = MetricHandler._run_daily_total_usage_query(
+                metric,
+                organization,
+                run_start,
+                run_end,
+                customer,
+                query_template,
+            )
+            for result in results:
+                date = convert_to_date(result.time_bucket)
+                if date not in query_dates_set:
+                    continue
+                per_day[date][
+                    str(result.uuidv5_customer_id)
+                ] = result.usage_qty or Decimal(0)
+        to_cache = {
+            key: per_day[date]
+            for key, date in cache_keys.items()
+            if date in query_dates_set
+        }
+        if len(to_cache) > 0:
+            cache.set_many(to_cache, timeout=DAILY_USAGE_CACHE_TIMEOUT)
+        per_customer = {}
+        for date, day_usage in per_day.items():
+            for uuidv5_customer_id, usage_qty in day_usage.items():
+                per_customer.setdefault(uuidv5_customer_id, {})[date] = usage_qty
+        return per_customer
+
+    @staticmethod
+    def _get_daily_total_usage_all_customers(
+        metric: Metric,
+        organization: Organization,
+        start_date,
+        end_date,
+        top_n: Optional[int],
+        query_template,
+        watermark,
+    ) -> dict[str, dict[datetime.date, Decimal]]:
+        # the top customers depend on the whole range, so they're ranked in SQL and only
+        # the top_n plus Other are returned, and cached if the whole range is final
+        cache_key = None
+        range_end = end_date
+        if not isinstance(range_end, datetime.datetime):
+            range_end = datetime.datetime.combine(
+                range_end, datetime.time.min, tzinfo=datetime.timezone.utc
+            )
+        if top_n and range_end < watermark:
+            cache_key = "daily_total_usage:{}:top_{}:{}:{}".format(
+                metric.metric_id.hex,
+                top_n,
+                start_date.isoformat(),
+                end_date.isoformat(),
+            )
+            per_customer = cache.get(cache_key)
+            if per_customer is not None:
+                return per_customer
+        results = MetricHandler._run_daily_total_usage_query(
+            metric,
+            organization,
+            start_date,
+            end_date,
+            None,
+            query_template,
+            top_n=top_n,
+        )
+        per_customer = {}
+        for result in results:
+            per_customer.setdefault(str(result.uuidv5_customer_id), {})[
+                convert_to_date(result.time_bucket)
+            ] = result.usage_qty or Decimal(0)
+        if cache_key is not None:
+            cache.set(cache_key, per_customer, timeout=DAILY_USAGE_CACHE_TIMEOUT)
+        return per_customer
+
+    @staticmethod
+    def _daily_usage_cache_key(metric: Metric, scope: str, date: datetime.date) -> str:
+        return "daily_total_usage:{}:{}:{}".format(
+            metric.metric_id.hex, scope, date.isoformat()
+        )
+
+    @staticmethod
+    def _consecutive_runs(dates: list[datetime.date]) -> list[list[datetime.date]]:
+        runs = []
+        for date in dates:
+            if len(runs) > 0 and runs[-1][-1] + datetime.timedelta(days=1) == date:
+                runs[-1].append(date)
+            else:
+                runs.append([date])
+        return runs
+
+    @staticmethod
+    def _day_is_final(start_date, end_date, date: datetime.date, watermark) -> bool:
+        # only days that are fully covered by the query range can be cached, and a
+        # date (rather than datetime) end_date only covers the very start of its day
+        day_start = datetime.datetime.combine(
+            date, datetime.time.min, tzinfo=datetime.timezone.utc
+        )
+        day_end = datetime.datetime.combine(
+            date, datetime.time.max, tzinfo=datetime.timezone.utc
+        )
+        if not isinstance(start_date, datetime.datetime):
+            start_date = datetime.datetime.combine(
+                start_date, datetime.time.min, tzinfo=datetime.timezone.utc
+            )
+        if not isinstance(end_date, datetime.datetime):
+            end_date = datetime.datetime.combine(
+                end_date, datetime.time.min, tzinfo=datetime.timezone.utc
+            )
+        return start_date <= day_start and end_date >= day_end and day_end < watermark
+
+    @staticmethod
+    def _run_daily_total_usage_query(
+        metric: Metric,
+        organization: Organization,
+        start_date,
+        end_date,
+        customer: Optional[Customer],
+        query_template,
+        top_n: Optional[int] = None,
+    ):
         injection_dict = {
             "query_type": metric.usage_aggregation_type,
             "filter_properties": {},
             "uuidv5_customer_id": customer.uuidv5_customer_id if customer else None,
-            "top_n": top_n if top_n else "ALL",
+            "top_n": top_n or "ALL",
             "property_name": metric.property_name,
             "uuidv5_event_name": uuid.uuid5(EVENT_NAME_NAMESPACE, metric.event_name),
             "organization_id": organization.id,
@@ -177,30 +388,10 @@ class MetricHandler(abc.ABC):
         )
         injection_dict["group_by"] = organization.subscription_filter_keys
         query = Template(query_template).render(**injection_dict)
-        with connection.cursor() as cursor:
+        with read_connection().cursor() as cursor:
             cursor.execute(query)
             results = namedtuplefetchall(cursor)
-        all_results = {}
-        for result in results:
-            if result.uuidv5_customer_id not in all_results:
-                all_results[result.uuidv5_customer_id] = {}
-            time = convert_to_date(result.time_bucket)
-            all_results[result.uuidv5_customer_id][time] = result.usage_qty or Decimal(
-                0
-            )
-        nil_uuid = uuid.UUID("00000000-0000-0000-0000-000000000000")
-        customer_ids_minus_other = set(all_results.keys()) - {nil_uuid}
-        customers = Customer.objects.filter(
-            uuidv5_customer_id__in=customer_ids_minus_other
-        )
-        all_results_with_customer_objects = {}
-        for customer in customers:
-            all_results_with_customer_objects[customer] = all_results[
-                customer.uuidv5_customer_id
-            ]
-        if nil_uuid in all_results:
-            all_results_with_customer_objects["Other"] = all_results[nil_uuid]
-        return all_results_with_customer_objects
+        return results
 
 
 class CounterHandler(MetricHandler):
@@ -241,6 +432,7 @@ class CounterHandler(MetricHandler):
         metric: Metric,
         billing_record: BillingRecord,
         organization: Organization,
+        start: Optional[datetime.datetime] = None,
     ) -> list[namedtuple]:
         from metering_billing.aggregation.counter_query_templates import (
             COUNTER_CAGG_TOTAL,
@@ -251,7 +443,8 @@ class CounterHandler(MetricHandler):
         injection_dict = CounterHandler._prepare_injection_dict(
             metric, billing_record, organization
         )
-        start = billing_record.start_date
+        if start is None or start < billing_record.start_date:
+            start = billing_record.start_date
         end = billing_record.end_date
         # there's 3 periods here.... the chunk between the start and the end of that day,
         # the full days in between, and the chunk between the last full day and the end. There
@@ -296,7 +489,7 @@ class CounterHandler(MetricHandler):
                 + "second"
             )
             query = Template(COUNTER_CAGG_TOTAL).render(**injection_dict)
-            with connection.cursor() as cursor:
+            with read_connection().cursor() as cursor:
                 cursor.execute(query)
                 results = namedtuplefetchall(cursor)
             all_results.extend(results)
@@ -311,7 +504,7 @@ class CounterHandler(MetricHandler):
                 + "day"
             )
             query = Template(COUNTER_CAGG_TOTAL).render(**injection_dict)
-            with connection.cursor() as cursor:
+            with read_connection().cursor() as cursor:
                 cursor.execute(query)
                 results = namedtuplefetchall(cursor)
             all_results.extend(results)
@@ -328,7 +521,7 @@ class CounterHandler(MetricHandler):
                 + "second"
             )
             query = Template(COUNTER_CAGG_TOTAL).render(**injection_dict)
-            with connection.cursor() as cursor:
+            with read_connection().cursor() as cursor:
                 cursor.execute(query)
                 results = namedtuplefetchall(cursor)
             all_results.extend(results)
@@ -370,7 +563,7 @@ class CounterHandler(MetricHandler):
                 for x in metric.categorical_filters.all()
             ]
             query = Template(COUNTER_UNIQUE_TOTAL).render(**injection_dict)
-            with connection.cursor() as cursor:
+            with read_connection().cursor() as cursor:
                 cursor.execute(query)
                 results = namedtuplefetchall(cursor)
             all_results = results
@@ -411,7 +604,9 @@ class CounterHandler(MetricHandler):
 
     @staticmethod
     def get_billing_record_daily_billable_usage(
-        metric: Metric, billing_record: BillingRecord
+        metric: Metric,
+        billing_record: BillingRecord,
+        since: Optional[datetime.date] = None,
     ) -> dict[datetime.date, Decimal]:
         from metering_billing.models import Organization
 
@@ -420,8 +615,19 @@ class CounterHandler(MetricHandler):
         organization = Organization.objects.get(id=metric.organization.id)
         all_results = {}
         if metric.usage_aggregation_type != METRIC_AGGREGATION.UNIQUE:
+            start = None
+            # the max is made incremental across days, so it needs the earlier days too
+            if (
+                since is not None
+                and metric.usage_aggregation_type != METRIC_AGGREGATION.MAX
+            ):
+                start = datetime.datetime.combine(
+                    since + datetime.timedelta(days=1),
+                    datetime.time.min,
+                    tzinfo=datetime.timezone.utc,
+                )
             usg_per_day_results = CounterHandler._get_total_usage_per_day_not_unique(
-                metric, billing_record, organization
+                metric, billing_record, organization, start=start
             )
             for result in usg_per_day_results:
                 time = convert_to_date(result.bucket)
@@ -474,7 +680,7 @@ class CounterHandler(MetricHandler):
                 for x in metric.categorical_filters.all()
             ]
             query = Template(COUNTER_UNIQUE_PER_DAY).render(**injection_dict)
-            with connection.cursor() as cursor:
+            with read_connection().cursor() as cursor:
                 cursor.execute(query)
                 results = namedtuplefetchall(cursor)
             all_results = results
@@ -631,43 +837,192 @@ class CounterHandler(MetricHandler):
 
 class CustomHandler(MetricHandler):
     @staticmethod
-    def _run_query(custom_sql, injection_dict: dict):
+    def _run_query(custom_sql, injection_dict: dict, daily=False):
+        """
+        Runs the custom query over the range of the injection dict. With daily, it's evaluated once per day of injection_dict["days"], a list of (date, day_start, day_end), and returns a row with the date and usage_qty of every day.
+        """
         from metering_billing.aggregation.custom_query_templates import (
             CUSTOM_BASE_QUERY,
+            CUSTOM_DAILY_BASE_QUERY,
+            CUSTOM_DAILY_QUERY_END,
         )
 
-        combined_query = CUSTOM_BASE_QUERY
+        combined_query = CUSTOM_DAILY_BASE_QUERY if daily else CUSTOM_BASE_QUERY
         if custom_sql.lower().lstrip().startswith("with"):
             custom_sql = custom_sql.lower().replace("with", ",")
         combined_query += custom_sql
+        if daily:
+            combined_query = (
+                combined_query.rstrip().rstrip(";") + CUSTOM_DAILY_QUERY_END
+            )
         query = Template(combined_query).render(**injection_dict)
-        with connection.cursor() as cursor:
+        with read_connection().cursor() as cursor:
             cursor.execute(query)
             results = namedtuplefetchall(cursor)
         return results
 
     @staticmethod
-    def get_billing_record_total_billable_usage(
-        metric: Metric, billing_record: BillingRecord
-    ) -> Decimal:
-        from metering_billing.models import Organization
+    def _sql_hash(metric: Metric) -> str:
+        return hashlib.md5(metric.custom_sql.encode()).hexdigest()
 
-        organization = Organization.objects.get(id=metric.organization.id)
+    @staticmethod
+    def _injection_dict(
+        metric: Metric,
+        billing_record: BillingRecord,
+        start: datetime.datetime,
+        end: datetime.datetime,
+    ) -> dict:
         injection_dict = {
             "filter_properties": {},
             "uuidv5_customer_id": billing_record.customer.uuidv5_customer_id,
+            "start_date": start,
+            "end_date": end,
+            "organization_id": metric.organization_id,
         }
-        start = billing_record.start_date
-        end = billing_record.end_date
-        injection_dict["start_date"] = start
-        injection_dict["end_date"] = end
-        injection_dict["organization_id"] = organization.id
         for filter in billing_record.subscription.subscription_filters:
             injection_dict["filter_properties"][filter[0]] = [filter[1]]
-        results = CustomHandler._run_query(metric.custom_sql, injection_dict)
-        if len(results) == 0:
-            return Decimal(0)
-        return results[0].usage_qty
+        return injection_dict
+
+    @staticmethod
+    def _closed_period_cache_key(metric: Metric, billing_record: BillingRecord) -> str:
+        filters = sorted(
+            [str(x) for x in filter]
+            for filter in billing_record.subscription.subscription_filters
+        )
+        return "custom_metric_usage:{}:{}:{}".format(
+            metric.metric_id.hex,
+            CustomHandler._sql_hash(metric),
+            hashlib.md5(
+                json.dumps(
+                    [
+                        str(billing_record.customer.uuidv5_customer_id),
+                        filters,
+                        billing_record.start_date.isoformat(),
+                        billing_record.end_date.isoformat(),
+                    ]
+                ).encode()
+            ).hexdigest(),
+        )
+
+    @staticmethod
+    def _get_daily_usage(
+        metric: Metric, billing_record: BillingRecord
+    ) -> dict[datetime.date, Decimal]:
+        """
+        Evaluates a metric that declares a daily aggregation one day at a time. Days fully inside the billing record that are closed are read from (and written to) CustomMetricDailyUsage, only the open days and partial days at the edges of the billing record are queried, every run of consecutive days in a single query.
+        """
+        from metering_billing.models import CustomMetricDailyUsage
+
+        now = now_utc()
+        start = billing_record.start_date
+        end = min(billing_record.end_date, now)
+        if end < start:
+            return {}
+        sql_hash = CustomHandler._sql_hash(metric)
+        uuidv5_customer_id = billing_record.customer.uuidv5_customer_id
+        group_values = {
+            filter[0]: filter[1]
+            for filter in billing_record.subscription.subscription_filters
+        }
+        segments = {}
+        for date in dates_bwn_two_dts(start, end):
+            day_start = datetime.datetime.combine(
+                date, datetime.time.min, tzinfo=datetime.timezone.utc
+            )
+            day_end = datetime.datetime.combine(
+                date, datetime.time.max, tzinfo=datetime.timezone.utc
+            )
+            materializable = (
+                start <= day_start
+                and end >= day_end
+                and day_end <= now - CUSTOM_METRIC_CLOSED_LAG
+            )
+            segments[date] = (max(start, day_start), min(end, day_end), materializable)
+        materialized = dict(
+            CustomMetricDailyUsage.objects.filter(
+                metric=metric,
+                sql_hash=sql_hash,
+                uuidv5_customer_id=uuidv5_customer_id,
+                group_values=group_values,
+                date__in=[date for date, x in segments.items() if x[2]],
+            ).values_list("date", "usage_qty")
+        )
+        usage = {date: materialized[date] for date in segments if date in materialized}
+        for run in CustomHandler._consecutive_runs(
+            [date for date in segments if date not in materialized]
+        ):
+            injection_dict = CustomHandler._injection_dict(
+                metric, billing_record, segments[run[0]][0], segments[run[-1]][1]
+            )
+            injection_dict["days"] = [(date, *segments[date][:2]) for date in run]
+            results = CustomHandler._run_query(
+                metric.custom_sql, injection_dict, daily=True
+            )
+            run_usage = {
+                row.date: Decimal(row.usage_qty)
+                for row in results
+                if row.usage_qty is not None
+            }
+            for date in run:
+                usage[date] = run_usage.get(date, Decimal(0))
+        to_materialize = []
+        for date, (_, _, materializable) in segments.items():
+            if date in materialized:
+                continue
+            usage_qty = usage[date]
+            if materializable:
+                to_materialize.append(
+                    CustomMetricDailyUsage(
+                        organization_id=metric.organization_id,
+                        metric=metric,
+                        sql_hash=sql_hash,
+                        uuidv5_customer_id=uuidv5_customer_id,
+                        group_values=group_values,
+                        date=date,
+                        usage_qty=usage_qty,
+                    )
+                )
+        if len(to_materialize) > 0:
+            CustomMetricDailyUsage.objects.bulk_create(
+                to_materialize, ignore_conflicts=True
+            )
+        return {date: usage[date] for date in segments}
+
+    @staticmethod
+    def get_billing_record_total_billable_usage(
+        metric: Metric, billing_record: BillingRecord
+    ) -> Decimal:
+        # the result for a billing record that ended before the last closed day can't
+        # change anymore, so we only ever compute it once
+        closed = billing_record.end_date <= now_utc() - CUSTOM_METRIC_CLOSED_LAG
+        if closed:
+            cache_key = CustomHandler._closed_period_cache_key(metric, billing_record)
+            usage_qty = cache.get(cache_key)
+            if usage_qty is not None:
+                return usage_qty
+        if metric.custom_sql_daily_aggregation is not None:
+            daily_usage = CustomHandler._get_daily_usage(metric, billing_record)
+            if len(daily_usage) == 0:
+                usage_qty = Decimal(0)
+            elif metric.custom_sql_daily_aggregation == METRIC_AGGREGATION.MAX:
+                usage_qty = max(daily_usage.values())
+            else:
+                usage_qty = sum(daily_usage.values(), Decimal(0))
+        else:
+            injection_dict = CustomHandler._injection_dict(
+                metric,
+                billing_record,
+                billing_record.start_date,
+                billing_record.end_date,
+            )
+            results = CustomHandler._run_query(metric.custom_sql, injection_dict)
+            if len(results) == 0:
+                usage_qty = Decimal(0)
+            else:
+                usage_qty = results[0].usage_qty
+        if closed:
+            cache.set(cache_key, usage_qty, CUSTOM_METRIC_CACHE_TIMEOUT)
+        return usage_qty
 
     @staticmethod
     def get_billing_record_current_usage(
@@ -679,8 +1034,12 @@ class CustomHandler(MetricHandler):
 
     @staticmethod
     def get_billing_record_daily_billable_usage(
-        metric: Metric, billing_record: BillingRecord
+        metric: Metric,
+        billing_record: BillingRecord,
+        since: Optional[datetime.date] = None,
     ) -> dict[datetime.date, Decimal]:
+        if metric.custom_sql_daily_aggregation is not None:
+            return CustomHandler._get_daily_usage(metric, billing_record)
         usage_qty = CustomHandler.get_billing_record_total_billable_usage(
             metric, billing_record
         )
@@ -698,7 +1057,10 @@ class CustomHandler(MetricHandler):
 
     @staticmethod
     def create_continuous_aggregate(metric: Metric, refresh=False):
-        pass
+        from metering_billing.models import CustomMetricDailyUsage
+
+        if refresh is True:
+            CustomMetricDailyUsage.objects.filter(metric=metric).delete()
 
     @staticmethod
     def create_metric(validated_data: dict) -> Metric:
@@ -708,7 +1070,9 @@ class CustomHandler(MetricHandler):
 
     @staticmethod
     def archive_metric(metric: Metric) -> Metric:
-        pass
+        from metering_billing.models import CustomMetricDailyUsage
+
+        CustomMetricDailyUsage.objects.filter(metric=metric).delete()
 
     @staticmethod
     def validate_data(data: dict) -> dict:
@@ -725,6 +1089,7 @@ class CustomHandler(MetricHandler):
         categorical_filters = data.get("categorical_filters", None)
         property_name = data.get("property_name", None)
         custom_sql = data.get("custom_sql", None)
+        daily_aggregation = data.get("custom_sql_daily_aggregation", None)
 
         # now validate
         if event_name is not None:
@@ -773,6 +1138,13 @@ class CustomHandler(MetricHandler):
             raise MetricValidationFailed(
                 "Custom SQL query is required for CUSTOM metric"
             )
+        if daily_aggregation is not None and daily_aggregation not in [
+            METRIC_AGGREGATION.SUM,
+            METRIC_AGGREGATION.MAX,
+        ]:
+            raise MetricValidationFailed(
+                "[METRIC TYPE: CUSTOM] Daily aggregation must be one of sum or max"
+            )
         sql_valid = CustomHandler.validate_custom_sql(custom_sql)
         if not sql_valid:
             raise MetricValidationFailed(
@@ -950,7 +1322,7 @@ class GaugeHandler(MetricHandler):
 
     @staticmethod
     def create_continuous_aggregate(metric: Metric, refresh=False):
-        from metering_billing.models import Organization
+        from metering_billing.models import GaugeStateCheckpoint, Organization
 
         from .common_query_templates import CAGG_COMPRESSION, CAGG_DROP, CAGG_REFRESH
         from .gauge_query_templates import (
@@ -989,6 +1361,10 @@ class GaugeHandler(MetricHandler):
             query = Template(GAUGE_TOTAL_CUMULATIVE_SUM).render(**sql_injection_data)
         refresh_query = Template(CAGG_REFRESH).render(**sql_injection_data)
         compression_query = Template(CAGG_COMPRESSION).render(**sql_injection_data)
+        if refresh:
+            # filters or subscription filter keys might have changed, so the
+            # checkpointed states are no longer valid
+            GaugeStateCheckpoint.objects.filter(metric=metric).delete()
         with connection.cursor() as cursor:
             if metric.event_type == "delta":
                 cursor.execute(drop_old)
@@ -998,6 +1374,72 @@ class GaugeHandler(MetricHandler):
             cursor.execute(refresh_query)
             if not refresh:
                 cursor.execute(compression_query)
+        # checkpoint right away instead of waiting for the hourly task, so the gauge
+        # queries don't have to start from the very first event in the meantime
+        GaugeHandler.checkpoint_gauge_state(metric)
+
+    @staticmethod
+    def _checkpoint_watermark(
+        metric: Metric, as_of: datetime.datetime
+    ) -> Union[datetime.datetime, str]:
+        from metering_billing.models import GaugeStateCheckpoint
+
+        watermark = GaugeStateCheckpoint.objects.filter(
+            metric=metric, checkpoint_time__lte=as_of
+        ).aggregate(watermark=Max("checkpoint_time"))["watermark"]
+        # checkpoints are seeded when the aggregates are created, and for metrics created
+        # before checkpoints existed by the first run of the checkpoint_gauge_states task,
+        # so until then, or if there were no events before, we start from the first event
+        return watermark or "-infinity"
+
+    @staticmethod
+    def checkpoint_gauge_state(
+        metric: Metric, checkpoint_time: Optional[datetime.datetime] = None
+    ) -> Optional[datetime.datetime]:
+        """
+        Persist the state of every customer and subscription filter group of the metric as of checkpoint_time, starting from the previous checkpoint and only scanning the events in between. By default we checkpoint at the start of the previous day, the same lag the continuous aggregates are refreshed with, so late events still make it in.
+        """
+        from metering_billing.models import GaugeStateCheckpoint, Organization
+
+        from .gauge_query_templates import (
+            GAUGE_DELTA_CHECKPOINT_UPSERT,
+            GAUGE_TOTAL_CHECKPOINT_UPSERT,
+        )
+
+        if checkpoint_time is None:
+            checkpoint_time = (now_utc() - relativedelta(days=1)).replace(
+                hour=0, minute=0, second=0, microsecond=0
+            )
+        latest_checkpoint = GaugeStateCheckpoint.objects.filter(
+            metric=metric
+        ).aggregate(latest=Max("checkpoint_time"))["latest"]
+        if latest_checkpoint is not None and latest_checkpoint >= checkpoint_time:
+            return None
+        organization = Organization.objects.get(id=metric.organization.id)
+        injection_dict = {
+            "metric_id": metric.id,
+            "organization_id": organization.id,
+            "group_by": organization.subscription_filter_keys,
+            "property_name": metric.property_name,
+            "uuidv5_event_name": uuid.uuid5(EVENT_NAME_NAMESPACE, metric.event_name),
+            "numeric_filters": [
+                (x.property_name, x.operator, x.comparison_value)
+                for x in metric.numeric_filters.all()
+            ],
+            "categorical_filters": [
+                (x.property_name, x.operator, x.comparison_value)
+                for x in metric.categorical_filters.all()
+            ],
+            "watermark": latest_checkpoint or "-infinity",
+            "checkpoint_time": checkpoint_time,
+        }
+        if metric.event_type == "delta":
+            query = Template(GAUGE_DELTA_CHECKPOINT_UPSERT).render(**injection_dict)
+        elif metric.event_type == "total":
+            query = Template(GAUGE_TOTAL_CHECKPOINT_UPSERT).render(**injection_dict)
+        with connection.cursor() as cursor:
+            cursor.execute(query)
+        return checkpoint_time
 
     @staticmethod
     def archive_metric(metric: Metric) -> Metric:
@@ -1080,6 +1522,10 @@ class GaugeHandler(MetricHandler):
                 for x in metric.categorical_filters.all()
             ],
             "property_name": metric.property_name,
+            "metric_id": metric.id,
+            "checkpoint_time": GaugeHandler._checkpoint_watermark(
+                metric, billing_record.start_date
+            ),
         }
         for filter in billing_record.subscription.subscription_filters:
             injection_dict["filter_properties"][filter[0]] = [filter[1]]
@@ -1091,7 +1537,7 @@ class GaugeHandler(MetricHandler):
             query = Template(GAUGE_TOTAL_GET_TOTAL_USAGE_WITH_PRORATION).render(
                 **injection_dict
             )
-        with connection.cursor() as cursor:
+        with read_connection().cursor() as cursor:
             cursor.execute(query)
             result = namedtuplefetchall(cursor)
         if len(result) == 0:
@@ -1155,6 +1601,8 @@ class GaugeHandler(MetricHandler):
                 for x in metric.categorical_filters.all()
             ],
             "property_name": metric.property_name,
+            "metric_id": metric.id,
+            "checkpoint_time": GaugeHandler._checkpoint_watermark(metric, now_utc()),
         }
         for filter in billing_record.subscription.subscription_filters:
             injection_dict["filter_properties"][filter[0]] = [filter[1]]
@@ -1162,16 +1610,18 @@ class GaugeHandler(MetricHandler):
             query = Template(GAUGE_DELTA_GET_CURRENT_USAGE).render(**injection_dict)
         elif metric.event_type == "total":
             query = Template(GAUGE_TOTAL_GET_CURRENT_USAGE).render(**injection_dict)
-        with connection.cursor() as cursor:
+        with read_connection().cursor() as cursor:
             cursor.execute(query)
             result = namedtuplefetchall(cursor)
         if len(result) == 0:
             return Decimal(0)
-        return result[0].usage_qty
+        return result[0].usage_qty or Decimal(0)
 
     @staticmethod
     def get_billing_record_daily_billable_usage(
-        metric: Metric, billing_record: BillingRecord
+        metric: Metric,
+        billing_record: BillingRecord,
+        since: Optional[datetime.date] = None,
     ) -> dict[datetime.date, Decimal]:
         from metering_billing.models import Organization
 
@@ -1237,7 +1687,7 @@ class GaugeHandler(MetricHandler):
             query = Template(GAUGE_TOTAL_GET_TOTAL_USAGE_WITH_PRORATION_PER_DAY).render(
                 **injection_dict
             )
-        with connection.cursor() as cursor:
+        with read_connection().cursor() as cursor:
             cursor.execute(query)
             result = namedtuplefetchall(cursor)
         results_dict = {}
@@ -1445,7 +1895,7 @@ class RateHandler(MetricHandler):
         for filter in billing_record.subscription.subscription_filters:
             injection_dict["filter_properties"][filter[0]] = [filter[1]]
         query = Template(RATE_CAGG_TOTAL).render(**injection_dict)
-        with connection.cursor() as cursor:
+        with read_connection().cursor() as cursor:
             cursor.execute(query)
             results = namedtuplefetchall(cursor)
         return results
@@ -1464,11 +1914,20 @@ class RateHandler(MetricHandler):
     def get_billing_record_current_usage(
         metric: Metric, billing_record: BillingRecord
     ) -> Decimal:
+        from metering_billing.aggregation.rate_counters import get_current_rate
         from metering_billing.aggregation.rate_query_templates import (
             RATE_GET_CURRENT_USAGE,
         )
         from metering_billing.models import Organization
 
+        current_rate = get_current_rate(
+            metric,
+            billing_record.customer.uuidv5_customer_id,
+            billing_record.subscription.subscription_filters,
+            billing_record.start_date,
+        )
+        if current_rate is not None:
+            return current_rate
         organization = Organization.objects.get(id=metric.organization.id)
         start = billing_record.start_date
         end = billing_record.end_date
@@ -1502,7 +1961,7 @@ class RateHandler(MetricHandler):
         for filter in billing_record.subscription.subscription_filters:
             injection_dict["filter_properties"][filter[0]] = [filter[1]]
         query = Template(RATE_GET_CURRENT_USAGE).render(**injection_dict)
-        with connection.cursor() as cursor:
+        with read_connection().cursor() as cursor:
             cursor.execute(query)
             results = namedtuplefetchall(cursor)
         if len(results) == 0:
@@ -1511,7 +1970,9 @@ class RateHandler(MetricHandler):
 
     @staticmethod
     def get_billing_record_daily_billable_usage(
-        metric: Metric, billing_record: BillingRecord
+        metric: Metric,
+        billing_record: BillingRecord,
+        since: Optional[datetime.date] = None,
     ) -> dict[datetime.date, Decimal]:
         results = RateHandler._rate_cagg_total_results(metric, billing_record)
         if len(results) == 0:
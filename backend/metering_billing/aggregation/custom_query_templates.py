@@ -1,3 +1,44 @@
+# evaluates the custom query once per day of the days relation, in a single statement,
+# with start_date and end_date bound to the bounds of each day
+CUSTOM_DAILY_BASE_QUERY = """
+SELECT DISTINCT ON (days.date) days.date AS date, usage.usage_qty AS usage_qty
+FROM (
+    VALUES
+    {%- for date, day_start, day_end in days %}
+        ('{{ date }}'::date, '{{ day_start }}'::timestamptz, '{{ day_end }}'::timestamptz)
+        {%- if not loop.last %},{% endif %}
+    {%- endfor %}
+) AS days(date, start_date, end_date)
+CROSS JOIN LATERAL (
+WITH events AS
+(
+    SELECT
+        "metering_billing_usageevent"."properties" as properties,
+        "metering_billing_usageevent"."time_created"::timestamptz as time_created,
+        "metering_billing_usageevent"."event_name" as event_name,
+        days.start_date as start_date,
+        days.end_date as end_date
+    FROM "metering_billing_usageevent"
+    WHERE
+        "metering_billing_usageevent"."organization_id" = {{ organization_id }}
+        AND "metering_billing_usageevent"."uuidv5_customer_id" = '{{ uuidv5_customer_id }}'
+        {%- for property_name, property_values in filter_properties.items() %}
+            AND {{ property_name }}
+                IN (
+                    {%- for pval in property_values %}
+                    '{{ pval }}'
+                    {%- if not loop.last %},{% endif %}
+                    {%- endfor %}
+                )
+        {%- endfor %}
+        AND "metering_billing_usageevent"."time_created" <= NOW()
+)
+"""
+
+CUSTOM_DAILY_QUERY_END = """
+) AS usage
+"""
+
 CUSTOM_BASE_QUERY = """
 WITH events AS
 (
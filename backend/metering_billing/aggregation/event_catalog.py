@@ -0,0 +1,175 @@
+"""
+Catalog of the event names and property keys every organization sends, with the inferred
+type, first and last time seen and a few sample values of each property. The ingestion
+consumers merge every batch they write into it with the update_event_catalog database
+function, one set-based upsert per batch, so the metric builder can list event names and
+properties without scanning the events table.
+
+The catalog is always maintained; EVENT_CATALOG_ENABLED only switches the read path over,
+once existing events have been loaded with the backfill_event_catalog command.
+"""
+import datetime
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.models import Max, Min
+
+EVENT_CATALOG_ENABLED = settings.EVENT_CATALOG_ENABLED
+
+
+def record_catalog_events(organization_pk, events_list: list) -> None:
+    """
+    Merges a batch of ingested events into the organization's event catalog.
+    """
+    if len(events_list) == 0:
+        return
+    catalog_events = [
+        {
+            "organization_id": organization_pk,
+            "event_name": event["event_name"],
+            "time_created": event["time_created"],
+            "properties": event.get("properties") or {},
+        }
+        for event in events_list
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT update_event_catalog(%s::jsonb)",
+            [json.dumps(catalog_events, cls=DjangoJSONEncoder)],
+        )
+
+
+# the same merge as update_event_catalog, for entries computed from the events table
+BACKFILL_EVENT_CATALOG_SQL = """
+WITH entries AS (
+    SELECT
+        events.event_name,
+        CASE WHEN grouping(properties.key) = 1 THEN '' ELSE properties.key END
+            AS property_key,
+        CASE
+            WHEN grouping(properties.key) = 1 THEN ''
+            WHEN count(DISTINCT jsonb_typeof(properties.value)) FILTER (
+                WHERE jsonb_typeof(properties.value) <> 'null'
+            ) > 1
+            THEN 'mixed'
+            ELSE coalesce(
+                max(jsonb_typeof(properties.value)) FILTER (
+                    WHERE jsonb_typeof(properties.value) <> 'null'
+                ),
+                'null'
+            )
+        END AS inferred_type,
+        min(events.time_created) AS first_seen,
+        max(events.time_created) AS last_seen
+    FROM metering_billing_usageevent AS events
+    LEFT JOIN LATERAL jsonb_each(
+        CASE
+            WHEN jsonb_typeof(events.properties) = 'object' THEN events.properties
+            ELSE '{}'::jsonb
+        END
+    ) AS properties ON true
+    WHERE events.organization_id = %(organization_id)s
+        AND events.time_created >= %(start)s
+        AND events.time_created < %(end)s
+    GROUP BY GROUPING SETS ((events.event_name), (events.event_name, properties.key))
+    -- events without properties only count towards the event name
+    HAVING grouping(properties.key) = 1 OR properties.key IS NOT NULL
+)
+INSERT INTO metering_billing_eventcatalogentry AS catalog (
+    organization_id,
+    event_name,
+    property_key,
+    inferred_type,
+    first_seen,
+    last_seen,
+    sample_values
+)
+SELECT
+    %(organization_id)s,
+    entries.event_name,
+    entries.property_key,
+    entries.inferred_type,
+    entries.first_seen,
+    entries.last_seen,
+    CASE
+        WHEN entries.property_key = '' THEN '[]'::jsonb
+        ELSE coalesce(
+            (
+                SELECT jsonb_path_query_array(jsonb_agg(DISTINCT samples.value), '$[0 to 4]')
+                FROM (
+                    SELECT events.properties -> entries.property_key AS value
+                    FROM metering_billing_usageevent AS events
+                    WHERE events.organization_id = %(organization_id)s
+                        AND events.time_created >= %(start)s
+                        AND events.time_created < %(end)s
+                        AND events.event_name = entries.event_name
+                        AND jsonb_typeof(events.properties -> entries.property_key)
+                            IN ('string', 'number', 'boolean')
+                    LIMIT 50
+                ) AS samples
+            ),
+            '[]'::jsonb
+        )
+    END
+FROM entries
+-- a consistent lock order keeps concurrent consumers from deadlocking
+ORDER BY entries.event_name, entries.property_key
+ON CONFLICT (organization_id, event_name, property_key) DO UPDATE SET
+    inferred_type = CASE
+        WHEN catalog.inferred_type = EXCLUDED.inferred_type
+            OR EXCLUDED.inferred_type = 'null'
+        THEN catalog.inferred_type
+        WHEN catalog.inferred_type = 'null' THEN EXCLUDED.inferred_type
+        ELSE 'mixed'
+    END,
+    first_seen = least(catalog.first_seen, EXCLUDED.first_seen),
+    last_seen = greatest(catalog.last_seen, EXCLUDED.last_seen),
+    sample_values = CASE
+        WHEN jsonb_array_length(catalog.sample_values) >= 5
+        THEN catalog.sample_values
+        ELSE coalesce(
+            jsonb_path_query_array(
+                (
+                    SELECT jsonb_agg(DISTINCT samples.value)
+                    FROM jsonb_array_elements(
+                        catalog.sample_values || EXCLUDED.sample_values
+                    ) AS samples(value)
+                ),
+                '$[0 to 4]'
+            ),
+            '[]'::jsonb
+        )
+    END
+"""
+
+
+def backfill_event_catalog(
+    organization, window=datetime.timedelta(days=1), reset=False
+) -> None:
+    """
+    Merges the organization's existing events into its event catalog, one time window at a time so every statement only reads a few chunks. Each window is grouped into its distinct event names and property keys in the database, so the events themselves never leave it. Merging is idempotent, so it can run while events are being ingested. With reset, the catalog is emptied first.
+    """
+    from metering_billing.models import Event, EventCatalogEntry
+
+    if reset:
+        EventCatalogEntry.objects.filter(organization=organization).delete()
+    bounds = Event.objects.filter(organization=organization).aggregate(
+        start=Min("time_created"), end=Max("time_created")
+    )
+    if bounds["start"] is None:
+        return
+    window_start = bounds["start"]
+    while window_start <= bounds["end"]:
+        window_end = window_start + window
+        with connection.cursor() as cursor:
+            cursor.execute(
+                BACKFILL_EVENT_CATALOG_SQL,
+                {
+                    "organization_id": organization.pk,
+                    "start": window_start,
+                    "end": window_end,
+                },
+            )
+        window_start = window_end
@@ -0,0 +1,61 @@
+"""
+Evaluation of metric filters and usage on single events in Python, for the counters that
+are fed event by event instead of through a query. The results match what the metric
+queries compute in the database.
+"""
+import json
+from decimal import Decimal
+from typing import Optional
+
+from metering_billing.utils.enums import (
+    CATEGORICAL_FILTER_OPERATORS,
+    METRIC_AGGREGATION,
+    NUMERIC_FILTER_OPERATORS,
+)
+
+
+def property_as_text(value) -> Optional[str]:
+    # mirror what properties ->> 'key' returns in postgres
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return value
+    return json.dumps(value)
+
+
+def event_passes_filters(metric, properties: dict) -> bool:
+    for numeric_filter in metric.numeric_filters.all():
+        value = properties.get(numeric_filter.property_name)
+        try:
+            value = Decimal(str(value))
+        except Exception:
+            return False
+        comparison = Decimal(str(numeric_filter.comparison_value))
+        operator = numeric_filter.operator
+        if operator == NUMERIC_FILTER_OPERATORS.GT and not value > comparison:
+            return False
+        elif operator == NUMERIC_FILTER_OPERATORS.GTE and not value >= comparison:
+            return False
+        elif operator == NUMERIC_FILTER_OPERATORS.LT and not value < comparison:
+            return False
+        elif operator == NUMERIC_FILTER_OPERATORS.LTE and not value <= comparison:
+            return False
+        elif operator == NUMERIC_FILTER_OPERATORS.EQ and not value == comparison:
+            return False
+    for categorical_filter in metric.categorical_filters.all():
+        value = property_as_text(properties.get(categorical_filter.property_name))
+        is_in = (value or "") in [str(x) for x in categorical_filter.comparison_value]
+        if categorical_filter.operator == CATEGORICAL_FILTER_OPERATORS.ISNOTIN:
+            is_in = not is_in
+        if not is_in:
+            return False
+    return True
+
+
+def event_usage(metric, properties: dict) -> Optional[Decimal]:
+    if metric.usage_aggregation_type == METRIC_AGGREGATION.COUNT:
+        return Decimal(1)
+    try:
+        return Decimal(str(properties.get(metric.property_name)))
+    except Exception:
+        return None
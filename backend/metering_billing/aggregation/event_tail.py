@@ -0,0 +1,164 @@
+"""
+Feeds the counters kept in the cache from the events table. Events are ingested both by
+the Python consumer and by the event-guidance service, and both write the time a row was
+inserted at, so instead of hooking into every ingestion path a periodic task reads the
+rows inserted since its previous run. Duplicates that were dropped on insert never make
+it into the table, so they are never counted.
+
+Rows are stamped with inserted_at before their transaction commits, so the watermark
+never passes the start of the oldest transaction that is still writing to the database,
+less EVENT_TAIL_SETTLE_SECONDS. The margin covers the time between stamping a batch and
+its first write, before which the transaction can't be told apart from a reader, and the
+clock skew between the ingestion services and the database. A batch stamped longer than
+that before its first write is still skipped, and only counted by the next
+reconciliation. Only events at most EVENT_TAIL_LOOKBACK old are read, which is as far back
+as any counter looks. Reconciliations of
+the counters hold the same lock as the tail and only count rows up to its watermark, so
+no row is counted twice.
+"""
+import contextlib
+import datetime
+import logging
+import uuid
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from metering_billing.utils import now_utc
+
+logger = logging.getLogger("django.server")
+
+EVENT_NAME_NAMESPACE = settings.EVENT_NAME_NAMESPACE
+
+EVENT_TAIL_SETTLE_SECONDS = 5
+EVENT_TAIL_LOOKBACK = datetime.timedelta(days=1)
+# counters fed by a tail that stopped running can't be trusted
+EVENT_TAIL_MAX_STALENESS = 2 * 60
+EVENT_TAIL_LOCK_TIMEOUT = 5 * 60
+EVENT_TAIL_WATERMARK_KEY = "event_tail:watermark"
+EVENT_TAIL_LOCK_KEY = "event_tail:lock"
+
+
+@contextlib.contextmanager
+def event_tail_lock():
+    """
+    Serializes the tail with the reconciliations of the counters it feeds. Yields whether the lock was acquired.
+    """
+    acquired = cache.add(EVENT_TAIL_LOCK_KEY, 1, timeout=EVENT_TAIL_LOCK_TIMEOUT)
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            cache.delete(EVENT_TAIL_LOCK_KEY)
+
+
+def get_event_tail_watermark() -> Optional[datetime.datetime]:
+    """
+    Every row inserted at or before the watermark has been fed into the counters.
+    """
+    return cache.get(EVENT_TAIL_WATERMARK_KEY)
+
+
+def event_tail_is_fresh() -> bool:
+    watermark = get_event_tail_watermark()
+    if watermark is None:
+        return False
+    staleness = (now_utc() - watermark).total_seconds()
+    return staleness <= EVENT_TAIL_MAX_STALENESS + EVENT_TAIL_SETTLE_SECONDS
+
+
+def _settled_watermark(now) -> datetime.datetime:
+    """
+    Every transaction that may have stamped a row at or before the returned time has ended.
+    """
+    with connection.cursor() as cursor:
+        # only transactions that wrote something have an xid
+        cursor.execute(
+            """
+            SELECT min(xact_start)
+            FROM pg_stat_activity
+            WHERE backend_xid IS NOT NULL AND pid <> pg_backend_pid()
+            """
+        )
+        (oldest_write_start,) = cursor.fetchone()
+    settled = now
+    if oldest_write_start is not None:
+        settled = min(settled, oldest_write_start)
+    return settled - datetime.timedelta(seconds=EVENT_TAIL_SETTLE_SECONDS)
+
+
+def _tracked_event_names() -> dict:
+    from metering_billing.aggregation.alert_counters import alert_counter_event_names
+    from metering_billing.aggregation.rate_counters import rate_counter_event_names
+
+    tracked = {}
+    for counter_event_names in [
+        rate_counter_event_names(),
+        alert_counter_event_names(),
+    ]:
+        for organization_pk, event_names in counter_event_names.items():
+            tracked.setdefault(organization_pk, set()).update(event_names)
+    return tracked
+
+
+def advance_event_tail() -> Optional[datetime.datetime]:
+    """
+    Feeds the events inserted since the previous run into the counters. Returns the new watermark, or None if another run or a reconciliation holds the lock.
+    """
+    from metering_billing.aggregation.alert_counters import record_alert_events
+    from metering_billing.aggregation.rate_counters import record_events
+    from metering_billing.models import Event, Organization
+
+    with event_tail_lock() as acquired:
+        if not acquired:
+            return None
+        now = now_utc()
+        new_watermark = _settled_watermark(now)
+        watermark = get_event_tail_watermark()
+        if watermark is not None and new_watermark <= watermark:
+            return watermark
+        tracked = _tracked_event_names()
+        # the first run only sets the watermark, the reconciliations take it from there
+        if watermark is not None and len(tracked) > 0:
+            events = Event.objects.filter(
+                organization_id__in=tracked.keys(),
+                uuidv5_event_name__in={
+                    uuid.uuid5(EVENT_NAME_NAMESPACE, event_name)
+                    for event_names in tracked.values()
+                    for event_name in event_names
+                },
+                time_created__gte=now - EVENT_TAIL_LOOKBACK,
+                inserted_at__gt=watermark,
+                inserted_at__lte=new_watermark,
+            ).values(
+                "organization_id",
+                "cust_id",
+                "event_name",
+                "properties",
+                "time_created",
+                "inserted_at",
+            )
+            events_per_organization = {}
+            for event in events.iterator():
+                if event["event_name"] not in tracked[event["organization_id"]]:
+                    continue
+                events_per_organization.setdefault(event["organization_id"], []).append(
+                    event
+                )
+            for organization in Organization.objects.filter(
+                pk__in=events_per_organization.keys()
+            ):
+                for record in [record_events, record_alert_events]:
+                    try:
+                        record(organization, events_per_organization[organization.pk])
+                    except Exception as e:
+                        # reconciled periodically, one organization can't hold back the rest
+                        logger.error(
+                            "Error recording events of organization {} into the counters. Error was {}".format(
+                                organization.pk, e
+                            )
+                        )
+        cache.set(EVENT_TAIL_WATERMARK_KEY, new_watermark, timeout=None)
+        return new_watermark
@@ -0,0 +1,124 @@
+"""
+Event counts read from metering_billing_eventvolume_hourly, a continuous aggregate of the
+events table with the number of events per organization, event name and hour. The
+aggregate is materialized every 15 minutes and queried with real-time aggregation, so the
+hours that weren't materialized yet are counted from the events table on the fly.
+
+The refresh policy only rematerializes the last EVENT_VOLUME_REFRESH_WINDOW, so events
+that arrive later than that, e.g. backfills, are only counted once the daily
+refresh_event_volume task has run. The same task materializes the existing events after
+the aggregate is created.
+
+Exact counts over arbitrary time ranges add the events of the partial hours at both ends
+of the range from the events table, which only touches the chunks of those two hours.
+"""
+import datetime
+
+import pytz
+from django.db import connection
+
+from metering_billing.db_router import read_connection
+from metering_billing.utils import now_utc
+
+EVENT_VOLUME_CAGG = "metering_billing_eventvolume_hourly"
+# start_offset of the aggregate's refresh policy
+EVENT_VOLUME_REFRESH_WINDOW = datetime.timedelta(days=32)
+ONE_HOUR = datetime.timedelta(hours=1)
+
+
+def _floor_hour(dt):
+    return dt.astimezone(pytz.UTC).replace(minute=0, second=0, microsecond=0)
+
+
+def _ceil_hour(dt):
+    floored = _floor_hour(dt)
+    return floored if floored == dt else floored + ONE_HOUR
+
+
+def count_events(organization, start, end, event_name=None) -> int:
+    """
+    Number of events the organization sent between start and end, both included. Events older than EVENT_VOLUME_REFRESH_WINDOW that were inserted after the last refresh_event_volume are missing.
+    """
+    from metering_billing.models import Event
+
+    # whole hours come from the aggregate, the partial ones at the edges from the events
+    full_hours_start = _ceil_hour(start)
+    full_hours_end = _floor_hour(end + datetime.timedelta(microseconds=1))
+    events = Event.objects.filter(organization=organization)
+    if event_name is not None:
+        events = events.filter(event_name=event_name)
+    if full_hours_start >= full_hours_end:
+        return events.filter(time_created__gte=start, time_created__lte=end).count()
+    n_events = (
+        events.filter(
+            time_created__gte=start, time_created__lt=full_hours_start
+        ).count()
+        if start < full_hours_start
+        else 0
+    )
+    n_events += events.filter(
+        time_created__gte=full_hours_end, time_created__lte=end
+    ).count()
+    query = f"""
+        SELECT COALESCE(SUM(num_events), 0)
+        FROM {EVENT_VOLUME_CAGG}
+        WHERE organization_id = %s
+            AND bucket >= %s
+            AND bucket < %s
+    """
+    params = [organization.id, full_hours_start, full_hours_end]
+    if event_name is not None:
+        query += " AND event_name = %s"
+        params.append(event_name)
+    with read_connection().cursor() as cursor:
+        cursor.execute(query, params)
+        (n_aggregated,) = cursor.fetchone()
+    return n_events + int(n_aggregated)
+
+
+def event_volume(
+    organization, start, end, granularity="day", by_event_name=False
+) -> list:
+    """
+    Number of events the organization sent per hour or per day of its timezone between start and end, optionally broken down by event name. Hours are counted whole. Has the same limitation on late events as count_events.
+    """
+    timezone = organization.timezone.zone
+    event_name_column = ", event_name" if by_event_name else ""
+    query = f"""
+        SELECT
+            date_trunc(%s, bucket AT TIME ZONE %s) AS period{event_name_column},
+            SUM(num_events) AS num_events
+        FROM {EVENT_VOLUME_CAGG}
+        WHERE organization_id = %s
+            AND bucket >= %s
+            AND bucket <= %s
+        GROUP BY period{event_name_column}
+        ORDER BY period{event_name_column}
+    """
+    params = [granularity, timezone, organization.id, _floor_hour(start), end]
+    with read_connection().cursor() as cursor:
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+    tz = pytz.timezone(timezone)
+    volume = []
+    for row in rows:
+        volume.append(
+            {
+                "time": tz.localize(row[0]),
+                "event_name": row[1] if by_event_name else None,
+                "num_events": int(row[-1]),
+            }
+        )
+    return volume
+
+
+def refresh_event_volume() -> None:
+    """
+    Materializes the hours older than the refresh policy covers. Timescale only recomputes the hours events were written to since the previous refresh, so after the first run, which loads the whole history, this only picks up late events.
+    """
+    # can't run inside a transaction, and always on the primary
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "CALL refresh_continuous_aggregate(%s, NULL, %s)",
+            [EVENT_VOLUME_CAGG, now_utc() - EVENT_VOLUME_REFRESH_WINDOW],
+        )
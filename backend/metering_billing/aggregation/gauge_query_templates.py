@@ -1,4 +1,171 @@
 ### INFRASTRUCTURE TABLES
+# The gauge state checkpoint table holds the state of every (customer, subscription
+# filter group) as of a checkpoint time, ie. taking into account every event strictly
+# before it. Each run only scans the events between the previous checkpoint (the
+# watermark) and the new one, and only writes rows for groups that changed, so the
+# latest checkpoint at or before the watermark is always the state of every group.
+GAUGE_DELTA_CHECKPOINT_UPSERT = """
+WITH prev_checkpoint AS (
+    SELECT DISTINCT ON (uuidv5_customer_id, group_values)
+        uuidv5_customer_id
+        , group_values
+        , usage_qty
+    FROM
+        "metering_billing_gaugestatecheckpoint"
+    WHERE
+        metric_id = {{ metric_id }}
+        AND checkpoint_time < '{{ checkpoint_time }}'::timestamptz
+    ORDER BY
+        uuidv5_customer_id
+        , group_values
+        , checkpoint_time DESC
+), state_change AS (
+    SELECT
+        "metering_billing_usageevent"."uuidv5_customer_id" AS uuidv5_customer_id
+        , jsonb_build_object(
+            {%- for group_by_field in group_by %}
+            '{{ group_by_field }}', "metering_billing_usageevent"."properties" ->> '{{ group_by_field }}'
+            {%- if not loop.last %},{% endif %}
+            {%- endfor %}
+        ) AS group_values
+        , SUM(
+            ("metering_billing_usageevent"."properties" ->> '{{ property_name }}')::text::decimal
+        ) AS net_state_change
+    FROM
+        "metering_billing_usageevent"
+    WHERE
+        "metering_billing_usageevent"."uuidv5_event_name" = '{{ uuidv5_event_name }}'
+        AND "metering_billing_usageevent"."organization_id" = {{ organization_id }}
+        AND "metering_billing_usageevent"."time_created" >= '{{ watermark }}'::timestamptz
+        AND "metering_billing_usageevent"."time_created" < '{{ checkpoint_time }}'::timestamptz
+        {%- for property_name, operator, comparison in numeric_filters %}
+        AND ("metering_billing_usageevent"."properties" ->> '{{ property_name }}')::text::decimal
+            {% if operator == "gt" %}
+            >
+            {% elif operator == "gte" %}
+            >=
+            {% elif operator == "lt" %}
+            <
+            {% elif operator == "lte" %}
+            <=
+            {% elif operator == "eq" %}
+            =
+            {% endif %}
+            {{ comparison }}
+        {%- endfor %}
+        {%- for property_name, operator, comparison in categorical_filters %}
+        AND (COALESCE("metering_billing_usageevent"."properties" ->> '{{ property_name }}', ''))
+            {% if operator == "isnotin" %}
+            NOT
+            {% endif %}
+            IN (
+                {%- for pval in comparison %}
+                '{{ pval }}'
+                {%- if not loop.last %},{% endif %}
+                {%- endfor %}
+            )
+        {%- endfor %}
+    GROUP BY
+        "metering_billing_usageevent"."uuidv5_customer_id"
+        , group_values
+)
+INSERT INTO "metering_billing_gaugestatecheckpoint" (
+    organization_id
+    , metric_id
+    , uuidv5_customer_id
+    , group_values
+    , checkpoint_time
+    , usage_qty
+)
+SELECT
+    {{ organization_id }}
+    , {{ metric_id }}
+    , state_change.uuidv5_customer_id
+    , state_change.group_values
+    , '{{ checkpoint_time }}'::timestamptz
+    , COALESCE(prev_checkpoint.usage_qty, 0) + state_change.net_state_change
+FROM
+    state_change
+LEFT JOIN
+    prev_checkpoint
+USING (uuidv5_customer_id, group_values)
+ON CONFLICT (metric_id, uuidv5_customer_id, group_values, checkpoint_time)
+DO UPDATE SET usage_qty = EXCLUDED.usage_qty
+"""
+
+GAUGE_TOTAL_CHECKPOINT_UPSERT = """
+WITH state_change AS (
+    SELECT
+        "metering_billing_usageevent"."uuidv5_customer_id" AS uuidv5_customer_id
+        , jsonb_build_object(
+            {%- for group_by_field in group_by %}
+            '{{ group_by_field }}', "metering_billing_usageevent"."properties" ->> '{{ group_by_field }}'
+            {%- if not loop.last %},{% endif %}
+            {%- endfor %}
+        ) AS group_values
+        , last(
+            ("metering_billing_usageevent"."properties" ->> '{{ property_name }}')::text::decimal,
+            "metering_billing_usageevent"."time_created"
+        ) AS usage_qty
+    FROM
+        "metering_billing_usageevent"
+    WHERE
+        "metering_billing_usageevent"."uuidv5_event_name" = '{{ uuidv5_event_name }}'
+        AND "metering_billing_usageevent"."organization_id" = {{ organization_id }}
+        AND "metering_billing_usageevent"."time_created" >= '{{ watermark }}'::timestamptz
+        AND "metering_billing_usageevent"."time_created" < '{{ checkpoint_time }}'::timestamptz
+        {%- for property_name, operator, comparison in numeric_filters %}
+        AND ("metering_billing_usageevent"."properties" ->> '{{ property_name }}')::text::decimal
+            {% if operator == "gt" %}
+            >
+            {% elif operator == "gte" %}
+            >=
+            {% elif operator == "lt" %}
+            <
+            {% elif operator == "lte" %}
+            <=
+            {% elif operator == "eq" %}
+            =
+            {% endif %}
+            {{ comparison }}
+        {%- endfor %}
+        {%- for property_name, operator, comparison in categorical_filters %}
+        AND (COALESCE("metering_billing_usageevent"."properties" ->> '{{ property_name }}', ''))
+            {% if operator == "isnotin" %}
+            NOT
+            {% endif %}
+            IN (
+                {%- for pval in comparison %}
+                '{{ pval }}'
+                {%- if not loop.last %},{% endif %}
+                {%- endfor %}
+            )
+        {%- endfor %}
+    GROUP BY
+        "metering_billing_usageevent"."uuidv5_customer_id"
+        , group_values
+)
+INSERT INTO "metering_billing_gaugestatecheckpoint" (
+    organization_id
+    , metric_id
+    , uuidv5_customer_id
+    , group_values
+    , checkpoint_time
+    , usage_qty
+)
+SELECT
+    {{ organization_id }}
+    , {{ metric_id }}
+    , state_change.uuidv5_customer_id
+    , state_change.group_values
+    , '{{ checkpoint_time }}'::timestamptz
+    , state_change.usage_qty
+FROM
+    state_change
+ON CONFLICT (metric_id, uuidv5_customer_id, group_values, checkpoint_time)
+DO UPDATE SET usage_qty = EXCLUDED.usage_qty
+"""
+
 
 ### FIRST ALL DELTA QUERIES
 GAUGE_DELTA_CUMULATIVE_SUM = """
@@ -54,24 +221,23 @@ GROUP BY
     , time_bucket('1 day', "metering_billing_usageevent"."time_created")
 """
 
-# cumsum_daily_cagg: sum of daily sum of deltas. From cagg so its quick
-# current day sum: more delta sums from same day, but not from cagg and before now
-# prev_value: the "starting point" for the query
+# checkpoint_state: latest persisted gauge state at or before the checkpoint watermark
+# state_change_since_checkpoint: delta sums between the watermark and the start date
+# prev_value: the "starting point" for the query, one row per subscription filter group
 # cumulative_sum_per_event: get cumsum for each event in the time range
 GAUGE_DELTA_GET_TOTAL_USAGE_WITH_PRORATION = """
-WITH cumsum_cagg_daily AS (
-    SELECT
-        uuidv5_customer_id
-        {%- for group_by_field in group_by %}
-        , {{ group_by_field }}
-        {%- endfor %}
-        , SUM(day_net_state_change) AS prev_days_usage_qty
+WITH checkpoint_state AS (
+    SELECT DISTINCT ON (group_values)
+        group_values
+        , usage_qty
     FROM
-        {{ cumsum_cagg }}
+        "metering_billing_gaugestatecheckpoint"
     WHERE
-        uuidv5_customer_id = '{{ uuidv5_customer_id }}'
+        metric_id = {{ metric_id }}
+        AND uuidv5_customer_id = '{{ uuidv5_customer_id }}'
+        AND checkpoint_time <= '{{ checkpoint_time }}'::timestamptz
         {%- for property_name, property_values in filter_properties.items() %}
-        AND {{ property_name }}
+        AND group_values ->> '{{ property_name }}'
             IN (
                 {%- for pval in property_values %}
                 '{{ pval }}'
@@ -79,30 +245,38 @@ WITH cumsum_cagg_daily AS (
                 {%- endfor %}
             )
         {%- endfor %}
-        AND time_bucket < date_trunc('day', '{{ start_date }}'::timestamptz)
-        AND time_bucket <= CURRENT_DATE
-    GROUP BY
-        uuidv5_customer_id
-        {%- for group_by_field in group_by %}
-        , {{ group_by_field }}
-        {%- endfor %}
-), current_day_sum AS (
+    ORDER BY
+        group_values
+        , checkpoint_time DESC
+), state_change_since_checkpoint AS (
     SELECT
-        "metering_billing_usageevent"."uuidv5_customer_id" AS uuidv5_customer_id
-        {%- for group_by_field in group_by %}
-        , "metering_billing_usageevent"."properties" ->> '{{ group_by_field }}' AS {{ group_by_field }}
-        {%- endfor %}
+        jsonb_build_object(
+            {%- for group_by_field in group_by %}
+            '{{ group_by_field }}', "metering_billing_usageevent"."properties" ->> '{{ group_by_field }}'
+            {%- if not loop.last %},{% endif %}
+            {%- endfor %}
+        ) AS group_values
         , SUM(
             ("metering_billing_usageevent"."properties" ->> '{{ property_name }}')::text::decimal
-        ) AS today_change
+        ) AS net_state_change
     FROM
         "metering_billing_usageevent"
     WHERE
         "metering_billing_usageevent"."uuidv5_event_name" = '{{ uuidv5_event_name }}'
         AND "metering_billing_usageevent"."organization_id" = {{ organization_id }}
+        AND "metering_billing_usageevent"."uuidv5_customer_id" = '{{ uuidv5_customer_id }}'
         AND "metering_billing_usageevent"."time_created" <= NOW()
+        AND "metering_billing_usageevent"."time_created" >= '{{ checkpoint_time }}'::timestamptz
         AND "metering_billing_usageevent"."time_created" < '{{ start_date }}'::timestamptz
-        AND date_trunc('day', "metering_billing_usageevent"."time_created") = date_trunc('day', '{{ start_date }}'::timestamptz)
+        {%- for property_name, property_values in filter_properties.items() %}
+        AND "metering_billing_usageevent"."properties" ->> '{{ property_name }}'
+            IN (
+                {%- for pval in property_values %}
+                '{{ pval }}'
+                {%- if not loop.last %},{% endif %}
+                {%- endfor %}
+            )
+        {%- endfor %}
         {%- for property_name, operator, comparison in numeric_filters %}
         AND ("metering_billing_usageevent"."properties" ->> '{{ property_name }}')::text::decimal
             {% if operator == "gt" %}
@@ -131,22 +305,20 @@ WITH cumsum_cagg_daily AS (
             )
         {%- endfor %}
     GROUP BY
-        uuidv5_customer_id
-        {%- for group_by_field in group_by %}
-        , "metering_billing_usageevent"."properties" ->> '{{ group_by_field }}'
-        {%- endfor %}
+        group_values
 ), prev_value AS (
     SELECT
-        uuidv5_customer_id
+        '{{ uuidv5_customer_id }}'::uuid AS uuidv5_customer_id
         {%- for group_by_field in group_by %}
-        , {{ group_by_field }}
+        , group_values ->> '{{ group_by_field }}' AS {{ group_by_field }}
         {%- endfor %}
-        , COALESCE(prev_days_usage_qty, 0) + COALESCE(today_change, 0) AS prev_usage_qty
+        , COALESCE(checkpoint_state.usage_qty, 0)
+            + COALESCE(state_change_since_checkpoint.net_state_change, 0) AS prev_usage_qty
     FROM
-        cumsum_cagg_daily
-    LEFT JOIN
-        current_day_sum
-    USING (uuidv5_customer_id {%- for group_by_field in group_by %}, {{ group_by_field }}{% endfor %})
+        checkpoint_state
+    FULL OUTER JOIN
+        state_change_since_checkpoint
+    USING (group_values)
 ),
 cumulative_sum_per_event AS (
     SELECT
@@ -168,6 +340,9 @@ cumulative_sum_per_event AS (
         "metering_billing_usageevent" AS event_table
     LEFT JOIN prev_value
         ON event_table.uuidv5_customer_id = prev_value.uuidv5_customer_id
+        {%- for group_by_field in group_by %}
+        AND event_table.properties ->> '{{ group_by_field }}' IS NOT DISTINCT FROM prev_value.{{ group_by_field }}
+        {%- endfor %}
     WHERE
        event_table.uuidv5_event_name = '{{ uuidv5_event_name }}'
         AND event_table.organization_id = {{ organization_id }}
@@ -216,10 +391,12 @@ proration_level_query AS (
         , locf(
             value => MAX(cumulative_usage_qty),
             prev => (
-                SELECT COALESCE(
-                    (select prev_usage_qty from prev_value limit 1),
-                    0
-                ) AS prev_usage_qty
+                SELECT COALESCE(SUM(prev_value.prev_usage_qty), 0)
+                FROM prev_value
+                WHERE TRUE
+                {%- for group_by_field in group_by %}
+                    AND prev_value.{{ group_by_field }} IS NOT DISTINCT FROM cumulative_sum_per_event.{{ group_by_field }}
+                {%- endfor %}
             )
         ) AS usage_qty
         {%- endif %}
@@ -290,9 +467,8 @@ SELECT
             from normalized_query
         ),
         (
-            select prev_usage_qty
+            select SUM(prev_usage_qty)
             from prev_value
-            limit 1
         )
     ) AS usage_qty
 """
@@ -539,19 +715,18 @@ DROP FUNCTION IF EXISTS tg_refresh_{{ cagg_name }};
 """
 
 GAUGE_DELTA_GET_CURRENT_USAGE = """
-WITH cumsum_cagg_daily AS (
-    SELECT
-        uuidv5_customer_id
-        {%- for group_by_field in group_by %}
-        , {{ group_by_field }}
-        {%- endfor %}
-        , SUM(day_net_state_change) AS prev_days_usage_qty
+WITH checkpoint_state AS (
+    SELECT DISTINCT ON (group_values)
+        group_values
+        , usage_qty
     FROM
-        {{ cumsum_cagg }}
+        "metering_billing_gaugestatecheckpoint"
     WHERE
-        uuidv5_customer_id = '{{ uuidv5_customer_id }}'
+        metric_id = {{ metric_id }}
+        AND uuidv5_customer_id = '{{ uuidv5_customer_id }}'
+        AND checkpoint_time <= '{{ checkpoint_time }}'::timestamptz
         {%- for property_name, property_values in filter_properties.items() %}
-        AND {{ property_name }}
+        AND group_values ->> '{{ property_name }}'
             IN (
                 {%- for pval in property_values %}
                 '{{ pval }}'
@@ -559,29 +734,37 @@ WITH cumsum_cagg_daily AS (
                 {%- endfor %}
             )
         {%- endfor %}
-        AND time_bucket < CURRENT_DATE
-    GROUP BY
-        uuidv5_customer_id
-        {%- for group_by_field in group_by %}
-        , {{ group_by_field }}
-        {%- endfor %}
-), current_day_sum AS (
+    ORDER BY
+        group_values
+        , checkpoint_time DESC
+), state_change_since_checkpoint AS (
     SELECT
-        "metering_billing_usageevent"."uuidv5_customer_id" AS uuidv5_customer_id
-        {%- for group_by_field in group_by %}
-        ,"metering_billing_usageevent"."properties" ->> '{{ group_by_field }}' AS {{ group_by_field }}
-        {%- endfor %}
-        , "metering_billing_usageevent"."time_created" AS time_bucket
+        jsonb_build_object(
+            {%- for group_by_field in group_by %}
+            '{{ group_by_field }}', "metering_billing_usageevent"."properties" ->> '{{ group_by_field }}'
+            {%- if not loop.last %},{% endif %}
+            {%- endfor %}
+        ) AS group_values
         , SUM(
             ("metering_billing_usageevent"."properties" ->> '{{ property_name }}')::text::decimal
-        ) AS today_change
+        ) AS net_state_change
     FROM
         "metering_billing_usageevent"
     WHERE
         "metering_billing_usageevent"."uuidv5_event_name" = '{{ uuidv5_event_name }}'
         AND "metering_billing_usageevent"."organization_id" = {{ organization_id }}
+        AND "metering_billing_usageevent"."uuidv5_customer_id" = '{{ uuidv5_customer_id }}'
         AND "metering_billing_usageevent"."time_created" <= NOW()
-        AND date_trunc("day", "metering_billing_usageevent"."time_created") = CURRENT_DATE
+        AND "metering_billing_usageevent"."time_created" >= '{{ checkpoint_time }}'::timestamptz
+        {%- for property_name, property_values in filter_properties.items() %}
+        AND "metering_billing_usageevent"."properties" ->> '{{ property_name }}'
+            IN (
+                {%- for pval in property_values %}
+                '{{ pval }}'
+                {%- if not loop.last %},{% endif %}
+                {%- endfor %}
+            )
+        {%- endfor %}
         {%- for property_name, operator, comparison in numeric_filters %}
         AND ("metering_billing_usageevent"."properties" ->> '{{ property_name }}')::text::decimal
             {% if operator == "gt" %}
@@ -608,24 +791,20 @@ WITH cumsum_cagg_daily AS (
                 {%- if not loop.last %},{% endif %}
                 {%- endfor %}
             )
-    GROUP BY
-        uuidv5_customer_id
-        {%- for group_by_field in group_by %}
-        , {{ group_by_field }}
         {%- endfor %}
-        , "metering_billing_usageevent"."time_created"
+    GROUP BY
+        group_values
 )
 SELECT
-    uuidv5_customer_id
-    {%- for group_by_field in group_by %}
-    , {{ group_by_field }}
-    {%- endfor %}
-    , COALESCE(prev_days_usage_qty, 0) + COALESCE(today_change, 0) AS current_usage_qty
+    SUM(
+        COALESCE(checkpoint_state.usage_qty, 0)
+        + COALESCE(state_change_since_checkpoint.net_state_change, 0)
+    ) AS usage_qty
 FROM
-    cumsum_cagg_daily
+    checkpoint_state
 FULL OUTER JOIN
-    current_day_sum
-USING (uuidv5_customer_id {%- for group_by_field in group_by %}, {{ group_by_field }}{% endfor %});
+    state_change_since_checkpoint
+USING (group_values)
 """
 
 GAUGE_DELTA_TOTAL_PER_DAY = """
@@ -849,47 +1028,144 @@ GROUP BY
 """
 
 GAUGE_TOTAL_GET_CURRENT_USAGE = """
-SELECT
-    uuidv5_customer_id
-    {%- for group_by_field in group_by %}
-    , {{ group_by_field }}
-    {%- endfor %}
-    , last(cumulative_usage_qty, time_bucket) AS usage_qty
-FROM
-    {{ cumsum_cagg }}
-WHERE
-    uuidv5_customer_id = '{{ uuidv5_customer_id }}'
-    {%- for property_name, property_values in filter_properties.items() %}
-    AND {{ property_name }}
-        IN (
-            {%- for pval in property_values %}
-            '{{ pval }}'
+WITH checkpoint_state AS (
+    SELECT DISTINCT ON (group_values)
+        group_values
+        , usage_qty
+    FROM
+        "metering_billing_gaugestatecheckpoint"
+    WHERE
+        metric_id = {{ metric_id }}
+        AND uuidv5_customer_id = '{{ uuidv5_customer_id }}'
+        AND checkpoint_time <= '{{ checkpoint_time }}'::timestamptz
+        {%- for property_name, property_values in filter_properties.items() %}
+        AND group_values ->> '{{ property_name }}'
+            IN (
+                {%- for pval in property_values %}
+                '{{ pval }}'
+                {%- if not loop.last %},{% endif %}
+                {%- endfor %}
+            )
+        {%- endfor %}
+    ORDER BY
+        group_values
+        , checkpoint_time DESC
+), latest_since_checkpoint AS (
+    SELECT
+        jsonb_build_object(
+            {%- for group_by_field in group_by %}
+            '{{ group_by_field }}', "metering_billing_usageevent"."properties" ->> '{{ group_by_field }}'
             {%- if not loop.last %},{% endif %}
             {%- endfor %}
-        )
-    {%- endfor %}
-    AND time_bucket <= NOW()
-GROUP BY
-    uuidv5_customer_id
-    {%- for group_by_field in group_by %}
-    , {{ group_by_field }}
-    {%- endfor %}
+        ) AS group_values
+        , last(
+            ("metering_billing_usageevent"."properties" ->> '{{ property_name }}')::text::decimal,
+            "metering_billing_usageevent"."time_created"
+        ) AS usage_qty
+    FROM
+        "metering_billing_usageevent"
+    WHERE
+        "metering_billing_usageevent"."uuidv5_event_name" = '{{ uuidv5_event_name }}'
+        AND "metering_billing_usageevent"."organization_id" = {{ organization_id }}
+        AND "metering_billing_usageevent"."uuidv5_customer_id" = '{{ uuidv5_customer_id }}'
+        AND "metering_billing_usageevent"."time_created" <= NOW()
+        AND "metering_billing_usageevent"."time_created" >= '{{ checkpoint_time }}'::timestamptz
+        {%- for property_name, property_values in filter_properties.items() %}
+        AND "metering_billing_usageevent"."properties" ->> '{{ property_name }}'
+            IN (
+                {%- for pval in property_values %}
+                '{{ pval }}'
+                {%- if not loop.last %},{% endif %}
+                {%- endfor %}
+            )
+        {%- endfor %}
+        {%- for property_name, operator, comparison in numeric_filters %}
+        AND ("metering_billing_usageevent"."properties" ->> '{{ property_name }}')::text::decimal
+            {% if operator == "gt" %}
+            >
+            {% elif operator == "gte" %}
+            >=
+            {% elif operator == "lt" %}
+            <
+            {% elif operator == "lte" %}
+            <=
+            {% elif operator == "eq" %}
+            =
+            {% endif %}
+            {{ comparison }}
+        {%- endfor %}
+        {%- for property_name, operator, comparison in categorical_filters %}
+        AND (COALESCE("metering_billing_usageevent"."properties" ->> '{{ property_name }}', ''))
+            {% if operator == "isnotin" %}
+            NOT
+            {% endif %}
+            IN (
+                {%- for pval in comparison %}
+                '{{ pval }}'
+                {%- if not loop.last %},{% endif %}
+                {%- endfor %}
+            )
+        {%- endfor %}
+    GROUP BY
+        group_values
+)
+SELECT
+    SUM(
+        COALESCE(latest_since_checkpoint.usage_qty, checkpoint_state.usage_qty, 0)
+    ) AS usage_qty
+FROM
+    checkpoint_state
+FULL OUTER JOIN
+    latest_since_checkpoint
+USING (group_values)
 """
 
 GAUGE_TOTAL_GET_TOTAL_USAGE_WITH_PRORATION = """
-WITH prev_state AS (
-    SELECT
-        uuidv5_customer_id
-        {%- for group_by_field in group_by %}
-        , {{ group_by_field }}
+WITH checkpoint_state AS (
+    SELECT DISTINCT ON (group_values)
+        group_values
+        , usage_qty
+    FROM
+        "metering_billing_gaugestatecheckpoint"
+    WHERE
+        metric_id = {{ metric_id }}
+        AND uuidv5_customer_id = '{{ uuidv5_customer_id }}'
+        AND checkpoint_time <= '{{ checkpoint_time }}'::timestamptz
+        {%- for property_name, property_values in filter_properties.items() %}
+        AND group_values ->> '{{ property_name }}'
+            IN (
+                {%- for pval in property_values %}
+                '{{ pval }}'
+                {%- if not loop.last %},{% endif %}
+                {%- endfor %}
+            )
         {%- endfor %}
-        , last(cumulative_usage_qty, time_bucket) AS prev_usage_qty
+    ORDER BY
+        group_values
+        , checkpoint_time DESC
+), latest_since_checkpoint AS (
+    SELECT
+        jsonb_build_object(
+            {%- for group_by_field in group_by %}
+            '{{ group_by_field }}', "metering_billing_usageevent"."properties" ->> '{{ group_by_field }}'
+            {%- if not loop.last %},{% endif %}
+            {%- endfor %}
+        ) AS group_values
+        , last(
+            ("metering_billing_usageevent"."properties" ->> '{{ property_name }}')::text::decimal,
+            "metering_billing_usageevent"."time_created"
+        ) AS usage_qty
     FROM
-        {{ cumsum_cagg }}
+        "metering_billing_usageevent"
     WHERE
-        uuidv5_customer_id = '{{ uuidv5_customer_id }}'
+        "metering_billing_usageevent"."uuidv5_event_name" = '{{ uuidv5_event_name }}'
+        AND "metering_billing_usageevent"."organization_id" = {{ organization_id }}
+        AND "metering_billing_usageevent"."uuidv5_customer_id" = '{{ uuidv5_customer_id }}'
+        AND "metering_billing_usageevent"."time_created" <= NOW()
+        AND "metering_billing_usageevent"."time_created" >= '{{ checkpoint_time }}'::timestamptz
+        AND "metering_billing_usageevent"."time_created" < '{{ start_date }}'::timestamptz
         {%- for property_name, property_values in filter_properties.items() %}
-        AND {{ property_name }}
+        AND "metering_billing_usageevent"."properties" ->> '{{ property_name }}'
             IN (
                 {%- for pval in property_values %}
                 '{{ pval }}'
@@ -897,12 +1173,50 @@ WITH prev_state AS (
                 {%- endfor %}
             )
         {%- endfor %}
-        AND time_bucket < '{{ start_date }}'::timestamptz
+        {%- for property_name, operator, comparison in numeric_filters %}
+        AND ("metering_billing_usageevent"."properties" ->> '{{ property_name }}')::text::decimal
+            {% if operator == "gt" %}
+            >
+            {% elif operator == "gte" %}
+            >=
+            {% elif operator == "lt" %}
+            <
+            {% elif operator == "lte" %}
+            <=
+            {% elif operator == "eq" %}
+            =
+            {% endif %}
+            {{ comparison }}
+        {%- endfor %}
+        {%- for property_name, operator, comparison in categorical_filters %}
+        AND (COALESCE("metering_billing_usageevent"."properties" ->> '{{ property_name }}', ''))
+            {% if operator == "isnotin" %}
+            NOT
+            {% endif %}
+            IN (
+                {%- for pval in comparison %}
+                '{{ pval }}'
+                {%- if not loop.last %},{% endif %}
+                {%- endfor %}
+            )
+        {%- endfor %}
     GROUP BY
-        uuidv5_customer_id
+        group_values
+), prev_state AS (
+    SELECT
+        '{{ uuidv5_customer_id }}'::uuid AS uuidv5_customer_id
         {%- for group_by_field in group_by %}
-        , {{ group_by_field }}
+        , group_values ->> '{{ group_by_field }}' AS {{ group_by_field }}
         {%- endfor %}
+        , COALESCE(
+            latest_since_checkpoint.usage_qty,
+            checkpoint_state.usage_qty
+        ) AS prev_usage_qty
+    FROM
+        checkpoint_state
+    FULL OUTER JOIN
+        latest_since_checkpoint
+    USING (group_values)
 ),
 prev_value AS (
     SELECT
@@ -0,0 +1,287 @@
+"""
+Sliding-window counters that answer "what is the current rate" for RATE metrics without
+going to the database. The window of a metric (1 unit of its granularity) is split into
+RATE_COUNTER_BUCKETS buckets that live in the cache. The event tail (event_tail.py)
+increments the bucket of every inserted event, whichever service ingested it, reads sum
+the buckets covering the window, and a periodic task rebuilds the buckets from the events
+table so the counters never drift for long.
+
+Counters are kept for every subset of the organization's subscription filters present in
+an event, so a subscription record reads exactly one counter no matter which filters it
+has. Only COUNT and SUM aggregations over windows of at most a day are supported, every
+other metric keeps using the query in RateHandler.
+"""
+import datetime
+import hashlib
+import itertools
+import json
+import logging
+import uuid
+from decimal import Decimal
+from typing import Optional
+
+from dateutil import parser
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from jinja2 import Template
+
+from metering_billing.aggregation.event_filters import (
+    event_passes_filters,
+    event_usage,
+    property_as_text,
+)
+from metering_billing.aggregation.event_tail import (
+    event_tail_is_fresh,
+    get_event_tail_watermark,
+)
+from metering_billing.utils import customer_id_uuidv5, namedtuplefetchall, now_utc
+from metering_billing.utils.enums import (
+    METRIC_AGGREGATION,
+    METRIC_GRANULARITY,
+    METRIC_STATUS,
+    METRIC_TYPE,
+)
+
+logger = logging.getLogger("django.server")
+
+RATE_COUNTERS_ENABLED = settings.RATE_COUNTERS_ENABLED
+EVENT_NAME_NAMESPACE = settings.EVENT_NAME_NAMESPACE
+
+RATE_COUNTER_BUCKETS = 60
+# the cache only does atomic increments on integers, so we store fixed point values
+RATE_COUNTER_SCALE = 10**6
+# counters are only trusted while a reconciliation has run recently
+RATE_COUNTER_RECONCILED_TIMEOUT = 30 * 60
+
+WINDOW_SECONDS = {
+    METRIC_GRANULARITY.SECOND: 1,
+    METRIC_GRANULARITY.MINUTE: 60,
+    METRIC_GRANULARITY.HOUR: 60 * 60,
+    METRIC_GRANULARITY.DAY: 24 * 60 * 60,
+}
+SUPPORTED_AGGREGATIONS = [METRIC_AGGREGATION.COUNT, METRIC_AGGREGATION.SUM]
+
+
+def rate_counter_supported(metric) -> bool:
+    return (
+        RATE_COUNTERS_ENABLED
+        and metric.metric_type == METRIC_TYPE.RATE
+        and metric.usage_aggregation_type in SUPPORTED_AGGREGATIONS
+        and metric.granularity in WINDOW_SECONDS
+    )
+
+
+def _bucket_seconds(metric) -> int:
+    return max(1, WINDOW_SECONDS[metric.granularity] // RATE_COUNTER_BUCKETS)
+
+
+def _num_buckets(metric) -> int:
+    return WINDOW_SECONDS[metric.granularity] // _bucket_seconds(metric)
+
+
+def _bucket_index(metric, time: datetime.datetime) -> int:
+    return int(time.timestamp()) // _bucket_seconds(metric)
+
+
+def _filters_digest(filter_pairs) -> str:
+    pairs = sorted((str(key), str(value)) for key, value in filter_pairs)
+    if len(pairs) == 0:
+        return "all"
+    return hashlib.md5(json.dumps(pairs).encode()).hexdigest()[:16]
+
+
+def _counter_key(metric, uuidv5_customer_id, filters_digest, bucket) -> str:
+    return "rate_counter:{}:{}:{}:{}".format(
+        metric.metric_id.hex,
+        uuid.UUID(str(uuidv5_customer_id)).hex,
+        filters_digest,
+        bucket,
+    )
+
+
+def _reconciled_key(metric) -> str:
+    return "rate_counter:{}:reconciled".format(metric.metric_id.hex)
+
+
+def _filter_subsets(group_values: dict):
+    pairs = [(key, value) for key, value in group_values.items() if value is not None]
+    for n in range(len(pairs) + 1):
+        yield from itertools.combinations(pairs, n)
+
+
+def rate_counter_event_names() -> dict:
+    """
+    Names of the events counted by the rate counters, per organization pk.
+    """
+    from metering_billing.models import Metric
+
+    if not RATE_COUNTERS_ENABLED:
+        return {}
+    event_names = {}
+    for metric in Metric.objects.filter(
+        metric_type=METRIC_TYPE.RATE,
+        status=METRIC_STATUS.ACTIVE,
+        usage_aggregation_type__in=SUPPORTED_AGGREGATIONS,
+        granularity__in=WINDOW_SECONDS.keys(),
+    ).only("organization_id", "event_name"):
+        event_names.setdefault(metric.organization_id, set()).add(metric.event_name)
+    return event_names
+
+
+def record_events(organization, events_list: list) -> None:
+    """
+    Feed a batch of inserted events into the counters of every RATE metric of the organization that tracks them.
+    """
+    from metering_billing.models import Metric
+
+    if not RATE_COUNTERS_ENABLED:
+        return
+    event_names = {event["event_name"] for event in events_list}
+    metrics = [
+        metric
+        for metric in Metric.objects.filter(
+            organization=organization,
+            metric_type=METRIC_TYPE.RATE,
+            status=METRIC_STATUS.ACTIVE,
+            event_name__in=event_names,
+        ).prefetch_related("numeric_filters", "categorical_filters")
+        if rate_counter_supported(metric)
+    ]
+    if len(metrics) == 0:
+        return
+    group_by = organization.subscription_filter_keys
+    now = now_utc()
+    increments = {}
+    for event in events_list:
+        time_created = event["time_created"]
+        if isinstance(time_created, str):
+            time_created = parser.isoparse(time_created)
+        properties = event.get("properties") or {}
+        uuidv5_customer_id = customer_id_uuidv5(event["cust_id"])
+        group_values = {key: property_as_text(properties.get(key)) for key in group_by}
+        for metric in metrics:
+            if metric.event_name != event["event_name"]:
+                continue
+            # events older than the window can't change the current rate
+            window_start = now - datetime.timedelta(
+                seconds=WINDOW_SECONDS[metric.granularity]
+            )
+            if time_created < window_start or time_created > now:
+                continue
+            if not event_passes_filters(metric, properties):
+                continue
+            usage = event_usage(metric, properties)
+            if usage is None:
+                continue
+            bucket = _bucket_index(metric, time_created)
+            for filter_pairs in _filter_subsets(group_values):
+                key = _counter_key(
+                    metric, uuidv5_customer_id, _filters_digest(filter_pairs), bucket
+                )
+                if key not in increments:
+                    increments[key] = [metric, 0]
+                increments[key][1] += int(usage * RATE_COUNTER_SCALE)
+    for key, (metric, amount) in increments.items():
+        timeout = WINDOW_SECONDS[metric.granularity] + 2 * _bucket_seconds(metric)
+        cache.add(key, 0, timeout=timeout)
+        try:
+            cache.incr(key, amount)
+        except ValueError:
+            # expired between the add and the incr
+            cache.set(key, amount, timeout=timeout)
+
+
+def get_current_rate(
+    metric, uuidv5_customer_id, subscription_filters, start_date
+) -> Optional[Decimal]:
+    """
+    Returns the current rate since start_date from the counters, or None if they can't be trusted and the caller should query the database instead.
+    """
+    if not rate_counter_supported(metric):
+        return None
+    if cache.get(_reconciled_key(metric)) is None or not event_tail_is_fresh():
+        return None
+    now = now_utc()
+    # the buckets are too coarse to cut the window at the start of a billing record
+    if start_date > now - datetime.timedelta(
+        seconds=WINDOW_SECONDS[metric.granularity]
+    ):
+        return None
+    digest = _filters_digest(subscription_filters)
+    current_bucket = _bucket_index(metric, now)
+    keys = [
+        _counter_key(metric, uuidv5_customer_id, digest, bucket)
+        for bucket in range(
+            current_bucket - _num_buckets(metric) + 1, current_bucket + 1
+        )
+    ]
+    values = cache.get_many(keys)
+    return Decimal(sum(values.values())) / RATE_COUNTER_SCALE
+
+
+def reconcile_rate_counters(metric) -> None:
+    """
+    Rebuild every counter of the metric from the events inserted up to the event tail's watermark, the tail counts the ones after it. Callers hold the event tail lock so the watermark doesn't move while this runs.
+    """
+    from metering_billing.models import Organization
+
+    from .rate_query_templates import RATE_SLIDING_WINDOW_BUCKETS
+
+    if not rate_counter_supported(metric):
+        return
+    inserted_until = get_event_tail_watermark()
+    if inserted_until is None:
+        # the tail hasn't run yet, the events it will count aren't known
+        return
+    organization = Organization.objects.get(id=metric.organization.id)
+    group_by = organization.subscription_filter_keys
+    bucket_seconds = _bucket_seconds(metric)
+    num_buckets = _num_buckets(metric)
+    now = now_utc()
+    current_bucket = _bucket_index(metric, now)
+    first_bucket = current_bucket - num_buckets + 1
+    injection_dict = {
+        "query_type": metric.usage_aggregation_type,
+        "property_name": metric.property_name,
+        "group_by": group_by,
+        "uuidv5_event_name": uuid.uuid5(EVENT_NAME_NAMESPACE, metric.event_name),
+        "organization_id": organization.id,
+        "numeric_filters": [
+            (x.property_name, x.operator, x.comparison_value)
+            for x in metric.numeric_filters.all()
+        ],
+        "categorical_filters": [
+            (x.property_name, x.operator, x.comparison_value)
+            for x in metric.categorical_filters.all()
+        ],
+        "bucket_seconds": bucket_seconds,
+        "window_start": datetime.datetime.fromtimestamp(
+            first_bucket * bucket_seconds, tz=datetime.timezone.utc
+        ),
+        "reference_time": now,
+        "inserted_until": inserted_until,
+    }
+    query = Template(RATE_SLIDING_WINDOW_BUCKETS).render(**injection_dict)
+    with connection.cursor() as cursor:
+        cursor.execute(query)
+        results = namedtuplefetchall(cursor)
+    counters = {}
+    for result in results:
+        group_values = {key: getattr(result, key) for key in group_by}
+        for filter_pairs in _filter_subsets(group_values):
+            counter = (result.uuidv5_customer_id, _filters_digest(filter_pairs))
+            if counter not in counters:
+                counters[counter] = {}
+            counters[counter][result.bucket] = counters[counter].get(
+                result.bucket, 0
+            ) + int((result.usage_qty or 0) * RATE_COUNTER_SCALE)
+    timeout = WINDOW_SECONDS[metric.granularity] + 2 * bucket_seconds
+    values = {}
+    for (uuidv5_customer_id, digest), buckets in counters.items():
+        for bucket in range(first_bucket, current_bucket + 1):
+            key = _counter_key(metric, uuidv5_customer_id, digest, bucket)
+            values[key] = buckets.get(bucket, 0)
+    if values:
+        cache.set_many(values, timeout=timeout)
+    cache.set(_reconciled_key(metric), now.isoformat(), RATE_COUNTER_RECONCILED_TIMEOUT)
@@ -336,3 +336,63 @@ GROUP BY
     COALESCE(top_n.uuidv5_customer_id, uuid_nil())
     , per_customer.time_bucket
 """
+
+# per-bucket usage over the sliding window, used to rebuild the rate counters
+RATE_SLIDING_WINDOW_BUCKETS = """
+SELECT
+    "metering_billing_usageevent"."uuidv5_customer_id" AS uuidv5_customer_id
+    {%- for group_by_field in group_by %}
+    , "metering_billing_usageevent"."properties" ->> '{{ group_by_field }}' AS {{ group_by_field }}
+    {%- endfor %}
+    , FLOOR(
+        EXTRACT(EPOCH FROM "metering_billing_usageevent"."time_created") / {{ bucket_seconds }}
+    )::bigint AS bucket
+    , {%- if query_type == "count" %}
+    COUNT("metering_billing_usageevent"."idempotency_id")
+    {%- elif query_type == "sum" %}
+    SUM(
+        ("metering_billing_usageevent"."properties" ->> '{{ property_name }}')::text::decimal
+    )
+    {%- endif %} AS usage_qty
+FROM
+    "metering_billing_usageevent"
+WHERE
+    "metering_billing_usageevent"."uuidv5_event_name" = '{{ uuidv5_event_name }}'
+    AND "metering_billing_usageevent"."organization_id" = {{ organization_id }}
+    AND "metering_billing_usageevent"."time_created" <= '{{ reference_time }}'::timestamptz
+    AND "metering_billing_usageevent"."time_created" >= '{{ window_start }}'::timestamptz
+    AND "metering_billing_usageevent"."inserted_at" <= '{{ inserted_until }}'::timestamptz
+    {%- for property_name, operator, comparison in numeric_filters %}
+    AND ("metering_billing_usageevent"."properties" ->> '{{ property_name }}')::text::decimal
+        {% if operator == "gt" %}
+        >
+        {% elif operator == "gte" %}
+        >=
+        {% elif operator == "lt" %}
+        <
+        {% elif operator == "lte" %}
+        <=
+        {% elif operator == "eq" %}
+        =
+        {% endif %}
+        {{ comparison }}
+    {%- endfor %}
+    {%- for property_name, operator, comparison in categorical_filters %}
+    AND (COALESCE("metering_billing_usageevent"."properties" ->> '{{ property_name }}', ''))
+        {% if operator == "isnotin" %}
+        NOT
+        {% endif %}
+        IN (
+            {%- for pval in comparison %}
+            '{{ pval }}'
+            {%- if not loop.last %},{% endif %}
+            {%- endfor %}
+        )
+    {%- endfor %}
+GROUP BY
+    "metering_billing_usageevent"."uuidv5_customer_id"
+    {%- for group_by_field in group_by %}
+    , "metering_billing_usageevent"."properties" ->> '{{ group_by_field }}'
+    {%- endfor %}
+    , bucket
+"""
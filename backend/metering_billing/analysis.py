@@ -0,0 +1,344 @@
+"""
+Analysis engine. Computes the ANALYSIS_KPI values, revenue per day, revenue per metric and
+top customers of every plan version an organization had subscriptions on during the
+analysis period. Revenue comes from the daily revenue ledger and costs from the cost
+metrics, so every figure is a grouped query instead of a loop over subscriptions. Plan
+versions are processed in batches and the results so far are saved to the analysis after
+every batch, with a progress between 0 and 1.
+"""
+import logging
+from decimal import Decimal
+
+import pytz
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Count, Exists, OuterRef, Sum
+
+from api.serializers.model_serializers import (
+    LightweightCustomerSerializer,
+    LightweightMetricSerializer,
+    LightweightPlanVersionSerializer,
+)
+from metering_billing.models import (
+    Analysis,
+    BillingRecordDailyRevenue,
+    Customer,
+    Metric,
+    PlanVersion,
+    SubscriptionRecord,
+)
+from metering_billing.utils import (
+    date_as_max_dt,
+    date_as_min_dt,
+    dates_bwn_two_dts,
+    make_all_json_serializable,
+)
+from metering_billing.utils.enums import ANALYSIS_KPI, METRIC_STATUS
+
+logger = logging.getLogger("django.server")
+
+ANALYSIS_PLAN_BATCH_SIZE = 25
+ANALYSIS_TOP_CUSTOMERS = 10
+
+
+def _period_subscription_records(analysis: Analysis):
+    start_time = date_as_min_dt(analysis.start_date, timezone=pytz.UTC)
+    end_time = date_as_max_dt(analysis.end_date, timezone=pytz.UTC)
+    return SubscriptionRecord.objects.filter(
+        organization=analysis.organization,
+        start_date__lte=end_time,
+        end_date__gte=start_time,
+        parent__isnull=True,
+    )
+
+
+def _cost_per_customer_day(analysis: Analysis) -> dict:
+    """
+    Returns the cost of every customer per day across all the active cost metrics of the organization.
+    """
+    costs = {}
+    cost_metrics = Metric.objects.filter(
+        organization=analysis.organization,
+        is_cost_metric=True,
+        status=METRIC_STATUS.ACTIVE,
+    )
+    for metric in cost_metrics:
+        usage = metric.get_daily_total_usage(analysis.start_date, analysis.end_date)
+        for customer, per_day in usage.items():
+            if not isinstance(customer, Customer):
+                continue
+            for date, qty in per_day.items():
+                key = (customer.pk, date)
+                costs[key] = costs.get(key, Decimal(0)) + Decimal(qty or 0)
+    return costs
+
+
+def _cost_per_plan(cost_per_customer_day, subscription_windows, plan_pks) -> dict:
+    # a customer's cost on a day is split evenly between the plan versions they were
+    # subscribed to that day
+    costs = {pk: Decimal(0) for pk in plan_pks}
+    for (customer_pk, date), cost in cost_per_customer_day.items():
+        active = [
+            plan_pk
+            for start, end, plan_pk in subscription_windows.get(customer_pk, [])
+            if start <= date <= end
+        ]
+        for plan_pk in active:
+            if plan_pk in costs:
+                costs[plan_pk] += cost / len(active)
+    return costs
+
+
+def _analyze_plan_batch(analysis, plan_versions, cost_per_customer_day, windows):
+    """
+    Computes the results of a batch of plan versions with one grouped query per figure.
+    """
+    plan_pks = [x.pk for x in plan_versions]
+    # the ledger was just brought up to date on the primary, which a replica may not
+    # have replayed yet
+    ledger = BillingRecordDailyRevenue.objects.using(DEFAULT_DB_ALIAS).filter(
+        organization=analysis.organization,
+        date__gte=analysis.start_date,
+        date__lte=analysis.end_date,
+        billing_record__billing_plan__in=plan_pks,
+    )
+    subscription_records = _period_subscription_records(analysis).filter(
+        billing_plan__in=plan_pks
+    )
+    total_revenue = {
+        x["billing_record__billing_plan"]: x["revenue"]
+        for x in ledger.values("billing_record__billing_plan").annotate(
+            revenue=Sum("revenue")
+        )
+    }
+    new_revenue = {
+        x["billing_record__billing_plan"]: x["revenue"]
+        for x in ledger.filter(billing_record__subscription__is_new=True)
+        .values("billing_record__billing_plan")
+        .annotate(revenue=Sum("revenue"))
+    }
+    subscription_counts = {
+        x["billing_plan"]: x
+        for x in subscription_records.values("billing_plan").annotate(
+            num_subscriptions=Count("id"),
+            num_customers=Count("customer", distinct=True),
+        )
+    }
+    # customers that had the plan during the period but no subscription left at the end
+    # of it
+    period_end = date_as_max_dt(analysis.end_date, timezone=pytz.UTC)
+    still_subscribed = SubscriptionRecord.objects.filter(
+        organization=analysis.organization,
+        customer=OuterRef("customer"),
+        parent__isnull=True,
+        end_date__gt=period_end,
+    )
+    churned_counts = {
+        x["billing_plan"]: x["num_customers"]
+        for x in subscription_records.annotate(
+            still_subscribed=Exists(still_subscribed)
+        )
+        .filter(still_subscribed=False)
+        .values("billing_plan")
+        .annotate(num_customers=Count("customer", distinct=True))
+    }
+    cost_per_plan = _cost_per_plan(cost_per_customer_day, windows, plan_pks)
+    revenue_per_day = {}
+    for x in ledger.values("billing_record__billing_plan", "date").annotate(
+        revenue=Sum("revenue")
+    ):
+        revenue_per_day[(x["billing_record__billing_plan"], x["date"])] = x["revenue"]
+    revenue_by_metric = {}
+    for x in (
+        ledger.filter(billing_record__component__isnull=False)
+        .values(
+            "billing_record__billing_plan",
+            "billing_record__component__billable_metric",
+        )
+        .annotate(revenue=Sum("revenue"))
+    ):
+        plan_metrics = revenue_by_metric.setdefault(
+            x["billing_record__billing_plan"], {}
+        )
+        plan_metrics[x["billing_record__component__billable_metric"]] = x["revenue"]
+    revenue_by_customer = {}
+    for x in ledger.values("billing_record__billing_plan", "customer").annotate(
+        revenue=Sum("revenue")
+    ):
+        plan_customers = revenue_by_customer.setdefault(
+            x["billing_record__billing_plan"], {}
+        )
+        plan_customers[x["customer"]] = x["revenue"]
+    subscriptions_by_customer = {
+        (x["billing_plan"], x["customer"]): x["num_subscriptions"]
+        for x in subscription_records.values("billing_plan", "customer").annotate(
+            num_subscriptions=Count("id")
+        )
+    }
+    metrics = Metric.objects.in_bulk(
+        {pk for plan_metrics in revenue_by_metric.values() for pk in plan_metrics}
+    )
+    customers = Customer.objects.in_bulk(
+        {pk for plan_customers in revenue_by_customer.values() for pk in plan_customers}
+    )
+
+    results = {
+        "analysis_summary": [],
+        "revenue_per_day": {},
+        "revenue_by_metric_graph": [],
+        "top_customers_by_plan": [],
+    }
+    for plan_version in plan_versions:
+        plan_repr = LightweightPlanVersionSerializer(plan_version).data
+        counts = subscription_counts.get(
+            plan_version.pk, {"num_subscriptions": 0, "num_customers": 0}
+        )
+        revenue = total_revenue.get(plan_version.pk) or Decimal(0)
+        cost = cost_per_plan[plan_version.pk]
+        kpis = {
+            ANALYSIS_KPI.TOTAL_REVENUE: revenue,
+            ANALYSIS_KPI.AVERAGE_REVENUE: (
+                revenue / counts["num_subscriptions"]
+                if counts["num_subscriptions"] > 0
+                else Decimal(0)
+            ),
+            ANALYSIS_KPI.NEW_REVENUE: new_revenue.get(plan_version.pk) or Decimal(0),
+            ANALYSIS_KPI.TOTAL_COST: cost,
+            ANALYSIS_KPI.PROFIT: revenue - cost,
+            ANALYSIS_KPI.CHURN: (
+                Decimal(churned_counts.get(plan_version.pk, 0))
+                / counts["num_customers"]
+                if counts["num_customers"] > 0
+                else Decimal(0)
+            ),
+        }
+        results["analysis_summary"].append(
+            {
+                "plan": plan_repr,
+                "kpis": [
+                    {"kpi": kpi, "value": kpis[kpi]}
+                    for kpi in sorted(analysis.kpis)
+                    if kpi in kpis
+                ],
+            }
+        )
+        for date in dates_bwn_two_dts(analysis.start_date, analysis.end_date):
+            results["revenue_per_day"].setdefault(date, []).append(
+                {
+                    "plan": plan_repr,
+                    "revenue": revenue_per_day.get((plan_version.pk, date))
+                    or Decimal(0),
+                }
+            )
+        results["revenue_by_metric_graph"].append(
+            {
+                "plan": plan_repr,
+                "by_metric": [
+                    {
+                        "metric": LightweightMetricSerializer(metrics[metric_pk]).data,
+                        "revenue": metric_revenue,
+                    }
+                    for metric_pk, metric_revenue in revenue_by_metric.get(
+                        plan_version.pk, {}
+                    ).items()
+                ],
+            }
+        )
+        plan_customers = revenue_by_customer.get(plan_version.pk, {})
+        average_by_customer = {
+            customer_pk: customer_revenue
+            / subscriptions_by_customer.get((plan_version.pk, customer_pk), 1)
+            for customer_pk, customer_revenue in plan_customers.items()
+        }
+        results["top_customers_by_plan"].append(
+            {
+                "plan": plan_repr,
+                "top_customers_by_revenue": _top_customers(plan_customers, customers),
+                "top_customers_by_average_revenue": _top_customers(
+                    average_by_customer, customers
+                ),
+            }
+        )
+    return results
+
+
+def _top_customers(value_by_customer, customers):
+    top = sorted(value_by_customer.items(), key=lambda x: x[1], reverse=True)
+    return [
+        {
+            "customer": LightweightCustomerSerializer(customers[customer_pk]).data,
+            "value": value,
+        }
+        for customer_pk, value in top[:ANALYSIS_TOP_CUSTOMERS]
+    ]
+
+
+def _format_analysis_results(results, progress) -> dict:
+    analysis_results = {
+        "analysis_summary": results["analysis_summary"],
+        "revenue_per_day_graph": [
+            {"date": date, "revenue_per_plan": revenue_per_plan}
+            for date, revenue_per_plan in sorted(results["revenue_per_day"].items())
+        ],
+        "revenue_by_metric_graph": results["revenue_by_metric_graph"],
+        "top_customers_by_plan": results["top_customers_by_plan"],
+        "progress": progress,
+    }
+    return make_all_json_serializable(
+        analysis_results, decimals="string", decimal_places=2
+    )
+
+
+def run_analysis_engine(analysis: Analysis) -> dict:
+    """
+    Computes the results of the analysis and saves them. Partial results are saved after every batch of plan versions so long analyses show progress. Returns the final results. The revenue ledger of the analysis period has to be refreshed first, see run_analysis.
+    """
+    subscription_records = _period_subscription_records(analysis)
+    plan_versions = list(
+        PlanVersion.objects.filter(
+            pk__in=subscription_records.values("billing_plan")
+        ).order_by("pk")
+    )
+    windows = {}
+    for customer_pk, start, end, plan_pk in subscription_records.values_list(
+        "customer", "start_date", "end_date", "billing_plan"
+    ):
+        windows.setdefault(customer_pk, []).append((start.date(), end.date(), plan_pk))
+    cost_per_customer_day = (
+        _cost_per_customer_day(analysis)
+        if {ANALYSIS_KPI.TOTAL_COST, ANALYSIS_KPI.PROFIT} & set(analysis.kpis)
+        else {}
+    )
+    logger.info(
+        f"Running analysis {analysis.analysis_id} over {len(plan_versions)} plan versions"
+    )
+    results = {
+        "analysis_summary": [],
+        "revenue_per_day": {
+            date: []
+            for date in dates_bwn_two_dts(analysis.start_date, analysis.end_date)
+        },
+        "revenue_by_metric_graph": [],
+        "top_customers_by_plan": [],
+    }
+    for i in range(0, len(plan_versions), ANALYSIS_PLAN_BATCH_SIZE):
+        batch = plan_versions[i : i + ANALYSIS_PLAN_BATCH_SIZE]
+        batch_results = _analyze_plan_batch(
+            analysis, batch, cost_per_customer_day, windows
+        )
+        for key in [
+            "analysis_summary",
+            "revenue_by_metric_graph",
+            "top_customers_by_plan",
+        ]:
+            results[key].extend(batch_results[key])
+        for date, revenue_per_plan in batch_results["revenue_per_day"].items():
+            results["revenue_per_day"][date].extend(revenue_per_plan)
+        if i + ANALYSIS_PLAN_BATCH_SIZE < len(plan_versions):
+            progress = (i + ANALYSIS_PLAN_BATCH_SIZE) / len(plan_versions)
+            Analysis.objects.filter(pk=analysis.pk).update(
+                analysis_results=_format_analysis_results(results, progress)
+            )
+    analysis_results = _format_analysis_results(results, 1)
+    Analysis.objects.filter(pk=analysis.pk).update(analysis_results=analysis_results)
+    analysis.analysis_results = analysis_results
+    return analysis_results
@@ -0,0 +1,410 @@
+"""
+Backtest engine. Instead of temporarily switching each subscription to the new plan and
+recomputing everything, every subscription's usage is queried once per (metric, window)
+and then rated in memory under both the original and the new plan version, so backtests
+never write to live billing data. Subscriptions are processed in chunks on a bounded pool
+and the results computed so far are saved to the backtest after every chunk.
+"""
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from decimal import Decimal, InvalidOperation
+
+import pytz
+from django.conf import settings
+from django.db import connections
+
+from metering_billing.db_router import own_replica_scope
+from metering_billing.models import Backtest, PlanVersion, SubscriptionRecord
+from metering_billing.serializers.experiment_serializers import (
+    AllSubstitutionResultsSerializer,
+)
+from metering_billing.serializers.serializer_utils import PlanVersionUUIDField
+from metering_billing.utils import (
+    date_as_max_dt,
+    date_as_min_dt,
+    dates_bwn_two_dts,
+    make_all_json_serializable,
+)
+from metering_billing.utils.enums import METRIC_TYPE
+
+logger = logging.getLogger("django.server")
+
+BACKTEST_WORKERS = settings.BACKTEST_WORKERS
+BACKTEST_CHUNK_SIZE = 50
+
+
+class SubscriptionUsageWindow:
+    """
+    Stands in for a billing record covering the whole subscription so the metric handlers can compute its usage under any plan version without touching the subscription.
+    """
+
+    def __init__(self, subscription_record, plan_version):
+        self.subscription = subscription_record
+        self.customer = subscription_record.customer
+        self.start_date = subscription_record.start_date
+        self.end_date = subscription_record.end_date
+        self.billing_plan = plan_version
+
+
+def _usage_key(metric, plan_version):
+    # gauges with total granularity are normalized by the plan duration, every other
+    # metric only depends on the subscription's customer, filters and dates
+    if metric.metric_type == METRIC_TYPE.GAUGE:
+        return (metric.pk, plan_version.plan.plan_duration)
+    return (metric.pk, None)
+
+
+def rate_subscription(subscription_record, plan_versions) -> dict:
+    """
+    Returns the revenue of the subscription under each of the plan versions, keyed by plan version pk. Usage shared between plan versions is only queried once.
+    """
+    usage = {}
+    results = {}
+    for plan_version in plan_versions:
+        rating = {"components": []}
+        for component in plan_version.plan_components.all():
+            metric = component.billable_metric
+            key = _usage_key(metric, plan_version)
+            if key not in usage:
+                usage[key] = metric.get_billing_record_total_billable_usage(
+                    SubscriptionUsageWindow(subscription_record, plan_version)
+                )
+            rating["components"].append(
+                (
+                    metric.billable_metric_name,
+                    {
+                        "revenue": component.tier_rating_function(usage[key]),
+                        "usage_qty": usage[key],
+                    },
+                )
+            )
+        rating["usage_amount_due"] = sum(
+            (x["revenue"] for _, x in rating["components"]), Decimal(0)
+        )
+        rating["flat_amount_due"] = sum(
+            (x.amount for x in plan_version.recurring_charges.all()), Decimal(0)
+        )
+        rating["total_amount_due"] = (
+            rating["flat_amount_due"] + rating["usage_amount_due"]
+        )
+        results[plan_version.pk] = rating
+    return results
+
+
+def _rate_chunk(subscription_records, substitutions_by_plan):
+    results = []
+    for sub in subscription_records:
+        subst = substitutions_by_plan[sub.billing_plan_id]
+        ratings = rate_subscription(sub, [subst.original_plan, subst.new_plan])
+        results.append(
+            (
+                subst,
+                sub,
+                ratings[subst.original_plan.pk],
+                ratings[subst.new_plan.pk],
+            )
+        )
+    return results
+
+
+def _empty_inner_results():
+    return {
+        "cumulative_revenue": {},
+        "revenue_by_metric": {},
+        "top_customers": {},
+    }
+
+
+def _add_subscription_results(inner_results, sub, original_rating, new_rating):
+    customer = sub.customer
+    if customer not in inner_results["top_customers"]:
+        inner_results["top_customers"][customer] = {
+            "original_plan_revenue": Decimal(0),
+            "new_plan_revenue": Decimal(0),
+        }
+    end_date = sub.end_date
+    if end_date not in inner_results["cumulative_revenue"]:
+        inner_results["cumulative_revenue"][end_date] = {
+            "original_plan_revenue": Decimal(0),
+            "new_plan_revenue": Decimal(0),
+        }
+    if "flat_fees" not in inner_results["revenue_by_metric"]:
+        inner_results["revenue_by_metric"]["flat_fees"] = {
+            "original_plan_revenue": Decimal(0),
+            "new_plan_revenue": Decimal(0),
+        }
+    for revenue_key, rating in (
+        ("original_plan_revenue", original_rating),
+        ("new_plan_revenue", new_rating),
+    ):
+        inner_results["cumulative_revenue"][end_date][revenue_key] += rating[
+            "total_amount_due"
+        ]
+        inner_results["top_customers"][customer][revenue_key] += rating[
+            "total_amount_due"
+        ]
+        for metric_name, component_dict in rating["components"]:
+            if metric_name not in inner_results["revenue_by_metric"]:
+                inner_results["revenue_by_metric"][metric_name] = {
+                    "original_plan_revenue": Decimal(0),
+                    "new_plan_revenue": Decimal(0),
+                }
+            inner_results["revenue_by_metric"][metric_name][
+                revenue_key
+            ] += component_dict["revenue"]
+        inner_results["revenue_by_metric"]["flat_fees"][revenue_key] += rating[
+            "flat_amount_due"
+        ]
+
+
+def _format_cumulative_revenue(cumulative_revenue):
+    cum_rev_dict_list = []
+    cum_rev_lst = sorted(cumulative_revenue.items(), key=lambda x: x[0], reverse=True)
+    cum_rev_lst = [(date.date(), cum_rev_dict) for date, cum_rev_dict in cum_rev_lst]
+    try:
+        every_date = list(dates_bwn_two_dts(cum_rev_lst[-1][0], cum_rev_lst[0][0]))
+    except IndexError:
+        every_date = []
+    if cum_rev_lst:
+        date, rev_dict = cum_rev_lst.pop(-1)
+        last_dict = {**rev_dict, "date": date}
+    for date in every_date:
+        if len(cum_rev_lst) == 0 or date < cum_rev_lst[-1][0]:
+            # have not reached the next data point yet, dont add
+            new_dict = last_dict.copy()
+            new_dict["date"] = date
+        elif date == cum_rev_lst[-1][0]:
+            # have reached the next data point, add it
+            date, rev_dict = cum_rev_lst.pop()
+            new_dict = {**rev_dict, "date": date}
+            new_dict["original_plan_revenue"] += last_dict["original_plan_revenue"]
+            new_dict["new_plan_revenue"] += last_dict["new_plan_revenue"]
+            last_dict = new_dict
+        else:
+            raise Exception("should not be greater than the most recent date")
+        cum_rev_dict_list.append(new_dict)
+    return cum_rev_dict_list
+
+
+def _customer_value(customer, value):
+    return {
+        "customer_id": customer.customer_id,
+        "customer_name": customer.customer_name,
+        "value": value,
+    }
+
+
+def _format_top_customers(top_cust):
+    top_cust_dict = {}
+    top_original = sorted(
+        top_cust.items(),
+        key=lambda x: x[1]["original_plan_revenue"],
+        reverse=True,
+    )[:5]
+    top_cust_dict["original_plan_revenue"] = [
+        _customer_value(customer, rev_dict.get("original_plan_revenue", 0))
+        for customer, rev_dict in top_original
+    ]
+    top_new = sorted(
+        top_cust.items(), key=lambda x: x[1]["new_plan_revenue"], reverse=True
+    )[:5]
+    top_cust_dict["new_plan_revenue"] = [
+        _customer_value(customer, rev_dict.get("new_plan_revenue", 0))
+        for customer, rev_dict in top_new
+    ]
+    all_pct_change = []
+    for customer, rev_dict in top_cust.items():
+        try:
+            pct_change = (
+                rev_dict.get("new_plan_revenue", 0)
+                / rev_dict.get("original_plan_revenue", 0)
+                - 1
+            )
+        except (ZeroDivisionError, InvalidOperation):
+            pct_change = None
+        all_pct_change.append((customer, pct_change))
+    all_pct_change = sorted(
+        [tup for tup in all_pct_change if tup[1] is not None],
+        key=lambda x: x[1],
+    )
+    top_cust_dict["biggest_pct_increase"] = [
+        _customer_value(customer, pct_change)
+        for customer, pct_change in all_pct_change[-5:]
+    ][::-1]
+    top_cust_dict["biggest_pct_decrease"] = [
+        _customer_value(customer, pct_change)
+        for customer, pct_change in all_pct_change[:5]
+    ]
+    return top_cust_dict
+
+
+def _format_substitution_results(subst, inner_results):
+    outer_results = {
+        "substitution_name": f"{str(subst.original_plan)} --> {str(subst.new_plan)}",
+        "original_plan": {
+            "plan_name": str(subst.original_plan),
+            "plan_id": PlanVersionUUIDField().to_representation(
+                subst.original_plan.version_id
+            ),
+            "plan_revenue": Decimal(0),
+        },
+        "new_plan": {
+            "plan_name": str(subst.new_plan),
+            "plan_id": PlanVersionUUIDField().to_representation(
+                subst.new_plan.version_id
+            ),
+            "plan_revenue": Decimal(0),
+        },
+    }
+    cumulative_revenue = _format_cumulative_revenue(inner_results["cumulative_revenue"])
+    outer_results["results"] = {
+        "cumulative_revenue": cumulative_revenue,
+        "revenue_by_metric": [
+            {**rev_dict, "metric_name": metric_name}
+            for metric_name, rev_dict in inner_results["revenue_by_metric"].items()
+        ],
+        "top_customers": _format_top_customers(inner_results["top_customers"]),
+    }
+    if cumulative_revenue:
+        outer_results["original_plan"]["plan_revenue"] = cumulative_revenue[-1][
+            "original_plan_revenue"
+        ]
+        outer_results["new_plan"]["plan_revenue"] = cumulative_revenue[-1][
+            "new_plan_revenue"
+        ]
+    try:
+        outer_results["pct_revenue_change"] = (
+            outer_results["new_plan"]["plan_revenue"]
+            / outer_results["original_plan"]["plan_revenue"]
+            - 1
+        )
+    except (ZeroDivisionError, InvalidOperation):
+        outer_results["pct_revenue_change"] = None
+    return outer_results
+
+
+def format_backtest_results(substitutions, inner_results_by_subst) -> dict:
+    all_results = {
+        "substitution_results": [
+            _format_substitution_results(subst, inner_results_by_subst[subst.pk])
+            for subst in substitutions
+        ],
+    }
+    all_results["original_plans_revenue"] = sum(
+        x["original_plan"]["plan_revenue"] for x in all_results["substitution_results"]
+    )
+    all_results["new_plans_revenue"] = sum(
+        x["new_plan"]["plan_revenue"] for x in all_results["substitution_results"]
+    )
+    try:
+        all_results["pct_revenue_change"] = (
+            all_results["new_plans_revenue"] / all_results["original_plans_revenue"] - 1
+        )
+    except (ZeroDivisionError, InvalidOperation):
+        all_results["pct_revenue_change"] = None
+    all_results = make_all_json_serializable(all_results, datetimes_as_dates=True)
+    serializer = AllSubstitutionResultsSerializer(data=all_results)
+    try:
+        serializer.is_valid(raise_exception=True)
+    except Exception:
+        logger.error("errors {} all results {}".format(serializer.errors, all_results))
+        raise
+    return make_all_json_serializable(serializer.validated_data)
+
+
+def _rate_chunk_in_thread(subscription_records, substitutions_by_plan):
+    own_replica_scope()
+    try:
+        return _rate_chunk(subscription_records, substitutions_by_plan)
+    finally:
+        # every thread opens its own connections, don't leak them
+        connections.close_all()
+
+
+def run_backtest_engine(backtest: Backtest) -> dict:
+    """
+    Computes the results of the backtest and saves them. Partial results are saved after every chunk of subscriptions so long backtests show progress. Returns the final results.
+    """
+    substitutions = list(
+        backtest.backtest_substitutions.select_related("original_plan", "new_plan")
+    )
+    plan_versions = {
+        plan_version.pk: plan_version
+        for plan_version in PlanVersion.objects.filter(
+            pk__in=[x.original_plan_id for x in substitutions]
+            + [x.new_plan_id for x in substitutions]
+        )
+        .select_related("plan")
+        .prefetch_related(
+            "recurring_charges",
+            "plan_components__tiers",
+            "plan_components__billable_metric__numeric_filters",
+            "plan_components__billable_metric__categorical_filters",
+        )
+    }
+    for subst in substitutions:
+        subst.original_plan = plan_versions[subst.original_plan_id]
+        subst.new_plan = plan_versions[subst.new_plan_id]
+    # since we can have at most one new plan per old plan, the old plan uniquely
+    # identifies the substitution
+    substitutions_by_plan = {x.original_plan_id: x for x in substitutions}
+    start_date = date_as_min_dt(backtest.start_date, timezone=pytz.UTC)
+    end_date = date_as_max_dt(backtest.end_date, timezone=pytz.UTC)
+    subscription_records = list(
+        SubscriptionRecord.objects.filter(
+            billing_plan__in=list(substitutions_by_plan),
+            start_date__lte=end_date,
+            end_date__gte=start_date,
+            end_date__lte=end_date,
+            organization=backtest.organization,
+        )
+        .select_related("customer")
+        .order_by("pk")
+    )
+    logger.info(
+        f"Running backtest for {len(substitutions)} substitutions over {len(subscription_records)} subscriptions"
+    )
+    chunks = [
+        subscription_records[i : i + BACKTEST_CHUNK_SIZE]
+        for i in range(0, len(subscription_records), BACKTEST_CHUNK_SIZE)
+    ]
+    inner_results_by_subst = {x.pk: _empty_inner_results() for x in substitutions}
+
+    def add_chunk_results(chunk_results):
+        for subst, sub, original_rating, new_rating in chunk_results:
+            _add_subscription_results(
+                inner_results_by_subst[subst.pk], sub, original_rating, new_rating
+            )
+
+    def save_partial_results():
+        Backtest.objects.filter(pk=backtest.pk).update(
+            backtest_results=format_backtest_results(
+                substitutions, inner_results_by_subst
+            )
+        )
+
+    if BACKTEST_WORKERS <= 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            add_chunk_results(_rate_chunk(chunk, substitutions_by_plan))
+            save_partial_results()
+    else:
+        with ThreadPoolExecutor(
+            max_workers=min(BACKTEST_WORKERS, len(chunks))
+        ) as executor:
+            # so the threads read from the same database as the caller
+            futures = [
+                executor.submit(
+                    contextvars.copy_context().run,
+                    _rate_chunk_in_thread,
+                    chunk,
+                    substitutions_by_plan,
+                )
+                for chunk in chunks
+            ]
+            for future in as_completed(futures):
+                add_chunk_results(future.result())
+                save_partial_results()
+    results = format_backtest_results(substitutions, inner_results_by_subst)
+    backtest.backtest_results = results
+    return results
@@ -0,0 +1,118 @@
+"""
+Response cache for the plan, metric and feature catalogs. Every organization has a catalog
+version that is bumped whenever one of its plans, versions, components, tiers, metrics or
+features is written, and list and detail responses of the catalog endpoints are cached
+under it, so a write makes every cached response of the organization stale at once.
+
+Some of what the catalog endpoints return depends on the time (which version is active)
+or on other tables (the number of active subscriptions), so responses are only reused
+within windows of CATALOG_CACHE_TIMEOUT seconds. Responses carry an ETag and requests
+whose If-None-Match matches it get a 304 without touching the database.
+"""
+import functools
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+
+CATALOG_CACHE_ENABLED = settings.CATALOG_CACHE_ENABLED
+CATALOG_CACHE_TIMEOUT = settings.CATALOG_CACHE_TIMEOUT
+
+
+def _catalog_version_key(organization_pk) -> str:
+    return f"catalog_version:{organization_pk}"
+
+
+def _new_catalog_version() -> int:
+    # larger than any version handed out before the counter was evicted
+    return int(time.time() * 1000)
+
+
+def get_catalog_version(organization_pk) -> int:
+    key = _catalog_version_key(organization_pk)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_catalog_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_catalog_version(organization_pk) -> None:
+    """
+    Makes the cached catalog responses of the organization stale, once the current transaction commits.
+    """
+    if not CATALOG_CACHE_ENABLED or organization_pk is None:
+        return
+
+    def bump():
+        try:
+            cache.incr(_catalog_version_key(organization_pk))
+        except ValueError:
+            cache.set(
+                _catalog_version_key(organization_pk),
+                _new_catalog_version(),
+                timeout=None,
+            )
+
+    transaction.on_commit(bump)
+
+
+def _catalog_response_digest(request) -> str:
+    organization_pk = request.organization.pk
+    window = int(time.time() // CATALOG_CACHE_TIMEOUT)
+    return hashlib.md5(
+        "{}:{}:{}:{}".format(
+            organization_pk,
+            get_catalog_version(organization_pk),
+            window,
+            request.get_full_path(),
+        ).encode()
+    ).hexdigest()
+
+
+def cache_catalog_response(view_method):
+    """
+    Caches the successful responses of a catalog list or retrieve action under the organization's catalog version.
+    """
+
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        if not CATALOG_CACHE_ENABLED:
+            return view_method(self, request, *args, **kwargs)
+        digest = _catalog_response_digest(request)
+        etag = f'"{digest}"'
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        key = f"catalog_response:{digest}"
+        data = cache.get(key)
+        if data is not None:
+            return Response(data, headers={"ETag": etag})
+        response = view_method(self, request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data, CATALOG_CACHE_TIMEOUT)
+            response["ETag"] = etag
+        return response
+
+    return wrapper
+
+
+class CatalogCacheMixin:
+    """
+    Bumps the organization's catalog version after every successful write request, which
+    also covers the many to many and bulk updates the model hooks don't see.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        response = super().dispatch(request, *args, **kwargs)
+        if request.method not in SAFE_METHODS and status.is_success(
+            response.status_code
+        ):
+            organization = getattr(self.request, "organization", None)
+            bump_catalog_version(getattr(organization, "pk", None))
+        return response
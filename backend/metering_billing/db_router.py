@@ -0,0 +1,145 @@
+"""
+Routing of read-only analytical queries to read replicas. Reads only go to a replica
+inside a replica_reads() block, which the dashboard period views, cost analysis, event
+search, backtests and analyses enter, so everything else, billing included, keeps reading
+from the primary. Writes always go to the primary.
+
+Replicas are configured with DATABASE_REPLICA_URLS. Before a block picks a replica its
+replication lag is checked, at most every REPLICA_LAG_CHECK_INTERVAL seconds, and replicas
+that are more than REPLICA_MAX_LAG_SECONDS behind, or can't be reached, are skipped in
+favour of the primary.
+"""
+import contextlib
+import contextvars
+import copy
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+from metering_billing.utils import now_utc
+
+logger = logging.getLogger("django.server")
+
+REPLICA_DATABASES = [
+    alias for alias in settings.DATABASES if alias.startswith("replica_")
+]
+REPLICA_MAX_LAG_SECONDS = settings.REPLICA_MAX_LAG_SECONDS
+REPLICA_LAG_CHECK_INTERVAL = settings.REPLICA_LAG_CHECK_INTERVAL
+
+# a replica that replayed everything it received is caught up even if the primary has
+# been idle for a while, and a database that isn't in recovery is its own primary
+REPLICA_LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(
+            EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())::float8,
+            'Infinity'::float8
+        )
+    END
+"""
+
+
+class _ReplicaScope:
+    def __init__(self, max_lag):
+        self.max_lag = max_lag
+        self.alias = None
+        self.chosen_at = None
+
+
+_replica_scope = contextvars.ContextVar("replica_scope", default=None)
+
+
+def replica_lag(alias) -> float:
+    """
+    Number of seconds the replica is behind the primary, infinite if it can't be reached.
+    """
+    key = f"replica_lag:{alias}"
+    lag = cache.get(key)
+    if lag is None:
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute(REPLICA_LAG_QUERY)
+                (lag,) = cursor.fetchone()
+            lag = float(lag)
+        except DatabaseError as e:
+            logger.warning(f"Couldn't check the replication lag of {alias}: {e}")
+            lag = float("inf")
+        cache.set(key, lag, REPLICA_LAG_CHECK_INTERVAL)
+    return lag
+
+
+def _choose_replica(max_lag):
+    replicas = [alias for alias in REPLICA_DATABASES if replica_lag(alias) <= max_lag]
+    return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+
+def read_database() -> str:
+    """
+    Alias of the database reads should go to right now.
+    """
+    scope = _replica_scope.get()
+    if scope is None or not REPLICA_DATABASES:
+        return DEFAULT_DB_ALIAS
+    # reads inside a transaction on the primary have to see its own writes
+    if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+        return DEFAULT_DB_ALIAS
+    # every read of a block goes to the same database, and long blocks recheck the lag
+    if (
+        scope.alias is None
+        or time.monotonic() - scope.chosen_at > REPLICA_LAG_CHECK_INTERVAL
+    ):
+        scope.alias = _choose_replica(scope.max_lag)
+        scope.chosen_at = time.monotonic()
+    return scope.alias
+
+
+def own_replica_scope() -> None:
+    """
+    Gives the current context its own copy of the replica scope. Threads running in a copy of the caller's context call this first, so they start on the caller's database but pick and recheck replicas on their own.
+    """
+    scope = _replica_scope.get()
+    if scope is not None:
+        _replica_scope.set(copy.copy(scope))
+
+
+def read_connection():
+    """
+    Connection for raw read-only queries, see read_database.
+    """
+    return connections[read_database()]
+
+
+@contextlib.contextmanager
+def replica_reads(written_at=None):
+    """
+    Sends the reads inside the block to a replica that is at most REPLICA_MAX_LAG_SECONDS behind. When written_at is given, replicas that may not have replayed the writes made at that time are skipped too. Can also be used as a decorator.
+    """
+    max_lag = REPLICA_MAX_LAG_SECONDS
+    if written_at is not None:
+        max_lag = min(max_lag, (now_utc() - written_at).total_seconds())
+    token = _replica_scope.set(_ReplicaScope(max_lag))
+    try:
+        yield
+    finally:
+        _replica_scope.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        # not falling back to the database of the instance hint, so objects read from a
+        # replica don't drag the reads of their relations outside the block along
+        return read_database()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
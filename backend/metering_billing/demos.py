@@ -18,6 +18,7 @@ from api.serializers.model_serializers import (
     LightweightPlanVersionSerializer,
 )
 from metering_billing.aggregation.billable_metrics import METRIC_HANDLER_MAP
+from metering_billing.aggregation.event_catalog import backfill_event_catalog
 from metering_billing.invoice import generate_invoice
 from metering_billing.models import (
     Analysis,
@@ -57,9 +58,8 @@ from metering_billing.utils import (
     date_as_max_dt,
     date_as_min_dt,
     dates_bwn_two_dts,
-    make_all_decimals_strings,
+    make_all_json_serializable,
     now_utc,
-    round_all_decimals_to_two_places,
 )
 from metering_billing.utils.enums import (
     ANALYSIS_KPI,
@@ -657,6 +657,7 @@ def setup_demo3(
     except Exception as e:
         print(e)
         pass
+    backfill_event_catalog(organization, reset=True)
     return user
 
 
@@ -1245,6 +1246,7 @@ def setup_demo4(
     #     organization=organization,
     # )
     # run_backtest.delay(backtest.backtest_id)
+    backfill_event_catalog(organization, reset=True)
     return user
 
 
@@ -2520,9 +2522,7 @@ def setup_database_demo(
     # top customers by plan
     top_customers_by_plan = []
     for plan in [pro_plan_bp_monthly, pay_as_you_go_bp_monthly]:
-        customers = Customer.objects.filter(
-            organization=organization,
-        ).order_by(
+        customers = Customer.objects.filter(organization=organization,).order_by(
             "?"
         )[:5]
         top_customers_by_total_revenue = []
@@ -2577,8 +2577,9 @@ def setup_database_demo(
         top_customers_by_plan.append(single_plan)
     analysis_results["top_customers_by_plan"] = top_customers_by_plan
     # create actual analysis
-    analysis_results = round_all_decimals_to_two_places(analysis_results)
-    analysis_results = make_all_decimals_strings(analysis_results)
+    analysis_results = make_all_json_serializable(
+        analysis_results, decimals="string", decimal_places=2
+    )
     Analysis.objects.create(
         organization=organization,
         analysis_results=analysis_results,
@@ -2588,6 +2589,7 @@ def setup_database_demo(
         kpis=[kpi for kpi, _ in ANALYSIS_KPI.choices],
         status=EXPERIMENT_STATUS.COMPLETED,
     )
+    backfill_event_catalog(organization, reset=True)
     return user
 
 
@@ -5,6 +5,7 @@ from decimal import Decimal
 import sentry_sdk
 from dateutil.relativedelta import relativedelta
 from django.conf import settings
+from django.db import transaction
 from django.db.models import Q, Sum
 from django.db.models.query import QuerySet
 
@@ -31,6 +32,7 @@ POSTHOG_PERSON = settings.POSTHOG_PERSON
 META = settings.META
 DEBUG = settings.DEBUG
 USE_KAFKA = settings.USE_KAFKA
+INVOICE_PDF_BATCH_ENABLED = settings.INVOICE_PDF_BATCH_ENABLED
 if USE_KAFKA:
     kafka_producer = Producer()
 else:
@@ -49,7 +51,7 @@ def generate_invoice(
 
     IMPORTANT: addons must be passed explicitly as part of subscription_records, otherwise they will not be charged.
     """
-    from metering_billing.models import Invoice, PricingUnit
+    from metering_billing.models import Invoice, InvoiceNumberSequence, PricingUnit
     from metering_billing.tasks import generate_invoice_pdf_async
 
     if not issue_date:
@@ -88,77 +90,103 @@ def generate_invoice(
     except AttributeError:
         distinct_currencies = {x.billing_plan.currency for x in subscription_records}
 
-    invoices = {}
-    for currency in distinct_currencies:
-        # create kwargs for invoice
-        invoice_kwargs = {
-            "issue_date": issue_date,
-            "organization": organization,
-            "customer": customer,
-            "payment_status": Invoice.PaymentStatus.DRAFT
-            if draft
-            else Invoice.PaymentStatus.UNPAID,
-            "currency": currency,
-            "due_date": due_date,
-        }
-        # Create the invoice
-        invoice = Invoice.objects.create(**invoice_kwargs)
-        invoices[currency] = invoice
-    for subscription_record in subscription_records:
-        invoice = invoices[subscription_record.billing_plan.currency]
-        invoice.subscription_records.add(subscription_record)
-        # flat fee calculation for current plan
-        calculate_subscription_record_flat_fees(subscription_record, invoice, draft)
-        # usage calculation
-        calculate_subscription_record_usage_fees(subscription_record, invoice, draft)
-        # next plan flat fee calculation
-        next_bp = find_next_billing_plan(subscription_record)
-        sr_renews = check_subscription_record_renews(subscription_record, issue_date)
-        if sr_renews:
-            if generate_next_subscription_record:
-                # actually make one, when we're actually invoicing
-                next_subscription_record = create_next_subscription_record(
-                    subscription_record, next_bp
-                )
-            else:
-                # this is just a placeholder e.g. for previewing draft invoices
-                next_subscription_record = subscription_record
-            if charge_next_plan:
-                # this can be both for actual invoicing or just for drafts to see whats next
-                charge_next_plan_flat_fee(
-                    subscription_record,
-                    next_subscription_record,
-                    next_bp,
-                    invoice,
-                    draft,
-                )
-    return_list = []
-    for invoice in invoices.values():
-        if invoice.line_items.count() == 0:
-            invoice.delete()
-            continue
-        apply_plan_discounts(invoice)
-        apply_taxes(invoice, customer, organization, draft)
-        apply_customer_balance_adjustments(invoice, customer, organization, draft)
-        finalize_invoice_amount(invoice, draft)
-
-        if not draft:
-            new_inv = generate_external_payment_obj(invoice)
-            if new_inv:
-                invoice = new_inv
+    distinct_currencies = list(distinct_currencies)
+    # the invoices, their line items and their numbers are committed together, so a
+    # failure halfway doesn't leave a partial invoice behind or a gap in the numbering,
+    # and the PDF batch only ever sees finished invoices
+    with transaction.atomic():
+        invoices = {}
+        for currency in distinct_currencies:
+            # create kwargs for invoice
+            invoice_kwargs = {
+                "issue_date": issue_date,
+                "organization": organization,
+                "customer": customer,
+                "payment_status": Invoice.PaymentStatus.DRAFT
+                if draft
+                else Invoice.PaymentStatus.UNPAID,
+                "currency": currency,
+                "due_date": due_date,
+            }
+            # Create the invoice, it's numbered once we know it isn't empty
+            invoice = Invoice(**invoice_kwargs)
+            invoice.save(reserve_invoice_number=False)
+            invoices[currency] = invoice
+        for subscription_record in subscription_records:
+            invoice = invoices[subscription_record.billing_plan.currency]
+            invoice.subscription_records.add(subscription_record)
+            # flat fee calculation for current plan
+            calculate_subscription_record_flat_fees(subscription_record, invoice, draft)
+            # usage calculation
+            calculate_subscription_record_usage_fees(
+                subscription_record, invoice, draft
+            )
+            # next plan flat fee calculation
+            next_bp = find_next_billing_plan(subscription_record)
+            sr_renews = check_subscription_record_renews(
+                subscription_record, issue_date
+            )
+            if sr_renews:
+                if generate_next_subscription_record:
+                    # actually make one, when we're actually invoicing
+                    next_subscription_record = create_next_subscription_record(
+                        subscription_record, next_bp
+                    )
+                else:
+                    # this is just a placeholder e.g. for previewing draft invoices
+                    next_subscription_record = subscription_record
+                if charge_next_plan:
+                    # this can be both for actual invoicing or just for drafts to see whats next
+                    charge_next_plan_flat_fee(
+                        subscription_record,
+                        next_subscription_record,
+                        next_bp,
+                        invoice,
+                        draft,
+                    )
+        return_list = []
+        for invoice in invoices.values():
+            if invoice.line_items.count() == 0:
+                invoice.delete()
+                continue
+            return_list.append(invoice)
+        for invoice in return_list:
+            apply_plan_discounts(invoice)
+            apply_taxes(invoice, customer, organization, draft)
+        if not draft and len(return_list) > 0:
             for subscription_record in subscription_records:
                 if subscription_record.end_date <= now_utc():
                     subscription_record.fully_billed = True
                     subscription_record.save()
+            # the sequence row of the organization's issue day stays locked until the
+            # commit, so the numbers are reserved after rating and taxes, in one round
+            # trip for all the invoices, and only the balance adjustments quoting them
+            # are left
+            invoice_numbers = InvoiceNumberSequence.reserve(
+                organization, issue_date.date(), len(return_list)
+            )
+            for invoice, invoice_number in zip(return_list, invoice_numbers):
+                invoice.invoice_number = invoice_number
+            Invoice.objects.bulk_update(return_list, ["invoice_number"])
+        for invoice in return_list:
+            apply_customer_balance_adjustments(invoice, customer, organization, draft)
+            finalize_invoice_amount(invoice, draft)
+    if draft:
+        return return_list
+    for i, invoice in enumerate(return_list):
+        new_inv = generate_external_payment_obj(invoice)
+        if new_inv:
+            invoice = return_list[i] = new_inv
+        # with batching the PDF is picked up by the next generate_invoice_pdfs run
+        if not INVOICE_PDF_BATCH_ENABLED:
             try:
                 generate_invoice_pdf_async.delay(invoice.pk)
             except Exception as e:
                 sentry_sdk.capture_exception(e)
 
-            invoice_created_webhook(invoice, organization)
-            if kafka_producer:
-                kafka_producer.produce_invoice(invoice)
-        return_list.append(invoice)
+        invoice_created_webhook(invoice, organization)
+        if kafka_producer:
+            kafka_producer.produce_invoice(invoice)
     return return_list
 
 
@@ -713,30 +741,33 @@ def generate_balance_adjustment_invoice(balance_adjustment, draft=False):
         "currency": balance_adjustment.amount_paid_currency,
         "due_date": due_date,
     }
-    # Create the invoice
-    invoice = Invoice.objects.create(**invoice_kwargs)
+    # committed together so the PDF batch never picks up the invoice half built
+    with transaction.atomic():
+        # Create the invoice
+        invoice = Invoice.objects.create(**invoice_kwargs)
 
-    # Create the invoice line item
-    InvoiceLineItem.objects.create(
-        name=f"Credit Grant: {balance_adjustment.amount_paid_currency.symbol}{balance_adjustment.amount}",
-        start_date=issue_date,
-        end_date=issue_date,
-        quantity=None,
-        base=balance_adjustment.amount_paid,
-        billing_type=INVOICE_CHARGE_TIMING_TYPE.ONE_TIME,
-        chargeable_item_type=CHARGEABLE_ITEM_TYPE.ONE_TIME_CHARGE,
-        invoice=invoice,
-        organization=organization,
-    )
+        # Create the invoice line item
+        InvoiceLineItem.objects.create(
+            name=f"Credit Grant: {balance_adjustment.amount_paid_currency.symbol}{balance_adjustment.amount}",
+            start_date=issue_date,
+            end_date=issue_date,
+            quantity=None,
+            base=balance_adjustment.amount_paid,
+            billing_type=INVOICE_CHARGE_TIMING_TYPE.ONE_TIME,
+            chargeable_item_type=CHARGEABLE_ITEM_TYPE.ONE_TIME_CHARGE,
+            invoice=invoice,
+            organization=organization,
+        )
 
-    finalize_invoice_amount(invoice, draft)
+        finalize_invoice_amount(invoice, draft)
 
     if not draft:
         generate_external_payment_obj(invoice)
-        try:
-            generate_invoice_pdf_async.delay(invoice.pk)
-        except Exception as e:
-            sentry_sdk.capture_exception(e)
+        if not INVOICE_PDF_BATCH_ENABLED:
+            try:
+                generate_invoice_pdf_async.delay(invoice.pk)
+            except Exception as e:
+                sentry_sdk.capture_exception(e)
         invoice_created_webhook(invoice, organization)
         if kafka_producer:
             kafka_producer.produce_invoice(invoice)
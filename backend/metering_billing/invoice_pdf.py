@@ -1,9 +1,13 @@
+import hashlib
+import json
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
 from io import BytesIO
 
 import boto3
+import sentry_sdk
 from botocore.exceptions import ClientError
 from django.conf import settings
 from django.forms.models import model_to_dict
@@ -15,23 +19,37 @@ from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.pdfgen import canvas
 from reportlab.rl_config import TTFSearchPath
 
-from metering_billing.models import InvoiceLineItemAdjustment, Organization
+from metering_billing.models import Invoice, InvoiceLineItemAdjustment, Organization
 from metering_billing.s3_utils import get_bucket_name
 from metering_billing.serializers.serializer_utils import PlanUUIDField
 from metering_billing.utils import make_hashable
 from metering_billing.utils.enums import CHARGEABLE_ITEM_TYPE
 
 logger = logging.getLogger("django.server")
+INVOICE_PDF_BATCH_SIZE = settings.INVOICE_PDF_BATCH_SIZE
+INVOICE_PDF_UPLOAD_CONCURRENCY = settings.INVOICE_PDF_UPLOAD_CONCURRENCY
 
 try:
     s3 = boto3.resource(
         "s3",
         aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
         aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+        endpoint_url=settings.AWS_S3_ENDPOINT_URL,
     )
 except ClientError:
     pass
 
+
+def get_s3_client():
+    # unlike resources, clients are safe to share between threads
+    return boto3.client(
+        "s3",
+        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+        endpoint_url=settings.AWS_S3_ENDPOINT_URL,
+    )
+
+
 FONT_XL = 24
 FONT_L = 22
 FONT_M = 14
@@ -70,10 +88,12 @@ def transform_date(date):
 
 
 class InvoicePDF:
-    def __init__(self, invoice, buffer=None):
+    def __init__(self, invoice, buffer=None, billing_address=None):
         """Takes an invoice and buffer (ie. name for output file)"""
         self.invoice = invoice
         self.buffer = buffer
+        # lets batch rendering look the address up once, it can be a payment provider call
+        self.billing_address = billing_address
 
     def fontSize(self, size, bold=False):
         """Helper Function: Change the font size"""
@@ -293,7 +313,7 @@ class InvoicePDF:
         """Add the customers details"""
 
         customer = self.invoice.customer
-        addr = customer.get_billing_address()
+        addr = self.billing_address or customer.get_billing_address()
 
         self.fontSize(FONT_S, bold=True)
         self.PDF.drawString(250, 127, "Billed To")
@@ -559,6 +579,19 @@ def get_invoice_pdf_key(invoice):
     return key
 
 
+def get_invoice_pdf_location(invoice, bucket=None):
+    """
+    Returns the bucket name and key of the invoice's PDF. bucket is the result of get_bucket_name for the invoice's organization, if it was already looked up.
+    """
+    bucket_name, prod = bucket or get_bucket_name(invoice.organization)
+    key = get_invoice_pdf_key(invoice)
+    if not prod:
+        team = invoice.organization.team
+        team_id = team.team_id.hex + "-" + slugify(team.name)
+        key = f"{team_id}/{key}"
+    return bucket_name, key
+
+
 def s3_file_exists(bucket_name, key):
     try:
         s3.Object(bucket_name, key).load()
@@ -581,10 +614,10 @@ def s3_bucket_exists(bucket_name) -> bool:
         return False
 
 
-def generate_invoice_pdf(invoice):
+def generate_invoice_pdf(invoice, billing_address=None):
     buffer = BytesIO()
     # init class
-    inv = InvoicePDF(invoice, buffer)
+    inv = InvoicePDF(invoice, buffer, billing_address=billing_address)
 
     # build invoice (calls pdf.save())
     _ = inv.build(buffer)
@@ -592,9 +625,9 @@ def generate_invoice_pdf(invoice):
     return buffer
 
 
-def upload_invoice_pdf_to_s3(invoice, bucket_name):
+def upload_invoice_pdf_to_s3(invoice, bucket_name, key=None):
     try:
-        key = get_invoice_pdf_key(invoice)
+        key = key or get_invoice_pdf_key(invoice)
         buffer = generate_invoice_pdf(invoice)
 
         if s3_bucket_exists(bucket_name):
@@ -614,26 +647,24 @@ def upload_invoice_pdf_to_s3(invoice, bucket_name):
     return key
 
 
-def get_invoice_presigned_url(invoice):
-    bucket_name, prod = get_bucket_name(invoice.organization)
-    key = get_invoice_pdf_key(invoice)
-    if not prod:
-        team_id = invoice.organization.team.team_id.hex
-        team = invoice.organization.team
-        team_id = team.team_id.hex + "-" + slugify(team.name)
-        key = f"{team_id}/{key}"
-
-    if (
+def skip_invoice_pdf(invoice) -> bool:
+    return (
         invoice.organization.organization_type
         == Organization.OrganizationType.EXTERNAL_DEMO
         or settings.DEBUG
-    ):
+    )
+
+
+def get_invoice_presigned_url(invoice):
+    bucket_name, key = get_invoice_pdf_location(invoice)
+
+    if skip_invoice_pdf(invoice):
         return {"exists": False, "url": None}
 
     if not s3_file_exists(bucket_name=bucket_name, key=key):
-        upload_invoice_pdf_to_s3(invoice, bucket_name)
+        upload_invoice_pdf_to_s3(invoice, bucket_name, key)
 
-    s3_client = boto3.client("s3")
+    s3_client = get_s3_client()
 
     url = s3_client.generate_presigned_url(
         ClientMethod="get_object",
@@ -641,3 +672,164 @@ def get_invoice_presigned_url(invoice):
         ExpiresIn=3600,  # URL will expire in 1 hour
     )
     return {"exists": True, "url": url}
+
+
+def _address_data(address):
+    if address is None:
+        return None
+    return [
+        address.line1,
+        address.line2,
+        address.city,
+        address.state,
+        address.postal_code,
+        address.country,
+    ]
+
+
+def get_invoice_pdf_content_hash(invoice, billing_address) -> str:
+    """
+    Hashes everything the PDF of the invoice is rendered from, so unchanged invoices don't have to be rendered and uploaded again.
+    """
+    organization = invoice.organization
+    customer = invoice.customer
+    line_items = []
+    for line_item in invoice.line_items.all():
+        sub_record = line_item.associated_subscription_record
+        line_items.append(
+            [
+                line_item.name,
+                line_item.start_date,
+                line_item.end_date,
+                line_item.quantity,
+                line_item.base,
+                line_item.amount,
+                line_item.billing_type,
+                line_item.chargeable_item_type,
+                sub_record.billing_plan.plan.plan_name if sub_record else None,
+                sub_record.subscription_filters if sub_record else None,
+                [[x.adjustment_type, x.amount] for x in line_item.adjustments.all()],
+            ]
+        )
+    data = {
+        "invoice": [
+            invoice.invoice_number,
+            invoice.issue_date,
+            invoice.due_date,
+            invoice.amount,
+            invoice.currency.symbol,
+        ],
+        "organization": [
+            organization.organization_name,
+            organization.email,
+            _address_data(organization.address),
+        ],
+        "customer": [
+            customer.customer_name,
+            customer.email,
+            _address_data(billing_address),
+        ],
+        "line_items": line_items,
+    }
+    return hashlib.sha256(
+        json.dumps(data, default=str, sort_keys=True).encode()
+    ).hexdigest()
+
+
+def get_pending_invoice_pdf_pks():
+    """
+    Invoices whose PDF has to be rendered. Invoices are generated in a single transaction, so the ones listed here are complete.
+    """
+    return list(
+        Invoice.objects.filter(pdf_content_hash__isnull=True)
+        .exclude(payment_status=Invoice.PaymentStatus.DRAFT)
+        .order_by("issue_date")
+        .values_list("pk", flat=True)
+    )
+
+
+def _invoice_pdf_queryset():
+    return Invoice.objects.select_related(
+        "organization__address",
+        "organization__team",
+        "customer__billing_address",
+        "currency",
+    ).prefetch_related(
+        "line_items__associated_subscription_record__billing_plan__plan",
+        "line_items__adjustments",
+    )
+
+
+def _ensure_bucket(s3_client, bucket_name):
+    try:
+        s3_client.head_bucket(Bucket=bucket_name)
+    except ClientError:
+        s3_client.create_bucket(Bucket=bucket_name, ACL="private")
+        logger.debug("Created bucket {}".format(bucket_name))
+
+
+def render_invoice_pdfs(invoice_pks, s3_client=None) -> int:
+    """
+    Renders the PDFs of the given invoices and uploads them to S3, skipping invoices whose PDF is already up to date. Invoices are loaded and rendered in chunks of INVOICE_PDF_BATCH_SIZE while at most INVOICE_PDF_UPLOAD_CONCURRENCY uploads run at a time. Invoices that fail to upload are left pending. Returns the number of PDFs that were uploaded.
+    """
+    if s3_client is None:
+        s3_client = get_s3_client()
+    invoice_pks = list(invoice_pks)
+    buckets = {}
+    existing_buckets = set()
+    uploaded = 0
+
+    def upload(bucket_name, key, buffer):
+        buffer.seek(0)
+        s3_client.upload_fileobj(buffer, bucket_name, key)
+
+    with ThreadPoolExecutor(max_workers=INVOICE_PDF_UPLOAD_CONCURRENCY) as executor:
+        for i in range(0, len(invoice_pks), INVOICE_PDF_BATCH_SIZE):
+            chunk = invoice_pks[i : i + INVOICE_PDF_BATCH_SIZE]
+            uploads = []
+            updated_invoices = []
+            for invoice in _invoice_pdf_queryset().filter(pk__in=chunk):
+                billing_address = invoice.customer.get_billing_address()
+                content_hash = get_invoice_pdf_content_hash(invoice, billing_address)
+                if invoice.pdf_content_hash == content_hash:
+                    continue
+                invoice.pdf_content_hash = content_hash
+                if skip_invoice_pdf(invoice):
+                    invoice.invoice_pdf = None
+                    updated_invoices.append(invoice)
+                    continue
+                if invoice.organization_id not in buckets:
+                    buckets[invoice.organization_id] = get_bucket_name(
+                        invoice.organization
+                    )
+                bucket_name, key = get_invoice_pdf_location(
+                    invoice, buckets[invoice.organization_id]
+                )
+                if bucket_name not in existing_buckets:
+                    _ensure_bucket(s3_client, bucket_name)
+                    existing_buckets.add(bucket_name)
+                buffer = generate_invoice_pdf(invoice, billing_address)
+                future = executor.submit(upload, bucket_name, key, buffer)
+                uploads.append((invoice, bucket_name, key, future))
+            for invoice, bucket_name, key, future in uploads:
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(
+                        "Error uploading the PDF of invoice {}: {}".format(
+                            invoice.invoice_number, e
+                        )
+                    )
+                    sentry_sdk.capture_exception(e)
+                    continue
+                invoice.invoice_pdf = s3_client.generate_presigned_url(
+                    ClientMethod="get_object",
+                    Params={"Bucket": bucket_name, "Key": key},
+                    ExpiresIn=3600,  # URL will expire in 1 hour
+                )
+                updated_invoices.append(invoice)
+                uploaded += 1
+            Invoice.objects.bulk_update(
+                updated_invoices, ["invoice_pdf", "pdf_content_hash"]
+            )
+    return uploaded
@@ -4,6 +4,7 @@ from dataclasses import dataclass
 import sentry_sdk
 from django.conf import settings
 
+from metering_billing.aggregation.event_catalog import record_catalog_events
 from metering_billing.models import Event
 from metering_billing.utils import now_utc
 
@@ -67,3 +68,8 @@ def write_batch_events_to_db(buffer):
             events_to_insert.append(Event(**{**event, "inserted_at": now}))
         ## now insert events
         Event.objects.bulk_create(events_to_insert, ignore_conflicts=True)
+        try:
+            record_catalog_events(org_pk, events_list)
+        except Exception as e:
+            # the catalog can be backfilled, never block ingestion on it
+            sentry_sdk.capture_exception(e)
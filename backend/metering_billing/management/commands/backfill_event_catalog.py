@@ -0,0 +1,24 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from metering_billing.aggregation.event_catalog import backfill_event_catalog
+from metering_billing.models import Organization
+
+
+class Command(BaseCommand):
+    "Django command to load existing events into the event catalog"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--organization", type=int, required=False)
+        parser.add_argument("--window-hours", type=int, default=24)
+        parser.add_argument("--reset", action="store_true")
+
+    def handle(self, *args, **options):
+        organizations = Organization.objects.all()
+        if options["organization"] is not None:
+            organizations = organizations.filter(pk=options["organization"])
+        window = datetime.timedelta(hours=options["window_hours"])
+        for organization in organizations.order_by("pk"):
+            backfill_event_catalog(organization, window=window, reset=options["reset"])
+            self.stdout.write(f"Backfilled the event catalog of {organization}")
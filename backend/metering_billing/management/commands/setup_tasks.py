@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.core.management.base import BaseCommand
 from django_celery_beat.models import IntervalSchedule, PeriodicTask
 from dotenv import load_dotenv
@@ -8,6 +9,10 @@ load_dotenv()
 class Command(BaseCommand):
     def handle(self, *args, **options):
         # Create schedules
+        every_day, _ = IntervalSchedule.objects.get_or_create(
+            every=1,
+            period=IntervalSchedule.DAYS,
+        )
         every_hour, _ = IntervalSchedule.objects.get_or_create(
             every=1,
             period=IntervalSchedule.HOURS,
@@ -24,6 +29,10 @@ class Command(BaseCommand):
             every=3,
             period=IntervalSchedule.MINUTES,
         )
+        every_15_seconds, _ = IntervalSchedule.objects.get_or_create(
+            every=15,
+            period=IntervalSchedule.SECONDS,
+        )
 
         # create tasks
         PeriodicTask.objects.update_or_create(
@@ -32,16 +41,47 @@ class Command(BaseCommand):
             defaults={"interval": every_hour, "crontab": None},
         )
 
+        # outbox messages are dispatched right after they commit, this retries
+        # failed ones and picks up any that were missed
+        PeriodicTask.objects.update_or_create(
+            name="Dispatch Webhooks",
+            task="metering_billing.tasks.dispatch_webhooks",
+            defaults={
+                "interval": every_3_minutes,
+                "crontab": None,
+                "enabled": settings.WEBHOOK_OUTBOX_ENABLED,
+            },
+        )
+
+        PeriodicTask.objects.update_or_create(
+            name="Render Invoice PDFs",
+            task="metering_billing.tasks.generate_invoice_pdfs",
+            defaults={
+                "interval": every_5_mins,
+                "crontab": None,
+                "enabled": settings.INVOICE_PDF_BATCH_ENABLED,
+            },
+        )
+
         PeriodicTask.objects.update_or_create(
             name="Check Payment Intent status and update invoice",
             task="metering_billing.tasks.update_invoice_status",
             defaults={"interval": every_15_mins, "crontab": None},
         )
 
+        # with alert counters the event tail fires alerts as events are inserted, so
+        # the refresh only has to reconcile them
         PeriodicTask.objects.update_or_create(
             name="Run Alert Refreshes",
             task="metering_billing.tasks.refresh_alerts",
-            defaults={"interval": every_3_minutes, "crontab": None},
+            defaults={
+                "interval": (
+                    every_15_mins
+                    if settings.ALERT_COUNTERS_ENABLED
+                    else every_3_minutes
+                ),
+                "crontab": None,
+            },
         )
 
         PeriodicTask.objects.update_or_create(
@@ -62,6 +102,44 @@ class Command(BaseCommand):
             defaults={"interval": every_15_mins, "crontab": None},
         )
 
+        PeriodicTask.objects.update_or_create(
+            name="Checkpoint Gauge States",
+            task="metering_billing.tasks.checkpoint_gauge_states",
+            defaults={"interval": every_hour, "crontab": None},
+        )
+
+        PeriodicTask.objects.update_or_create(
+            name="Update Revenue Ledger",
+            task="metering_billing.tasks.update_revenue_ledger",
+            defaults={"interval": every_hour, "crontab": None},
+        )
+
+        # late events the event volume aggregate's refresh policy doesn't cover
+        PeriodicTask.objects.update_or_create(
+            name="Refresh Event Volume",
+            task="metering_billing.tasks.refresh_event_volume",
+            defaults={"interval": every_day, "crontab": None},
+        )
+
+        # feeds the counters with the events ingested by any service
+        PeriodicTask.objects.update_or_create(
+            name="Advance Event Tail",
+            task="metering_billing.tasks.advance_event_tail",
+            defaults={
+                "interval": every_15_seconds,
+                "crontab": None,
+                "enabled": settings.RATE_COUNTERS_ENABLED
+                or settings.ALERT_COUNTERS_ENABLED,
+            },
+        )
+
+        if settings.RATE_COUNTERS_ENABLED:
+            PeriodicTask.objects.update_or_create(
+                name="Reconcile Rate Counters",
+                task="metering_billing.tasks.reconcile_rate_counters",
+                defaults={"interval": every_5_mins, "crontab": None},
+            )
+
         PeriodicTask.objects.update_or_create(
             name="Sync with CRM",
             task="metering_billing.tasks.sync_all_crm_integrations",
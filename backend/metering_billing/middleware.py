@@ -3,6 +3,7 @@ import logging
 from django.core.cache import cache
 from metering_billing.models import APIToken, Organization
 from metering_billing.permissions import HasUserAPIKey
+from metering_billing.serializers.serializer_utils import request_timezone_resolver
 from metering_billing.utils import now_utc
 
 logger = logging.getLogger("django.server")
@@ -52,3 +53,13 @@ class OrganizationInsertMiddleware:
         response = self.get_response(request)
 
         return response
+
+
+class TimezoneResolverMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        # customer and organization timezones are resolved once per request
+        with request_timezone_resolver():
+            return self.get_response(request)
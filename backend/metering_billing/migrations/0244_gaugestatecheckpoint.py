@@ -0,0 +1,74 @@
+# Generated by Django 4.0.5 on 2023-05-22 17:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("metering_billing", "0243_alter_backtest_backtest_name_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GaugeStateCheckpoint",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("uuidv5_customer_id", models.UUIDField()),
+                ("group_values", models.JSONField(blank=True, default=dict)),
+                ("checkpoint_time", models.DateTimeField()),
+                ("usage_qty", models.DecimalField(decimal_places=10, max_digits=20)),
+                (
+                    "metric",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="gauge_state_checkpoints",
+                        to="metering_billing.metric",
+                    ),
+                ),
+                (
+                    "organization",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="metering_billing.organization",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="gaugestatecheckpoint",
+            index=models.Index(
+                fields=["metric", "uuidv5_customer_id", "checkpoint_time"],
+                name="metering_bi_metric__b7291e_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="gaugestatecheckpoint",
+            index=models.Index(
+                fields=["metric", "checkpoint_time"],
+                name="metering_bi_metric__9a2c11_idx",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="gaugestatecheckpoint",
+            constraint=models.UniqueConstraint(
+                fields=(
+                    "metric",
+                    "uuidv5_customer_id",
+                    "group_values",
+                    "checkpoint_time",
+                ),
+                name="unique_gauge_state_checkpoint",
+            ),
+        ),
+    ]
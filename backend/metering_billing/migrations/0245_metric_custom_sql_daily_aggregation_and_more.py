@@ -0,0 +1,105 @@
+# Generated by Django 4.0.5 on 2023-05-23 09:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("metering_billing", "0244_gaugestatecheckpoint"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="historicalmetric",
+            name="custom_sql_daily_aggregation",
+            field=models.CharField(
+                blank=True,
+                choices=[
+                    ("count", "Count"),
+                    ("sum", "Sum"),
+                    ("max", "Max"),
+                    ("unique", "Unique"),
+                    ("latest", "Latest"),
+                    ("average", "Average"),
+                ],
+                help_text="Only applies to metrics of type 'custom'. If set, the custom SQL only depends on the events between start_date and end_date, so it can be evaluated one day at a time and the daily results combined with this aggregation (sum or max). Results for closed days are then materialized instead of being recomputed.",
+                max_length=10,
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="metric",
+            name="custom_sql_daily_aggregation",
+            field=models.CharField(
+                blank=True,
+                choices=[
+                    ("count", "Count"),
+                    ("sum", "Sum"),
+                    ("max", "Max"),
+                    ("unique", "Unique"),
+                    ("latest", "Latest"),
+                    ("average", "Average"),
+                ],
+                help_text="Only applies to metrics of type 'custom'. If set, the custom SQL only depends on the events between start_date and end_date, so it can be evaluated one day at a time and the daily results combined with this aggregation (sum or max). Results for closed days are then materialized instead of being recomputed.",
+                max_length=10,
+                null=True,
+            ),
+        ),
+        migrations.CreateModel(
+            name="CustomMetricDailyUsage",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("sql_hash", models.CharField(max_length=32)),
+                ("uuidv5_customer_id", models.UUIDField()),
+                ("group_values", models.JSONField(blank=True, default=dict)),
+                ("date", models.DateField()),
+                ("usage_qty", models.DecimalField(decimal_places=10, max_digits=20)),
+                (
+                    "metric",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="custom_daily_usage",
+                        to="metering_billing.metric",
+                    ),
+                ),
+                (
+                    "organization",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="metering_billing.organization",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="custommetricdailyusage",
+            index=models.Index(
+                fields=["metric", "sql_hash", "uuidv5_customer_id", "date"],
+                name="metering_bi_metric__d9fc06_idx",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="custommetricdailyusage",
+            constraint=models.UniqueConstraint(
+                fields=(
+                    "metric",
+                    "sql_hash",
+                    "uuidv5_customer_id",
+                    "group_values",
+                    "date",
+                ),
+                name="unique_custom_metric_daily_usage",
+            ),
+        ),
+    ]
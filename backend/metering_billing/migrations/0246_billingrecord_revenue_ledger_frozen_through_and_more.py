@@ -0,0 +1,88 @@
+# Generated by Django 4.0.5 on 2023-05-24 11:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("metering_billing", "0245_metric_custom_sql_daily_aggregation_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="billingrecord",
+            name="revenue_ledger_frozen_through",
+            field=models.DateField(
+                blank=True,
+                help_text="Days up to and including this date are closed and final in the earned revenue ledger.",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="billingrecord",
+            name="revenue_ledger_refreshed_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name="BillingRecordDailyRevenue",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("revenue", models.DecimalField(decimal_places=10, max_digits=20)),
+                ("usage_qty", models.DecimalField(decimal_places=10, max_digits=20)),
+                (
+                    "billing_record",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_revenue",
+                        to="metering_billing.billingrecord",
+                    ),
+                ),
+                (
+                    "customer",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="metering_billing.customer",
+                    ),
+                ),
+                (
+                    "organization",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="metering_billing.organization",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="billingrecorddailyrevenue",
+            index=models.Index(
+                fields=["organization", "date"], name="metering_bi_organiz_7302e4_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="billingrecorddailyrevenue",
+            index=models.Index(
+                fields=["customer", "date"], name="metering_bi_custome_4f9dbb_idx"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="billingrecorddailyrevenue",
+            constraint=models.UniqueConstraint(
+                fields=("billing_record", "date"),
+                name="unique_billing_record_daily_revenue",
+            ),
+        ),
+    ]
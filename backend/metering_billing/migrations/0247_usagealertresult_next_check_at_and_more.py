@@ -0,0 +1,31 @@
+# Generated by Django 4.0.5 on 2023-05-25 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        (
+            "metering_billing",
+            "0246_billingrecord_revenue_ledger_frozen_through_and_more",
+        ),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="usagealertresult",
+            name="next_check_at",
+            field=models.DateTimeField(
+                blank=True,
+                help_text="When the periodic refresh should evaluate this alert again. Null means as soon as possible.",
+                null=True,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="usagealertresult",
+            index=models.Index(
+                fields=["next_check_at"], name="metering_bi_next_ch_df8780_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 4.0.5 on 2023-05-26 10:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BACKFILL_SEQUENCES = r"""
+INSERT INTO metering_billing_invoicenumbersequence
+    (organization_id, issue_date, last_number)
+SELECT
+    organization_id,
+    to_date(left(invoice_number, 6), 'YYMMDD'),
+    max(substr(invoice_number, 8)::integer)
+FROM metering_billing_invoice
+WHERE invoice_number ~ '^\d{6}-\d{6}$'
+GROUP BY organization_id, left(invoice_number, 6)
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("metering_billing", "0247_usagealertresult_next_check_at_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="InvoiceNumberSequence",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("issue_date", models.DateField()),
+                ("last_number", models.PositiveIntegerField(default=0)),
+                (
+                    "organization",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="metering_billing.organization",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="invoicenumbersequence",
+            constraint=models.UniqueConstraint(
+                fields=("organization", "issue_date"),
+                name="unique_invoice_number_sequence",
+            ),
+        ),
+        migrations.RunSQL(BACKFILL_SEQUENCES, migrations.RunSQL.noop),
+    ]
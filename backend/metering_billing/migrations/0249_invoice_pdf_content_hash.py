@@ -0,0 +1,37 @@
+# Generated by Django 4.0.5 on 2023-05-27 14:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("metering_billing", "0248_invoicenumbersequence"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="invoice",
+            name="pdf_content_hash",
+            field=models.CharField(
+                blank=True,
+                help_text="Hash of the data the current PDF was rendered from. Null means the PDF still has to be rendered.",
+                max_length=64,
+                null=True,
+            ),
+        ),
+        # existing invoices were rendered one by one when they were created, don't
+        # queue them up for the batch renderer
+        migrations.RunSQL(
+            "UPDATE metering_billing_invoice SET pdf_content_hash = ''",
+            migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name="invoice",
+            index=models.Index(
+                condition=models.Q(("pdf_content_hash__isnull", True)),
+                fields=["issue_date"],
+                name="invoice_pdf_pending_idx",
+            ),
+        ),
+    ]
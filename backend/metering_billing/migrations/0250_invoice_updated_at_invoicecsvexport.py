@@ -0,0 +1,67 @@
+# Generated by Django 4.0.5 on 2023-05-29 08:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+import metering_billing.utils.utils
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("metering_billing", "0249_invoice_pdf_content_hash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="invoice",
+            name="updated_at",
+            field=models.DateTimeField(
+                default=metering_billing.utils.utils.now_utc,
+                help_text="Last time the invoice was saved, used for incremental exports.",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="invoice",
+            index=models.Index(
+                fields=["organization", "updated_at"],
+                name="metering_bi_organiz_d2c273_idx",
+            ),
+        ),
+        migrations.CreateModel(
+            name="InvoiceCSVExport",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "created",
+                    models.DateTimeField(default=metering_billing.utils.utils.now_utc),
+                ),
+                ("changed_since", models.DateTimeField(blank=True, null=True)),
+                ("changed_through", models.DateTimeField()),
+                ("csv_filename", models.TextField()),
+                (
+                    "organization",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="invoice_csv_exports",
+                        to="metering_billing.organization",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="invoicecsvexport",
+            index=models.Index(
+                fields=["organization", "-changed_through"],
+                name="metering_bi_organiz_a9d7ae_idx",
+            ),
+        ),
+    ]
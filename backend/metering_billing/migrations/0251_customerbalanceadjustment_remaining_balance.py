@@ -0,0 +1,38 @@
+# Generated by Django 4.0.5 on 2023-05-30 11:52
+
+from django.db import migrations, models
+
+BACKFILL_REMAINING_BALANCE = """
+UPDATE metering_billing_customerbalanceadjustment AS credit
+SET remaining_balance = credit.amount + COALESCE(
+    (
+        SELECT SUM(drawdown.amount)
+        FROM metering_billing_customerbalanceadjustment AS drawdown
+        WHERE drawdown.parent_adjustment_id = credit.id
+    ),
+    0
+)
+WHERE credit.amount > 0
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("metering_billing", "0250_invoice_updated_at_invoicecsvexport"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="customerbalanceadjustment",
+            name="remaining_balance",
+            field=models.DecimalField(
+                blank=True,
+                decimal_places=10,
+                help_text="For credits, the amount that hasn't been drawn down yet. Null for drawdowns.",
+                max_digits=20,
+                null=True,
+            ),
+        ),
+        migrations.RunSQL(BACKFILL_REMAINING_BALANCE, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,100 @@
+# Generated by Django 4.0.5 on 2023-05-31 15:20
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.db import migrations, models
+
+import metering_billing.utils.utils
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("metering_billing", "0251_customerbalanceadjustment_remaining_balance"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="WebhookOutboxMessage",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "event_type",
+                    models.CharField(
+                        choices=[
+                            ("customer.created", "customer.created"),
+                            ("invoice.created", "invoice.created"),
+                            ("invoice.paid", "invoice.paid"),
+                            ("invoice.past_due", "invoice.past_due"),
+                            ("subscription.created", "subscription.created"),
+                            ("usage_alert.triggered", "usage_alert.triggered"),
+                            ("subscription.cancelled", "subscription.cancelled"),
+                            ("subscription.renewed", "subscription.renewed"),
+                        ],
+                        max_length=40,
+                    ),
+                ),
+                ("event_id", models.TextField()),
+                (
+                    "payload",
+                    models.JSONField(
+                        encoder=django.core.serializers.json.DjangoJSONEncoder
+                    ),
+                ),
+                (
+                    "created",
+                    models.DateTimeField(default=metering_billing.utils.utils.now_utc),
+                ),
+                ("attempts", models.PositiveSmallIntegerField(default=0)),
+                (
+                    "next_attempt_at",
+                    models.DateTimeField(
+                        blank=True,
+                        default=metering_billing.utils.utils.now_utc,
+                        help_text="Null once the message was given up on.",
+                        null=True,
+                    ),
+                ),
+                ("sent_at", models.DateTimeField(blank=True, null=True)),
+                ("last_error", models.TextField(blank=True, null=True)),
+                (
+                    "organization",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="metering_billing.organization",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="webhookoutboxmessage",
+            index=models.Index(
+                condition=models.Q(("sent_at__isnull", True)),
+                fields=["next_attempt_at"],
+                name="webhook_outbox_due_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="webhookoutboxmessage",
+            index=models.Index(
+                fields=["sent_at"], name="metering_bi_sent_at_f7eb2f_idx"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="webhookoutboxmessage",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("sent_at__isnull", True)),
+                fields=("organization", "event_id"),
+                name="unique_unsent_webhook_event",
+            ),
+        ),
+    ]
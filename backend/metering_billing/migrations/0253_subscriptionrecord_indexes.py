@@ -0,0 +1,27 @@
+# Generated by Django 4.0.5 on 2023-06-01 10:04
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("metering_billing", "0252_webhookoutboxmessage"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="subscriptionrecord",
+            index=models.Index(
+                fields=["organization", "-start_date"],
+                name="metering_bi_organiz_ae5519_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="subscriptionrecord",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["subscription_filters"], name="metering_bi_subscri_9b9f27_gin"
+            ),
+        ),
+    ]
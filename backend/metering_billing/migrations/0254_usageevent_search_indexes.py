@@ -0,0 +1,48 @@
+# Generated by Django 4.0.5 on 2023-06-02 10:12
+
+from django.db import migrations
+
+
+def _create_event_index(name, columns):
+    return migrations.RunSQL(
+        f"""
+        CREATE INDEX IF NOT EXISTS {name}
+            ON metering_billing_usageevent ({columns})
+            WITH (timescaledb.transaction_per_chunk);
+        """,
+        reverse_sql=f"DROP INDEX IF EXISTS {name};",
+    )
+
+
+class Migration(migrations.Migration):
+    # transaction_per_chunk builds the index one chunk at a time, only locking the chunk
+    # being indexed, and can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ("metering_billing", "0253_subscriptionrecord_indexes"),
+    ]
+
+    operations = [
+        _create_event_index(
+            "metering_billing_usageevent_org_time_idem_idx",
+            "organization_id, time_created DESC, idempotency_id DESC",
+        ),
+        _create_event_index(
+            "metering_billing_usageevent_org_cust_time_idx",
+            "organization_id, uuidv5_customer_id, time_created DESC",
+        ),
+        _create_event_index(
+            "metering_billing_usageevent_org_idem_idx",
+            "organization_id, uuidv5_idempotency_id",
+        ),
+        # text_pattern_ops serves prefix searches (LIKE 'abc%') whatever the collation
+        _create_event_index(
+            "metering_billing_usageevent_org_cust_id_prefix_idx",
+            "organization_id, cust_id text_pattern_ops",
+        ),
+        _create_event_index(
+            "metering_billing_usageevent_org_idem_prefix_idx",
+            "organization_id, idempotency_id text_pattern_ops",
+        ),
+    ]
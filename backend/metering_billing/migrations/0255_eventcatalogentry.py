@@ -0,0 +1,158 @@
+# Generated by Django 4.0.5 on 2023-06-03 09:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("metering_billing", "0254_usageevent_search_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="EventCatalogEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("event_name", models.TextField()),
+                (
+                    "property_key",
+                    models.TextField(
+                        blank=True,
+                        help_text="Empty for the entry of the event name itself.",
+                    ),
+                ),
+                (
+                    "inferred_type",
+                    models.TextField(
+                        blank=True,
+                        help_text="The JSON type of the property's values, or mixed if they don't agree.",
+                    ),
+                ),
+                ("first_seen", models.DateTimeField()),
+                ("last_seen", models.DateTimeField()),
+                ("sample_values", models.JSONField(blank=True, default=list)),
+                (
+                    "organization",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="metering_billing.organization",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="eventcatalogentry",
+            constraint=models.UniqueConstraint(
+                fields=("organization", "event_name", "property_key"),
+                name="unique_event_catalog_entry",
+            ),
+        ),
+        migrations.RunSQL(
+            """
+            CREATE OR REPLACE FUNCTION update_event_catalog(p_events jsonb) RETURNS VOID AS $$
+            WITH events AS (
+                SELECT
+                    (event ->> 'organization_id')::bigint AS organization_id,
+                    event ->> 'event_name' AS event_name,
+                    (event ->> 'time_created')::timestamptz AS time_created,
+                    CASE
+                        WHEN jsonb_typeof(event -> 'properties') = 'object'
+                        THEN event -> 'properties'
+                        ELSE '{}'::jsonb
+                    END AS properties
+                FROM jsonb_array_elements(p_events) AS event
+            ),
+            entries AS (
+                SELECT
+                    organization_id,
+                    event_name,
+                    '' AS property_key,
+                    '' AS inferred_type,
+                    time_created,
+                    NULL::jsonb AS value
+                FROM events
+                UNION ALL
+                SELECT
+                    events.organization_id,
+                    events.event_name,
+                    properties.key,
+                    jsonb_typeof(properties.value),
+                    events.time_created,
+                    properties.value
+                FROM events, jsonb_each(events.properties) AS properties
+            )
+            INSERT INTO metering_billing_eventcatalogentry AS catalog (
+                organization_id,
+                event_name,
+                property_key,
+                inferred_type,
+                first_seen,
+                last_seen,
+                sample_values
+            )
+            SELECT
+                organization_id,
+                event_name,
+                property_key,
+                CASE
+                    WHEN count(DISTINCT inferred_type) FILTER (WHERE inferred_type <> 'null') > 1
+                    THEN 'mixed'
+                    ELSE coalesce(max(inferred_type) FILTER (WHERE inferred_type <> 'null'), 'null')
+                END,
+                min(time_created),
+                max(time_created),
+                coalesce(
+                    jsonb_path_query_array(
+                        jsonb_agg(DISTINCT value) FILTER (
+                            WHERE jsonb_typeof(value) IN ('string', 'number', 'boolean')
+                        ),
+                        '$[0 to 4]'
+                    ),
+                    '[]'::jsonb
+                )
+            FROM entries
+            GROUP BY organization_id, event_name, property_key
+            -- a consistent lock order keeps concurrent consumers from deadlocking
+            ORDER BY organization_id, event_name, property_key
+            ON CONFLICT (organization_id, event_name, property_key) DO UPDATE SET
+                inferred_type = CASE
+                    WHEN catalog.inferred_type = EXCLUDED.inferred_type
+                        OR EXCLUDED.inferred_type = 'null'
+                    THEN catalog.inferred_type
+                    WHEN catalog.inferred_type = 'null' THEN EXCLUDED.inferred_type
+                    ELSE 'mixed'
+                END,
+                first_seen = least(catalog.first_seen, EXCLUDED.first_seen),
+                last_seen = greatest(catalog.last_seen, EXCLUDED.last_seen),
+                sample_values = CASE
+                    WHEN jsonb_array_length(catalog.sample_values) >= 5
+                    THEN catalog.sample_values
+                    ELSE coalesce(
+                        jsonb_path_query_array(
+                            (
+                                SELECT jsonb_agg(DISTINCT samples.value)
+                                FROM jsonb_array_elements(
+                                    catalog.sample_values || EXCLUDED.sample_values
+                                ) AS samples(value)
+                            ),
+                            '$[0 to 4]'
+                        ),
+                        '[]'::jsonb
+                    )
+                END;
+            $$ LANGUAGE sql;
+            """,
+            reverse_sql="DROP FUNCTION IF EXISTS update_event_catalog(jsonb);",
+        ),
+    ]
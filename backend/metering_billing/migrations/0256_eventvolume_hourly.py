@@ -0,0 +1,39 @@
+# Generated by Django 4.0.5 on 2023-06-05 14:22
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # the aggregate is created empty, the refresh_event_volume task materializes the
+    # existing events after the deploy
+    dependencies = [
+        ("metering_billing", "0255_eventcatalogentry"),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            """
+            CREATE MATERIALIZED VIEW IF NOT EXISTS metering_billing_eventvolume_hourly
+            WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+            SELECT
+                organization_id,
+                event_name,
+                time_bucket(INTERVAL '1 hour', time_created) AS bucket,
+                COUNT(*) AS num_events
+            FROM metering_billing_usageevent
+            GROUP BY organization_id, event_name, bucket
+            WITH NO DATA;
+            """,
+            reverse_sql="DROP MATERIALIZED VIEW IF EXISTS metering_billing_eventvolume_hourly;",
+        ),
+        migrations.RunSQL(
+            """
+            SELECT add_continuous_aggregate_policy('metering_billing_eventvolume_hourly',
+                start_offset => INTERVAL '32 days',
+                end_offset => INTERVAL '1 hour',
+                schedule_interval => INTERVAL '15 minutes',
+                if_not_exists => TRUE);
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.0.5 on 2023-06-06 11:40
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # transaction_per_chunk builds the index one chunk at a time, only locking the chunk
+    # being indexed, and can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ("metering_billing", "0256_eventvolume_hourly"),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            """
+            CREATE INDEX IF NOT EXISTS metering_billing_usageevent_inserted_at_idx
+                ON metering_billing_usageevent (inserted_at)
+                WITH (timescaledb.transaction_per_chunk);
+            """,
+            reverse_sql="DROP INDEX IF EXISTS metering_billing_usageevent_inserted_at_idx;",
+        ),
+    ]
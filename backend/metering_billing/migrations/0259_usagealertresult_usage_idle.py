@@ -0,0 +1,21 @@
+# Generated by Django 4.0.5 on 2023-06-06 13:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("metering_billing", "0258_usageevent_inserted_at_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="usagealertresult",
+            name="usage_idle",
+            field=models.BooleanField(
+                default=False,
+                help_text="Usage didn't grow on the last run, so there was no rate to schedule the next check by. New events for the customer make the alert due right away.",
+            ),
+        ),
+    ]
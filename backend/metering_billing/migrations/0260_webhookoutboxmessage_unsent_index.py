@@ -0,0 +1,25 @@
+# Generated by Django 4.0.5 on 2023-06-06 14:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("metering_billing", "0259_usagealertresult_usage_idle"),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name="webhookoutboxmessage",
+            name="unique_unsent_webhook_event",
+        ),
+        migrations.AddIndex(
+            model_name="webhookoutboxmessage",
+            index=models.Index(
+                condition=models.Q(("sent_at__isnull", True)),
+                fields=["organization", "event_type", "event_id"],
+                name="webhook_outbox_unsent_idx",
+            ),
+        ),
+    ]
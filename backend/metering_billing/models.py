@@ -13,19 +13,21 @@ from dateutil.relativedelta import relativedelta
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
 from django.core.cache import cache
 from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import (
     MaxLengthValidator,
     MaxValueValidator,
     MinLengthValidator,
     MinValueValidator,
 )
-from django.db import connection, models
-from django.db.models import Count, F, FloatField, Q, Sum
+from django.db import connection, models, transaction
+from django.db.models import Count, F, Q, Sum
 from django.db.models.constraints import CheckConstraint, UniqueConstraint
-from django.db.models.functions import Cast, Coalesce
 from django.utils.translation import gettext_lazy as _
+from metering_billing.catalog_cache import bump_catalog_version
 from metering_billing.exceptions.exceptions import (
     ExternalConnectionFailure,
     NotEditable,
@@ -71,7 +73,11 @@ from metering_billing.utils.enums import (
     TAX_PROVIDER,
     WEBHOOK_TRIGGER_EVENTS,
 )
-from metering_billing.webhooks import invoice_paid_webhook, usage_alert_webhook
+from metering_billing.webhooks import (
+    invalidate_webhook_triggers,
+    invoice_paid_webhook,
+    usage_alert_webhook,
+)
 from rest_framework_api_key.models import AbstractAPIKey
 from simple_history.models import HistoricalRecords
 from svix.api import ApplicationIn, EndpointIn, EndpointSecretRotateIn, EndpointUpdate
@@ -85,6 +91,8 @@ logger = logging.getLogger("django.server")
 META = settings.META
 SVIX_CONNECTOR = settings.SVIX_CONNECTOR
 CUSTOMER_ID_NAMESPACE = settings.CUSTOMER_ID_NAMESPACE
+ALERT_CHECK_MIN_INTERVAL = datetime.timedelta(minutes=3)
+ALERT_CHECK_MAX_INTERVAL = datetime.timedelta(hours=1)
 
 
 class Team(models.Model):
@@ -522,6 +530,13 @@ class WebhookEndpoint(models.Model):
                         dictionary
                     )
                 )
+        invalidate_webhook_triggers(self.organization)
+
+    def delete(self, *args, **kwargs):
+        organization = self.organization
+        result = super().delete(*args, **kwargs)
+        invalidate_webhook_triggers(organization)
+        return result
 
 
 class WebhookTrigger(models.Model):
@@ -547,6 +562,45 @@ class WebhookTrigger(models.Model):
         ]
 
 
+class WebhookOutboxMessage(models.Model):
+    """
+    A webhook message waiting to be sent, written in the same transaction as the change it announces and sent by the dispatch_webhooks task.
+    """
+
+    organization = models.ForeignKey(
+        Organization, on_delete=models.CASCADE, related_name="+"
+    )
+    event_type = models.CharField(choices=WEBHOOK_TRIGGER_EVENTS.choices, max_length=40)
+    event_id = models.TextField()
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    created = models.DateTimeField(default=now_utc)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(
+        default=now_utc,
+        null=True,
+        blank=True,
+        help_text="Null once the message was given up on.",
+    )
+    sent_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # newer messages for the same event replace the unsent one, unless it's being sent
+            models.Index(
+                fields=["organization", "event_type", "event_id"],
+                condition=Q(sent_at__isnull=True),
+                name="webhook_outbox_unsent_idx",
+            ),
+            models.Index(
+                fields=["next_attempt_at"],
+                condition=Q(sent_at__isnull=True),
+                name="webhook_outbox_due_idx",
+            ),
+            models.Index(fields=["sent_at"]),
+        ]
+
+
 class User(AbstractUser):
     organization = models.ForeignKey(
         Organization,
@@ -866,6 +920,13 @@ class CustomerBalanceAdjustment(models.Model):
         choices=CUSTOMER_BALANCE_ADJUSTMENT_STATUS.choices,
         default=CUSTOMER_BALANCE_ADJUSTMENT_STATUS.ACTIVE,
     )
+    remaining_balance = models.DecimalField(
+        decimal_places=10,
+        max_digits=20,
+        null=True,
+        blank=True,
+        help_text="For credits, the amount that hasn't been drawn down yet. Null for drawdowns.",
+    )
 
     def __str__(self):
         return f"{self.customer.customer_name} {self.amount} {self.created}"
@@ -899,6 +960,8 @@ class CustomerBalanceAdjustment(models.Model):
                 )
             if self.expires_at is not None and now_utc() > self.expires_at:
                 raise NotEditable("Cannot change the expiry date to the past")
+            # drawdowns update the balance in the database, don't overwrite it
+            self.remaining_balance = orig.remaining_balance
         if self.amount < 0:
             assert (
                 self.parent_adjustment is not None
@@ -924,9 +987,18 @@ class CustomerBalanceAdjustment(models.Model):
             self.amount_paid_currency = None
         if not self.pricing_unit:
             raise ValidationError("Pricing unit must be provided")
+        if new and self.amount > 0:
+            self.remaining_balance = self.amount
         super(CustomerBalanceAdjustment, self).save(*args, **kwargs)
+        if new and self.parent_adjustment:
+            CustomerBalanceAdjustment.objects.filter(
+                pk=self.parent_adjustment.pk
+            ).update(remaining_balance=F("remaining_balance") + self.amount)
+            self.parent_adjustment.remaining_balance += self.amount
 
     def get_remaining_balance(self):
+        if self.remaining_balance is not None:
+            return self.remaining_balance
         try:
             dd_aggregate = self.total_drawdowns
         except AttributeError:
@@ -960,79 +1032,186 @@ class CustomerBalanceAdjustment(models.Model):
 
     @staticmethod
     def draw_down_amount(customer, amount, pricing_unit, description=""):
+        """
+        Draws the amount down from the customer's active credits, the ones expiring first and then the ones with the highest cost basis first. The allocation, the balance updates and the drawdown rows are a single statement. Returns the part of the amount the credits didn't cover.
+        """
         now = now_utc()
-        adjs = (
-            CustomerBalanceAdjustment.objects.filter(
-                Q(expires_at__gte=now) | Q(expires_at__isnull=True),
-                organization=customer.organization,
-                customer=customer,
-                pricing_unit=pricing_unit,
-                amount__gt=0,
-                status=CUSTOMER_BALANCE_ADJUSTMENT_STATUS.ACTIVE,
+        # created is unique per customer, so space out the drawdowns by a microsecond
+        query = """
+            WITH credits AS (
+                SELECT
+                    id,
+                    remaining_balance,
+                    expires_at,
+                    COALESCE(amount_paid / NULLIF(amount, 0), 0)::float AS cost_basis
+                FROM metering_billing_customerbalanceadjustment
+                WHERE organization_id = %(organization_id)s
+                    AND customer_id = %(customer_id)s
+                    AND pricing_unit_id = %(pricing_unit_id)s
+                    AND amount > 0
+                    AND remaining_balance > 0
+                    AND status = %(active)s
+                    AND (expires_at IS NULL OR expires_at >= %(now)s)
+                FOR UPDATE
+            ),
+            ranked AS (
+                SELECT
+                    id,
+                    remaining_balance,
+                    SUM(remaining_balance) OVER (
+                        ORDER BY expires_at ASC NULLS LAST, cost_basis DESC, id
+                    ) - remaining_balance AS drawn_before
+                FROM credits
+            ),
+            allocations AS (
+                SELECT id, LEAST(remaining_balance, %(amount)s - drawn_before) AS drawdown
+                FROM ranked
+                WHERE drawn_before < %(amount)s
+            ),
+            updated AS (
+                UPDATE metering_billing_customerbalanceadjustment AS credit
+                SET
+                    remaining_balance = credit.remaining_balance - allocations.drawdown,
+                    status = CASE
+                        WHEN credit.remaining_balance - allocations.drawdown <= 0
+                        THEN %(inactive)s
+                        ELSE credit.status
+                    END
+                FROM allocations
+                WHERE credit.id = allocations.id
+                RETURNING credit.id, allocations.drawdown
             )
-            .annotate(
-                cost_basis=Cast(
-                    Coalesce(F("amount_paid") / F("amount"), 0), FloatField()
-                )
+            INSERT INTO metering_billing_customerbalanceadjustment (
+                adjustment_id,
+                organization_id,
+                customer_id,
+                amount,
+                pricing_unit_id,
+                description,
+                created,
+                effective_at,
+                parent_adjustment_id,
+                amount_paid,
+                status
             )
-            .order_by(
-                F("expires_at").asc(nulls_last=True),
-                F("cost_basis").desc(nulls_last=True),
+            SELECT
+                uuid_generate_v4(),
+                %(organization_id)s,
+                %(customer_id)s,
+                -drawdown,
+                %(pricing_unit_id)s,
+                %(description)s,
+                %(now)s + ROW_NUMBER() OVER (ORDER BY id) * INTERVAL '1 microsecond',
+                %(now)s,
+                id,
+                0,
+                %(active)s
+            FROM updated
+            RETURNING amount
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                query,
+                {
+                    "organization_id": customer.organization_id,
+                    "customer_id": customer.id,
+                    "pricing_unit_id": pricing_unit.id,
+                    "amount": amount,
+                    "description": description,
+                    "now": now,
+                    "active": CUSTOMER_BALANCE_ADJUSTMENT_STATUS.ACTIVE,
+                    "inactive": CUSTOMER_BALANCE_ADJUSTMENT_STATUS.INACTIVE,
+                },
             )
-            .annotate(
-                drawn_down_amount=Coalesce(
-                    Sum("drawdowns__amount"), 0, output_field=models.DecimalField()
+            drawdowns = cursor.fetchall()
+        return amount + sum(drawdown for (drawdown,) in drawdowns)
+
+    @staticmethod
+    def expire_balance_adjustments(now) -> int:
+        """
+        Zeroes out the remaining balance of every active credit that expired before now in a single statement. Returns the number of expired credits.
+        """
+        query = """
+            WITH expired AS (
+                SELECT
+                    id,
+                    organization_id,
+                    customer_id,
+                    pricing_unit_id,
+                    expires_at,
+                    remaining_balance
+                FROM metering_billing_customerbalanceadjustment
+                WHERE status = %(active)s
+                    AND amount > 0
+                    AND expires_at < %(now)s
+                FOR UPDATE
+            ),
+            updated AS (
+                UPDATE metering_billing_customerbalanceadjustment AS credit
+                SET status = %(inactive)s, remaining_balance = 0
+                FROM expired
+                WHERE credit.id = expired.id
+                RETURNING expired.*
+            ),
+            drawdowns AS (
+                INSERT INTO metering_billing_customerbalanceadjustment (
+                    adjustment_id,
+                    organization_id,
+                    customer_id,
+                    amount,
+                    pricing_unit_id,
+                    description,
+                    created,
+                    effective_at,
+                    parent_adjustment_id,
+                    amount_paid,
+                    status
                 )
+                SELECT
+                    uuid_generate_v4(),
+                    organization_id,
+                    customer_id,
+                    -remaining_balance,
+                    pricing_unit_id,
+                    'Expiring remaining credit at '
+                        || to_char(expires_at AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI')
+                        || ' UTC',
+                    %(now)s + ROW_NUMBER() OVER (
+                        PARTITION BY customer_id ORDER BY id
+                    ) * INTERVAL '1 microsecond',
+                    %(now)s,
+                    id,
+                    0,
+                    %(active)s
+                FROM updated
+                WHERE remaining_balance > 0
             )
-            .annotate(remaining_balance=F("amount") + F("drawn_down_amount"))
-        )
-        am = amount
-        for adj in adjs:
-            remaining_balance = adj.remaining_balance
-            if remaining_balance <= 0:
-                adj.status = CUSTOMER_BALANCE_ADJUSTMENT_STATUS.INACTIVE
-                adj.save()
-                continue
-            drawdown_amount = min(am, remaining_balance)
-            CustomerBalanceAdjustment.objects.create(
-                organization=customer.organization,
-                customer=customer,
-                amount=-drawdown_amount,
-                pricing_unit=adj.pricing_unit,
-                parent_adjustment=adj,
-                description=description,
+            SELECT COUNT(*) FROM updated
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                query,
+                {
+                    "now": now,
+                    "active": CUSTOMER_BALANCE_ADJUSTMENT_STATUS.ACTIVE,
+                    "inactive": CUSTOMER_BALANCE_ADJUSTMENT_STATUS.INACTIVE,
+                },
             )
-            if drawdown_amount == remaining_balance:
-                adj.status = CUSTOMER_BALANCE_ADJUSTMENT_STATUS.INACTIVE
-                adj.save()
-            am -= drawdown_amount
-            if am == 0:
-                break
-        return am
+            (expired,) = cursor.fetchone()
+        return expired
 
     @staticmethod
     def get_pricing_unit_balance(customer, pricing_unit):
         now = now_utc()
-        adjs = (
-            CustomerBalanceAdjustment.objects.filter(
-                Q(expires_at__gte=now) | Q(expires_at__isnull=True),
-                organization=customer.organization,
-                customer=customer,
-                pricing_unit=pricing_unit,
-                amount__gt=0,
-                status=CUSTOMER_BALANCE_ADJUSTMENT_STATUS.ACTIVE,
-            )
-            .prefetch_related("drawdowns")
-            .annotate(
-                drawn_down_amount=Coalesce(
-                    Sum("drawdowns__amount"), 0, output_field=models.DecimalField()
-                )
-            )
-            .annotate(remaining_balance=F("amount") - F("drawn_down_amount"))
-            .aggregate(total_balance=Sum("remaining_balance"))["total_balance"]
-        )
-        total_balance = adjs or 0
-        return total_balance
+        total_balance = CustomerBalanceAdjustment.objects.filter(
+            Q(expires_at__gte=now) | Q(expires_at__isnull=True),
+            organization=customer.organization,
+            customer=customer,
+            pricing_unit=pricing_unit,
+            amount__gt=0,
+            status=CUSTOMER_BALANCE_ADJUSTMENT_STATUS.ACTIVE,
+        ).aggregate(total_balance=Sum("remaining_balance"))["total_balance"]
+        return total_balance or 0
 
 
 class IdempotenceCheck(models.Model):
@@ -1118,6 +1297,38 @@ class Event(models.Model):
         )
 
 
+class EventCatalogEntry(models.Model):
+    """
+    An event name or one of its property keys that an organization has sent. The ingestion consumers merge every batch of events into the catalog with the update_event_catalog database function.
+    """
+
+    organization = models.ForeignKey(
+        Organization, on_delete=models.CASCADE, related_name="+"
+    )
+    event_name = models.TextField()
+    property_key = models.TextField(
+        blank=True, help_text="Empty for the entry of the event name itself."
+    )
+    inferred_type = models.TextField(
+        blank=True,
+        help_text="The JSON type of the property's values, or mixed if they don't agree.",
+    )
+    first_seen = models.DateTimeField()
+    last_seen = models.DateTimeField()
+    sample_values = models.JSONField(default=list, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["organization", "event_name", "property_key"],
+                name="unique_event_catalog_entry",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.event_name} - {self.property_key}"
+
+
 class NumericFilter(models.Model):
     organization = models.ForeignKey(
         Organization,
@@ -1147,7 +1358,23 @@ class CategoricalFilter(models.Model):
         return f"{self.property_name} {self.operator} {self.comparison_value}"
 
 
-class Metric(models.Model):
+class CatalogVersionMixin:
+    """
+    Bumps the organization's catalog version when the object is saved or deleted, so that cached catalog responses are refreshed.
+    """
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        bump_catalog_version(self.organization_id)
+
+    def delete(self, *args, **kwargs):
+        organization_id = self.organization_id
+        ret = super().delete(*args, **kwargs)
+        bump_catalog_version(organization_id)
+        return ret
+
+
+class Metric(CatalogVersionMixin, models.Model):
     organization = models.ForeignKey(
         Organization,
         on_delete=models.CASCADE,
@@ -1216,6 +1443,13 @@ class Metric(models.Model):
         null=True,
         help_text="A custom SQL query that can be used to define the metric. Please refer to our documentation for more information.",
     )
+    custom_sql_daily_aggregation = models.CharField(
+        max_length=10,
+        choices=METRIC_AGGREGATION.choices,
+        blank=True,
+        null=True,
+        help_text="Only applies to metrics of type 'custom'. If set, the custom SQL only depends on the events between start_date and end_date, so it can be evaluated one day at a time and the daily results combined with this aggregation (sum or max). Results for closed days are then materialized instead of being recomputed.",
+    )
 
     # filters
     numeric_filters = models.ManyToManyField(NumericFilter, blank=True)
@@ -1330,14 +1564,22 @@ class Metric(models.Model):
 
         return usage
 
-    def get_billing_record_daily_billable_usage(self, billing_record):
+    def get_billing_record_daily_billable_usage(self, billing_record, since=None):
         from metering_billing.aggregation.billable_metrics import METRIC_HANDLER_MAP
 
         if self.status == METRIC_STATUS.ACTIVE and not self.mat_views_provisioned:
             self.provision_materialized_views()
 
         handler = METRIC_HANDLER_MAP[self.metric_type]
-        usage = handler.get_billing_record_daily_billable_usage(self, billing_record)
+        usage = handler.get_billing_record_daily_billable_usage(
+            self, billing_record, since=since
+        )
+        if since is not None:
+            usage = {
+                date: usage_qty
+                for date, usage_qty in usage.items()
+                if convert_to_date(date) > since
+            }
 
         return usage
 
@@ -1376,6 +1618,7 @@ class Metric(models.Model):
 
         handler = METRIC_HANDLER_MAP[self.metric_type]
         handler.create_continuous_aggregate(self, refresh=True)
+        cache.delete_pattern(f"daily_total_usage:{self.metric_id.hex}:*")
         self.mat_views_provisioned = True
         self.save()
 
@@ -1388,12 +1631,87 @@ class Metric(models.Model):
         self.save()
 
 
+class GaugeStateCheckpoint(models.Model):
+    """
+    Persisted state of a gauge metric for a customer and subscription filter group, taking into account every event before checkpoint_time. Rows are only written for groups whose state changed since the previous checkpoint, so the latest row at or before a given checkpoint is the state of that group.
+    """
+
+    organization = models.ForeignKey(
+        Organization, on_delete=models.CASCADE, related_name="+"
+    )
+    metric = models.ForeignKey(
+        Metric, on_delete=models.CASCADE, related_name="gauge_state_checkpoints"
+    )
+    uuidv5_customer_id = models.UUIDField()
+    group_values = models.JSONField(default=dict, blank=True)
+    checkpoint_time = models.DateTimeField()
+    usage_qty = models.DecimalField(max_digits=20, decimal_places=10)
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(
+                fields=[
+                    "metric",
+                    "uuidv5_customer_id",
+                    "group_values",
+                    "checkpoint_time",
+                ],
+                name="unique_gauge_state_checkpoint",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["metric", "uuidv5_customer_id", "checkpoint_time"]),
+            models.Index(fields=["metric", "checkpoint_time"]),
+        ]
+
+    def __str__(self):
+        return f"{self.metric} - {self.uuidv5_customer_id} - {self.checkpoint_time}"
+
+
+class CustomMetricDailyUsage(models.Model):
+    """
+    Materialized result of a custom metric that declares a daily aggregation, evaluated over a single closed day for a customer and subscription filter group. Rows are keyed by the hash of the metric's SQL so editing the query never serves stale results.
+    """
+
+    organization = models.ForeignKey(
+        Organization, on_delete=models.CASCADE, related_name="+"
+    )
+    metric = models.ForeignKey(
+        Metric, on_delete=models.CASCADE, related_name="custom_daily_usage"
+    )
+    sql_hash = models.CharField(max_length=32)
+    uuidv5_customer_id = models.UUIDField()
+    group_values = models.JSONField(default=dict, blank=True)
+    date = models.DateField()
+    usage_qty = models.DecimalField(max_digits=20, decimal_places=10)
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(
+                fields=[
+                    "metric",
+                    "sql_hash",
+                    "uuidv5_customer_id",
+                    "group_values",
+                    "date",
+                ],
+                name="unique_custom_metric_daily_usage",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["metric", "sql_hash", "uuidv5_customer_id", "date"]),
+        ]
+
+    def __str__(self):
+        return f"{self.metric} - {self.uuidv5_customer_id} - {self.date}"
+
+
 class UsageRevenueSummary(TypedDict):
     revenue: Decimal
     usage_qty: Decimal
 
 
-class PriceTier(models.Model):
+class PriceTier(CatalogVersionMixin, models.Model):
     class PriceTierType(models.IntegerChoices):
         FLAT = (1, _("flat"))
         PER_UNIT = (2, _("per_unit"))
@@ -1578,7 +1896,7 @@ class ComponentFixedCharge(models.Model):
         return mapping.get(label, label)
 
 
-class PlanComponent(models.Model):
+class PlanComponent(CatalogVersionMixin, models.Model):
     class IntervalLengthType(models.IntegerChoices):
         DAY = (1, "day")
         WEEK = (2, "week")
@@ -1789,22 +2107,31 @@ class PlanComponent(models.Model):
         return revenue
 
     def calculate_revenue_per_day(
-        self, billing_record
+        self,
+        billing_record,
+        since=None,
+        usage_through_since=Decimal(0),
+        revenue_through_since=Decimal(0),
     ) -> dict[datetime.datetime, UsageRevenueSummary]:
+        """
+        If since is given only the days after it are computed, with the tiers picking up from the usage and revenue earned up to and including since.
+        """
         assert isinstance(billing_record, BillingRecord)
         billable_metric = self.billable_metric
         usage_per_day = billable_metric.get_billing_record_daily_billable_usage(
-            billing_record
+            billing_record, since=since
         )
         results = {}
         for period in dates_bwn_two_dts(
             billing_record.start_date, billing_record.end_date
         ):
             period = convert_to_date(period)
+            if since is not None and period <= since:
+                continue
             results[period] = {"revenue": Decimal(0), "usage_qty": Decimal(0)}
 
-        running_total_revenue = Decimal(0)
-        running_total_usage = Decimal(0)
+        running_total_revenue = revenue_through_since
+        running_total_usage = usage_through_since
         for date, usage_qty in usage_per_day.items():
             date = convert_to_date(date)
             usage_qty = convert_to_decimal(usage_qty)
@@ -1828,7 +2155,7 @@ class PlanComponent(models.Model):
         return results
 
 
-class Feature(models.Model):
+class Feature(CatalogVersionMixin, models.Model):
     feature_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
     organization = models.ForeignKey(
         Organization, on_delete=models.CASCADE, related_name="features"
@@ -1869,6 +2196,16 @@ class Invoice(models.Model):
     )
     issue_date = models.DateTimeField(max_length=100, default=now_utc)
     invoice_pdf = models.URLField(max_length=300, null=True, blank=True)
+    updated_at = models.DateTimeField(
+        default=now_utc,
+        help_text="Last time the invoice was saved, used for incremental exports.",
+    )
+    pdf_content_hash = models.CharField(
+        max_length=64,
+        null=True,
+        blank=True,
+        help_text="Hash of the data the current PDF was rendered from. Null means the PDF still has to be rendered.",
+    )
     org_connected_to_cust_payment_provider = models.BooleanField(default=False)
     cust_connected_to_payment_provider = models.BooleanField(default=False)
     payment_status = models.PositiveSmallIntegerField(
@@ -1912,6 +2249,12 @@ class Invoice(models.Model):
             models.Index(fields=["organization", "invoice_id"]),
             models.Index(fields=["organization", "external_payment_obj_id"]),
             models.Index(fields=["organization", "-issue_date"]),
+            models.Index(fields=["organization", "updated_at"]),
+            models.Index(
+                fields=["issue_date"],
+                condition=Q(pdf_content_hash__isnull=True),
+                name="invoice_pdf_pending_idx",
+            ),
         ]
 
     def __str__(self):
@@ -1920,27 +2263,27 @@ class Invoice(models.Model):
     def save(self, *args, **kwargs):
         if not self.currency:
             self.currency = self.organization.default_currency
+        self.updated_at = now_utc()
+        if kwargs.get("update_fields") is not None:
+            kwargs["update_fields"] = list(kwargs["update_fields"]) + ["updated_at"]
 
         ### Generate invoice number
         new = self._state.adding is True
-        if new and self.payment_status != Invoice.PaymentStatus.DRAFT:
-            issue_date = self.issue_date.date()
-            issue_date_string = issue_date.strftime("%y%m%d")
-            next_invoice_number = "000001"
-            last_invoice = (
-                Invoice.objects.filter(
-                    invoice_number__startswith=issue_date_string,
-                    organization=self.organization,
+        reserve_invoice_number = kwargs.pop("reserve_invoice_number", True)
+        if (
+            new
+            and reserve_invoice_number
+            and self.payment_status != Invoice.PaymentStatus.DRAFT
+            and not self.invoice_number
+        ):
+            with transaction.atomic():
+                # the number is only used up if the invoice is saved too
+                (self.invoice_number,) = InvoiceNumberSequence.reserve(
+                    self.organization, self.issue_date.date()
                 )
-                .order_by("-invoice_number")
-                .first()
-            )
-            if last_invoice:
-                last_invoice_number = int(last_invoice.invoice_number[7:])
-                next_invoice_number = "{0:06d}".format(last_invoice_number + 1)
-
-            self.invoice_number = issue_date_string + "-" + next_invoice_number
-        super().save(*args, **kwargs)
+                super().save(*args, **kwargs)
+        else:
+            super().save(*args, **kwargs)
         if (
             self.__original_payment_status != self.payment_status
             and self.payment_status == Invoice.PaymentStatus.PAID
@@ -1950,6 +2293,75 @@ class Invoice(models.Model):
         self.__original_payment_status = self.payment_status
 
 
+class InvoiceCSVExport(models.Model):
+    """
+    An incremental invoice CSV export. Each one contains the invoices that changed after the previous export's changed_through and up to its own.
+    """
+
+    organization = models.ForeignKey(
+        Organization, on_delete=models.CASCADE, related_name="invoice_csv_exports"
+    )
+    created = models.DateTimeField(default=now_utc)
+    changed_since = models.DateTimeField(null=True, blank=True)
+    changed_through = models.DateTimeField()
+    csv_filename = models.TextField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["organization", "-changed_through"]),
+        ]
+
+
+class InvoiceNumberSequence(models.Model):
+    """
+    Last invoice number handed out per organization and issue day. Invoice numbers look like <yymmdd>-<6 digit counter>.
+    """
+
+    organization = models.ForeignKey(
+        Organization, on_delete=models.CASCADE, related_name="+"
+    )
+    issue_date = models.DateField()
+    last_number = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(
+                fields=["organization", "issue_date"],
+                name="unique_invoice_number_sequence",
+            ),
+        ]
+
+    @staticmethod
+    def reserve(organization, issue_date: datetime.date, n: int = 1) -> list[str]:
+        """
+        Atomically reserves the next n invoice numbers of the organization for the issue date. The sequence row stays locked until the surrounding transaction ends, so concurrent invoice runs of the same organization get consecutive, non-overlapping numbers, and rolled back reservations are handed out again.
+        """
+        query = """
+            INSERT INTO metering_billing_invoicenumbersequence
+                (organization_id, issue_date, last_number)
+            VALUES (%(organization_id)s, %(issue_date)s, %(n)s)
+            ON CONFLICT (organization_id, issue_date) DO UPDATE
+                SET last_number = metering_billing_invoicenumbersequence.last_number
+                    + EXCLUDED.last_number
+            RETURNING last_number
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                query,
+                {
+                    "organization_id": organization.id,
+                    "issue_date": issue_date,
+                    "n": n,
+                },
+            )
+            (last_number,) = cursor.fetchone()
+        issue_date_string = issue_date.strftime("%y%m%d")
+        return [
+            issue_date_string + "-" + "{0:06d}".format(number)
+            for number in range(last_number - n + 1, last_number + 1)
+        ]
+
+
 class InvoiceLineItemAdjustment(models.Model):
     class AdjustmentType(models.IntegerChoices):
         SALES_TAX = (1, _("sales_tax"))
@@ -2335,7 +2747,7 @@ class AddOnPlanVersionManager(PlanVersionManager):
         return super().get_queryset().filter(addon_spec__isnull=False)
 
 
-class PlanVersion(models.Model):
+class PlanVersion(CatalogVersionMixin, models.Model):
     # META
     organization = models.ForeignKey(
         Organization,
@@ -2554,7 +2966,7 @@ class AddOnSpecification(models.Model):
         return mapping.get(label, label)
 
 
-class Plan(models.Model):
+class Plan(CatalogVersionMixin, models.Model):
     # META
     organization = models.ForeignKey(
         Organization, on_delete=models.CASCADE, related_name="plans"
@@ -2877,6 +3289,10 @@ class SubscriptionRecord(models.Model):
                 name="stripe_subscription_id_xor_billing_plan",
             ),
         ]
+        indexes = [
+            models.Index(fields=["organization", "-start_date"]),
+            GinIndex(fields=["subscription_filters"]),
+        ]
 
     def __str__(self):
         addon = "[ADDON] " if self.billing_plan.addon_spec else ""
@@ -3435,6 +3851,12 @@ class BillingRecord(models.Model):
     invoicing_dates = ArrayField(models.DateTimeField(), default=list)
     next_invoicing_date = models.DateTimeField()
     fully_billed = models.BooleanField(default=False)
+    revenue_ledger_frozen_through = models.DateField(
+        null=True,
+        blank=True,
+        help_text="Days up to and including this date are closed and final in the earned revenue ledger.",
+    )
+    revenue_ledger_refreshed_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         constraints = [
@@ -3473,6 +3895,9 @@ class BillingRecord(models.Model):
                 self.invoicing_dates = [self.end_date]
             if self.next_invoicing_date is None:
                 self.next_invoicing_date = self.invoicing_dates[0]
+        else:
+            # the open days of the revenue ledger get recomputed the next time they're read
+            self.revenue_ledger_refreshed_at = None
         super().save(*args, **kwargs)
 
     def get_usage_and_revenue(self):
@@ -3537,8 +3962,24 @@ class BillingRecord(models.Model):
             pass
 
     def calculate_earned_revenue_per_day(self) -> dict:
-        dates = dates_bwn_two_dts(self.start_date, self.end_date)
+        return {
+            date: summary["revenue"]
+            for date, summary in self.calculate_earned_revenue_and_usage_per_day().items()
+        }
+
+    def calculate_earned_revenue_and_usage_per_day(
+        self, since=None
+    ) -> dict[datetime.date, UsageRevenueSummary]:
+        """
+        If since is given only the days after it are computed, picking up from the usage and revenue already in the earned revenue ledger up to and including since.
+        """
+        dates = [
+            date
+            for date in dates_bwn_two_dts(self.start_date, self.end_date)
+            if since is None or date > since
+        ]
         rev_per_day = dict.fromkeys(dates, Decimal(0))
+        usage_per_day = dict.fromkeys(dates, Decimal(0))
         if self.recurring_charge:
             for day in rev_per_day:
                 if day == self.start_date.date():
@@ -3564,13 +4005,26 @@ class BillingRecord(models.Model):
                     * duration_microseconds
                 )
         else:  # components
-            component_rev_per_day = self.component.calculate_revenue_per_day(self)
+            through_since = {"usage_qty": None, "revenue": None}
+            if since is not None:
+                through_since = self.daily_revenue.filter(date__lte=since).aggregate(
+                    usage_qty=Sum("usage_qty"), revenue=Sum("revenue")
+                )
+            component_rev_per_day = self.component.calculate_revenue_per_day(
+                self,
+                since=since,
+                usage_through_since=through_since["usage_qty"] or Decimal(0),
+                revenue_through_since=through_since["revenue"] or Decimal(0),
+            )
             for period, d in component_rev_per_day.items():
                 period = convert_to_date(period)
-                revenue = d["revenue"]
                 if period in rev_per_day:
-                    rev_per_day[period] += revenue
-        return rev_per_day
+                    rev_per_day[period] += d["revenue"]
+                    usage_per_day[period] += d["usage_qty"]
+        return {
+            date: {"revenue": rev_per_day[date], "usage_qty": usage_per_day[date]}
+            for date in dates
+        }
 
     def prepaid_already_invoiced(self):
         return self.line_items.filter(
@@ -3648,6 +4102,38 @@ class BillingRecord(models.Model):
         return amt_left_to_invoice
 
 
+class BillingRecordDailyRevenue(models.Model):
+    """
+    Earned revenue ledger, with the revenue and usage a billing record earned on each day it covers. Kept up to date by a periodic task; rows for closed days are never rewritten, so revenue dashboards are range sums over this table.
+    """
+
+    organization = models.ForeignKey(
+        Organization, on_delete=models.CASCADE, related_name="+"
+    )
+    billing_record = models.ForeignKey(
+        BillingRecord, on_delete=models.CASCADE, related_name="daily_revenue"
+    )
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name="+")
+    date = models.DateField()
+    revenue = models.DecimalField(max_digits=20, decimal_places=10)
+    usage_qty = models.DecimalField(max_digits=20, decimal_places=10)
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(
+                fields=["billing_record", "date"],
+                name="unique_billing_record_daily_revenue",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["organization", "date"]),
+            models.Index(fields=["customer", "date"]),
+        ]
+
+    def __str__(self):
+        return f"{self.billing_record} - {self.date}"
+
+
 class ComponentChargeRecord(models.Model):
     organization = models.ForeignKey(
         Organization, on_delete=models.CASCADE, related_name="component_charge_records"
@@ -3918,6 +4404,15 @@ class UsageAlertResult(models.Model):
     last_run_value = models.DecimalField(max_digits=20, decimal_places=10)
     last_run_timestamp = models.DateTimeField(default=now_utc)
     triggered_count = models.PositiveIntegerField(default=0)
+    next_check_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="When the periodic refresh should evaluate this alert again. Null means as soon as possible.",
+    )
+    usage_idle = models.BooleanField(
+        default=False,
+        help_text="Usage didn't grow on the last run, so there was no rate to schedule the next check by. New events for the customer make the alert due right away.",
+    )
 
     class Meta:
         constraints = [
@@ -3926,33 +4421,81 @@ class UsageAlertResult(models.Model):
                 name="unique_alert_result_per_org",
             ),
         ]
+        indexes = [
+            models.Index(fields=["next_check_at"]),
+        ]
 
-    def refresh(self):
+    def get_next_check_at(self, new_value, billing_record, now):
+        """
+        Alerts far from their threshold, or whose usage grows slowly, are checked less often. We aim to check again halfway to the time the threshold would be reached at the current rate of usage growth, and never wait longer than the share of ALERT_CHECK_MAX_INTERVAL left to the threshold.
+        """
+        threshold = self.alert.threshold
+        elapsed = (now - self.last_run_timestamp).total_seconds()
+        if new_value >= threshold or new_value <= self.last_run_value or elapsed <= 0:
+            # already triggered, or no growth since the last run to project from
+            wait = ALERT_CHECK_MAX_INTERVAL
+        else:
+            velocity = (new_value - self.last_run_value) / Decimal(elapsed)
+            seconds_to_threshold = (threshold - new_value) / velocity
+            wait = min(
+                max(
+                    datetime.timedelta(seconds=float(seconds_to_threshold) / 2),
+                    ALERT_CHECK_MIN_INTERVAL,
+                ),
+                ALERT_CHECK_MAX_INTERVAL,
+            )
+        if new_value < threshold and threshold > 0:
+            # a burst can cross the threshold without any growth before it, so alerts
+            # close to it are checked often whatever their rate
+            distance = float((threshold - new_value) / threshold)
+            wait = min(wait, ALERT_CHECK_MAX_INTERVAL * distance)
+        next_check_at = now + wait
+        if billing_record is not None:
+            # usage resets with the next billing period, which can re-arm the alert
+            next_check_at = min(next_check_at, billing_record.end_date)
+        return max(next_check_at, now + ALERT_CHECK_MIN_INTERVAL)
+
+    def refresh(self, billing_record=None):
         # calculate the value for the alert
         # update the last_run_value and last_run_timestamp
         # save the object
+        from metering_billing.aggregation.alert_counters import seed_alert_counter
 
         metric = self.alert.metric
         subscription_record = self.subscription_record
         now = now_utc()
-        billing_record = subscription_record.billing_records.filter(
-            start_date__lte=now,
-            end_date__gt=now,
-            component__billable_metric=metric,
-        ).first()
+        if billing_record is None:
+            billing_record = (
+                subscription_record.billing_records.filter(
+                    start_date__lte=now,
+                    end_date__gt=now,
+                    component__billable_metric=metric,
+                )
+                .select_related("component__billable_metric")
+                .first()
+            )
         new_value = metric.get_billing_record_total_billable_usage(billing_record)
-        if (
+        # the event tail keeps counting from here and fires the alert as soon as the
+        # threshold is crossed
+        seed_alert_counter(billing_record, new_value)
+        crossed = (
             new_value >= self.alert.threshold
             and self.last_run_value < self.alert.threshold
-        ):
-            # send alert
-            usage_alert_webhook(
-                self.alert, self, subscription_record, self.organization
-            )
+        )
+        if crossed:
             self.triggered_count = self.triggered_count + 1
+        self.next_check_at = self.get_next_check_at(new_value, billing_record, now)
+        self.usage_idle = (
+            new_value <= self.last_run_value and new_value < self.alert.threshold
+        )
         self.last_run_value = new_value
         self.last_run_timestamp = now
         self.save()
+        if crossed:
+            # send alert
+            usage_alert_webhook(
+                self.alert, self, subscription_record, self.organization
+            )
 
 
 class StripeCustomerIntegration(models.Model):
@@ -2,14 +2,15 @@ import csv
 import datetime
 import io
 import logging
+import tempfile
 
 import boto3
 from botocore.exceptions import ClientError
 from django.conf import settings
 from django.utils.text import slugify
 
-from metering_billing.invoice_pdf import s3_bucket_exists, s3_file_exists
-from metering_billing.models import Organization
+from metering_billing.invoice_pdf import get_s3_client, s3_bucket_exists, s3_file_exists
+from metering_billing.models import InvoiceCSVExport, InvoiceLineItem, Organization
 from metering_billing.s3_utils import get_bucket_name
 from metering_billing.utils import convert_to_datetime, now_utc
 
@@ -20,11 +21,37 @@ try:
         "s3",
         aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
         aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+        endpoint_url=settings.AWS_S3_ENDPOINT_URL,
     )
 except ClientError:
     pass
 
 CSV_FOLDER = "invoice_csvs"
+# rows fetched per round trip of the server side cursor
+CSV_CHUNK_SIZE = 2000
+# exports bigger than this are spooled to a temporary file instead of memory
+CSV_SPOOL_SIZE = 8 * 1024 * 1024
+# invoices saved less than this long ago might still be in an uncommitted
+# transaction, leave them to the next incremental export
+INCREMENTAL_EXPORT_LAG = datetime.timedelta(minutes=5)
+
+INVOICE_CSV_HEADER = [
+    # HEADER
+    "externalId",
+    "entity",  # customer
+    "terms",  # unsure about this one, can work on case-by case
+    "tranDate",  # issue date
+    "postingPeriod",  # mmm yyyy format of issue date
+    "dueDate",  # due date
+    "currency",  # 3 letter iso code
+    # LINE ITEMS
+    "item",  # lets make this the internal lotus IDs of the plans
+    "description",
+    "quantity",
+    "rate",
+    "amount",
+    "taxCode",
+]
 
 
 def get_key(organization, csv_folder, csv_filename):
@@ -33,44 +60,58 @@ def get_key(organization, csv_folder, csv_filename):
     return key
 
 
-def generate_invoices_csv(organization, start_date=None, end_date=None):
-    # Format start and end dates as YYMMDD
-    csv_filename = get_csv_filename(organization, start_date, end_date)
+def get_csv_location(organization, csv_folder, csv_filename):
+    bucket_name, prod = get_bucket_name(organization)
+    key = get_key(organization, csv_folder, csv_filename)
+    if not prod:
+        team = organization.team
+        team_id = team.team_id.hex + "-" + slugify(team.name)
+        key = f"{team_id}/{key}"
+    return bucket_name, key
+
 
-    csv_buffer = io.StringIO()
-    writer = csv.writer(csv_buffer)
-    invoices = organization.invoices.filter().select_related("customer")
+def get_invoice_csv_line_items(
+    organization,
+    start_date=None,
+    end_date=None,
+    changed_since=None,
+    changed_through=None,
+):
+    """
+    Returns the line items to export, with everything a row needs joined in so the export runs as a single query.
+    """
+    line_items = InvoiceLineItem.objects.filter(
+        invoice__organization=organization
+    ).select_related(
+        "invoice__customer",
+        "invoice__currency",
+        "associated_recurring_charge",
+        "associated_plan_component",
+    )
     if start_date:
         start_time = convert_to_datetime(
             start_date, date_behavior="min", tz=organization.timezone
         )
-        invoices = invoices.filter(issue_date__gte=start_time)
+        line_items = line_items.filter(invoice__issue_date__gte=start_time)
     if end_date:
         end_time = convert_to_datetime(
             end_date, date_behavior="max", tz=organization.timezone
         )
-        invoices = invoices.filter(issue_date__lte=end_time)
-    writer.writerow(
-        [
-            # HEADER
-            "externalId",
-            "entity",  # customer
-            "terms",  # unsure about this one, can work on case-by case
-            "tranDate",  # issue date
-            "postingPeriod",  # mmm yyyy format of issue date
-            "dueDate",  # due date
-            "currency",  # 3 letter iso code
-            # LINE ITEMS
-            "item",  # lets make this the internal lotus IDs of the plans
-            "description",
-            "quantity",
-            "rate",
-            "amount",
-            "taxCode",
-        ]
-    )
+        line_items = line_items.filter(invoice__issue_date__lte=end_time)
+    if changed_since:
+        line_items = line_items.filter(invoice__updated_at__gt=changed_since)
+    if changed_through:
+        line_items = line_items.filter(invoice__updated_at__lte=changed_through)
+    return line_items.order_by("invoice__issue_date", "invoice_id", "pk")
 
-    for invoice in invoices:
+
+def iter_invoice_csv_rows(line_items):
+    """
+    Yields the header and then one row per line item, reading the line items through a server side cursor.
+    """
+    yield INVOICE_CSV_HEADER
+    for line_item in line_items.iterator(chunk_size=CSV_CHUNK_SIZE):
+        invoice = line_item.invoice
         externalId = invoice.invoice_number
         entity = invoice.customer.customer_id
         terms = None
@@ -78,46 +119,90 @@ def generate_invoices_csv(organization, start_date=None, end_date=None):
         postingPeriod = invoice.issue_date.strftime("%B %Y")
         dueDate = invoice.due_date.strftime("%m/%d/%Y") if invoice.due_date else None
         currency = invoice.currency.code
-        for line_item in invoice.line_items.all():
-            if line_item.associated_recurring_charge:
-                item = (
-                    "recurring_charge_"
-                    + line_item.associated_recurring_charge.recurring_charge_id.hex
-                )
-            elif line_item.associated_plan_component:
-                item = (
-                    "usage_component_"
-                    + line_item.associated_plan_component.usage_component_id.hex
-                )
-            else:
-                item = line_item.name
-            description = line_item.name
-            quantity = line_item.quantity or 1
-            amount = line_item.amount
-            rate = amount / quantity
-            taxCode = None
-            writer.writerow(
-                [
-                    externalId,
-                    entity,
-                    terms,
-                    tranDate,
-                    postingPeriod,
-                    dueDate,
-                    currency,
-                    item,
-                    description,
-                    quantity,
-                    rate,
-                    amount,
-                    taxCode,
-                ]
+        if line_item.associated_recurring_charge:
+            item = (
+                "recurring_charge_"
+                + line_item.associated_recurring_charge.recurring_charge_id.hex
             )
+        elif line_item.associated_plan_component:
+            item = (
+                "usage_component_"
+                + line_item.associated_plan_component.usage_component_id.hex
+            )
+        else:
+            item = line_item.name
+        description = line_item.name
+        quantity = line_item.quantity or 1
+        amount = line_item.amount
+        rate = amount / quantity
+        taxCode = None
+        yield [
+            externalId,
+            entity,
+            terms,
+            tranDate,
+            postingPeriod,
+            dueDate,
+            currency,
+            item,
+            description,
+            quantity,
+            rate,
+            amount,
+            taxCode,
+        ]
+
+
+def write_csv(rows, csv_file):
+    """
+    Writes the rows to a binary file object as UTF-8 CSV.
+    """
+    text_file = io.TextIOWrapper(csv_file, encoding="utf-8", newline="")
+    csv.writer(text_file).writerows(rows)
+    text_file.flush()
+    # leave the underlying file open for the caller
+    text_file.detach()
 
-    upload_csv(organization, csv_buffer, CSV_FOLDER, csv_filename)
 
+def generate_invoices_csv(
+    organization, start_date=None, end_date=None, incremental=False
+):
+    """
+    Exports the organization's invoices to a CSV in S3 and returns its filename. In incremental mode only the invoices saved since the previous incremental export are exported, and the export is recorded as the watermark for the next one.
+    """
+    changed_since = None
+    changed_through = None
+    if incremental:
+        changed_through = now_utc() - INCREMENTAL_EXPORT_LAG
+        last_export = organization.invoice_csv_exports.order_by(
+            "-changed_through"
+        ).first()
+        if last_export:
+            changed_since = last_export.changed_through
+        csv_filename = get_incremental_csv_filename(changed_since, changed_through)
+    else:
+        # Format start and end dates as YYMMDD
+        csv_filename = get_csv_filename(organization, start_date, end_date)
+
+    line_items = get_invoice_csv_line_items(
+        organization, start_date, end_date, changed_since, changed_through
+    )
+    with tempfile.SpooledTemporaryFile(max_size=CSV_SPOOL_SIZE) as csv_file:
+        write_csv(iter_invoice_csv_rows(line_items), csv_file)
+        csv_file.seek(0)
+        uploaded = upload_csv(organization, csv_file, CSV_FOLDER, csv_filename)
+
+    if incremental and uploaded:
+        InvoiceCSVExport.objects.create(
+            organization=organization,
+            changed_since=changed_since,
+            changed_through=changed_through,
+            csv_filename=csv_filename,
+        )
+    return csv_filename
 
-def upload_csv(organization, csv_buffer, csv_folder, csv_filename):
+
+def upload_csv(organization, csv_file, csv_folder, csv_filename) -> bool:
     # If the organization is not an external demo organization
     if (
         not settings.DEBUG
@@ -126,36 +211,25 @@ def upload_csv(organization, csv_buffer, csv_folder, csv_filename):
     ):
         try:
             # Upload the file to s3
-            bucket_name, prod = get_bucket_name(organization)
+            bucket_name, key = get_csv_location(organization, csv_folder, csv_filename)
             if s3_bucket_exists(bucket_name):
                 logger.error("Bucket exists")
             else:
                 s3.create_bucket(Bucket=bucket_name, ACL="private")
                 logger.error("Created bucket", bucket_name)
 
-            key = get_key(organization, csv_folder, csv_filename)
-            if not prod:
-                team_id = organization.team.team_id.hex
-                team = organization.team
-                team_id = team.team_id.hex + "-" + slugify(team.name)
-                key = f"{team_id}/{key}"
-            csv_bytes = csv_buffer.getvalue().encode()
-            s3.Bucket(bucket_name).upload_fileobj(io.BytesIO(csv_bytes), key)
-
+            # switches to a multipart upload for big files, so it never needs
+            # the whole file in memory
+            get_s3_client().upload_fileobj(csv_file, bucket_name, key)
+            return True
         except Exception as e:
             print(e)
+    return False
 
 
-def get_invoices_csv_presigned_url(organization, start_date=None, end_date=None):
-    # Format start and end dates as YYMMDD
-    csv_filename = get_csv_filename(organization, start_date, end_date)
-    bucket_name, prod = get_bucket_name(organization)
-    key = get_key(organization, CSV_FOLDER, csv_filename)
-    if not prod:
-        team_id = organization.team.team_id.hex
-        team = organization.team
-        team_id = team.team_id.hex + "-" + slugify(team.name)
-        key = f"{team_id}/{key}"
+def get_invoices_csv_presigned_url(
+    organization, start_date=None, end_date=None, incremental=False
+):
     # if its an external demo, or we're in debug mode, don't generate these
     if (
         organization.organization_type == Organization.OrganizationType.EXTERNAL_DEMO
@@ -163,13 +237,17 @@ def get_invoices_csv_presigned_url(organization, start_date=None, end_date=None)
     ):
         return {"exists": False, "url": None}
 
-    exists = s3_file_exists(bucket_name=bucket_name, key=key)
-    if not exists:
-        generate_invoices_csv(organization, start_date, end_date)
-    s3_resource = boto3.resource("s3")
-    bucket = s3_resource.Bucket(bucket_name)
-    object = bucket.Object(key)
-    url = object.meta.client.generate_presigned_url(
+    if incremental:
+        csv_filename = generate_invoices_csv(organization, incremental=True)
+        bucket_name, key = get_csv_location(organization, CSV_FOLDER, csv_filename)
+    else:
+        # Format start and end dates as YYMMDD
+        csv_filename = get_csv_filename(organization, start_date, end_date)
+        bucket_name, key = get_csv_location(organization, CSV_FOLDER, csv_filename)
+        exists = s3_file_exists(bucket_name=bucket_name, key=key)
+        if not exists:
+            generate_invoices_csv(organization, start_date, end_date)
+    url = get_s3_client().generate_presigned_url(
         ClientMethod="get_object",
         Params={"Bucket": bucket_name, "Key": key},
         ExpiresIn=3600,
@@ -177,6 +255,12 @@ def get_invoices_csv_presigned_url(organization, start_date=None, end_date=None)
     return {"exists": True, "url": url}
 
 
+def get_incremental_csv_filename(changed_since, changed_through):
+    since_str = changed_since.strftime("%y%m%d%H%M%S") if changed_since else "start"
+    through_str = changed_through.strftime("%y%m%d%H%M%S")
+    return f"changes-{since_str}-{through_str}"
+
+
 def get_csv_filename(organization, start_date, end_date):
     if start_date is not None and end_date is not None:
         start_date_str = datetime.datetime.strftime(start_date, "%y%m%d")
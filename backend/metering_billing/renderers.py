@@ -0,0 +1,81 @@
+import datetime
+import uuid
+from decimal import Decimal
+
+from django.conf import settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_DECIMAL_POLICY = settings.JSON_DECIMAL_POLICY
+
+_encoder = JSONEncoder()
+
+
+def _orjson_default(obj):
+    if isinstance(obj, Decimal):
+        return float(obj) if JSON_DECIMAL_POLICY == "float" else str(obj)
+    # lazy strings, timedeltas, querysets and the like
+    return _encoder.default(obj)
+
+
+def _isoformat(value):
+    # same as orjson with OPT_UTC_Z
+    representation = value.isoformat()
+    if isinstance(value, datetime.datetime) and representation.endswith("+00:00"):
+        representation = representation[:-6] + "Z"
+    return representation
+
+
+def _make_serializable(data):
+    """
+    Converts what orjson encodes natively, keys included, the same way orjson does, so the
+    standard library fallback renders the same output.
+    """
+
+    def convert(value):
+        if isinstance(value, (list, tuple)):
+            return [convert(x) for x in value]
+        elif isinstance(value, dict):
+            return {convert(key): convert(val) for key, val in value.items()}
+        elif isinstance(value, Decimal):
+            return _orjson_default(value)
+        elif isinstance(value, (datetime.date, datetime.time)):
+            return _isoformat(value)
+        elif isinstance(value, uuid.UUID):
+            return str(value)
+        return value
+
+    return convert(data)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    Renders responses in a single pass, encoding Decimals (as floats or strings depending
+    on JSON_DECIMAL_POLICY), dates, datetimes and UUIDs natively, so views don't need to
+    walk their payloads with the make_all_* helpers first. Uses orjson, falling back to
+    the standard library with the same output if it's missing.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        if orjson is None:
+            return super().render(
+                _make_serializable(data),
+                accepted_media_type,
+                renderer_context,
+            )
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z
+        renderer_context = renderer_context or {}
+        if self.get_indent(accepted_media_type, renderer_context):
+            option |= orjson.OPT_INDENT_2
+        ret = orjson.dumps(data, default=_orjson_default, option=option)
+        # same as the default renderer, keep the output a strict javascript subset
+        return ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(
+            b"\xe2\x80\xa9", b"\\u2029"
+        )
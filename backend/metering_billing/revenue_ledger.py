@@ -0,0 +1,165 @@
+import datetime
+import logging
+from decimal import Decimal
+from typing import Optional
+
+from dateutil.relativedelta import relativedelta
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.db.models.functions import TruncDate
+
+from metering_billing.models import (
+    BillingRecord,
+    BillingRecordDailyRevenue,
+    Customer,
+    Organization,
+)
+from metering_billing.utils import dates_bwn_two_dts, now_utc
+
+logger = logging.getLogger("django.server")
+
+# usage can still be late-ingested and continuous aggregates are refreshed up to 1 day
+# ago every 30 minutes, so only days that ended before this lag are final
+REVENUE_LEDGER_CLOSED_LAG = relativedelta(days=1, minutes=30)
+
+
+def _closed_through() -> datetime.date:
+    return (now_utc() - REVENUE_LEDGER_CLOSED_LAG).date() - relativedelta(days=1)
+
+
+def refresh_billing_record_ledger(billing_record: BillingRecord) -> None:
+    """
+    Recomputes the days of the billing record that aren't frozen yet and freezes the ones that are now closed.
+    """
+    closed_through = _closed_through()
+    frozen_through = billing_record.revenue_ledger_frozen_through
+    # frozen days never change, so only the days after them are computed
+    per_day = billing_record.calculate_earned_revenue_and_usage_per_day(
+        since=frozen_through
+    )
+    entries = [
+        BillingRecordDailyRevenue(
+            organization_id=billing_record.organization_id,
+            billing_record=billing_record,
+            customer_id=billing_record.customer_id,
+            date=date,
+            revenue=summary["revenue"],
+            usage_qty=summary["usage_qty"],
+        )
+        for date, summary in per_day.items()
+    ]
+    if len(per_day) > 0:
+        last_closed = min(max(per_day), closed_through)
+        if last_closed >= min(per_day):
+            frozen_through = last_closed
+    with transaction.atomic():
+        stale = billing_record.daily_revenue.all()
+        if billing_record.revenue_ledger_frozen_through is not None:
+            record_dates = list(
+                dates_bwn_two_dts(billing_record.start_date, billing_record.end_date)
+            )
+            stale = stale.filter(
+                Q(date__gt=billing_record.revenue_ledger_frozen_through)
+                | ~Q(date__in=record_dates)
+            )
+        stale.delete()
+        BillingRecordDailyRevenue.objects.bulk_create(entries)
+        # update instead of save so we don't mark the ledger as stale again
+        BillingRecord.objects.filter(pk=billing_record.pk).update(
+            revenue_ledger_frozen_through=frozen_through,
+            revenue_ledger_refreshed_at=now_utc(),
+        )
+    billing_record.revenue_ledger_frozen_through = frozen_through
+
+
+def refresh_revenue_ledger(billing_records, only_missing: bool = False) -> None:
+    """
+    Brings the ledger up to date for the given billing records. Records whose days are all frozen are skipped. If only_missing is True, only the records that were never computed or changed since they were last computed are refreshed.
+    """
+    billing_records = billing_records.filter(
+        Q(revenue_ledger_frozen_through__isnull=True)
+        | Q(revenue_ledger_frozen_through__lt=TruncDate("end_date"))
+        | Q(revenue_ledger_refreshed_at__isnull=True)
+    )
+    if only_missing:
+        billing_records = billing_records.filter(
+            revenue_ledger_refreshed_at__isnull=True
+        )
+    billing_records = billing_records.select_related(
+        "subscription",
+        "customer",
+        "recurring_charge",
+        "component",
+        "component__billable_metric",
+    ).prefetch_related("component__tiers")
+    for billing_record in billing_records:
+        try:
+            refresh_billing_record_ledger(billing_record)
+        except Exception as e:
+            logger.error(
+                "Error refreshing revenue ledger for billing record {}. Error was {}".format(
+                    billing_record.billing_record_id, e
+                )
+            )
+
+
+def overlapping_billing_records(
+    organization: Organization,
+    start_date: datetime.date,
+    end_date: datetime.date,
+    customer: Optional[Customer] = None,
+):
+    billing_records = BillingRecord.objects.filter(
+        organization=organization,
+        start_date__date__lte=end_date,
+        end_date__date__gte=start_date,
+    )
+    if customer is not None:
+        billing_records = billing_records.filter(customer=customer)
+    return billing_records
+
+
+def earned_revenue_per_day(
+    organization: Organization,
+    start_date: datetime.date,
+    end_date: datetime.date,
+    customer: Optional[Customer] = None,
+) -> dict[datetime.date, Decimal]:
+    """
+    Earned revenue per day from the ledger, which is kept up to date by the periodic update_revenue_ledger task. Billing records that were never added to the ledger, or changed since, are computed in memory so new subscriptions show up right away, but they aren't written to the ledger here.
+    """
+    pending = (
+        overlapping_billing_records(organization, start_date, end_date, customer)
+        .filter(revenue_ledger_refreshed_at__isnull=True)
+        .select_related(
+            "subscription",
+            "customer",
+            "recurring_charge",
+            "component",
+            "component__billable_metric",
+        )
+        .prefetch_related("component__tiers")
+    )
+    entries = BillingRecordDailyRevenue.objects.filter(
+        organization=organization, date__gte=start_date, date__lte=end_date
+    ).exclude(billing_record__revenue_ledger_refreshed_at__isnull=True)
+    if customer is not None:
+        entries = entries.filter(customer=customer)
+    revenue_per_day = {
+        x["date"]: x["revenue"]
+        for x in entries.values("date").annotate(revenue=Sum("revenue"))
+    }
+    for billing_record in pending:
+        try:
+            per_day = billing_record.calculate_earned_revenue_per_day()
+        except Exception as e:
+            logger.error(
+                "Error computing earned revenue for billing record {}. Error was {}".format(
+                    billing_record.billing_record_id, e
+                )
+            )
+            continue
+        for date, revenue in per_day.items():
+            if start_date <= date <= end_date:
+                revenue_per_day[date] = revenue_per_day.get(date, Decimal(0)) + revenue
+    return revenue_per_day
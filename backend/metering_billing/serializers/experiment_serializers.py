@@ -157,6 +157,24 @@ class BacktestDetailSerializer(BacktestSummarySerializer):
     backtest_substitutions = BacktestSubstitutionSerializer(many=True)
 
 
+class AnalysisCreateSerializer(TimezoneFieldMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Analysis
+        fields = ("start_date", "end_date", "kpis", "analysis_name")
+
+    kpis = serializers.ListSerializer(
+        child=serializers.ChoiceField(choices=ANALYSIS_KPI.choices),
+        required=True,
+        allow_empty=False,
+    )
+
+    def validate(self, data):
+        data = super().validate(data)
+        if data["start_date"] > data["end_date"]:
+            raise serializers.ValidationError("start_date must be before end_date")
+        return data
+
+
 class AnalysisSummarySerializer(serializers.ModelSerializer):
     class Meta:
         model = Analysis
@@ -224,6 +242,10 @@ class AnalysisResultsSerializer(serializers.Serializer):
     revenue_per_day_graph = RevenuePerDaySerializer(many=True)
     revenue_by_metric_graph = RevenueByPlanMetricSerializer(many=True)
     top_customers_by_plan = TopCustomersPerPlanAnalysisSerializer(many=True)
+    progress = serializers.FloatField(
+        required=False,
+        help_text="Fraction of the plans that have been analyzed so far. The results are partial until the analysis is completed.",
+    )
 
 
 class AnalysisDetailSerializer(AnalysisSummarySerializer):
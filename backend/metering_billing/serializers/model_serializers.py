@@ -48,6 +48,7 @@ from metering_billing.serializers.serializer_utils import (
     TimeZoneSerializerField,
     WebhookEndpointUUIDField,
     WebhookSecretUUIDField,
+    clear_request_timezones,
 )
 from metering_billing.utils import now_utc
 from metering_billing.utils.enums import (
@@ -455,6 +456,7 @@ class OrganizationUpdateSerializer(TimezoneFieldMixin, serializers.ModelSerializ
         new_tz = validated_data.get("timezone", instance.timezone)
         if new_tz != instance.timezone:
             cache.delete(f"tz_organization_{instance.id}")
+            clear_request_timezones()
         instance.timezone = new_tz
 
         address = validated_data.pop("address", None)
@@ -560,6 +562,7 @@ class CustomerUpdateSerializer(TimezoneFieldMixin, serializers.ModelSerializer):
         tz = validated_data.get("timezone", None)
         if tz != instance.timezone:
             cache.delete(f"tz_customer_{instance.id}")
+            clear_request_timezones()
         if tz:
             instance.timezone = tz
             instance.timezone_set = True
@@ -786,6 +789,7 @@ class MetricCreateSerializer(TimezoneFieldMixin, serializers.ModelSerializer):
             "properties",
             "is_cost_metric",
             "custom_sql",
+            "custom_sql_daily_aggregation",
             "categorical_filters",
             "numeric_filters",
         )
@@ -804,6 +808,11 @@ class MetricCreateSerializer(TimezoneFieldMixin, serializers.ModelSerializer):
             "properties": {"write_only": True},
             "is_cost_metric": {"write_only": True, "default": False},
             "custom_sql": {"write_only": True},
+            "custom_sql_daily_aggregation": {
+                "write_only": True,
+                "required": False,
+                "allow_null": True,
+            },
             "proration": {
                 "write_only": True,
                 "required": False,
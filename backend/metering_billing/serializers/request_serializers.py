@@ -1,3 +1,6 @@
+import datetime
+
+from django.conf import settings
 from rest_framework import serializers
 
 from metering_billing.models import (
@@ -8,6 +11,9 @@ from metering_billing.models import (
 from metering_billing.serializers.serializer_utils import (
     SlugRelatedFieldWithOrganization,
 )
+from metering_billing.utils import now_utc
+
+EVENT_SEARCH_MAX_WINDOW_DAYS = settings.EVENT_SEARCH_MAX_WINDOW_DAYS
 
 
 class SinglePeriodRequestSerializer(serializers.Serializer):
@@ -27,6 +33,14 @@ class OptionalPeriodRequestSerializer(serializers.Serializer):
     end_date = serializers.DateField(required=False)
 
 
+class InvoiceCSVRequestSerializer(OptionalPeriodRequestSerializer):
+    incremental = serializers.BooleanField(
+        required=False,
+        default=False,
+        help_text="Only export the invoices that changed since the last incremental export. start_date and end_date are ignored.",
+    )
+
+
 class URLResponseSerializer(serializers.Serializer):
     url = serializers.URLField()
     exists = serializers.BooleanField()
@@ -46,6 +60,13 @@ class CostAnalysisRequestSerializer(PeriodRequestSerializer):
     )
 
 
+class EventVolumeRequestSerializer(PeriodRequestSerializer):
+    granularity = serializers.ChoiceField(choices=["hour", "day"], default="day")
+    by_event_name = serializers.BooleanField(
+        default=False, help_text="Break the volume down by event name."
+    )
+
+
 class PeriodMetricUsageRequestSerializer(PeriodRequestSerializer):
     top_n_customers = serializers.IntegerField(required=False)
 
@@ -132,4 +153,34 @@ class StripeMultiSubscriptionsSerializer(serializers.Serializer):
 class EventSearchRequestSerializer(serializers.Serializer):
     customer_id = serializers.CharField(allow_blank=True, required=False)
     idempotency_id = serializers.CharField(allow_blank=True, required=False)
+    match = serializers.ChoiceField(
+        choices=["exact", "prefix"],
+        default="prefix",
+        help_text="Whether customer_id and idempotency_id must match exactly or only the start of the ids.",
+    )
+    time_created_gte = serializers.DateTimeField(
+        required=False,
+        help_text=f"Start of the searched time window. Defaults to {EVENT_SEARCH_MAX_WINDOW_DAYS} days before time_created_lt.",
+    )
+    time_created_lt = serializers.DateTimeField(
+        required=False,
+        help_text="End of the searched time window. Defaults to now.",
+    )
     c = serializers.CharField(allow_blank=True, required=False)
+
+    def validate(self, data):
+        data = super().validate(data)
+        max_window = datetime.timedelta(days=EVENT_SEARCH_MAX_WINDOW_DAYS)
+        time_created_lt = data.get("time_created_lt") or now_utc()
+        time_created_gte = data.get("time_created_gte") or time_created_lt - max_window
+        if time_created_gte >= time_created_lt:
+            raise serializers.ValidationError(
+                "time_created_gte must be before time_created_lt"
+            )
+        if time_created_lt - time_created_gte > max_window:
+            raise serializers.ValidationError(
+                f"The time window can't be longer than {EVENT_SEARCH_MAX_WINDOW_DAYS} days"
+            )
+        data["time_created_gte"] = time_created_gte
+        data["time_created_lt"] = time_created_lt
+        return data
@@ -1,4 +1,5 @@
 from metering_billing.serializers.model_serializers import MetricDetailSerializer
+from metering_billing.serializers.serializer_utils import MetricUUIDField
 from rest_framework import serializers
 
 
@@ -22,6 +23,11 @@ class PeriodSingleMetricUsageSerializer(serializers.Serializer):
 
 class PeriodMetricUsageResponseSerializer(serializers.Serializer):
     metrics = serializers.DictField(child=PeriodSingleMetricUsageSerializer())
+    incomplete_metrics = serializers.ListField(
+        child=MetricUUIDField(),
+        required=False,
+        help_text="Ids of the metrics whose usage couldn't be computed within the time budget of the request and are missing from the response.",
+    )
 
 
 class CustomerRevenueSerializer(serializers.Serializer):
@@ -45,6 +51,16 @@ class PeriodEventsResponseSerializer(serializers.Serializer):
     total_events_period_2 = serializers.IntegerField()
 
 
+class EventVolumeSerializer(serializers.Serializer):
+    time = serializers.DateTimeField(help_text="Start of the hour or day.")
+    event_name = serializers.CharField(allow_null=True)
+    num_events = serializers.IntegerField()
+
+
+class EventVolumeResponseSerializer(serializers.Serializer):
+    volume = EventVolumeSerializer(many=True)
+
+
 class SubscriptionUsageResponseSerializer(serializers.Serializer):
     usage_amount_due = serializers.DecimalField(decimal_places=10, max_digits=20)
     flat_amount_due = serializers.DecimalField(decimal_places=10, max_digits=20)
@@ -68,3 +84,8 @@ class CostAnalysisSerializer(serializers.Serializer):
     total_revenue = serializers.DecimalField(decimal_places=10, max_digits=20)
     profit_margin = serializers.DecimalField(decimal_places=10, max_digits=20)
     markup = serializers.DecimalField(decimal_places=10, max_digits=20)
+    incomplete_metrics = serializers.ListField(
+        child=serializers.CharField(),
+        required=False,
+        help_text="Ids of the cost metrics whose usage couldn't be computed within the time budget of the request and are missing from the costs.",
+    )
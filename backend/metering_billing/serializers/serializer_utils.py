@@ -1,15 +1,26 @@
+import contextlib
+import contextvars
 import datetime
+import functools
 import uuid
 
 import pytz
 from dateutil.parser import parse
+from django.conf import settings
 from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist
 from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
 from drf_spectacular.utils import extend_schema_field
-from rest_framework import serializers
+from rest_framework import ISO_8601, serializers
 from rest_framework.exceptions import ValidationError
+from rest_framework.fields import SkipField
+from rest_framework.relations import PKOnlyObject
+from rest_framework.settings import api_settings
 from timezone_field.rest_framework import TimeZoneSerializerField
 
+FAST_READ_SERIALIZERS = settings.FAST_READ_SERIALIZERS
+
 
 @extend_schema_field(serializers.ChoiceField(choices=pytz.common_timezones))
 class TimeZoneSerializerField(TimeZoneSerializerField):
@@ -30,51 +41,138 @@ class ConvertEmptyStringToNullMixin:
         return data
 
 
-class TimezoneFieldMixin:
-    def get_organization_timezone(self, organization_id):
-        from metering_billing.models import Organization
+_TIMEZONE_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+_request_timezone_resolver = contextvars.ContextVar(
+    "request_timezone_resolver", default=None
+)
+
+
+class TimezoneResolver:
+    """
+    Memoizes the timezones of customers and organizations, looking them up in the cache and
+    then the database. Lists prime it with every object on the page, so a page costs one
+    get_many and at most one query per model instead of a lookup per row.
+    """
+
+    def __init__(self):
+        self.customer_timezones = {}
+        self.organization_timezones = {}
+
+    def clear(self):
+        self.customer_timezones.clear()
+        self.organization_timezones.clear()
+
+    def prime(self, model, instances):
+        try:
+            customer_field = model._meta.get_field("customer")
+        except FieldDoesNotExist:
+            customer_field = None
+        by_customer = customer_field is not None and customer_field.is_relation
+        customer_ids, organization_ids = set(), set()
+        for instance in instances:
+            customer_id = getattr(instance, "customer_id", None)
+            if by_customer and customer_id is not None:
+                customer_ids.add(customer_id)
+            elif customer_id is None:
+                organization_ids.add(getattr(instance, "organization_id", None))
+        organization_ids.discard(None)
+        self._load_customers(customer_ids - self.customer_timezones.keys())
+        self._load_organizations(organization_ids - self.organization_timezones.keys())
+
+    def customer_timezone(self, customer_id):
+        from metering_billing.models import Customer
 
-        serializer_context = self.context
-        if "tz_organization_cache" not in serializer_context:
-            serializer_context["tz_organization_cache"] = {}
-        tz_organization_cache = serializer_context["tz_organization_cache"]
-        if organization_id in tz_organization_cache:
-            tz_string = tz_organization_cache[organization_id]
-        else:
-            organization_cache_key = f"tz_organization_{organization_id}"
-            tz_string = cache.get(organization_cache_key)
-            if tz_string is None:
-                try:
-                    organization = Organization.objects.get(id=organization_id)
-                except Organization.DoesNotExist:
-                    tz_string = "UTC"
-                else:
-                    tz_string = organization.timezone.zone
-                    cache.set(organization_cache_key, tz_string, 60 * 60 * 24 * 7)
-        return pytz.timezone(tz_string)
+        if customer_id not in self.customer_timezones:
+            self._load_customers({customer_id})
+            if customer_id not in self.customer_timezones:
+                raise Customer.DoesNotExist("Customer matching query does not exist.")
+        return pytz.timezone(self.customer_timezones[customer_id])
 
-    def get_timezone(self, instance):
+    def organization_timezone(self, organization_id):
+        if organization_id not in self.organization_timezones:
+            self._load_organizations({organization_id})
+            self.organization_timezones.setdefault(organization_id, "UTC")
+        return pytz.timezone(self.organization_timezones[organization_id])
+
+    def _load_customers(self, customer_ids):
         from metering_billing.models import Customer
 
-        serializer_context = self.context
+        self._load(customer_ids, self.customer_timezones, "tz_customer_", Customer)
+
+    def _load_organizations(self, organization_ids):
+        from metering_billing.models import Organization
+
+        self._load(
+            organization_ids,
+            self.organization_timezones,
+            "tz_organization_",
+            Organization,
+        )
+
+    def _load(self, pks, timezones, key_prefix, model):
+        if not pks:
+            return
+        cache_keys = {f"{key_prefix}{pk}": pk for pk in pks}
+        for cache_key, tz_string in cache.get_many(list(cache_keys)).items():
+            timezones[cache_keys[cache_key]] = tz_string
+        missing = [pk for pk in pks if pk not in timezones]
+        if not missing:
+            return
+        loaded = {
+            pk: timezone.zone
+            for pk, timezone in model.objects.filter(id__in=missing).values_list(
+                "id", "timezone"
+            )
+        }
+        cache.set_many(
+            {f"{key_prefix}{pk}": tz_string for pk, tz_string in loaded.items()},
+            _TIMEZONE_CACHE_TIMEOUT,
+        )
+        timezones.update(loaded)
+
+
+@contextlib.contextmanager
+def request_timezone_resolver():
+    """
+    Shares one TimezoneResolver between every serializer used while handling a request,
+    including nested serializers that aren't given the parent's context.
+    """
+    token = _request_timezone_resolver.set(TimezoneResolver())
+    try:
+        yield
+    finally:
+        _request_timezone_resolver.reset(token)
+
+
+def get_timezone_resolver(context=None) -> TimezoneResolver:
+    resolver = _request_timezone_resolver.get()
+    if resolver is None:
+        if context is None:
+            return TimezoneResolver()
+        resolver = context.setdefault("timezone_resolver", TimezoneResolver())
+    return resolver
+
+
+def clear_request_timezones():
+    resolver = _request_timezone_resolver.get()
+    if resolver is not None:
+        resolver.clear()
+
+
+class TimezoneFieldMixin:
+    def get_organization_timezone(self, organization_id):
+        return get_timezone_resolver(self.context).organization_timezone(
+            organization_id
+        )
+
+    def get_timezone(self, instance):
+        resolver = get_timezone_resolver(self.context)
         customer_id = getattr(instance, "customer_id", None)
         if customer_id is not None:
-            if "tz_customer_cache" not in serializer_context:
-                serializer_context["tz_customer_cache"] = {}
-            tz_customer_cache = serializer_context["tz_customer_cache"]
-            if customer_id in tz_customer_cache:
-                tz_string = tz_customer_cache[customer_id]
-            else:
-                customer_cache_key = f"tz_customer_{customer_id}"
-                tz_string = cache.get(customer_cache_key)
-                if tz_string is None:
-                    customer_tz = Customer.objects.get(id=customer_id).timezone
-                    tz_string = customer_tz.zone
-                    cache.set(customer_cache_key, tz_string, 60 * 60 * 24 * 7)
-                tz_customer_cache[customer_id] = tz_string
-            return pytz.timezone(tz_string)
+            return resolver.customer_timezone(customer_id)
         else:
-            return self.get_organization_timezone(instance.organization_id)
+            return resolver.organization_timezone(instance.organization_id)
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
@@ -90,6 +188,112 @@ class TimezoneFieldMixin:
         return representation
 
 
+_REPRESENTATION_CLASSES = (
+    ConvertEmptyStringToNullMixin,
+    TimezoneFieldMixin,
+    serializers.ModelSerializer,
+    serializers.Serializer,
+    serializers.BaseSerializer,
+    serializers.Field,
+)
+
+
+@functools.lru_cache(maxsize=None)
+def _has_compilable_representation(serializer_class) -> bool:
+    # a serializer that customizes to_representation itself can't be compiled
+    return all(
+        klass in _REPRESENTATION_CLASSES or "to_representation" not in vars(klass)
+        for klass in serializer_class.__mro__
+    )
+
+
+class FastReadListSerializer(serializers.ListSerializer):
+    """
+    Read path for the hot list endpoints. The child's readable fields are compiled once per
+    list into a plan of plain attribute reads and field conversions, and each object is
+    built as a plain dict in a single pass, converting datetimes to the object's timezone
+    and empty strings to null the way TimezoneFieldMixin and ConvertEmptyStringToNullMixin
+    do, without formatting datetimes to strings and parsing them back. The output is
+    identical to the child serializer's, and children that override to_representation
+    are serialized as usual.
+    """
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.Manager) else data
+        model = self.child.Meta.model
+        if isinstance(self.child, TimezoneFieldMixin):
+            iterable = list(iterable)
+            get_timezone_resolver(self.child.context).prime(model, iterable)
+        if not FAST_READ_SERIALIZERS or not _has_compilable_representation(
+            type(self.child)
+        ):
+            return super().to_representation(iterable)
+        plan = self._compile_field_plan(model)
+        return [
+            self._represent(item, plan)
+            if isinstance(item, model)
+            else self.child.to_representation(item)
+            for item in iterable
+        ]
+
+    def _compile_field_plan(self, model):
+        child = self.child
+        attnames = {field.attname for field in model._meta.concrete_fields}
+        convert_datetimes = isinstance(child, TimezoneFieldMixin)
+        plan = []
+        for field in child._readable_fields:
+            attname = None
+            if len(field.source_attrs) == 1 and field.source_attrs[0] in attnames:
+                attname = field.source_attrs[0]
+            is_datetime = convert_datetimes and isinstance(
+                field, serializers.DateTimeField
+            )
+            output_format = getattr(field, "format", api_settings.DATETIME_FORMAT)
+            native_datetime = is_datetime and (
+                output_format is None or output_format.lower() == ISO_8601
+            )
+            plan.append((field, attname, is_datetime, native_datetime))
+        return plan
+
+    def _represent(self, instance, plan):
+        child = self.child
+        timezone = None
+        ret = {}
+        for field, attname, is_datetime, native_datetime in plan:
+            if attname is not None:
+                attribute = getattr(instance, attname)
+            else:
+                try:
+                    attribute = field.get_attribute(instance)
+                except SkipField:
+                    continue
+            check_for_none = (
+                attribute.pk if isinstance(attribute, PKOnlyObject) else attribute
+            )
+            if check_for_none is None:
+                ret[field.field_name] = None
+                continue
+            if (
+                native_datetime
+                and isinstance(attribute, datetime.datetime)
+                and attribute.tzinfo is not None
+            ):
+                value = attribute
+            else:
+                value = field.to_representation(attribute)
+                if not is_datetime or value is None:
+                    ret[field.field_name] = value
+                    continue
+                if isinstance(value, str):
+                    value = parse(value)
+            if timezone is None:
+                timezone = child.get_timezone(instance)
+            ret[field.field_name] = value.astimezone(timezone).isoformat()
+        if isinstance(child, ConvertEmptyStringToNullMixin):
+            child.recursive_convert_empty_string_to_none(ret)
+        return ret
+
+
 class DjangoJSONEncoder(DjangoJSONEncoder):
     def default(self, obj):
         if isinstance(obj, datetime.datetime):
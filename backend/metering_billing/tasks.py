@@ -1,34 +1,26 @@
 import logging
-from decimal import Decimal, InvalidOperation
+import time
 
-import pytz
 from celery import shared_task
 from dateutil.relativedelta import relativedelta
 from django.conf import settings
-from django.db.models import Q
+from django.db.models import Exists, F, OuterRef, Q
 
+from metering_billing.db_router import replica_reads
 from metering_billing.payment_processors import PAYMENT_PROCESSOR_MAP
-from metering_billing.serializers.experiment_serializers import (
-    AllSubstitutionResultsSerializer,
-)
-from metering_billing.serializers.serializer_utils import PlanVersionUUIDField
-from metering_billing.utils import (
-    date_as_max_dt,
-    date_as_min_dt,
-    dates_bwn_two_dts,
-    make_all_dates_times_strings,
-    make_all_datetimes_dates,
-    make_all_decimals_floats,
-    now_utc,
-)
+from metering_billing.utils import now_utc
 from metering_billing.utils.enums import (
-    CUSTOMER_BALANCE_ADJUSTMENT_STATUS,
     EXPERIMENT_STATUS,
+    METRIC_STATUS,
+    METRIC_TYPE,
 )
 from metering_billing.webhooks import invoice_past_due_webhook
 
 logger = logging.getLogger("django.server")
 POSTHOG_PERSON = settings.POSTHOG_PERSON
+ALERT_REFRESH_BATCH_SIZE = settings.ALERT_REFRESH_BATCH_SIZE
+ALERT_REFRESH_TIME_BUDGET = settings.ALERT_REFRESH_TIME_BUDGET
+INVOICE_PDF_BATCH_ENABLED = settings.INVOICE_PDF_BATCH_ENABLED
 
 
 @shared_task
@@ -65,19 +57,33 @@ def update_subscription_filter_settings_task(org_pk, subscription_filter_keys):
 
 @shared_task
 def generate_invoice_pdf_async(invoice_pk):
-    from metering_billing.invoice_pdf import get_invoice_presigned_url
-    from metering_billing.models import Invoice
+    from metering_billing.invoice_pdf import render_invoice_pdfs
 
-    invoice = Invoice.objects.get(pk=invoice_pk)
     try:
-        pdf_url_dict = get_invoice_presigned_url(invoice)
-        pdf_url = pdf_url_dict.get("url")
+        render_invoice_pdfs([invoice_pk])
     except Exception as e:
         logger.error("RAN INTO ERROR GENERATING PDF: {}".format(e))
-        pdf_url = None
 
-    invoice.invoice_pdf = pdf_url
-    invoice.save()
+
+@shared_task
+def dispatch_webhooks():
+    from metering_billing.webhooks import dispatch_webhooks_inner
+
+    dispatch_webhooks_inner()
+
+
+@shared_task
+def generate_invoice_pdfs():
+    generate_invoice_pdfs_inner()
+
+
+def generate_invoice_pdfs_inner():
+    from metering_billing.invoice_pdf import (
+        get_pending_invoice_pdf_pks,
+        render_invoice_pdfs,
+    )
+
+    render_invoice_pdfs(get_pending_invoice_pdf_pks())
 
 
 @shared_task
@@ -148,24 +154,121 @@ def calculate_invoice_inner():
             customer_id=customer_id,
             organization_id=organization_id,
         ).delete()
+    if INVOICE_PDF_BATCH_ENABLED:
+        generate_invoice_pdfs.delay()
+
+
+def due_alert_result_batches(now):
+    """
+    Groups the alert results that are due by metric, most overdue first, in batches of at most ALERT_REFRESH_BATCH_SIZE. Idle alert results are due as soon as new events arrive for them.
+    """
+    from metering_billing.models import Event, UsageAlertResult
+
+    new_events = Event.objects.filter(
+        organization_id=OuterRef("organization_id"),
+        uuidv5_customer_id=OuterRef(
+            "subscription_record__customer__uuidv5_customer_id"
+        ),
+        event_name=OuterRef("alert__metric__event_name"),
+        inserted_at__gt=OuterRef("last_run_timestamp"),
+    )
+    due = (
+        UsageAlertResult.objects.filter(
+            Q(next_check_at__isnull=True)
+            | Q(next_check_at__lte=now)
+            | Q(Exists(new_events), usage_idle=True),
+            subscription_record__end_date__gte=now,
+        )
+        .order_by(F("next_check_at").asc(nulls_first=True))
+        .values_list("pk", "alert__metric")
+    )
+    per_metric = {}
+    for pk, metric_pk in due:
+        per_metric.setdefault(metric_pk, []).append(pk)
+    batches = []
+    for pks in per_metric.values():
+        for i in range(0, len(pks), ALERT_REFRESH_BATCH_SIZE):
+            batches.append(pks[i : i + ALERT_REFRESH_BATCH_SIZE])
+    return batches
+
+
+def refresh_alert_batch_inner(alert_result_pks, time_budget):
+    from metering_billing.models import (
+        ALERT_CHECK_MAX_INTERVAL,
+        BillingRecord,
+        UsageAlertResult,
+    )
+
+    now = now_utc()
+    deadline = time.monotonic() + time_budget
+    alert_results = list(
+        UsageAlertResult.objects.filter(pk__in=alert_result_pks)
+        .select_related("alert__metric", "subscription_record", "organization")
+        .prefetch_related(
+            "alert__metric__numeric_filters", "alert__metric__categorical_filters"
+        )
+        .order_by(F("next_check_at").asc(nulls_first=True))
+    )
+    # one query for the current billing records of the whole batch
+    billing_records = {
+        (x.subscription_id, x.component.billable_metric_id): x
+        for x in BillingRecord.objects.filter(
+            subscription__in={x.subscription_record_id for x in alert_results},
+            component__billable_metric__in={x.alert.metric_id for x in alert_results},
+            start_date__lte=now,
+            end_date__gt=now,
+        ).select_related("component__billable_metric")
+    }
+    without_billing_record = []
+    for alert_result in alert_results:
+        if time.monotonic() > deadline:
+            # the rest stay due and are picked up by the next run
+            break
+        billing_record = billing_records.get(
+            (alert_result.subscription_record_id, alert_result.alert.metric_id)
+        )
+        if billing_record is None:
+            without_billing_record.append(alert_result.pk)
+            continue
+        try:
+            alert_result.refresh(billing_record=billing_record)
+        except Exception as e:
+            logger.error(
+                "Error refreshing alert result {}. Error was {}".format(
+                    alert_result.pk, e
+                )
+            )
+    # nothing to measure right now, don't pick them up again on every run
+    UsageAlertResult.objects.filter(pk__in=without_billing_record).update(
+        next_check_at=now + ALERT_CHECK_MAX_INTERVAL
+    )
+
 
+@shared_task
+def refresh_alert_batch(alert_result_pks, time_budget):
+    refresh_alert_batch_inner(alert_result_pks, time_budget)
 
-def refresh_alerts_inner():
+
+def refresh_alerts_inner(dispatch=False):
     from metering_billing.models import UsageAlertResult
 
-    # get all UsageAlertResults
     now = now_utc()
     UsageAlertResult.objects.filter(subscription_record__end_date__lt=now).delete()
-    alert_results = UsageAlertResult.objects.filter(
-        subscription_record__end_date__gte=now
-    ).prefetch_related("alert", "subscription_record", "alert__metric")
-    for alert_result in alert_results:
-        alert_result.refresh()
+    batches = due_alert_result_batches(now)
+    if len(batches) == 0:
+        return
+    # the database time of a run is capped, every batch gets its share of it
+    time_budget = ALERT_REFRESH_TIME_BUDGET / len(batches)
+    for batch in batches:
+        if dispatch:
+            refresh_alert_batch.delay(batch, time_budget)
+        else:
+            refresh_alert_batch_inner(batch, time_budget)
 
 
 @shared_task
 def refresh_alerts():
-    refresh_alerts_inner()
+    refresh_alerts_inner(dispatch=True)
 
 
 def prune_guard_table_inner():
@@ -181,18 +284,104 @@ def prune_guard_table():
     prune_guard_table_inner()
 
 
+def checkpoint_gauge_states_inner():
+    from metering_billing.aggregation.billable_metrics import GaugeHandler
+    from metering_billing.models import Metric
+
+    gauge_metrics = Metric.objects.filter(
+        metric_type=METRIC_TYPE.GAUGE,
+        status=METRIC_STATUS.ACTIVE,
+        mat_views_provisioned=True,
+    ).prefetch_related("numeric_filters", "categorical_filters")
+    for metric in gauge_metrics:
+        try:
+            GaugeHandler.checkpoint_gauge_state(metric)
+        except Exception as e:
+            logger.error(
+                "Error checkpointing gauge state for metric {}. Error was {}".format(
+                    metric.metric_id, e
+                )
+            )
+
+
+@shared_task
+def checkpoint_gauge_states():
+    checkpoint_gauge_states_inner()
+
+
+def update_revenue_ledger_inner():
+    from metering_billing.models import BillingRecord
+    from metering_billing.revenue_ledger import refresh_revenue_ledger
+
+    refresh_revenue_ledger(BillingRecord.objects.all())
+
+
+@shared_task
+def update_revenue_ledger():
+    update_revenue_ledger_inner()
+
+
+def refresh_event_volume_inner():
+    from metering_billing.aggregation.event_volume import refresh_event_volume
+
+    refresh_event_volume()
+
+
+@shared_task
+def refresh_event_volume():
+    refresh_event_volume_inner()
+
+
+def advance_event_tail_inner():
+    from metering_billing.aggregation.event_tail import advance_event_tail
+
+    advance_event_tail()
+
+
+@shared_task
+def advance_event_tail():
+    advance_event_tail_inner()
+
+
+def reconcile_rate_counters_inner():
+    from metering_billing.aggregation.event_tail import event_tail_lock
+    from metering_billing.aggregation.rate_counters import (
+        rate_counter_supported,
+        reconcile_rate_counters,
+    )
+    from metering_billing.models import Metric
+
+    rate_metrics = Metric.objects.filter(
+        metric_type=METRIC_TYPE.RATE,
+        status=METRIC_STATUS.ACTIVE,
+    ).prefetch_related("numeric_filters", "categorical_filters")
+    with event_tail_lock() as acquired:
+        if not acquired:
+            # the tail is running, try again on the next run
+            return
+        for metric in rate_metrics:
+            if not rate_counter_supported(metric):
+                continue
+            try:
+                reconcile_rate_counters(metric)
+            except Exception as e:
+                logger.error(
+                    "Error reconciling rate counters for metric {}. Error was {}".format(
+                        metric.metric_id, e
+                    )
+                )
+
+
+@shared_task
+def reconcile_rate_counters():
+    reconcile_rate_counters_inner()
+
+
 @shared_task
 def zero_out_expired_balance_adjustments():
     from metering_billing.models import CustomerBalanceAdjustment
 
-    now = now_utc()
-    expired_balance_adjustments = CustomerBalanceAdjustment.objects.filter(
-        expires_at__lt=now,
-        amount__gt=0,
-        status=CUSTOMER_BALANCE_ADJUSTMENT_STATUS.ACTIVE,
-    )
-    for ba in expired_balance_adjustments:
-        ba.zero_out(reason="expired")
+    CustomerBalanceAdjustment.expire_balance_adjustments(now_utc())
 
 
 @shared_task
@@ -217,287 +406,14 @@ def update_invoice_status():
 
 @shared_task
 def run_backtest(backtest_id):
-    from metering_billing.models import Backtest, PlanComponent, SubscriptionRecord
+    from metering_billing.backtest import run_backtest_engine
+    from metering_billing.models import Backtest
 
+    backtest = Backtest.objects.get(backtest_id=backtest_id)
     try:
-        backtest = Backtest.objects.get(backtest_id=backtest_id)
-        backtest_substitutions = backtest.backtest_substitutions.all()
-        queries = [Q(billing_plan=x.original_plan) for x in backtest_substitutions]
-        query = queries.pop()
-        start_date = date_as_min_dt(backtest.start_date, timezone=pytz.UTC)
-        end_date = date_as_max_dt(backtest.end_date, timezone=pytz.UTC)
-        for item in queries:
-            query |= item
-        all_subs_time_period = (
-            SubscriptionRecord.objects.filter(
-                query,
-                start_date__lte=end_date,
-                end_date__gte=start_date,
-                end_date__lte=end_date,
-                organization=backtest.organization,
-            )
-            .prefetch_related("billing_plan")
-            .prefetch_related("billing_plan__plan_components")
-        )
-        all_results = {
-            "substitution_results": [],
-        }
-        logger.info(f"Running backtest for {len(backtest_substitutions)} substitutions")
-        for subst in backtest_substitutions:
-            outer_results = {
-                "substitution_name": f"{str(subst.original_plan)} --> {str(subst.new_plan)}",
-                "original_plan": {
-                    "plan_name": str(subst.original_plan),
-                    "plan_id": PlanVersionUUIDField().to_representation(
-                        subst.original_plan.version_id
-                    ),
-                    "plan_revenue": Decimal(0),
-                },
-                "new_plan": {
-                    "plan_name": str(subst.new_plan),
-                    "plan_id": PlanVersionUUIDField().to_representation(
-                        subst.new_plan.version_id
-                    ),
-                    "plan_revenue": Decimal(0),
-                },
-            }
-            # since we can have at most one new plan per old plan, the old plan uniquely
-            # identifies the substitutiont
-            subst_subscriptions = all_subs_time_period.filter(
-                billing_plan=subst.original_plan
-            )
-            inner_results = {
-                "cumulative_revenue": {},
-                "revenue_by_metric": {},
-                "top_customers": {},
-            }
-            for sub in subst_subscriptions:
-                # create if not seen
-                customer = sub.customer
-                if customer not in inner_results["top_customers"]:
-                    inner_results["top_customers"][customer] = {
-                        "original_plan_revenue": Decimal(0),
-                        "new_plan_revenue": Decimal(0),
-                    }
-                end_date = sub.end_date
-                if end_date not in inner_results["cumulative_revenue"]:
-                    inner_results["cumulative_revenue"][end_date] = {
-                        "original_plan_revenue": Decimal(0),
-                        "new_plan_revenue": Decimal(0),
-                    }
-                ## PROCESS OLD SUB
-                old_usage_revenue = sub.get_usage_and_revenue()
-                # cumulative revenue
-                inner_results["cumulative_revenue"][end_date][
-                    "original_plan_revenue"
-                ] += old_usage_revenue["total_amount_due"]
-                # customer revenue
-                inner_results["top_customers"][customer][
-                    "original_plan_revenue"
-                ] += old_usage_revenue["total_amount_due"]
-                # per metric
-                for component_pk, component_dict in old_usage_revenue["components"]:
-                    metric = PlanComponent.objects.get(pk=component_pk).billable_metric
-                    metric_name = metric.billable_metric_name
-                    if metric_name not in inner_results["revenue_by_metric"]:
-                        inner_results["revenue_by_metric"][metric_name] = {
-                            "original_plan_revenue": Decimal(0),
-                            "new_plan_revenue": Decimal(0),
-                        }
-                    inner_results["revenue_by_metric"][metric_name][
-                        "original_plan_revenue"
-                    ] += component_dict["revenue"]
-                if "flat_fees" not in inner_results["revenue_by_metric"]:
-                    inner_results["revenue_by_metric"]["flat_fees"] = {
-                        "original_plan_revenue": Decimal(0),
-                        "new_plan_revenue": Decimal(0),
-                    }
-                inner_results["revenue_by_metric"]["flat_fees"][
-                    "original_plan_revenue"
-                ] += old_usage_revenue["flat_amount_due"]
-                ## PROCESS NEW SUB
-                sub.billing_plan = subst.new_plan
-                sub.save()
-                new_usage_revenue = sub.get_usage_and_revenue()
-                # revert it so we don't accidentally change the past lol
-                sub.billing_plan = subst.original_plan
-                sub.save()
-                # cumulative revenue
-                inner_results["cumulative_revenue"][end_date][
-                    "new_plan_revenue"
-                ] += new_usage_revenue["total_amount_due"]
-                # customer revenue
-                inner_results["top_customers"][customer][
-                    "new_plan_revenue"
-                ] += new_usage_revenue["total_amount_due"]
-                # per metric
-                for component_pk, component_dict in new_usage_revenue["components"]:
-                    metric = PlanComponent.objects.get(pk=component_pk).billable_metric
-                    metric_name = metric.billable_metric_name
-                    if metric_name not in inner_results["revenue_by_metric"]:
-                        inner_results["revenue_by_metric"][metric_name] = {
-                            "new_plan_revenue": Decimal(0),
-                            "original_plan_revenue": Decimal(0),
-                        }
-                    inner_results["revenue_by_metric"][metric_name][
-                        "new_plan_revenue"
-                    ] += component_dict["revenue"]
-                inner_results["revenue_by_metric"]["flat_fees"][
-                    "new_plan_revenue"
-                ] += new_usage_revenue["flat_amount_due"]
-            # change cumulative revenue to be cumulative and in fronted format
-            cum_rev_dict_list = []
-            cum_rev = inner_results.pop("cumulative_revenue")
-            cum_rev_lst = sorted(cum_rev.items(), key=lambda x: x[0], reverse=True)
-            date_cumrev_list = []
-            for date, cum_rev_dict in cum_rev_lst:
-                date_cumrev_list.append((date.date(), cum_rev_dict))
-            cum_rev_lst = date_cumrev_list
-            try:
-                every_date = list(
-                    dates_bwn_two_dts(cum_rev_lst[-1][0], cum_rev_lst[0][0])
-                )
-            except IndexError:
-                every_date = []
-            if cum_rev_lst:
-                date, rev_dict = cum_rev_lst.pop(-1)
-                last_dict = {**rev_dict, "date": date}
-            else:
-                rev_dict = {}
-            for date in every_date:
-                if (
-                    date < cum_rev_lst[-1][0]
-                ):  # have not reached the next data point yet, dont add
-                    new_dict = last_dict.copy()
-                    new_dict["date"] = date
-                elif (
-                    date == cum_rev_lst[-1][0]
-                ):  # have reached the next data point, add it
-                    date, rev_dict = cum_rev_lst.pop()
-                    new_dict = {**rev_dict, "date": date}
-                    new_dict["original_plan_revenue"] += last_dict[
-                        "original_plan_revenue"
-                    ]
-                    new_dict["new_plan_revenue"] += last_dict["new_plan_revenue"]
-                    last_dict = new_dict
-                else:
-                    raise Exception("should not be greater than the most recent date")
-                cum_rev_dict_list.append(new_dict)
-            inner_results["cumulative_revenue"] = cum_rev_dict_list
-            # change metric revenue to be in frontend format
-            metric_rev = inner_results.pop("revenue_by_metric")
-            metric_rev = [
-                {**rev_dict, "metric_name": metric_name}
-                for metric_name, rev_dict in metric_rev.items()
-            ]
-            inner_results["revenue_by_metric"] = metric_rev
-            # change top customers to be in frontend format
-            top_cust_dict = {}
-            top_cust = inner_results.pop("top_customers")
-            top_original = sorted(
-                top_cust.items(),
-                key=lambda x: x[1]["original_plan_revenue"],
-                reverse=True,
-            )[:5]
-            top_cust_dict["original_plan_revenue"] = [
-                {
-                    "customer_id": customer.customer_id,
-                    "customer_name": customer.customer_name,
-                    "value": rev_dict.get("original_plan_revenue", 0),
-                }
-                for customer, rev_dict in top_original
-            ]
-            top_new = sorted(
-                top_cust.items(), key=lambda x: x[1]["new_plan_revenue"], reverse=True
-            )[:5]
-            top_cust_dict["new_plan_revenue"] = [
-                {
-                    "customer_id": customer.customer_id,
-                    "customer_name": customer.customer_name,
-                    "value": rev_dict.get("new_plan_revenue", 0),
-                }
-                for customer, rev_dict in top_new
-            ]
-            all_pct_change = []
-            for customer, rev_dict in top_cust.items():
-                try:
-                    pct_change = (
-                        rev_dict.get("new_plan_revenue", 0)
-                        / rev_dict.get("original_plan_revenue", 0)
-                        - 1
-                    )
-                except ZeroDivisionError:
-                    pct_change = None
-                all_pct_change.append((customer, pct_change))
-            all_pct_change = sorted(
-                [tup for tup in all_pct_change if tup[1] is not None],
-                key=lambda x: x[1],
-            )
-            top_cust_dict["biggest_pct_increase"] = [
-                {
-                    "customer_id": customer.customer_id,
-                    "customer_name": customer.customer_name,
-                    "value": pct_change,
-                }
-                for customer, pct_change in all_pct_change[-5:]
-            ][::-1]
-            top_cust_dict["biggest_pct_decrease"] = [
-                {
-                    "customer_id": customer.customer_id,
-                    "customer_name": customer.customer_name,
-                    "value": pct_change,
-                }
-                for customer, pct_change in all_pct_change[:5]
-            ]
-            inner_results["top_customers"] = top_cust_dict
-            # now add the inner results to the outer results
-            outer_results["results"] = inner_results
-            try:
-                outer_results["original_plan"]["plan_revenue"] = inner_results[
-                    "cumulative_revenue"
-                ][-1]["original_plan_revenue"]
-            except IndexError:
-                outer_results["original_plan"]["plan_revenue"] = Decimal(0)
-            try:
-                outer_results["new_plan"]["plan_revenue"] = inner_results[
-                    "cumulative_revenue"
-                ][-1]["new_plan_revenue"]
-            except IndexError:
-                outer_results["new_plan"]["plan_revenue"] = Decimal(0)
-            try:
-                outer_results["pct_revenue_change"] = (
-                    outer_results["new_plan"]["plan_revenue"]
-                    / outer_results["original_plan"]["plan_revenue"]
-                    - 1
-                )
-            except (ZeroDivisionError, InvalidOperation):
-                outer_results["pct_revenue_change"] = None
-            all_results["substitution_results"].append(outer_results)
-        all_results["original_plans_revenue"] = sum(
-            x["original_plan"]["plan_revenue"]
-            for x in all_results["substitution_results"]
-        )
-        all_results["new_plans_revenue"] = sum(
-            x["new_plan"]["plan_revenue"] for x in all_results["substitution_results"]
-        )
-        try:
-            all_results["pct_revenue_change"] = (
-                all_results["new_plans_revenue"] / all_results["original_plans_revenue"]
-                - 1
-            )
-        except (ZeroDivisionError, InvalidOperation):
-            all_results["pct_revenue_change"] = None
-        all_results = make_all_decimals_floats(all_results)
-        all_results = make_all_datetimes_dates(all_results)
-        all_results = make_all_dates_times_strings(all_results)
-        serializer = AllSubstitutionResultsSerializer(data=all_results)
-        try:
-            serializer.is_valid(raise_exception=True)
-        except Exception:
-            logger.error("errors", serializer.errors, "all results", all_results)
-            raise Exception
-        results = make_all_dates_times_strings(serializer.validated_data)
-        backtest.backtest_results = results
+        # the replica has to have the substitutions written along with the backtest
+        with replica_reads(written_at=backtest.time_created):
+            run_backtest_engine(backtest)
         backtest.status = EXPERIMENT_STATUS.COMPLETED
         backtest.save()
     except Exception as e:
@@ -506,6 +422,34 @@ def run_backtest(backtest_id):
         raise e
 
 
+@shared_task
+def run_analysis(analysis_id):
+    from metering_billing.analysis import run_analysis_engine
+    from metering_billing.models import Analysis
+    from metering_billing.revenue_ledger import (
+        overlapping_billing_records,
+        refresh_revenue_ledger,
+    )
+
+    analysis = Analysis.objects.get(analysis_id=analysis_id)
+    try:
+        # the refresh reads the ledger it builds on, so it can't run on a replica
+        refresh_revenue_ledger(
+            overlapping_billing_records(
+                analysis.organization, analysis.start_date, analysis.end_date
+            ),
+            only_missing=True,
+        )
+        with replica_reads(written_at=analysis.time_created):
+            run_analysis_engine(analysis)
+        analysis.status = EXPERIMENT_STATUS.COMPLETED
+        analysis.save()
+    except Exception as e:
+        analysis.status = EXPERIMENT_STATUS.FAILED
+        analysis.save()
+        raise e
+
+
 @shared_task
 def run_generate_invoice(subscription_record_pk_set, **kwargs):
     from metering_billing.invoice import generate_invoice
@@ -1,9 +1,12 @@
 import itertools
 import json
+import unittest.mock as mock
 from datetime import timedelta
 
 import pytest
+from django.core.cache import cache
 from django.urls import reverse
+from metering_billing.aggregation import alert_counters, event_tail
 from metering_billing.aggregation.billable_metrics import METRIC_HANDLER_MAP
 from metering_billing.models import (
     Event,
@@ -261,3 +264,89 @@ class TestUsageAlerts:
         alert_result = UsageAlertResult.objects.all().first()
         assert alert_result.triggered_count == 1
         assert alert_result.triggered_count == 1
+
+    def test_usage_alert_triggered_by_ingested_events(self, alerts_test_common_setup):
+        setup_dict = alerts_test_common_setup(
+            num_subscriptions=1, auth_method="session_auth"
+        )
+        response = setup_dict["client"].post(
+            reverse("usage_alert-list"),
+            data=json.dumps(setup_dict["payload"], cls=DjangoJSONEncoder),
+            content_type="application/json",
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+
+        cache.delete(event_tail.EVENT_TAIL_WATERMARK_KEY)
+        with (
+            mock.patch.object(alert_counters, "ALERT_COUNTERS_ENABLED", True),
+            mock.patch.object(event_tail, "EVENT_TAIL_SETTLE_SECONDS", 0),
+        ):
+            event_tail.advance_event_tail()
+            # inserted before the seed, so already part of the seeded usage
+            Event.objects.create(
+                organization=setup_dict["org"],
+                event_name="email_sent",
+                cust_id=setup_dict["customer"].customer_id,
+                time_created=now_utc(),
+                properties={"num_characters": 20},
+            )
+            # the refresh seeds the counter
+            refresh_alerts_inner()
+            alert_result = UsageAlertResult.objects.all().first()
+            assert alert_result.triggered_count == 0
+
+            Event.objects.create(
+                organization=setup_dict["org"],
+                event_name="email_sent",
+                cust_id=setup_dict["customer"].customer_id,
+                time_created=now_utc(),
+                properties={"num_characters": 50},
+            )
+            event_tail.advance_event_tail()
+
+            # triggered without waiting for the periodic refresh
+            alert_result = UsageAlertResult.objects.all().first()
+            assert alert_result.triggered_count == 1
+            assert alert_result.last_run_value == 70
+
+            # and the refresh doesn't trigger it again
+            refresh_alerts_inner()
+            alert_result = UsageAlertResult.objects.all().first()
+            assert alert_result.triggered_count == 1
+
+    def test_alert_check_scheduled_by_distance_to_threshold(
+        self, alerts_test_common_setup
+    ):
+        setup_dict = alerts_test_common_setup(
+            num_subscriptions=1, auth_method="session_auth"
+        )
+        response = setup_dict["client"].post(
+            reverse("usage_alert-list"),
+            data=json.dumps(setup_dict["payload"], cls=DjangoJSONEncoder),
+            content_type="application/json",
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        alert_result = UsageAlertResult.objects.all().first()
+        now = now_utc()
+        alert_result.last_run_value = 0
+        alert_result.last_run_timestamp = now - timedelta(hours=1)
+
+        # 10 units per hour with 40 to go, reached in 4 hours
+        far = alert_result.get_next_check_at(10, None, now)
+        # 25 units per hour with 25 to go, reached in an hour
+        mid = alert_result.get_next_check_at(25, None, now)
+        # 49 units per hour with 1 to go, reached in about a minute
+        close = alert_result.get_next_check_at(49, None, now)
+        # no growth
+        idle = alert_result.get_next_check_at(0, None, now)
+
+        assert close == now + timedelta(minutes=3)
+        assert mid == now + timedelta(minutes=30)
+        # capped by the 80% left to the threshold
+        assert far == now + timedelta(minutes=48)
+        assert idle == now + timedelta(hours=1)
+
+        # no growth but close to the threshold
+        alert_result.last_run_value = 49
+        idle_close = alert_result.get_next_check_at(49, None, now)
+        assert idle_close == now + timedelta(minutes=3)
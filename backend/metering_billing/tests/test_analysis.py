@@ -0,0 +1,67 @@
+from decimal import Decimal
+
+import pytest
+from dateutil.relativedelta import relativedelta
+from django.db.models import Sum
+
+from metering_billing.models import Analysis, BillingRecordDailyRevenue
+from metering_billing.serializers.experiment_serializers import (
+    AnalysisResultsSerializer,
+)
+from metering_billing.serializers.serializer_utils import PlanVersionUUIDField
+from metering_billing.tasks import run_analysis
+from metering_billing.utils import now_utc
+from metering_billing.utils.enums import ANALYSIS_KPI, EXPERIMENT_STATUS
+
+
+@pytest.mark.django_db(transaction=True)
+class TestAnalysisEngine:
+    def test_plan_kpis_from_revenue_ledger(
+        self,
+        generate_org_and_api_key,
+        add_product_to_org,
+        add_plan_to_product,
+        add_plan_version_to_plan,
+        add_customers_to_org,
+        add_subscription_record_to_org,
+    ):
+        org, _ = generate_org_and_api_key()
+        plan = add_plan_to_product(add_product_to_org(org))
+        plan_version = add_plan_version_to_plan(plan)
+        (customer,) = add_customers_to_org(org, n=1)
+        now = now_utc()
+        add_subscription_record_to_org(
+            org, plan_version, customer, now - relativedelta(days=10)
+        )
+        analysis = Analysis.objects.create(
+            organization=org,
+            analysis_name="test",
+            start_date=(now - relativedelta(days=10)).date(),
+            end_date=now.date(),
+            kpis=[ANALYSIS_KPI.TOTAL_REVENUE, ANALYSIS_KPI.CHURN],
+        )
+
+        run_analysis(analysis.analysis_id)
+
+        analysis.refresh_from_db()
+        assert analysis.status == EXPERIMENT_STATUS.COMPLETED
+        results = analysis.analysis_results
+        assert AnalysisResultsSerializer(data=results).is_valid()
+        assert results["progress"] == 1
+        (plan_summary,) = results["analysis_summary"]
+        assert plan_summary["plan"][
+            "version_id"
+        ] == PlanVersionUUIDField().to_representation(plan_version.version_id)
+        kpis = {x["kpi"]: Decimal(x["value"]) for x in plan_summary["kpis"]}
+        ledger_revenue = BillingRecordDailyRevenue.objects.filter(
+            organization=org,
+            date__gte=analysis.start_date,
+            date__lte=analysis.end_date,
+        ).aggregate(revenue=Sum("revenue"))["revenue"]
+        assert ledger_revenue > 0
+        assert kpis[ANALYSIS_KPI.TOTAL_REVENUE] == ledger_revenue.quantize(
+            Decimal(".01")
+        )
+        # the subscription is still active after the analysis period
+        assert kpis[ANALYSIS_KPI.CHURN] == 0
+        assert len(results["revenue_per_day_graph"]) == 11
@@ -0,0 +1,169 @@
+import unittest.mock as mock
+from decimal import Decimal
+
+import pytest
+from dateutil.relativedelta import relativedelta
+from model_bakery import baker
+
+from metering_billing import backtest, db_router
+from metering_billing.aggregation.billable_metrics import METRIC_HANDLER_MAP
+from metering_billing.backtest import rate_subscription, run_backtest_engine
+from metering_billing.db_router import replica_reads
+from metering_billing.models import (
+    Backtest,
+    BacktestSubstitution,
+    Event,
+    Metric,
+    PlanComponent,
+    PlanVersion,
+    PriceTier,
+    SubscriptionRecord,
+)
+from metering_billing.utils import now_utc
+from metering_billing.utils.enums import METRIC_AGGREGATION, METRIC_TYPE
+
+
+@pytest.mark.django_db(transaction=True)
+class TestRateSubscription:
+    def test_rates_both_plans_without_changing_subscription(
+        self,
+        generate_org_and_api_key,
+        add_product_to_org,
+        add_plan_to_product,
+        add_customers_to_org,
+        add_subscription_record_to_org,
+    ):
+        org, _ = generate_org_and_api_key()
+        plan = add_plan_to_product(add_product_to_org(org))
+        (customer,) = add_customers_to_org(org, n=1)
+        billable_metric = Metric.objects.create(
+            organization=org,
+            event_name="test_event",
+            property_name="qty",
+            usage_aggregation_type=METRIC_AGGREGATION.SUM,
+            metric_type=METRIC_TYPE.COUNTER,
+        )
+        METRIC_HANDLER_MAP[billable_metric.metric_type].create_continuous_aggregate(
+            billable_metric
+        )
+        original_plan = PlanVersion.objects.create(organization=org, plan=plan)
+        plan_component = PlanComponent.objects.create(
+            billable_metric=billable_metric, plan_version=original_plan
+        )
+        PriceTier.objects.create(
+            plan_component=plan_component,
+            type=PriceTier.PriceTierType.PER_UNIT,
+            range_start=0,
+            cost_per_batch=1,
+            metric_units_per_batch=1,
+        )
+        new_plan = PlanVersion.objects.create(organization=org, plan=plan, version=2)
+        plan_component = PlanComponent.objects.create(
+            billable_metric=billable_metric, plan_version=new_plan
+        )
+        PriceTier.objects.create(
+            plan_component=plan_component,
+            type=PriceTier.PriceTierType.FREE,
+            range_start=0,
+            range_end=3,
+        )
+        PriceTier.objects.create(
+            plan_component=plan_component,
+            type=PriceTier.PriceTierType.PER_UNIT,
+            range_start=3,
+            cost_per_batch=2,
+            metric_units_per_batch=1,
+        )
+        now = now_utc()
+        baker.make(
+            Event,
+            event_name="test_event",
+            properties={"qty": 2},
+            organization=org,
+            time_created=now,
+            cust_id=customer.customer_id,
+            _quantity=5,
+        )
+        with mock.patch(
+            "metering_billing.models.now_utc",
+            return_value=now - relativedelta(days=1),
+        ):
+            subscription_record = add_subscription_record_to_org(
+                org, original_plan, customer, now - relativedelta(days=1)
+            )
+
+        with mock.patch.object(
+            Metric,
+            "get_billing_record_total_billable_usage",
+            autospec=True,
+            side_effect=Metric.get_billing_record_total_billable_usage,
+        ) as get_usage:
+            ratings = rate_subscription(subscription_record, [original_plan, new_plan])
+
+        # both plans share the metric, so its usage is only queried once
+        assert get_usage.call_count == 1
+        assert ratings[original_plan.pk]["usage_amount_due"] == Decimal(10)
+        assert ratings[new_plan.pk]["usage_amount_due"] == Decimal(14)
+        assert (
+            SubscriptionRecord.objects.get(pk=subscription_record.pk).billing_plan
+            == original_plan
+        )
+
+
+@pytest.mark.django_db(transaction=True)
+class TestRunBacktestEngine:
+    def test_threads_read_from_the_same_database_as_the_caller(
+        self,
+        generate_org_and_api_key,
+        add_product_to_org,
+        add_plan_to_product,
+        add_customers_to_org,
+        add_subscription_record_to_org,
+        monkeypatch,
+    ):
+        # the primary stands in for the replica, so the queries of the caller still work
+        monkeypatch.setattr(
+            db_router, "REPLICA_DATABASES", [db_router.DEFAULT_DB_ALIAS]
+        )
+        org, _ = generate_org_and_api_key()
+        plan = add_plan_to_product(add_product_to_org(org))
+        original_plan = PlanVersion.objects.create(organization=org, plan=plan)
+        new_plan = PlanVersion.objects.create(organization=org, plan=plan, version=2)
+        now = now_utc()
+        for customer in add_customers_to_org(org, n=2):
+            add_subscription_record_to_org(
+                org,
+                original_plan,
+                customer,
+                start_date=now - relativedelta(days=40),
+                end_date=now - relativedelta(days=10),
+            )
+        test_backtest = Backtest.objects.create(
+            organization=org,
+            backtest_name="threads",
+            start_date=(now - relativedelta(days=60)).date(),
+            end_date=now.date(),
+        )
+        BacktestSubstitution.objects.create(
+            organization=org,
+            backtest=test_backtest,
+            original_plan=original_plan,
+            new_plan=new_plan,
+        )
+        scopes = []
+
+        def rate_chunk(subscription_records, substitutions_by_plan):
+            scopes.append(db_router._replica_scope.get())
+            return []
+
+        with (
+            mock.patch.object(backtest, "BACKTEST_WORKERS", 2),
+            mock.patch.object(backtest, "BACKTEST_CHUNK_SIZE", 1),
+            mock.patch.object(backtest, "_rate_chunk", side_effect=rate_chunk),
+            replica_reads(),
+        ):
+            caller_scope = db_router._replica_scope.get()
+            run_backtest_engine(test_backtest)
+
+        assert caller_scope is not None
+        assert scopes == [caller_scope, caller_scope]
@@ -0,0 +1,97 @@
+from decimal import Decimal
+
+import pytest
+from dateutil.relativedelta import relativedelta
+
+from metering_billing.models import CustomerBalanceAdjustment, PricingUnit
+from metering_billing.utils import now_utc
+from metering_billing.utils.enums import CUSTOMER_BALANCE_ADJUSTMENT_STATUS
+
+
+@pytest.mark.django_db(transaction=True)
+class TestCreditDrawdown:
+    def test_draw_down_expiring_credits_first(
+        self, generate_org_and_api_key, add_customers_to_org
+    ):
+        org, _ = generate_org_and_api_key()
+        (customer,) = add_customers_to_org(org, n=1)
+        usd = PricingUnit.objects.get(organization=org, code="USD")
+        now = now_utc()
+        never_expires = CustomerBalanceAdjustment.objects.create(
+            customer=customer,
+            amount=Decimal(50),
+            pricing_unit=usd,
+            created=now - relativedelta(days=3),
+        )
+        expires_later = CustomerBalanceAdjustment.objects.create(
+            customer=customer,
+            amount=Decimal(20),
+            pricing_unit=usd,
+            created=now - relativedelta(days=2),
+            expires_at=now + relativedelta(days=20),
+        )
+        expires_soon = CustomerBalanceAdjustment.objects.create(
+            customer=customer,
+            amount=Decimal(10),
+            pricing_unit=usd,
+            created=now - relativedelta(days=1),
+            expires_at=now + relativedelta(days=10),
+        )
+        assert CustomerBalanceAdjustment.get_pricing_unit_balance(
+            customer, usd
+        ) == Decimal(80)
+
+        leftover = CustomerBalanceAdjustment.draw_down_amount(
+            customer, Decimal(25), usd, description="test"
+        )
+
+        assert leftover == 0
+        expires_soon.refresh_from_db()
+        expires_later.refresh_from_db()
+        never_expires.refresh_from_db()
+        assert expires_soon.remaining_balance == 0
+        assert expires_soon.status == CUSTOMER_BALANCE_ADJUSTMENT_STATUS.INACTIVE
+        assert expires_later.remaining_balance == Decimal(5)
+        assert expires_later.status == CUSTOMER_BALANCE_ADJUSTMENT_STATUS.ACTIVE
+        assert never_expires.remaining_balance == Decimal(50)
+        assert sorted(x.amount for x in expires_later.drawdowns.all()) == [Decimal(-15)]
+        assert CustomerBalanceAdjustment.get_pricing_unit_balance(
+            customer, usd
+        ) == Decimal(55)
+        # more than the balance leaves the rest for the invoice
+        assert CustomerBalanceAdjustment.draw_down_amount(
+            customer, Decimal(60), usd
+        ) == Decimal(5)
+        assert CustomerBalanceAdjustment.get_pricing_unit_balance(customer, usd) == 0
+
+    def test_expire_balance_adjustments(
+        self, generate_org_and_api_key, add_customers_to_org
+    ):
+        org, _ = generate_org_and_api_key()
+        (customer,) = add_customers_to_org(org, n=1)
+        usd = PricingUnit.objects.get(organization=org, code="USD")
+        now = now_utc()
+        credit = CustomerBalanceAdjustment.objects.create(
+            customer=customer,
+            amount=Decimal(30),
+            pricing_unit=usd,
+            created=now - relativedelta(days=2),
+            expires_at=now + relativedelta(days=1),
+        )
+        CustomerBalanceAdjustment.draw_down_amount(customer, Decimal(10), usd)
+
+        assert CustomerBalanceAdjustment.expire_balance_adjustments(now) == 0
+        assert (
+            CustomerBalanceAdjustment.expire_balance_adjustments(
+                now + relativedelta(days=2)
+            )
+            == 1
+        )
+
+        credit.refresh_from_db()
+        assert credit.remaining_balance == 0
+        assert credit.status == CUSTOMER_BALANCE_ADJUSTMENT_STATUS.INACTIVE
+        assert sorted(x.amount for x in credit.drawdowns.all()) == [
+            Decimal(-20),
+            Decimal(-10),
+        ]
@@ -143,6 +143,48 @@ class TestGetCustomers:
         assert response.status_code == status.HTTP_200_OK
         assert len(response.data) == num_customers
 
+    @pytest.mark.parametrize("url_name", ["customer-list", "customer-summary"])
+    def test_customers_paginated_by_page_size(
+        self, customer_test_common_setup, url_name
+    ):
+        num_customers = 5
+        setup_dict = customer_test_common_setup(
+            num_customers=num_customers,
+            auth_method="session_auth",
+            user_org_and_api_key_org_different=False,
+        )
+
+        customer_ids = []
+        payload = {"page_size": 2}
+        while True:
+            response = setup_dict["client"].get(reverse(url_name), payload)
+            assert response.status_code == status.HTTP_200_OK
+            assert len(response.data["results"]) <= 2
+            customer_ids += [x["customer_id"] for x in response.data["results"]]
+            if response.data["next"] is None:
+                break
+            payload["c"] = response.data["next"]
+
+        assert customer_ids == sorted(
+            x.customer_id for x in setup_dict["org_customers"]
+        )
+
+    def test_customer_totals(self, customer_test_common_setup):
+        num_customers = 3
+        setup_dict = customer_test_common_setup(
+            num_customers=num_customers,
+            auth_method="session_auth",
+            user_org_and_api_key_org_different=False,
+        )
+
+        response = setup_dict["client"].get(reverse("customer-totals"))
+
+        assert response.status_code == status.HTTP_200_OK
+        assert sorted(response.data, key=lambda x: x["customer_id"]) == [
+            {"customer_id": x.customer_id, "total_amount_due": 0}
+            for x in sorted(setup_dict["org_customers"], key=lambda x: x.customer_id)
+        ]
+
 
 @pytest.fixture
 def insert_customer_payload():
@@ -0,0 +1,118 @@
+import datetime
+
+import pytest
+from django.db import DEFAULT_DB_ALIAS
+
+from metering_billing import db_router
+from metering_billing.db_router import (
+    ReplicaRouter,
+    read_database,
+    replica_lag,
+    replica_reads,
+)
+from metering_billing.models import Event
+from metering_billing.utils import now_utc, run_with_time_budget
+
+
+@pytest.fixture
+def replica_with_lag(monkeypatch):
+    lag = {"replica_0": 0.0}
+    monkeypatch.setattr(db_router, "REPLICA_DATABASES", ["replica_0"])
+    monkeypatch.setattr(db_router, "replica_lag", lambda alias: lag[alias])
+    return lag
+
+
+class TestReplicaRouter:
+    def test_reads_go_to_replica_only_inside_block(self, replica_with_lag):
+        router = ReplicaRouter()
+
+        assert router.db_for_read(Event) == DEFAULT_DB_ALIAS
+        with replica_reads():
+            assert router.db_for_read(Event) == "replica_0"
+            assert router.db_for_write(Event) == DEFAULT_DB_ALIAS
+        assert router.db_for_read(Event) == DEFAULT_DB_ALIAS
+
+    def test_lagging_replica_falls_back_to_primary(self, replica_with_lag):
+        replica_with_lag["replica_0"] = db_router.REPLICA_MAX_LAG_SECONDS + 1
+
+        with replica_reads():
+            assert read_database() == DEFAULT_DB_ALIAS
+
+    def test_replica_must_have_replayed_recent_writes(self, replica_with_lag):
+        replica_with_lag["replica_0"] = 5.0
+
+        with replica_reads(written_at=now_utc()):
+            assert read_database() == DEFAULT_DB_ALIAS
+        with replica_reads(written_at=now_utc() - datetime.timedelta(minutes=1)):
+            assert read_database() == "replica_0"
+
+    def test_threads_read_from_the_same_database(self, replica_with_lag):
+        with replica_reads():
+            results, timed_out = run_with_time_budget(
+                lambda _: read_database(), [1, 2, 3], max_workers=3, time_budget=10
+            )
+
+        assert timed_out == []
+        assert set(results.values()) == {"replica_0"}
+
+    def test_threads_choose_replicas_on_their_own(self, replica_with_lag):
+        def choose(_):
+            read_database()
+            # the lag check interval passed, so the thread picks a replica again
+            db_router._replica_scope.get().chosen_at -= (
+                db_router.REPLICA_LAG_CHECK_INTERVAL + 1
+            )
+            return db_router._replica_scope.get()
+
+        with replica_reads():
+            read_database()
+            scope = db_router._replica_scope.get()
+            chosen_at = scope.chosen_at
+            results, _ = run_with_time_budget(
+                choose, [1, 2, 3], max_workers=3, time_budget=10
+            )
+
+        assert scope.chosen_at == chosen_at
+        assert len({id(x) for x in results.values()}) == 3
+
+    @pytest.mark.parametrize("max_workers", [1, 3])
+    def test_failed_items_are_returned_as_incomplete(self, max_workers):
+        def func(item):
+            if item == 2:
+                raise ValueError("query failed")
+            return item * 10
+
+        results, incomplete = run_with_time_budget(
+            func, [1, 2, 3], max_workers=max_workers, time_budget=10
+        )
+
+        assert results == {1: 10, 3: 30}
+        assert incomplete == [2]
+
+    @pytest.mark.django_db
+    def test_reads_inside_transactions_stay_on_primary(self, replica_with_lag):
+        # the test runs inside a transaction
+        with replica_reads():
+            assert read_database() == DEFAULT_DB_ALIAS
+
+    @pytest.mark.django_db
+    def test_primary_has_no_lag(self):
+        assert replica_lag(DEFAULT_DB_ALIAS) == 0
+
+
+@pytest.mark.skipif(not db_router.REPLICA_DATABASES, reason="no replica configured")
+@pytest.mark.django_db(transaction=True, databases="__all__")
+class TestReplicaReads:
+    def test_reads_see_events_written_to_primary(
+        self,
+        generate_org_and_api_key,
+        add_customers_to_org,
+        create_events_with_org_customer,
+    ):
+        org, _ = generate_org_and_api_key()
+        (customer,) = add_customers_to_org(org, n=1)
+        create_events_with_org_customer(org, customer, n=5)
+
+        with replica_reads():
+            assert read_database() in db_router.REPLICA_DATABASES
+            assert Event.objects.filter(organization=org).count() == 5
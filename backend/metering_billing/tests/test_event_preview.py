@@ -1,8 +1,25 @@
+import datetime
+import unittest.mock as mock
+import uuid
+
 import pytest
 from django.urls import reverse
+from model_bakery import baker
 from rest_framework import status
 from rest_framework.test import APIClient
 
+from metering_billing.aggregation.event_catalog import (
+    backfill_event_catalog,
+    record_catalog_events,
+)
+from metering_billing.aggregation.event_volume import (
+    count_events,
+    refresh_event_volume,
+)
+from metering_billing.models import Event, EventCatalogEntry
+from metering_billing.utils import now_utc
+from metering_billing.views import model_views
+
 
 @pytest.fixture
 def event_preview_test_common_setup(
@@ -77,3 +94,241 @@ class TestEventPreview:
         data = response.json()
         events = data["results"]
         assert len(events) == 10
+
+    def test_search_matches_ids_within_time_window(
+        self, event_preview_test_common_setup, create_events_with_org_customer
+    ):
+        setup_dict = event_preview_test_common_setup(
+            num_subscriptions=0,
+            auth_method="session_auth",
+            user_org_and_api_key_org_different=False,
+        )
+        events = create_events_with_org_customer(
+            setup_dict["org"], setup_dict["customer"], 15
+        )
+        customer_id = setup_dict["customer"].customer_id
+
+        for match, search_id in [
+            ("exact", customer_id),
+            ("prefix", customer_id[:6]),
+        ]:
+            response = setup_dict["client"].get(
+                reverse("event-search"),
+                {"customer_id": search_id, "match": match},
+            )
+            assert response.status_code == status.HTTP_200_OK
+            data = response.json()
+            assert len(data["results"]) == 10
+            response = setup_dict["client"].get(data["next"])
+            assert len(response.json()["results"]) == 5
+
+        response = setup_dict["client"].get(
+            reverse("event-search"),
+            {"idempotency_id": events[0].idempotency_id, "match": "exact"},
+        )
+        assert [event["idempotency_id"] for event in response.json()["results"]] == [
+            events[0].idempotency_id
+        ]
+
+        response = setup_dict["client"].get(
+            reverse("event-search"),
+            {
+                "customer_id": customer_id,
+                "time_created_lt": (now_utc() - datetime.timedelta(days=1)).isoformat(),
+            },
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["results"] == []
+
+        response = setup_dict["client"].get(
+            reverse("event-search"),
+            {
+                "customer_id": customer_id,
+                "time_created_gte": (
+                    now_utc() - datetime.timedelta(days=365)
+                ).isoformat(),
+            },
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_event_catalog_is_merged_per_batch(
+        self, event_preview_test_common_setup, create_events_with_org_customer
+    ):
+        setup_dict = event_preview_test_common_setup(
+            num_subscriptions=0,
+            auth_method="session_auth",
+            user_org_and_api_key_org_different=False,
+        )
+        org = setup_dict["org"]
+        create_events_with_org_customer(org, setup_dict["customer"], 5)
+        backfill_event_catalog(org)
+        first_seen = (now_utc() - datetime.timedelta(days=3)).replace(microsecond=0)
+        record_catalog_events(
+            org.pk,
+            [
+                {
+                    "event_name": "api_call",
+                    "time_created": first_seen,
+                    "properties": {"region": "us", "latency": 10},
+                },
+                {
+                    "event_name": "api_call",
+                    "time_created": now_utc(),
+                    "properties": {"region": "eu"},
+                },
+            ],
+        )
+        record_catalog_events(
+            org.pk,
+            [
+                {
+                    "event_name": "api_call",
+                    "time_created": now_utc(),
+                    "properties": {"latency": "slow"},
+                }
+            ],
+        )
+
+        region = EventCatalogEntry.objects.get(
+            organization=org, event_name="api_call", property_key="region"
+        )
+        assert region.inferred_type == "string"
+        assert sorted(region.sample_values) == ["eu", "us"]
+        assert region.first_seen == first_seen
+        latency = EventCatalogEntry.objects.get(
+            organization=org, event_name="api_call", property_key="latency"
+        )
+        assert latency.inferred_type == "mixed"
+
+        with mock.patch.object(model_views, "EVENT_CATALOG_ENABLED", True):
+            response = setup_dict["client"].get(reverse("event-event-properties"))
+        assert response.status_code == status.HTTP_200_OK
+        data = response.json()
+        assert data["event_names"] == ["api_call", "test_event"]
+        assert data["event_name_to_props"]["api_call"] == ["latency", "region"]
+
+    def test_event_catalog_backfill_groups_existing_events(
+        self, event_preview_test_common_setup
+    ):
+        setup_dict = event_preview_test_common_setup(
+            num_subscriptions=0,
+            auth_method="session_auth",
+            user_org_and_api_key_org_different=False,
+        )
+        org = setup_dict["org"]
+        first_seen = (now_utc() - datetime.timedelta(days=3)).replace(microsecond=0)
+        baker.make(
+            Event,
+            _quantity=4,
+            organization=org,
+            cust_id=setup_dict["customer"].customer_id,
+            idempotency_id=iter([uuid.uuid4().hex for _ in range(4)]),
+            event_name="api_call",
+            time_created=iter(
+                [first_seen + datetime.timedelta(days=x) for x in range(4)]
+            ),
+            properties=iter(
+                [
+                    {"region": "us", "latency": 10},
+                    {"region": "eu"},
+                    {"latency": "slow"},
+                    {},
+                ]
+            ),
+        )
+
+        backfill_event_catalog(org)
+
+        entries = {
+            entry.property_key: entry
+            for entry in EventCatalogEntry.objects.filter(
+                organization=org, event_name="api_call"
+            )
+        }
+        assert set(entries) == {"", "region", "latency"}
+        assert entries[""].first_seen == first_seen
+        assert entries[""].last_seen == first_seen + datetime.timedelta(days=3)
+        assert entries["region"].inferred_type == "string"
+        assert sorted(entries["region"].sample_values) == ["eu", "us"]
+        assert entries["latency"].inferred_type == "mixed"
+
+    def test_late_events_are_counted_after_refresh(
+        self, event_preview_test_common_setup
+    ):
+        setup_dict = event_preview_test_common_setup(
+            num_subscriptions=0,
+            auth_method="session_auth",
+            user_org_and_api_key_org_different=False,
+        )
+        org = setup_dict["org"]
+        base = now_utc().replace(minute=0, second=0, microsecond=0)
+        base -= datetime.timedelta(days=60)
+
+        def make_event():
+            baker.make(
+                Event,
+                organization=org,
+                cust_id=setup_dict["customer"].customer_id,
+                idempotency_id=uuid.uuid4().hex,
+                event_name="a",
+                time_created=base + datetime.timedelta(minutes=30),
+            )
+
+        make_event()
+        refresh_event_volume()
+        start, end = base, base + datetime.timedelta(hours=2)
+        assert count_events(org, start, end) == 1
+
+        # older than the refresh policy covers
+        make_event()
+        assert count_events(org, start, end) == 1
+        refresh_event_volume()
+        assert count_events(org, start, end) == 2
+
+    def test_event_counts_come_from_hourly_rollup(
+        self, event_preview_test_common_setup
+    ):
+        setup_dict = event_preview_test_common_setup(
+            num_subscriptions=0,
+            auth_method="session_auth",
+            user_org_and_api_key_org_different=False,
+        )
+        org = setup_dict["org"]
+        base = now_utc().replace(minute=0, second=0, microsecond=0)
+        base -= datetime.timedelta(days=2)
+        baker.make(
+            Event,
+            _quantity=5,
+            organization=org,
+            cust_id=setup_dict["customer"].customer_id,
+            idempotency_id=iter([uuid.uuid4().hex for _ in range(5)]),
+            event_name=iter(["a", "b", "a", "a", "b"]),
+            time_created=iter(
+                [base + datetime.timedelta(minutes=x) for x in [5, 30, 65, 130, 185]]
+            ),
+        )
+
+        start = base + datetime.timedelta(minutes=20)
+        end = base + datetime.timedelta(minutes=140)
+        assert count_events(org, start, end) == 3
+        assert count_events(org, start, end, event_name="a") == 2
+        assert count_events(org, base, base + datetime.timedelta(minutes=10)) == 1
+
+        response = setup_dict["client"].get(
+            reverse("event_volume"),
+            {
+                "start_date": (base - datetime.timedelta(days=1)).date(),
+                "end_date": now_utc().date(),
+                "granularity": "hour",
+                "by_event_name": True,
+            },
+        )
+        assert response.status_code == status.HTTP_200_OK
+        volume = response.json()["volume"]
+        assert [(x["event_name"], x["num_events"]) for x in volume] == [
+            ("a", 1),
+            ("b", 1),
+            ("a", 1),
+            ("a", 1),
+            ("b", 1),
+        ]
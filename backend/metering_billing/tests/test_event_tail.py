@@ -0,0 +1,68 @@
+import datetime
+import threading
+import unittest.mock as mock
+
+import pytest
+from django.core.cache import cache
+from django.db import connections, transaction
+from model_bakery import baker
+
+from metering_billing.aggregation import alert_counters, event_tail, rate_counters
+from metering_billing.models import Event
+from metering_billing.utils import now_utc
+
+
+@pytest.mark.django_db(transaction=True)
+class TestEventTail:
+    def test_rows_of_open_transactions_are_not_skipped(
+        self, generate_org_and_api_key, add_customers_to_org
+    ):
+        org, _ = generate_org_and_api_key()
+        (customer,) = add_customers_to_org(org, n=1)
+        watermark = now_utc() - datetime.timedelta(minutes=1)
+        cache.set(event_tail.EVENT_TAIL_WATERMARK_KEY, watermark, timeout=None)
+        inserted = threading.Event()
+        release = threading.Event()
+
+        def ingest():
+            # stamped before its transaction commits, like the ingestion services do
+            try:
+                with transaction.atomic():
+                    baker.make(
+                        Event,
+                        organization=org,
+                        cust_id=customer.customer_id,
+                        event_name="tail_event",
+                        time_created=now_utc(),
+                        inserted_at=now_utc(),
+                    )
+                    inserted.set()
+                    release.wait(timeout=10)
+            finally:
+                connections.close_all()
+
+        thread = threading.Thread(target=ingest)
+        with (
+            mock.patch.object(
+                event_tail,
+                "_tracked_event_names",
+                return_value={org.pk: {"tail_event"}},
+            ),
+            mock.patch.object(event_tail, "EVENT_TAIL_SETTLE_SECONDS", 1),
+            mock.patch.object(rate_counters, "record_events") as record_events,
+            mock.patch.object(alert_counters, "record_alert_events"),
+        ):
+            thread.start()
+            assert inserted.wait(timeout=10)
+            # the open transaction holds the watermark back
+            new_watermark = event_tail.advance_event_tail()
+            release.set()
+            thread.join()
+            assert new_watermark < Event.objects.get().inserted_at
+            assert record_events.call_count == 0
+
+            with mock.patch.object(event_tail, "EVENT_TAIL_SETTLE_SECONDS", 0):
+                event_tail.advance_event_tail()
+
+        ((_, events), _) = record_events.call_args
+        assert [x["event_name"] for x in events] == ["tail_event"]
@@ -0,0 +1,73 @@
+import unittest.mock as mock
+
+import pytest
+from api.serializers.model_serializers import (
+    CustomerSerializer,
+    EventSerializer,
+    InvoiceSerializer,
+    SubscriptionRecordSerializer,
+)
+from metering_billing.invoice import generate_invoice
+from metering_billing.models import Customer, Event, Invoice, SubscriptionRecord
+from metering_billing.serializers import serializer_utils
+from rest_framework.renderers import JSONRenderer
+
+
+@pytest.fixture
+def fast_serializer_test_common_setup(
+    generate_org_and_api_key,
+    add_customers_to_org,
+    add_product_to_org,
+    add_plan_to_product,
+    add_plan_version_to_plan,
+    add_subscription_record_to_org,
+    create_events_with_org_customer,
+):
+    def do_fast_serializer_test_common_setup():
+        org, _ = generate_org_and_api_key()
+        customers = add_customers_to_org(org, n=3)
+        customers[0].email = ""
+        customers[0].save()
+        product = add_product_to_org(org)
+        plan = add_plan_to_product(product)
+        plan_version = add_plan_version_to_plan(plan)
+        for customer in customers:
+            subscription_record = add_subscription_record_to_org(
+                org, plan_version, customer
+            )
+            generate_invoice(subscription_record)
+            create_events_with_org_customer(org, customer, 5)
+        return org
+
+    return do_fast_serializer_test_common_setup
+
+
+def render_list(serializer_class, queryset, fast):
+    with mock.patch.object(serializer_utils, "FAST_READ_SERIALIZERS", fast):
+        return JSONRenderer().render(serializer_class(queryset, many=True).data)
+
+
+@pytest.mark.django_db(transaction=True)
+class TestFastReadListSerializer:
+    @pytest.mark.parametrize(
+        "serializer_class, model",
+        [
+            (CustomerSerializer, Customer),
+            (SubscriptionRecordSerializer, SubscriptionRecord),
+            (InvoiceSerializer, Invoice),
+            (EventSerializer, Event),
+        ],
+    )
+    def test_output_matches_serializer(
+        self, serializer_class, model, fast_serializer_test_common_setup
+    ):
+        org = fast_serializer_test_common_setup()
+        queryset = model.objects.filter(organization=org)
+        assert queryset.exists()
+
+        fast = render_list(serializer_class, queryset, fast=True)
+
+        assert fast == render_list(serializer_class, queryset, fast=False)
+        assert fast == JSONRenderer().render(
+            [serializer_class(instance).data for instance in queryset]
+        )
@@ -1,22 +1,40 @@
+import csv
+import io
 import itertools
 import json
 import unittest.mock as mock
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
 from decimal import Decimal
 
 import pytest
+from botocore.exceptions import ClientError
 from dateutil.relativedelta import relativedelta
+from django.db import connections
 from django.urls import reverse
+from metering_billing.invoice import apply_taxes, generate_invoice
+from metering_billing.invoice_pdf import (
+    get_invoice_pdf_location,
+    get_pending_invoice_pdf_pks,
+    render_invoice_pdfs,
+)
 from metering_billing.models import (
     BillingRecord,
     Event,
     Invoice,
+    InvoiceNumberSequence,
     Metric,
     PlanComponent,
     PriceAdjustment,
     PriceTier,
     SubscriptionRecord,
 )
+from metering_billing.netsuite_csv import (
+    INVOICE_CSV_HEADER,
+    get_invoice_csv_line_items,
+    iter_invoice_csv_rows,
+    write_csv,
+)
 from metering_billing.serializers.serializer_utils import DjangoJSONEncoder
 from metering_billing.tasks import calculate_invoice_inner
 from metering_billing.utils import now_utc
@@ -26,6 +44,26 @@ from rest_framework import status
 from rest_framework.test import APIClient
 
 
+class LocalS3Client:
+    """In memory stand-in for the S3 client used to upload invoice PDFs."""
+
+    def __init__(self):
+        self.buckets = {}
+
+    def head_bucket(self, Bucket):
+        if Bucket not in self.buckets:
+            raise ClientError({"Error": {"Code": "404"}}, "HeadBucket")
+
+    def create_bucket(self, Bucket, ACL):
+        self.buckets[Bucket] = {}
+
+    def upload_fileobj(self, Fileobj, Bucket, Key):
+        self.buckets[Bucket][Key] = Fileobj.read()
+
+    def generate_presigned_url(self, ClientMethod, Params, ExpiresIn):
+        return f"http://localhost/{Params['Bucket']}/{Params['Key']}"
+
+
 @pytest.fixture
 def invoice_test_common_setup(
     generate_org_and_api_key,
@@ -317,6 +355,136 @@ class TestGenerateInvoice:
         result_invoice = Invoice.objects.order_by("-invoice_number").first()
         assert result_invoice.invoice_pdf != ""
 
+    def test_batch_render_invoice_pdfs(self, invoice_test_common_setup):
+        setup_dict = invoice_test_common_setup(auth_method="api_key")
+        (invoice,) = generate_invoice(setup_dict["subscription_record"])
+        s3_client = LocalS3Client()
+
+        pending = get_pending_invoice_pdf_pks()
+        assert invoice.pk in pending
+        assert render_invoice_pdfs(pending, s3_client=s3_client) == len(pending)
+
+        invoice.refresh_from_db()
+        bucket_name, key = get_invoice_pdf_location(invoice)
+        assert s3_client.buckets[bucket_name][key].startswith(b"%PDF")
+        assert invoice.invoice_pdf == f"http://localhost/{bucket_name}/{key}"
+        assert invoice.pdf_content_hash
+        assert get_pending_invoice_pdf_pks() == []
+        # unchanged invoices aren't rendered again
+        assert render_invoice_pdfs([invoice.pk], s3_client=s3_client) == 0
+        Invoice.objects.filter(pk=invoice.pk).update(
+            due_date=invoice.issue_date + timedelta(days=60)
+        )
+        assert render_invoice_pdfs([invoice.pk], s3_client=s3_client) == 1
+
+    def test_invoices_are_only_pending_pdf_once_generated(
+        self, invoice_test_common_setup
+    ):
+        setup_dict = invoice_test_common_setup(auth_method="api_key")
+        pending_during_generation = []
+
+        def get_pending_from_another_connection():
+            # like the PDF batch, which runs in another process
+            try:
+                return get_pending_invoice_pdf_pks()
+            finally:
+                connections.close_all()
+
+        def apply_taxes_and_check_pending(*args, **kwargs):
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                pending_during_generation.extend(
+                    executor.submit(get_pending_from_another_connection).result()
+                )
+            return apply_taxes(*args, **kwargs)
+
+        with mock.patch(
+            "metering_billing.invoice.apply_taxes",
+            side_effect=apply_taxes_and_check_pending,
+        ):
+            invoice = generate_invoice(setup_dict["subscription_record"])[0]
+
+        assert invoice.pk not in pending_during_generation
+        assert invoice.pk in get_pending_invoice_pdf_pks()
+
+    def test_invoice_numbers_are_gapless_per_org(self, invoice_test_common_setup):
+        setup_dict = invoice_test_common_setup(auth_method="api_key")
+        issue_date = now_utc()
+        prefix = issue_date.strftime("%y%m%d")
+
+        invoice = generate_invoice(
+            setup_dict["subscription_record"], issue_date=issue_date
+        )[0]
+        assert invoice.invoice_number == f"{prefix}-000001"
+        assert InvoiceNumberSequence.reserve(
+            setup_dict["org"], issue_date.date(), 3
+        ) == [f"{prefix}-000002", f"{prefix}-000003", f"{prefix}-000004"]
+        # other organizations have their own sequence
+        assert InvoiceNumberSequence.reserve(setup_dict["org2"], issue_date.date()) == [
+            f"{prefix}-000001"
+        ]
+        invoice = Invoice.objects.create(
+            organization=setup_dict["org"],
+            customer=setup_dict["customer"],
+            currency=invoice.currency,
+            issue_date=issue_date,
+            payment_status=Invoice.PaymentStatus.UNPAID,
+        )
+        assert invoice.invoice_number == f"{prefix}-000005"
+
+    def test_invoice_number_is_reserved_after_taxes(self, invoice_test_common_setup):
+        setup_dict = invoice_test_common_setup(auth_method="api_key")
+        issue_date = now_utc()
+        numbered_during_taxes = []
+
+        def apply_taxes_and_check_numbering(invoice, *args, **kwargs):
+            numbered_during_taxes.append(
+                invoice.invoice_number != ""
+                or InvoiceNumberSequence.objects.filter(
+                    organization=setup_dict["org"], issue_date=issue_date.date()
+                ).exists()
+            )
+            return apply_taxes(invoice, *args, **kwargs)
+
+        with mock.patch(
+            "metering_billing.invoice.apply_taxes",
+            side_effect=apply_taxes_and_check_numbering,
+        ):
+            invoice = generate_invoice(
+                setup_dict["subscription_record"], issue_date=issue_date
+            )[0]
+
+        assert numbered_during_taxes == [False]
+        invoice.refresh_from_db()
+        assert invoice.invoice_number == issue_date.strftime("%y%m%d") + "-000001"
+
+    def test_failed_generation_leaves_no_invoice_or_gap(
+        self, invoice_test_common_setup
+    ):
+        setup_dict = invoice_test_common_setup(auth_method="api_key")
+        issue_date = now_utc()
+        prefix = issue_date.strftime("%y%m%d")
+        invoices_before = Invoice.objects.filter(
+            customer=setup_dict["customer"]
+        ).count()
+
+        with mock.patch(
+            "metering_billing.invoice.apply_taxes", side_effect=Exception("tax error")
+        ):
+            with pytest.raises(Exception, match="tax error"):
+                generate_invoice(
+                    setup_dict["subscription_record"], issue_date=issue_date
+                )
+
+        # the invoice, its line items and its number were all rolled back
+        assert (
+            Invoice.objects.filter(customer=setup_dict["customer"]).count()
+            == invoices_before
+        )
+        invoice = generate_invoice(
+            setup_dict["subscription_record"], issue_date=issue_date
+        )[0]
+        assert invoice.invoice_number == f"{prefix}-000001"
+
 
 @pytest.mark.django_db(transaction=True)
 class TestInvoiceTask:
@@ -367,3 +535,41 @@ class TestInvoiceTask:
             calculate_invoice_inner()
         invoices_after = len(Invoice.objects.all())
         assert invoices_after == invoices_before + 1
+
+
+@pytest.mark.django_db(transaction=True)
+class TestNetsuiteInvoiceCSV:
+    def test_invoice_csv_rows(
+        self, invoice_test_common_setup, django_assert_max_num_queries
+    ):
+        setup_dict = invoice_test_common_setup(auth_method="api_key")
+        (invoice,) = generate_invoice(setup_dict["subscription_record"])
+        line_items = get_invoice_csv_line_items(setup_dict["org"])
+
+        csv_file = io.BytesIO()
+        # line items come with their invoice, customer and charge in one query
+        with django_assert_max_num_queries(1):
+            write_csv(iter_invoice_csv_rows(line_items), csv_file)
+
+        csv_file.seek(0)
+        rows = list(csv.reader(io.TextIOWrapper(csv_file, encoding="utf-8")))
+        assert rows[0] == INVOICE_CSV_HEADER
+        assert len(rows) == invoice.line_items.count() + 1
+        assert {row[0] for row in rows[1:]} == {invoice.invoice_number}
+
+    def test_incremental_invoice_csv_rows(self, invoice_test_common_setup):
+        setup_dict = invoice_test_common_setup(auth_method="api_key")
+        (invoice,) = generate_invoice(setup_dict["subscription_record"])
+        invoice.refresh_from_db()
+        watermark = invoice.updated_at
+
+        assert not get_invoice_csv_line_items(
+            setup_dict["org"], changed_since=watermark
+        ).exists()
+        invoice.save()
+        assert (
+            get_invoice_csv_line_items(
+                setup_dict["org"], changed_since=watermark
+            ).count()
+            == invoice.line_items.count()
+        )
@@ -1,25 +1,42 @@
 import itertools
 import json
+import time
 import unittest.mock as mock
 from decimal import Decimal
 
 import pytest
 from dateutil.relativedelta import relativedelta
+from django.core.cache import cache
+from django.db.models import Sum
 from django.urls import reverse
 from model_bakery import baker
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from metering_billing.aggregation.billable_metrics import METRIC_HANDLER_MAP
+from metering_billing.aggregation import event_tail, rate_counters
+from metering_billing.aggregation.billable_metrics import (
+    METRIC_HANDLER_MAP,
+    CustomHandler,
+    GaugeHandler,
+    MetricHandler,
+)
+from metering_billing.db_router import read_connection
 from metering_billing.models import (
+    BillingRecordDailyRevenue,
     CategoricalFilter,
+    CustomMetricDailyUsage,
     Event,
+    GaugeStateCheckpoint,
     Metric,
     NumericFilter,
     PlanComponent,
     PlanVersion,
     PriceTier,
 )
+from metering_billing.revenue_ledger import (
+    refresh_billing_record_ledger,
+    refresh_revenue_ledger,
+)
 from metering_billing.serializers.serializer_utils import DjangoJSONEncoder
 from metering_billing.utils import now_utc
 from metering_billing.utils.enums import (
@@ -32,6 +49,7 @@ from metering_billing.utils.enums import (
     NUMERIC_FILTER_OPERATORS,
     PLAN_DURATION,
 )
+from metering_billing.views import views
 
 
 @pytest.fixture
@@ -664,6 +682,256 @@ class TestCalculateMetric:
         # 1 dollar per for 64 rows - 3 free rows = 61 rows * 1 dollar = 61 dollars
         assert usage_revenue_dict["revenue"] == Decimal(61)
 
+    def test_rate_current_usage_from_counters(self, billable_metric_test_common_setup):
+        num_billable_metrics = 0
+        setup_dict = billable_metric_test_common_setup(
+            num_billable_metrics=num_billable_metrics,
+            auth_method="api_key",
+            user_org_and_api_key_org_different=False,
+        )
+        billable_metric = Metric.objects.create(
+            organization=setup_dict["org"],
+            event_name="rows_inserted",
+            property_name="num_rows",
+            usage_aggregation_type=METRIC_AGGREGATION.SUM,
+            billable_aggregation_type=METRIC_AGGREGATION.MAX,
+            metric_type=METRIC_TYPE.RATE,
+            granularity=METRIC_GRANULARITY.HOUR,
+        )
+        customer = setup_dict["customer"]
+        cache.delete(event_tail.EVENT_TAIL_WATERMARK_KEY)
+        # 6 rows in the last hour, 10 rows outside of the window
+        now = now_utc()
+        baker.make(
+            Event,
+            event_name="rows_inserted",
+            properties=iter([{"num_rows": 1}, {"num_rows": 5}, {"num_rows": 10}]),
+            organization=setup_dict["org"],
+            time_created=iter(
+                [
+                    now - relativedelta(minutes=30),
+                    now - relativedelta(minutes=10),
+                    now - relativedelta(hours=2),
+                ]
+            ),
+            inserted_at=now - relativedelta(minutes=5),
+            cust_id=customer.customer_id,
+            _quantity=3,
+        )
+        with (
+            mock.patch.object(rate_counters, "RATE_COUNTERS_ENABLED", True),
+            mock.patch.object(event_tail, "EVENT_TAIL_SETTLE_SECONDS", 0),
+        ):
+            # the first run of the tail only sets the watermark
+            event_tail.advance_event_tail()
+            # not trusted until the counters have been reconciled
+            assert (
+                rate_counters.get_current_rate(
+                    billable_metric,
+                    customer.uuidv5_customer_id,
+                    [],
+                    now - relativedelta(days=1),
+                )
+                is None
+            )
+            rate_counters.reconcile_rate_counters(billable_metric)
+            assert rate_counters.get_current_rate(
+                billable_metric,
+                customer.uuidv5_customer_id,
+                [],
+                now - relativedelta(days=1),
+            ) == Decimal(6)
+            # the counters only pick up the events inserted after the watermark
+            baker.make(
+                Event,
+                event_name="rows_inserted",
+                properties=iter([{"num_rows": 2.5}, {"num_rows": 100}]),
+                organization=setup_dict["org"],
+                time_created=iter(
+                    [now - relativedelta(minutes=1), now - relativedelta(hours=3)]
+                ),
+                cust_id=customer.customer_id,
+                _quantity=2,
+            )
+            event_tail.advance_event_tail()
+            assert rate_counters.get_current_rate(
+                billable_metric,
+                customer.uuidv5_customer_id,
+                [],
+                now - relativedelta(days=1),
+            ) == Decimal("8.5")
+            # billing records that started within the window are queried exactly
+            assert (
+                rate_counters.get_current_rate(
+                    billable_metric,
+                    customer.uuidv5_customer_id,
+                    [],
+                    now - relativedelta(minutes=20),
+                )
+                is None
+            )
+
+    def test_daily_total_usage_caches_closed_days(
+        self, billable_metric_test_common_setup
+    ):
+        num_billable_metrics = 0
+        setup_dict = billable_metric_test_common_setup(
+            num_billable_metrics=num_billable_metrics,
+            auth_method="api_key",
+            user_org_and_api_key_org_different=False,
+        )
+        billable_metric = Metric.objects.create(
+            organization=setup_dict["org"],
+            event_name="email_sent",
+            usage_aggregation_type=METRIC_AGGREGATION.COUNT,
+            metric_type=METRIC_TYPE.COUNTER,
+        )
+        METRIC_HANDLER_MAP[billable_metric.metric_type].create_continuous_aggregate(
+            billable_metric
+        )
+        customer = setup_dict["customer"]
+        now = now_utc()
+        closed_day = now - relativedelta(days=5, hour=12)
+        baker.make(
+            Event,
+            event_name="email_sent",
+            organization=setup_dict["org"],
+            time_created=iter([closed_day, closed_day, now]),
+            cust_id=customer.customer_id,
+            _quantity=3,
+        )
+        start_date = (now - relativedelta(days=10)).date()
+        end_date = now.date()
+        usage = billable_metric.get_daily_total_usage(
+            start_date, end_date, customer=customer
+        )
+        assert usage[customer][closed_day.date()] == 2
+
+        # closed days are served from the cache, the open tail is recomputed
+        baker.make(
+            Event,
+            event_name="email_sent",
+            organization=setup_dict["org"],
+            time_created=iter([closed_day, now]),
+            cust_id=customer.customer_id,
+            _quantity=2,
+        )
+        usage = billable_metric.get_daily_total_usage(
+            start_date, end_date, customer=customer
+        )
+        assert usage[customer][closed_day.date()] == 2
+
+        billable_metric.refresh_materialized_views()
+        usage = billable_metric.get_daily_total_usage(
+            start_date, end_date, customer=customer
+        )
+        assert usage[customer][closed_day.date()] == 3
+
+    def test_daily_total_usage_only_queries_uncached_days(
+        self, billable_metric_test_common_setup
+    ):
+        num_billable_metrics = 0
+        setup_dict = billable_metric_test_common_setup(
+            num_billable_metrics=num_billable_metrics,
+            auth_method="api_key",
+            user_org_and_api_key_org_different=False,
+        )
+        billable_metric = Metric.objects.create(
+            organization=setup_dict["org"],
+            event_name="email_sent",
+            usage_aggregation_type=METRIC_AGGREGATION.COUNT,
+            metric_type=METRIC_TYPE.COUNTER,
+        )
+        METRIC_HANDLER_MAP[billable_metric.metric_type].create_continuous_aggregate(
+            billable_metric
+        )
+        customer = setup_dict["customer"]
+        now = now_utc()
+        closed_day = now - relativedelta(days=5, hour=12)
+        baker.make(
+            Event,
+            event_name="email_sent",
+            organization=setup_dict["org"],
+            time_created=iter([closed_day, closed_day, now]),
+            cust_id=customer.customer_id,
+            _quantity=3,
+        )
+        start_date = (now - relativedelta(days=10)).date()
+        end_date = now.date()
+        billable_metric.get_daily_total_usage(start_date, end_date, customer=customer)
+
+        cache.delete(
+            MetricHandler._daily_usage_cache_key(
+                billable_metric,
+                str(customer.uuidv5_customer_id),
+                closed_day.date(),
+            )
+        )
+        with mock.patch.object(
+            MetricHandler,
+            "_run_daily_total_usage_query",
+            wraps=MetricHandler._run_daily_total_usage_query,
+        ) as run_query:
+            usage = billable_metric.get_daily_total_usage(
+                start_date, end_date, customer=customer
+            )
+        assert usage[customer][closed_day.date()] == 2
+        # the evicted day and the open tail, not everything after the evicted day
+        assert run_query.call_count == 2
+        evicted_run_start = run_query.call_args_list[0].args[2]
+        evicted_run_end = run_query.call_args_list[0].args[3]
+        assert evicted_run_start.date() == closed_day.date()
+        assert evicted_run_end.date() == closed_day.date()
+
+    def test_daily_total_usage_ranks_top_customers_in_sql(
+        self, billable_metric_test_common_setup, add_customers_to_org
+    ):
+        num_billable_metrics = 0
+        setup_dict = billable_metric_test_common_setup(
+            num_billable_metrics=num_billable_metrics,
+            auth_method="api_key",
+            user_org_and_api_key_org_different=False,
+        )
+        billable_metric = Metric.objects.create(
+            organization=setup_dict["org"],
+            event_name="email_sent",
+            usage_aggregation_type=METRIC_AGGREGATION.COUNT,
+            metric_type=METRIC_TYPE.COUNTER,
+        )
+        METRIC_HANDLER_MAP[billable_metric.metric_type].create_continuous_aggregate(
+            billable_metric
+        )
+        customer = setup_dict["customer"]
+        (other_customer,) = add_customers_to_org(setup_dict["org"], n=1)
+        closed_day = now_utc() - relativedelta(days=5, hour=12)
+        for event_customer, n in [(customer, 3), (other_customer, 1)]:
+            baker.make(
+                Event,
+                event_name="email_sent",
+                organization=setup_dict["org"],
+                time_created=closed_day,
+                cust_id=event_customer.customer_id,
+                _quantity=n,
+            )
+        start_date = (closed_day - relativedelta(days=2)).date()
+        end_date = (closed_day + relativedelta(days=2)).date()
+
+        with mock.patch.object(
+            MetricHandler,
+            "_run_daily_total_usage_query",
+            wraps=MetricHandler._run_daily_total_usage_query,
+        ) as run_query:
+            for _ in range(2):
+                usage = billable_metric.get_daily_total_usage(
+                    start_date, end_date, top_n=1
+                )
+        assert usage[customer][closed_day.date()] == 3
+        assert usage["Other"][closed_day.date()] == 1
+        assert other_customer not in usage
+        # the whole range is final, so the second call is served from the cache
+        assert run_query.call_count == 1
+        assert run_query.call_args.kwargs["top_n"] == 1
+
     def test_gauge_daily_granularity_delta_event(
         self, billable_metric_test_common_setup, add_subscription_record_to_org
     ):
@@ -747,6 +1015,174 @@ class TestCalculateMetric:
             <= usage_revenue_dict["revenue"]
         )
 
+    def test_gauge_delta_current_usage_from_checkpoint(
+        self, billable_metric_test_common_setup, add_subscription_record_to_org
+    ):
+        num_billable_metrics = 0
+        setup_dict = billable_metric_test_common_setup(
+            num_billable_metrics=num_billable_metrics,
+            auth_method="api_key",
+            user_org_and_api_key_org_different=False,
+        )
+        billable_metric = Metric.objects.create(
+            organization=setup_dict["org"],
+            event_name="number_of_users",
+            property_name="number",
+            usage_aggregation_type=METRIC_AGGREGATION.MAX,
+            metric_type=METRIC_TYPE.GAUGE,
+            granularity=METRIC_GRANULARITY.MONTH,
+            event_type=EVENT_TYPE.DELTA,
+            proration=METRIC_GRANULARITY.DAY,
+        )
+        METRIC_HANDLER_MAP[billable_metric.metric_type].create_continuous_aggregate(
+            billable_metric
+        )
+        time_created = now_utc() - relativedelta(days=10)
+        customer = setup_dict["customer"]
+        event_times = [time_created + relativedelta(days=i) for i in range(8)]
+        properties = (
+            1 * [{"number": 3}]
+            + 3 * [{"number": 1}]
+            + 1 * [{"number": 0}]
+            + 3 * [{"number": -1}]
+        )
+        baker.make(
+            Event,
+            event_name="number_of_users",
+            properties=iter(properties),
+            organization=setup_dict["org"],
+            time_created=iter(event_times),
+            cust_id=customer.customer_id,
+            _quantity=8,
+        )
+        billing_plan = PlanVersion.objects.create(
+            organization=setup_dict["org"],
+            plan=setup_dict["plan"],
+        )
+        PlanComponent.objects.create(
+            billable_metric=billable_metric,
+            plan_version=billing_plan,
+        )
+        with (
+            mock.patch("metering_billing.models.now_utc", return_value=time_created),
+            mock.patch(
+                "metering_billing.tests.test_metrics.now_utc",
+                return_value=time_created,
+            ),
+        ):
+            subscription_record = add_subscription_record_to_org(
+                setup_dict["org"], billing_plan, customer, time_created
+            )
+        billing_record = subscription_record.billing_records.first()
+
+        # no checkpoints yet, so we start from the very first event
+        assert billable_metric.get_billing_record_current_usage(
+            billing_record
+        ) == Decimal(3)
+
+        # checkpoint after the first 5 events: 3 + 1 + 1 + 1 + 0
+        GaugeHandler.checkpoint_gauge_state(
+            billable_metric,
+            checkpoint_time=now_utc() - relativedelta(days=5, hours=12),
+        )
+        checkpoint = GaugeStateCheckpoint.objects.get(metric=billable_metric)
+        assert checkpoint.usage_qty == Decimal(6)
+        assert billable_metric.get_billing_record_current_usage(
+            billing_record
+        ) == Decimal(3)
+
+        # checkpointing again at the same time is a no-op
+        assert (
+            GaugeHandler.checkpoint_gauge_state(
+                billable_metric, checkpoint_time=checkpoint.checkpoint_time
+            )
+            is None
+        )
+        GaugeHandler.checkpoint_gauge_state(billable_metric)
+        assert GaugeStateCheckpoint.objects.filter(metric=billable_metric).count() == 2
+        assert billable_metric.get_billing_record_current_usage(
+            billing_record
+        ) == Decimal(3)
+
+    def test_gauge_delta_total_usage_from_checkpoint_with_filters(
+        self, billable_metric_test_common_setup, add_subscription_record_to_org
+    ):
+        num_billable_metrics = 0
+        setup_dict = billable_metric_test_common_setup(
+            num_billable_metrics=num_billable_metrics,
+            auth_method="api_key",
+            user_org_and_api_key_org_different=False,
+        )
+        setup_dict["org"].subscription_filter_keys = ["region"]
+        setup_dict["org"].save()
+        billable_metric = Metric.objects.create(
+            organization=setup_dict["org"],
+            event_name="number_of_users",
+            property_name="number",
+            usage_aggregation_type=METRIC_AGGREGATION.MAX,
+            metric_type=METRIC_TYPE.GAUGE,
+            granularity=METRIC_GRANULARITY.TOTAL,
+            event_type=EVENT_TYPE.DELTA,
+            proration=METRIC_GRANULARITY.TOTAL,
+        )
+        METRIC_HANDLER_MAP[billable_metric.metric_type].create_continuous_aggregate(
+            billable_metric
+        )
+        time_created = now_utc() - relativedelta(days=10)
+        customer = setup_dict["customer"]
+        event_times = [
+            time_created - relativedelta(days=5),
+            time_created - relativedelta(days=5),
+            time_created + relativedelta(days=1),
+            time_created + relativedelta(days=1),
+            time_created + relativedelta(days=2),
+        ]
+        properties = [
+            {"number": 2, "region": "eu"},
+            {"number": 5, "region": "us"},
+            {"number": 3, "region": "eu"},
+            {"number": 10, "region": "us"},
+            {"number": -1, "region": "eu"},
+        ]
+        baker.make(
+            Event,
+            event_name="number_of_users",
+            properties=iter(properties),
+            organization=setup_dict["org"],
+            time_created=iter(event_times),
+            cust_id=customer.customer_id,
+            _quantity=5,
+        )
+        billing_plan = PlanVersion.objects.create(
+            organization=setup_dict["org"],
+            plan=setup_dict["plan"],
+        )
+        PlanComponent.objects.create(
+            billable_metric=billable_metric,
+            plan_version=billing_plan,
+        )
+        with mock.patch("metering_billing.models.now_utc", return_value=time_created):
+            subscription_record = add_subscription_record_to_org(
+                setup_dict["org"], billing_plan, customer, time_created
+            )
+        subscription_record.subscription_filters = [["region", "eu"]]
+        subscription_record.save()
+        billing_record = subscription_record.billing_records.first()
+
+        # 2 before the subscription started, then + 3
+        assert billable_metric.get_billing_record_total_billable_usage(
+            billing_record
+        ) == Decimal(5)
+
+        # the us group's state is checkpointed too, but mustn't leak into the eu one
+        GaugeHandler.checkpoint_gauge_state(
+            billable_metric, checkpoint_time=time_created - relativedelta(days=1)
+        )
+        assert GaugeStateCheckpoint.objects.filter(metric=billable_metric).count() == 2
+        assert billable_metric.get_billing_record_total_billable_usage(
+            billing_record
+        ) == Decimal(5)
+
 
 @pytest.mark.django_db(transaction=True)
 class TestCalculateMetricProrationForGauge:
@@ -866,6 +1302,48 @@ class TestCalculateMetricProrationForGauge:
                 assert day["revenue"] == 0
         assert abs(data["total_revenue"] - float(calculated_amt)) < 0.01
 
+        # the view computes records missing from the ledger without writing them
+        billing_record = subscription_record.billing_records.first()
+        ledger = BillingRecordDailyRevenue.objects.filter(billing_record=billing_record)
+        assert not ledger.exists()
+
+        # the earned revenue now comes from the ledger, with the closed days frozen
+        refresh_revenue_ledger(subscription_record.billing_records.all())
+        billing_record.refresh_from_db()
+        assert billing_record.revenue_ledger_frozen_through is not None
+        assert billing_record.revenue_ledger_frozen_through < now.date()
+        assert ledger.filter(date=date_where_billable_events_happened).exists()
+        assert abs(
+            ledger.aggregate(revenue=Sum("revenue"))["revenue"] - calculated_amt
+        ) < Decimal(0.01)
+        response = setup_dict["client"].get(
+            reverse(
+                "customer-cost_analysis", kwargs={"customer_id": customer.customer_id}
+            ),
+            {
+                "customer_id": customer.customer_id,
+                "start_date": subscription_record.start_date.date(),
+                "end_date": subscription_record.end_date.date(),
+            },
+        )
+        assert abs(response.json()["total_revenue"] - float(calculated_amt)) < 0.01
+
+        # frozen days are kept, only the days after them are computed again
+        frozen_through = billing_record.revenue_ledger_frozen_through
+        get_daily_usage = Metric.get_billing_record_daily_billable_usage
+        with mock.patch.object(
+            Metric,
+            "get_billing_record_daily_billable_usage",
+            autospec=True,
+            side_effect=get_daily_usage,
+        ) as daily_usage:
+            refresh_billing_record_ledger(billing_record)
+        assert daily_usage.call_args.kwargs["since"] == frozen_through
+        assert ledger.filter(date=date_where_billable_events_happened).exists()
+        assert abs(
+            ledger.aggregate(revenue=Sum("revenue"))["revenue"] - calculated_amt
+        ) < Decimal(0.01)
+
     def test_metric_granularity_daily_proration_smaller_than_day(
         self, billable_metric_test_common_setup, add_subscription_record_to_org
     ):
@@ -2184,6 +2662,105 @@ class TestCustomSQLMetrics:
 
         assert total_usage == 2
 
+    def test_daily_aggregation_materializes_closed_days(
+        self,
+        get_billable_metrics_in_org,
+        billable_metric_test_common_setup,
+        add_subscription_record_to_org,
+    ):
+        num_billable_metrics = 0
+        setup_dict = billable_metric_test_common_setup(
+            num_billable_metrics=num_billable_metrics,
+            auth_method="session_auth",
+            user_org_and_api_key_org_different=False,
+        )
+
+        insert_billable_metric_payload = {
+            "metric_type": METRIC_TYPE.CUSTOM,
+            "metric_name": "test_billable_metric",
+            "custom_sql": "SELECT COUNT(*) AS usage_qty FROM events WHERE time_created BETWEEN start_date AND end_date",
+            "custom_sql_daily_aggregation": METRIC_AGGREGATION.SUM,
+        }
+
+        response = setup_dict["client"].post(
+            reverse("metric-list"),
+            data=json.dumps(insert_billable_metric_payload, cls=DjangoJSONEncoder),
+            content_type="application/json",
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        assert len(get_billable_metrics_in_org(setup_dict["org"])) == 1
+
+        billable_metric = Metric.objects.all().first()
+        assert billable_metric.custom_sql_daily_aggregation == METRIC_AGGREGATION.SUM
+        customer = setup_dict["customer"]
+        now = now_utc()
+        # 2 events a day at noon for the last 6 days, plus 2 today
+        event_times = [
+            now - relativedelta(days=i, hour=12, minute=0, second=0, microsecond=0)
+            for i in range(1, 7)
+        ] + [now, now]
+        baker.make(
+            Event,
+            event_name="test_event",
+            properties={"test_property": "foo"},
+            organization=setup_dict["org"],
+            time_created=iter(event_times * 2),
+            cust_id=customer.customer_id,
+            _quantity=len(event_times) * 2,
+        )
+        billing_plan = PlanVersion.objects.create(
+            organization=setup_dict["org"],
+            plan=setup_dict["plan"],
+        )
+        plan_component = PlanComponent.objects.create(
+            billable_metric=billable_metric,
+            plan_version=billing_plan,
+        )
+        PriceTier.objects.create(
+            plan_component=plan_component,
+            type=PriceTier.PriceTierType.PER_UNIT,
+            range_start=0,
+            cost_per_batch=1,
+            metric_units_per_batch=1,
+        )
+        with (
+            mock.patch(
+                "metering_billing.models.now_utc",
+                return_value=now - relativedelta(days=10),
+            ),
+            mock.patch(
+                "metering_billing.tests.test_metrics.now_utc",
+                return_value=now - relativedelta(days=10),
+            ),
+        ):
+            subscription_record = add_subscription_record_to_org(
+                setup_dict["org"],
+                billing_plan,
+                customer,
+                now - relativedelta(days=10),
+            )
+        billing_record = subscription_record.billing_records.first()
+
+        with mock.patch.object(
+            CustomHandler, "_run_query", side_effect=CustomHandler._run_query
+        ) as run_query:
+            total_usage = billable_metric.get_billing_record_total_billable_usage(
+                billing_record
+            )
+        assert total_usage == 16
+        # the days are consecutive, so they're all evaluated by the same query
+        assert run_query.call_count == 1
+        # every full day that ended more than a day ago was materialized
+        materialized = CustomMetricDailyUsage.objects.filter(metric=billable_metric)
+        assert materialized.count() > 0
+        assert all(x.date < (now - relativedelta(days=1)).date() for x in materialized)
+        # materialized days are read back instead of being recomputed
+        materialized.update(usage_qty=0)
+        total_usage = billable_metric.get_billing_record_total_billable_usage(
+            billing_record
+        )
+        assert total_usage < 16
+
     def test_reject_if_using_table_name(
         self,
         get_billable_metrics_in_org,
@@ -2243,6 +2820,57 @@ class TestCustomSQLMetrics:
         assert len(get_billable_metrics_in_org(setup_dict["org"])) == 0
 
 
+@pytest.mark.django_db(transaction=True)
+class TestPeriodMetricUsage:
+    def test_metrics_over_the_time_budget_are_reported_incomplete(
+        self, billable_metric_test_common_setup
+    ):
+        num_billable_metrics = 2
+        setup_dict = billable_metric_test_common_setup(
+            num_billable_metrics=num_billable_metrics,
+            auth_method="session_auth",
+            user_org_and_api_key_org_different=False,
+        )
+        fast_metric, slow_metric = setup_dict["org_billable_metrics"]
+        Metric.objects.filter(organization=setup_dict["org"]).update(
+            metric_type=METRIC_TYPE.COUNTER, status=METRIC_STATUS.ACTIVE
+        )
+        statement_timeouts = []
+
+        def get_daily_total_usage(metric, *args, **kwargs):
+            with read_connection().cursor() as cursor:
+                cursor.execute("SHOW statement_timeout")
+                statement_timeouts.append(cursor.fetchone()[0])
+            if metric == slow_metric:
+                time.sleep(2)
+            return {}
+
+        with (
+            mock.patch.object(views, "DASHBOARD_QUERY_TIME_BUDGET", 1),
+            mock.patch.object(
+                Metric,
+                "get_daily_total_usage",
+                autospec=True,
+                side_effect=get_daily_total_usage,
+            ),
+        ):
+            response = setup_dict["client"].get(
+                reverse("period_metric_usage"),
+                {
+                    "start_date": (now_utc() - relativedelta(days=7)).date(),
+                    "end_date": now_utc().date(),
+                },
+            )
+
+        assert response.status_code == status.HTTP_200_OK
+        data = response.json()
+        assert fast_metric.billable_metric_name in data["metrics"]
+        assert slow_metric.billable_metric_name not in data["metrics"]
+        assert data["incomplete_metrics"] == ["metric_" + slow_metric.metric_id.hex]
+        # the queries of threads that ran out of time are cancelled by the database
+        assert statement_timeouts == ["1s", "1s"]
+
+
 @pytest.mark.django_db(transaction=True)
 class TestRegressions:
     def test_granularity_ratio_total_fails(
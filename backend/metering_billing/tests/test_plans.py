@@ -1,4 +1,5 @@
 import json
+import unittest.mock as mock
 import urllib.parse
 
 import pytest
@@ -7,6 +8,7 @@ from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
 
+from metering_billing import catalog_cache
 from metering_billing.models import Customer, Feature, Plan, PlanVersion, Tag
 from metering_billing.serializers.serializer_utils import DjangoJSONEncoder
 from metering_billing.utils import now_utc
@@ -894,3 +896,38 @@ class TestPlanVersionOperations:
         )
         assert list_plans.status_code == status.HTTP_200_OK
         assert len(list_plans.data) == 0  # all plans removed cuz no versions left
+
+
+@pytest.mark.django_db(transaction=True)
+class TestPlanCatalogCache:
+    def test_unchanged_plans_not_modified_until_plan_changes(
+        self,
+        plan_test_common_setup,
+    ):
+        setup_dict = plan_test_common_setup()
+        with mock.patch.object(catalog_cache, "CATALOG_CACHE_ENABLED", True):
+            response = setup_dict["client"].post(
+                reverse("plan-list"),
+                data=json.dumps(setup_dict["plan_payload"], cls=DjangoJSONEncoder),
+                content_type="application/json",
+            )
+            assert response.status_code == status.HTTP_201_CREATED
+
+            response = setup_dict["client"].get(reverse("plan-list"))
+            assert response.status_code == status.HTTP_200_OK
+            etag = response["ETag"]
+            response = setup_dict["client"].get(
+                reverse("plan-list"), HTTP_IF_NONE_MATCH=etag
+            )
+            assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+            plan = Plan.objects.get(organization=setup_dict["org"])
+            plan.plan_name = "renamed_plan"
+            plan.save()
+
+            response = setup_dict["client"].get(
+                reverse("plan-list"), HTTP_IF_NONE_MATCH=etag
+            )
+            assert response.status_code == status.HTTP_200_OK
+            assert response["ETag"] != etag
+            assert response.data[0]["plan_name"] == "renamed_plan"
@@ -0,0 +1,60 @@
+import datetime
+import json
+import unittest.mock as mock
+import uuid
+from decimal import Decimal
+
+import pytest
+
+from metering_billing import renderers
+from metering_billing.renderers import FastJSONRenderer
+from metering_billing.utils import make_all_json_serializable
+
+
+class TestFastJSONRenderer:
+    def test_renders_decimals_dates_and_uuids(self):
+        customer_id = uuid.uuid4()
+        data = {
+            "total": Decimal("10.50"),
+            "per_day": {datetime.date(2022, 1, 1): [Decimal("1.25"), None]},
+            "start": datetime.datetime(2022, 1, 1, tzinfo=datetime.timezone.utc),
+            "customer": customer_id,
+        }
+
+        rendered = json.loads(FastJSONRenderer().render(data))
+
+        assert rendered["total"] == 10.5
+        assert rendered["per_day"] == {"2022-01-01": [1.25, None]}
+        assert rendered["start"].startswith("2022-01-01")
+        assert rendered["customer"] == str(customer_id)
+
+    @pytest.mark.skipif(renderers.orjson is None, reason="orjson isn't installed")
+    def test_fallback_renders_the_same_as_orjson(self):
+        data = {
+            "total": Decimal("10.50"),
+            "per_day": {datetime.date(2022, 1, 1): [Decimal("1.25"), None]},
+            "start": datetime.datetime(
+                2022, 1, 1, 12, 30, 5, 250, tzinfo=datetime.timezone.utc
+            ),
+            "end": datetime.datetime(
+                2022, 1, 2, tzinfo=datetime.timezone(datetime.timedelta(hours=2))
+            ),
+            "customer": uuid.uuid4(),
+            "name": "café",
+        }
+
+        rendered = FastJSONRenderer().render(data)
+        with mock.patch.object(renderers, "orjson", None):
+            fallback = FastJSONRenderer().render(data)
+
+        assert json.loads(fallback) == json.loads(rendered)
+        assert json.loads(rendered)["start"] == "2022-01-01T12:30:05.000250Z"
+
+    def test_make_all_json_serializable_rounds_to_strings(self):
+        data = {"revenue": [Decimal("1.005"), (Decimal("2"),)]}
+
+        serialized = make_all_json_serializable(
+            data, decimals="string", decimal_places=2
+        )
+
+        assert serialized == {"revenue": ["1.01", ["2.00"]]}
@@ -670,6 +670,42 @@ class TestRegressions:
         response = setup_dict["client"].get(reverse("subscription-list"), payload)
         assert response.status_code == status.HTTP_400_BAD_REQUEST
 
+    def test_list_subscriptions_with_page_size(
+        self, subscription_test_common_setup, add_subscription_record_to_org
+    ):
+        setup_dict = subscription_test_common_setup(
+            num_subscriptions=0, auth_method="session_auth"
+        )
+        for days_ago in [3, 2, 1]:
+            add_subscription_record_to_org(
+                setup_dict["org"],
+                setup_dict["billing_plan"],
+                setup_dict["customer"],
+                start_date=now_utc() - timedelta(days=days_ago),
+            )
+        payload = {"customer_id": setup_dict["customer"].customer_id}
+
+        response = setup_dict["client"].get(reverse("subscription-list"), payload)
+        assert response.status_code == status.HTTP_200_OK
+        all_ids = [x["subscription_id"] for x in response.json()]
+        assert len(all_ids) == 3
+
+        response = setup_dict["client"].get(
+            reverse("subscription-list"), {**payload, "page_size": 2}
+        )
+        assert response.status_code == status.HTTP_200_OK
+        first_page = response.json()
+        assert len(first_page["results"]) == 2
+        response = setup_dict["client"].get(first_page["next"])
+        assert response.status_code == status.HTTP_200_OK
+        second_page = response.json()
+        assert second_page["next"] is None
+        paged = first_page["results"] + second_page["results"]
+        assert sorted(x["subscription_id"] for x in paged) == sorted(all_ids)
+        # newest first
+        start_dates = [x["start_date"] for x in paged]
+        assert start_dates == sorted(start_dates, reverse=True)
+
     def test_refresh_rate_metric_doesnt_fail(self, subscription_test_common_setup):
         from metering_billing.models import Organization
         from metering_billing.utils.enums import (
@@ -21,7 +21,12 @@ from metering_billing.models import (
     PriceTier,
     SubscriptionRecord,
 )
-from metering_billing.serializers.serializer_utils import DjangoJSONEncoder
+from metering_billing.serializers.serializer_utils import (
+    DjangoJSONEncoder,
+    TimezoneResolver,
+    get_timezone_resolver,
+    request_timezone_resolver,
+)
 from metering_billing.utils import now_utc
 
 
@@ -361,3 +366,44 @@ class TestTimezones:
             end_date.replace(tzinfo=None)
         )
         assert start_date.utcoffset() != end_date.utcoffset()
+
+
+@pytest.mark.django_db(transaction=True)
+class TestTimezoneResolver:
+    def test_prime_loads_page_timezones_in_one_query(
+        self,
+        generate_org_and_api_key,
+        add_customers_to_org,
+        add_product_to_org,
+        add_plan_to_product,
+        add_plan_version_to_plan,
+        add_subscription_record_to_org,
+        django_assert_num_queries,
+    ):
+        org, _ = generate_org_and_api_key()
+        customers = add_customers_to_org(org, n=3)
+        tz_strings = ["America/New_York", "Europe/Paris", "Asia/Tokyo"]
+        for customer, tz_string in zip(customers, tz_strings):
+            customer.timezone = pytz.timezone(tz_string)
+            customer.timezone_set = True
+            customer.save()
+        plan_version = add_plan_version_to_plan(
+            add_plan_to_product(add_product_to_org(org))
+        )
+        subscription_records = [
+            add_subscription_record_to_org(org, plan_version, customer)
+            for customer in customers
+        ]
+
+        resolver = TimezoneResolver()
+        with django_assert_num_queries(1):
+            resolver.prime(SubscriptionRecord, subscription_records)
+        with django_assert_num_queries(0):
+            for subscription_record, tz_string in zip(subscription_records, tz_strings):
+                timezone = resolver.customer_timezone(subscription_record.customer_id)
+                assert timezone.zone == tz_string
+
+    def test_resolver_is_shared_within_a_request(self):
+        with request_timezone_resolver():
+            assert get_timezone_resolver({}) is get_timezone_resolver({})
+        assert get_timezone_resolver({}) is not get_timezone_resolver({})
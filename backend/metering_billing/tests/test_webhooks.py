@@ -0,0 +1,138 @@
+import unittest.mock as mock
+
+import pytest
+from django.db import connections
+
+from metering_billing import webhooks
+from metering_billing.models import (
+    WebhookEndpoint,
+    WebhookOutboxMessage,
+    WebhookTrigger,
+)
+from metering_billing.utils import now_utc
+from metering_billing.utils.enums import WEBHOOK_TRIGGER_EVENTS
+
+
+class LocalSvixMessages:
+    def __init__(self, failures, on_create=None):
+        self.failures = failures
+        self.on_create = on_create
+        self.sent = []
+
+    def create(self, app_id, message_in):
+        if self.on_create is not None:
+            self.on_create()
+        if self.failures > 0:
+            self.failures -= 1
+            raise Exception("svix unavailable")
+        self.sent.append((app_id, message_in))
+
+
+class LocalSvix:
+    """In memory stand-in for the Svix client."""
+
+    def __init__(self, failures=0, on_create=None):
+        self.message = LocalSvixMessages(failures, on_create)
+
+
+@pytest.mark.django_db(transaction=True)
+class TestWebhookOutbox:
+    def test_outbox_messages_are_coalesced_and_retried(
+        self, generate_org_and_api_key, add_customers_to_org
+    ):
+        org, _ = generate_org_and_api_key()
+        other_org, _ = generate_org_and_api_key()
+        (customer,) = add_customers_to_org(org, n=1)
+        (other_customer,) = add_customers_to_org(other_org, n=1)
+        endpoint = WebhookEndpoint.objects.create(
+            organization=org, webhook_url="https://example.com/webhooks"
+        )
+        WebhookTrigger.objects.create(
+            organization=org,
+            webhook_endpoint=endpoint,
+            trigger_name=WEBHOOK_TRIGGER_EVENTS.CUSTOMER_CREATED,
+        )
+        endpoint.save()
+        svix = LocalSvix(failures=1)
+
+        with mock.patch.object(webhooks, "SVIX_CONNECTOR", svix), mock.patch.object(
+            webhooks, "WEBHOOK_OUTBOX_ENABLED", True
+        ), mock.patch.object(webhooks, "schedule_webhook_dispatch") as schedule:
+            for name in ["first", "second"]:
+                webhooks.customer_created_webhook(
+                    customer, customer_data={"customer_name": name}
+                )
+            webhooks.customer_created_webhook(
+                other_customer, customer_data={"customer_name": "other"}
+            )
+
+            # nothing is sent until the dispatcher runs
+            assert svix.message.sent == []
+            assert schedule.call_count == 2
+            (message,) = WebhookOutboxMessage.objects.all()
+            assert message.organization == org
+            assert message.payload["properties"]["payload"]["customer_name"] == "second"
+
+            assert webhooks.dispatch_webhooks_inner() == 0
+            message.refresh_from_db()
+            assert message.attempts == 1
+            assert message.sent_at is None
+            assert message.next_attempt_at > now_utc()
+
+            WebhookOutboxMessage.objects.update(next_attempt_at=now_utc())
+            assert webhooks.dispatch_webhooks_inner() == 1
+
+        message.refresh_from_db()
+        assert message.sent_at is not None
+        ((app_id, message_in),) = svix.message.sent
+        assert app_id == org.organization_id.hex
+        assert message_in.event_type == WEBHOOK_TRIGGER_EVENTS.CUSTOMER_CREATED
+
+    def test_messages_of_different_events_are_kept_apart(
+        self, generate_org_and_api_key
+    ):
+        org, _ = generate_org_and_api_key()
+
+        with mock.patch.object(
+            webhooks, "WEBHOOK_OUTBOX_ENABLED", True
+        ), mock.patch.object(webhooks, "schedule_webhook_dispatch"):
+            for event_type in [
+                WEBHOOK_TRIGGER_EVENTS.INVOICE_PAID,
+                WEBHOOK_TRIGGER_EVENTS.INVOICE_PAST_DUE,
+            ]:
+                webhooks._send_webhook(org, event_type, "invoice", {})
+
+        assert set(
+            WebhookOutboxMessage.objects.values_list("event_type", flat=True)
+        ) == {
+            WEBHOOK_TRIGGER_EVENTS.INVOICE_PAID,
+            WEBHOOK_TRIGGER_EVENTS.INVOICE_PAST_DUE,
+        }
+
+    def test_messages_queued_while_sending_are_not_marked_sent(
+        self, generate_org_and_api_key
+    ):
+        org, _ = generate_org_and_api_key()
+
+        def queue_newer_message():
+            # runs on the dispatcher's thread while the message is locked
+            webhooks._send_webhook(
+                org, WEBHOOK_TRIGGER_EVENTS.INVOICE_PAID, "invoice", {"n": 2}
+            )
+            connections.close_all()
+
+        svix = LocalSvix(on_create=queue_newer_message)
+        with mock.patch.object(webhooks, "SVIX_CONNECTOR", svix), mock.patch.object(
+            webhooks, "WEBHOOK_OUTBOX_ENABLED", True
+        ), mock.patch.object(webhooks, "schedule_webhook_dispatch"):
+            webhooks._send_webhook(
+                org, WEBHOOK_TRIGGER_EVENTS.INVOICE_PAID, "invoice", {"n": 1}
+            )
+            assert webhooks.dispatch_webhooks_inner() == 1
+
+        sent, unsent = WebhookOutboxMessage.objects.order_by("pk")
+        assert sent.payload["properties"] == {"n": 1}
+        assert sent.sent_at is not None
+        assert unsent.payload["properties"] == {"n": 2}
+        assert unsent.sent_at is None
+        assert unsent.next_attempt_at is not None
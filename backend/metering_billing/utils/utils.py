@@ -1,14 +1,18 @@
-import collections
+import contextvars
 import datetime
 import json
+import logging
+import time
 import uuid
 from collections import OrderedDict, namedtuple
 from collections.abc import MutableMapping, MutableSequence
+from concurrent.futures import ThreadPoolExecutor, wait
 from decimal import ROUND_DOWN, ROUND_HALF_UP, ROUND_UP, Decimal
 
 import pytz
 from dateutil import parser
 from dateutil.relativedelta import relativedelta
+from django.db import connections
 from django.db.models import Field, Model
 from metering_billing.exceptions.exceptions import ServerError
 from metering_billing.utils.enums import (
@@ -17,6 +21,8 @@ from metering_billing.utils.enums import (
     USAGE_CALC_GRANULARITY,
 )
 
+logger = logging.getLogger("django.server")
+
 ModelType = type[Model]
 Fields = list[Field]
 
@@ -83,74 +89,32 @@ def convert_to_datetime(value, date_behavior="min", tz=pytz.UTC):
         raise ServerError(f"can't convert type {type(value)} into date")
 
 
-def make_all_decimals_floats(data):
-    if isinstance(data, list):
-        return [make_all_decimals_floats(x) for x in data]
-    elif isinstance(data, (dict, collections.OrderedDict)):
-        return {
-            make_all_decimals_floats(key): make_all_decimals_floats(val)
-            for key, val in data.items()
-        }
-    elif isinstance(data, Decimal):
-        return float(data)
-    else:
-        return data
-
-
-def round_all_decimals_to_two_places(data):
-    if isinstance(data, list):
-        return [round_all_decimals_to_two_places(x) for x in data]
-    elif isinstance(data, (dict, collections.OrderedDict)):
-        return {
-            round_all_decimals_to_two_places(key): round_all_decimals_to_two_places(val)
-            for key, val in data.items()
-        }
-    elif isinstance(data, Decimal):
-        return data.quantize(Decimal(".01"), rounding=ROUND_HALF_UP)
-    else:
-        return data
-
-
-def make_all_decimals_strings(data):
-    if isinstance(data, list):
-        return [make_all_decimals_strings(x) for x in data]
-    elif isinstance(data, (dict, collections.OrderedDict)):
-        return {
-            make_all_decimals_strings(key): make_all_decimals_strings(val)
-            for key, val in data.items()
-        }
-    elif isinstance(data, Decimal):
-        return str(data)
-    else:
-        return data
-
-
-def make_all_dates_times_strings(data):
-    if isinstance(data, list):
-        return [make_all_dates_times_strings(x) for x in data]
-    elif isinstance(data, (dict, collections.OrderedDict)):
-        return {
-            make_all_dates_times_strings(key): make_all_dates_times_strings(val)
-            for key, val in data.items()
-        }
-    elif isinstance(data, (datetime.date, datetime.datetime)):
-        return str(data)
-    else:
-        return data
-
-
-def make_all_datetimes_dates(data):
-    if isinstance(data, list):
-        return [make_all_datetimes_dates(x) for x in data]
-    elif isinstance(data, (dict, collections.OrderedDict)):
-        return {
-            make_all_datetimes_dates(key): make_all_datetimes_dates(val)
-            for key, val in data.items()
-        }
-    elif isinstance(data, datetime.datetime):
-        return data.date()
-    else:
-        return data
+def make_all_json_serializable(
+    data, decimals="float", decimal_places=None, datetimes_as_dates=False
+):
+    """
+    Makes the payload JSON serializable in a single pass, instead of chaining the make_all_* walkers. Decimals become floats or strings depending on `decimals`, rounded to `decimal_places` if given, and dates, datetimes and UUIDs become strings, keys included.
+    """
+    quantize_exp = (
+        Decimal(1).scaleb(-decimal_places) if decimal_places is not None else None
+    )
+
+    def convert(value):
+        if isinstance(value, (list, tuple)):
+            return [convert(x) for x in value]
+        elif isinstance(value, dict):
+            return {convert(key): convert(val) for key, val in value.items()}
+        elif isinstance(value, Decimal):
+            if quantize_exp is not None:
+                value = value.quantize(quantize_exp, rounding=ROUND_HALF_UP)
+            return float(value) if decimals == "float" else str(value)
+        elif isinstance(value, datetime.datetime):
+            return str(value.date() if datetimes_as_dates else value)
+        elif isinstance(value, (datetime.date, uuid.UUID)):
+            return str(value)
+        return value
+
+    return convert(data)
 
 
 def years_bwn_twodates(start_date, end_date):
@@ -592,3 +556,52 @@ def idempotency_id_uuidv5(idempotency_id):
     from django.conf import settings
 
     return uuid.uuid5(settings.IDEMPOTENCY_ID_NAMESPACE, idempotency_id)
+
+
+def run_with_time_budget(func, items, max_workers, time_budget, statement_timeout=None):
+    """
+    Runs func over items in a bounded thread pool, each thread using its own database connections and the context variables of the caller. Returns a dict of item -> result for the items that finished within time_budget seconds, and the list of items that didn't or that failed, so callers can return partial results. Failures are logged. Threads that don't finish in time keep running in the background, so when statement_timeout (in seconds) is given their queries are cancelled by the database after that long.
+    """
+    items = list(items)
+    results = {}
+    if max_workers <= 1 or len(items) <= 1:
+        deadline = time.monotonic() + time_budget
+        for item in items:
+            if time.monotonic() > deadline:
+                break
+            try:
+                results[item] = func(item)
+            except Exception as e:
+                logger.error("Error computing {}: {}".format(item, e))
+        return results, [item for item in items if item not in results]
+
+    def run(item):
+        from metering_billing.db_router import own_replica_scope, read_connection
+
+        own_replica_scope()
+        try:
+            if statement_timeout is not None:
+                with read_connection().cursor() as cursor:
+                    cursor.execute(
+                        "SET statement_timeout = %s", [int(statement_timeout * 1000)]
+                    )
+            return func(item)
+        finally:
+            # every thread opens its own connections, don't leak them
+            connections.close_all()
+
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(items)))
+    # so the threads read from the same database as the caller
+    futures = {
+        executor.submit(contextvars.copy_context().run, run, item): item
+        for item in items
+    }
+    done, _ = wait(futures, timeout=time_budget)
+    executor.shutdown(wait=False, cancel_futures=True)
+    for future in done:
+        try:
+            results[futures[future]] = future.result()
+        except Exception as e:
+            logger.error("Error computing {}: {}".format(futures[future], e))
+    incomplete = [item for item in items if item not in results]
+    return results, incomplete
@@ -1,5 +1,6 @@
 # import lotus_python
 import logging
+from decimal import Decimal
 
 import api.views as api_views
 import posthog
@@ -24,7 +25,8 @@ from api.serializers.webhook_serializers import (
 from django.conf import settings
 from django.core.cache import cache
 from django.core.validators import MinValueValidator
-from django.db.models import Func, Max
+from django.db.models import DecimalField, Func, Max, Q, Sum
+from django.db.models.functions import Coalesce
 from django.db.utils import IntegrityError
 from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import (
@@ -33,6 +35,8 @@ from drf_spectacular.utils import (
     extend_schema,
     inline_serializer,
 )
+from metering_billing.catalog_cache import CatalogCacheMixin, cache_catalog_response
+from metering_billing.db_router import replica_reads
 from metering_billing.exceptions import (
     DuplicateMetric,
     DuplicateWebhookEndpoint,
@@ -43,9 +47,12 @@ from metering_billing.models import (
     Analysis,
     APIToken,
     Backtest,
+    Customer,
     Event,
+    EventCatalogEntry,
     ExternalPlanLink,
     Feature,
+    Invoice,
     Metric,
     Organization,
     Plan,
@@ -61,6 +68,7 @@ from metering_billing.models import (
 from metering_billing.payment_processors import PAYMENT_PROCESSOR_MAP
 from metering_billing.permissions import ValidOrganization
 from metering_billing.serializers.experiment_serializers import (
+    AnalysisCreateSerializer,
     AnalysisDetailSerializer,
     AnalysisSummarySerializer,
     BacktestCreateSerializer,
@@ -79,6 +87,7 @@ from metering_billing.serializers.model_serializers import (
     APITokenSerializer,
     CustomerDetailSerializer,
     CustomerSummarySerializer,
+    SubscriptionCustomerSummarySerializer,
     CustomerUpdateSerializer,
     CustomerWithRevenueSerializer,
     EventDetailSerializer,
@@ -127,8 +136,12 @@ from metering_billing.serializers.serializer_utils import (
     UsageAlertUUIDField,
     WebhookEndpointUUIDField,
 )
-from metering_billing.tasks import run_backtest
-from metering_billing.utils import make_all_decimals_floats, now_utc
+from metering_billing.tasks import run_analysis, run_backtest
+from metering_billing.utils import (
+    customer_id_uuidv5,
+    idempotency_id_uuidv5,
+    now_utc,
+)
 from metering_billing.utils.enums import (
     METRIC_STATUS,
     PAYMENT_PROCESSORS,
@@ -143,6 +156,7 @@ from rest_framework.response import Response
 
 POSTHOG_PERSON = settings.POSTHOG_PERSON
 SVIX_CONNECTOR = settings.SVIX_CONNECTOR
+EVENT_CATALOG_ENABLED = settings.EVENT_CATALOG_ENABLED
 logger = logging.getLogger("django.server")
 
 
@@ -465,6 +479,11 @@ class CursorSetPagination(CustomPagination):
     cursor_query_param = "c"
 
 
+class EventCursorPagination(CursorSetPagination):
+    # matches the (organization_id, time_created, idempotency_id) index on the events table
+    ordering = ("-time_created", "-idempotency_id")
+
+
 class EventViewSet(
     PermissionPolicyMixin, mixins.ListModelMixin, viewsets.GenericViewSet
 ):
@@ -500,10 +519,10 @@ class EventViewSet(
         parameters=[
             EventSearchRequestSerializer,
             OpenApiParameter(
-                name=CursorSetPagination.cursor_query_param,
+                name=EventCursorPagination.cursor_query_param,
                 type=str,
                 location=OpenApiParameter.QUERY,
-                description=CursorSetPagination.cursor_query_description,
+                description=EventCursorPagination.cursor_query_description,
             ),
         ],
         responses=EventDetailSerializer(many=True),
@@ -512,8 +531,9 @@ class EventViewSet(
         detail=False,
         methods=["get"],
         url_path="search",
-        pagination_class=CursorSetPagination,
+        pagination_class=EventCursorPagination,
     )
+    @replica_reads()
     def search(self, request):
         # dont use self.get_queryset() since we use diff for request and response
         serializer = EventSearchRequestSerializer(data=request.query_params)
@@ -523,11 +543,27 @@ class EventViewSet(
         customer_id = data.get("customer_id")
         idempotency_id = data.get("idempotency_id")
 
-        queryset = self.get_queryset()
-        if customer_id and len(customer_id) > 0:
-            queryset = queryset.filter(cust_id__icontains=customer_id)
-        if idempotency_id and len(idempotency_id) > 0:
-            queryset = queryset.filter(idempotency_id__icontains=idempotency_id)
+        # constant bounds on time_created let timescale skip the chunks outside the window
+        queryset = Event.objects.filter(
+            organization=request.organization,
+            time_created__gte=data["time_created_gte"],
+            time_created__lt=data["time_created_lt"],
+        )
+        if data["match"] == "exact":
+            if customer_id:
+                queryset = queryset.filter(
+                    uuidv5_customer_id=customer_id_uuidv5(customer_id)
+                )
+            if idempotency_id:
+                queryset = queryset.filter(
+                    uuidv5_idempotency_id=idempotency_id_uuidv5(idempotency_id)
+                )
+        else:
+            # served by the (organization_id, text_pattern_ops) indexes on the ids
+            if customer_id:
+                queryset = queryset.filter(cust_id__startswith=customer_id)
+            if idempotency_id:
+                queryset = queryset.filter(idempotency_id__startswith=idempotency_id)
 
         # this snippet is from ListModelMixin
         page = self.paginate_queryset(queryset)
@@ -552,6 +588,25 @@ class EventViewSet(
     @action(detail=False, methods=["get"], url_path="properties")
     def event_properties(self, request):
         org = request.organization
+        if EVENT_CATALOG_ENABLED:
+            event_names = []
+            event_name_to_props = {}
+            for event_name, property_key in (
+                EventCatalogEntry.objects.filter(organization=org)
+                .order_by("event_name", "property_key")
+                .values_list("event_name", "property_key")
+            ):
+                if property_key == "":
+                    event_names.append(event_name)
+                else:
+                    event_name_to_props.setdefault(event_name, []).append(property_key)
+            return Response(
+                {
+                    "event_names": event_names,
+                    "event_name_to_props": event_name_to_props,
+                },
+                status=status.HTTP_200_OK,
+            )
         event_names = list(
             Event.objects.filter(organization=org)
             .values_list("event_name", flat=True)
@@ -604,8 +659,13 @@ class UserViewSet(
         serializer.save(organization=self.request.organization)
 
 
+class CustomerCursorSetPagination(CustomPagination, api_views.CustomerCursorPagination):
+    pass
+
+
 class CustomerViewSet(api_views.CustomerViewSet):
     http_method_names = ["get", "post", "head", "patch"]
+    keyset_pagination_class = CustomerCursorSetPagination
 
     def get_serializer_class(self):
         if self.action == "partial_update":
@@ -634,29 +694,84 @@ class CustomerViewSet(api_views.CustomerViewSet):
             status=status.HTTP_200_OK,
         )
 
-    @extend_schema(request=None, responses=CustomerSummarySerializer)
+    def _serialize_customer_summaries(self, customers):
+        organization = self.request.organization
+        subscription_records = SubscriptionRecord.base_objects.active(now_utc()).filter(
+            organization=organization
+        )
+        if isinstance(customers, list):
+            # a single page, otherwise it's every customer of the organization
+            subscription_records = subscription_records.filter(
+                customer__in=[x["id"] for x in customers]
+            )
+        subscriptions_per_customer = {}
+        for subscription_record in subscription_records.select_related(
+            "billing_plan__plan"
+        ):
+            subscriptions_per_customer.setdefault(
+                subscription_record.customer_id, []
+            ).append(subscription_record)
+        return [
+            {
+                "customer_name": customer["customer_name"],
+                "customer_id": customer["customer_id"],
+                "subscriptions": SubscriptionCustomerSummarySerializer(
+                    subscriptions_per_customer.get(customer["id"], []), many=True
+                ).data,
+            }
+            for customer in customers
+        ]
+
+    @extend_schema(
+        request=None,
+        parameters=CustomerCursorSetPagination.get_schema_parameters(),
+        responses=CustomerSummarySerializer,
+    )
     @action(detail=False, methods=["get"], url_path="summary")
     def summary(self, request):
         """
-        Get the current settings for the organization.
+        Get the name and active subscriptions of the organization's customers.
         """
-        customers = self.get_queryset()
-        serializer = CustomerSummarySerializer(customers, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        customers = Customer.objects.filter(
+            organization=self.request.organization
+        ).values("id", "customer_name", "customer_id")
+        return self.keyset_pagination_class().get_list_response(
+            customers, request, self, self._serialize_customer_summaries
+        )
 
-    @extend_schema(request=None, responses=CustomerWithRevenueSerializer)
+    @extend_schema(
+        request=None,
+        parameters=CustomerCursorSetPagination.get_schema_parameters(),
+        responses=CustomerWithRevenueSerializer,
+    )
     @action(detail=False, methods=["get"], url_path="totals")
     def totals(self, request, pk=None):
         """
-        Get the current settings for the organization.
+        Get the amount due on unpaid invoices of the organization's customers.
         """
-        customers = self.get_queryset()
-        cust = CustomerWithRevenueSerializer(customers, many=True).data
-        cust = make_all_decimals_floats(cust)
-        return Response(cust, status=status.HTTP_200_OK)
+        customers = (
+            Customer.objects.filter(organization=self.request.organization)
+            .values("customer_id")
+            .annotate(
+                total_amount_due=Coalesce(
+                    Sum(
+                        "invoices__amount",
+                        filter=Q(invoices__payment_status=Invoice.PaymentStatus.UNPAID),
+                    ),
+                    Decimal(0),
+                    output_field=DecimalField(),
+                )
+            )
+        )
+        return self.keyset_pagination_class().get_list_response(
+            customers,
+            request,
+            self,
+            list,
+        )
 
 
-class MetricViewSet(PermissionPolicyMixin, viewsets.ModelViewSet):
+class MetricViewSet(CatalogCacheMixin, PermissionPolicyMixin, viewsets.ModelViewSet):
     http_method_names = ["get", "post", "head", "patch"]
     lookup_field = "metric_id"
     permission_classes_per_method = {
@@ -691,6 +806,14 @@ class MetricViewSet(PermissionPolicyMixin, viewsets.ModelViewSet):
         context.update({"organization": organization})
         return context
 
+    @cache_catalog_response
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cache_catalog_response
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
     def dispatch(self, request, *args, **kwargs):
         response = super().dispatch(request, *args, **kwargs)
         if status.is_success(response.status_code):
@@ -737,6 +860,7 @@ class MetricViewSet(PermissionPolicyMixin, viewsets.ModelViewSet):
 
 
 class FeatureViewSet(
+    CatalogCacheMixin,
     PermissionPolicyMixin,
     mixins.ListModelMixin,
     mixins.CreateModelMixin,
@@ -760,6 +884,10 @@ class FeatureViewSet(
         objs = Feature.objects.filter(organization=organization)
         return objs
 
+    @cache_catalog_response
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
     def get_serializer_context(self):
         context = super().get_serializer_context()
         organization = self.request.organization
@@ -799,7 +927,9 @@ class FeatureViewSet(
         return serializer.save(organization=self.request.organization)
 
 
-class PlanVersionViewSet(PermissionPolicyMixin, viewsets.ModelViewSet):
+class PlanVersionViewSet(
+    CatalogCacheMixin, PermissionPolicyMixin, viewsets.ModelViewSet
+):
     serializer_class = PlanVersionDetailSerializer
     lookup_field = "version_id"
     http_method_names = [
@@ -1934,7 +2064,7 @@ class AnalysisViewSet(PermissionPolicyMixin, viewsets.ModelViewSet):
         elif self.action == "retrieve":
             return AnalysisDetailSerializer
         else:
-            return BacktestCreateSerializer
+            return AnalysisCreateSerializer
 
     def get_queryset(self):
         organization = self.request.organization
@@ -1942,8 +2072,8 @@ class AnalysisViewSet(PermissionPolicyMixin, viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         analysis_obj = serializer.save(organization=self.request.organization)
-        an_id = analysis_obj.backtest_id
-        run_backtest.delay(an_id)
+        an_id = analysis_obj.analysis_id
+        run_analysis.delay(an_id)
 
     def dispatch(self, request, *args, **kwargs):
         response = super().dispatch(request, *args, **kwargs)
@@ -2245,7 +2375,7 @@ class CustomerBalanceAdjustmentViewSet(api_views.CustomerBalanceAdjustmentViewSe
     pass
 
 
-class AddOnViewSet(viewsets.ModelViewSet):
+class AddOnViewSet(CatalogCacheMixin, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated & ValidOrganization]
     http_method_names = ["get", "post", "patch", "head"]
     lookup_field = "plan_id"
@@ -2377,7 +2507,9 @@ class AddOnViewSet(viewsets.ModelViewSet):
         )
 
 
-class AddOnVersionViewSet(PermissionPolicyMixin, viewsets.ModelViewSet):
+class AddOnVersionViewSet(
+    CatalogCacheMixin, PermissionPolicyMixin, viewsets.ModelViewSet
+):
     serializer_class = AddOnVersionDetailSerializer
     lookup_field = "version_id"
     http_method_names = [
@@ -5,15 +5,20 @@ import pytz
 from django.conf import settings
 from django.db.models import Count, F, Q, Sum
 from drf_spectacular.utils import extend_schema, inline_serializer
+from metering_billing.aggregation.event_volume import count_events, event_volume
+from metering_billing.db_router import replica_reads
 from metering_billing.exceptions import (
     ExternalConnectionFailure,
     ExternalConnectionInvalid,
 )
-from metering_billing.models import Event, Invoice, Organization, SubscriptionRecord
+from metering_billing.models import Invoice, Organization, SubscriptionRecord
 from metering_billing.netsuite_csv import get_invoices_csv_presigned_url
 from metering_billing.payment_processors import PAYMENT_PROCESSOR_MAP
 from metering_billing.permissions import HasUserAPIKey, ValidOrganization
+from metering_billing.revenue_ledger import earned_revenue_per_day
 from metering_billing.serializers.request_serializers import (
+    EventVolumeRequestSerializer,
+    InvoiceCSVRequestSerializer,
     OptionalPeriodRequestSerializer,
     PeriodComparisonRequestSerializer,
     PeriodMetricUsageRequestSerializer,
@@ -22,6 +27,7 @@ from metering_billing.serializers.request_serializers import (
     URLResponseSerializer,
 )
 from metering_billing.serializers.response_serializers import (
+    EventVolumeResponseSerializer,
     PeriodEventsResponseSerializer,
     PeriodMetricRevenueResponseSerializer,
     PeriodMetricUsageResponseSerializer,
@@ -36,8 +42,7 @@ from metering_billing.utils import (
     date_as_max_dt,
     date_as_min_dt,
     dates_bwn_two_dts,
-    make_all_dates_times_strings,
-    make_all_decimals_floats,
+    run_with_time_budget,
 )
 from metering_billing.utils.enums import METRIC_STATUS, METRIC_TYPE, PAYMENT_PROCESSORS
 from rest_framework import mixins, serializers, status, viewsets
@@ -48,6 +53,8 @@ from rest_framework.views import APIView
 
 logger = logging.getLogger("django.server")
 POSTHOG_PERSON = settings.POSTHOG_PERSON
+DASHBOARD_QUERY_WORKERS = settings.DASHBOARD_QUERY_WORKERS
+DASHBOARD_QUERY_TIME_BUDGET = settings.DASHBOARD_QUERY_TIME_BUDGET
 
 
 class PeriodMetricRevenueView(APIView):
@@ -57,6 +64,7 @@ class PeriodMetricRevenueView(APIView):
         parameters=[SinglePeriodRequestSerializer],
         responses={200: PeriodMetricRevenueResponseSerializer},
     )
+    @replica_reads()
     def get(self, request, format=None):
         """
         Returns the revenue for an organization in a given time period.
@@ -77,20 +85,6 @@ class PeriodMetricRevenueView(APIView):
         ).aggregate(tot=Sum("amount"))["tot"]
         return_dict["total_revenue"] = collected or Decimal(0)
         # earned
-        subs = (
-            SubscriptionRecord.objects.filter(
-                Q(start_date__range=(start, end))
-                | Q(end_date__range=(start, end))
-                | Q(start_date__lte=start, end_date__gte=end),
-                organization=organization,
-            )
-            .select_related("billing_plan")
-            .select_related("customer")
-            .prefetch_related("billing_plan__recurring_charges")
-            .prefetch_related("billing_plan__plan_components")
-            .prefetch_related("billing_plan__plan_components__billable_metric")
-            .prefetch_related("billing_plan__plan_components__tiers")
-        )
         per_day_dict = {}
         for period in dates_bwn_two_dts(start, end):
             period = convert_to_date(period)
@@ -98,21 +92,19 @@ class PeriodMetricRevenueView(APIView):
                 "date": period,
                 "revenue": Decimal(0),
             }
-        for subscription in subs:
-            earned_revenue = subscription.calculate_earned_revenue_per_day()
-            for date, earned_revenue in earned_revenue.items():
-                date = convert_to_date(date)
-                if date in per_day_dict:
-                    per_day_dict[date]["revenue"] += earned_revenue
+        earned_revenue = earned_revenue_per_day(
+            organization, convert_to_date(start), convert_to_date(end)
+        )
+        for date, earned_revenue in earned_revenue.items():
+            if date in per_day_dict:
+                per_day_dict[date]["revenue"] += earned_revenue
         return_dict["earned_revenue"] = sum(
             [x["revenue"] for x in per_day_dict.values()]
         )
-        serializer = PeriodMetricRevenueResponseSerializer(data=return_dict)
-        serializer.is_valid(raise_exception=True)
-        ret = serializer.validated_data
-        ret = make_all_decimals_floats(ret)
-        ret = make_all_dates_times_strings(ret)
-        return Response(ret, status=status.HTTP_200_OK)
+        return Response(
+            PeriodMetricRevenueResponseSerializer(return_dict).data,
+            status=status.HTTP_200_OK,
+        )
 
 
 class PeriodEventsView(APIView):
@@ -122,6 +114,7 @@ class PeriodEventsView(APIView):
         parameters=[PeriodComparisonRequestSerializer],
         responses={200: PeriodMetricRevenueResponseSerializer},
     )
+    @replica_reads()
     def get(self, request, format=None):
         """
         Returns the revenue for an organization in a given time period.
@@ -148,16 +141,42 @@ class PeriodEventsView(APIView):
         return_dict = {}
         # earned
         for start, end, num in [(p1_start, p1_end, 1), (p2_start, p2_end, 2)]:
-            n_events = Event.objects.filter(
-                organization=organization,
-                time_created__gte=start,
-                time_created__lte=end,
-            ).count()
-            return_dict[f"total_events_period_{num}"] = n_events
-        serializer = PeriodEventsResponseSerializer(data=return_dict)
+            return_dict[f"total_events_period_{num}"] = count_events(
+                organization, start, end
+            )
+        return Response(
+            PeriodEventsResponseSerializer(return_dict).data, status=status.HTTP_200_OK
+        )
+
+
+class EventVolumeView(APIView):
+    permission_classes = [IsAuthenticated | ValidOrganization]
+
+    @extend_schema(
+        parameters=[EventVolumeRequestSerializer],
+        responses={200: EventVolumeResponseSerializer},
+    )
+    @replica_reads()
+    def get(self, request, format=None):
+        """
+        Returns the number of events an organization sent per hour or day in a given time period.
+        """
+        organization = request.organization
+        timezone = organization.timezone
+        serializer = EventVolumeRequestSerializer(data=request.query_params)
         serializer.is_valid(raise_exception=True)
-        ret = serializer.validated_data
-        return Response(ret, status=status.HTTP_200_OK)
+        data = serializer.validated_data
+        volume = event_volume(
+            organization,
+            date_as_min_dt(data["start_date"], timezone=timezone),
+            date_as_max_dt(data["end_date"], timezone=timezone),
+            granularity=data["granularity"],
+            by_event_name=data["by_event_name"],
+        )
+        return Response(
+            EventVolumeResponseSerializer({"volume": volume}).data,
+            status=status.HTTP_200_OK,
+        )
 
 
 class PeriodSubscriptionsView(APIView):
@@ -167,6 +186,7 @@ class PeriodSubscriptionsView(APIView):
         parameters=[PeriodComparisonRequestSerializer],
         responses={200: PeriodSubscriptionsResponseSerializer},
     )
+    @replica_reads()
     def get(self, request, format=None):
         organization = request.organization
         timezone = organization.timezone
@@ -211,11 +231,10 @@ class PeriodSubscriptionsView(APIView):
             return_dict[f"period_{i+1}_new_subscriptions"] = sum(
                 [1 for k, v in seen_dict.items() if v]
             )
-        serializer = PeriodSubscriptionsResponseSerializer(data=return_dict)
-        serializer.is_valid(raise_exception=True)
-        ret = serializer.validated_data
-        ret = make_all_decimals_floats(ret)
-        return Response(ret, status=status.HTTP_200_OK)
+        return Response(
+            PeriodSubscriptionsResponseSerializer(return_dict).data,
+            status=status.HTTP_200_OK,
+        )
 
 
 class PeriodMetricUsageView(APIView):
@@ -226,6 +245,7 @@ class PeriodMetricUsageView(APIView):
         parameters=[PeriodMetricUsageRequestSerializer],
         responses={200: PeriodMetricUsageResponseSerializer},
     )
+    @replica_reads()
     def get(self, request, format=None):
         """
         Return current usage for a customer during a given billing period.
@@ -242,12 +262,23 @@ class PeriodMetricUsageView(APIView):
         final_results = {}
         metrics = organization.metrics.filter(
             ~Q(metric_type=METRIC_TYPE.CUSTOM), status=METRIC_STATUS.ACTIVE
+        ).prefetch_related("numeric_filters", "categorical_filters")
+        # the metrics are independent, so query them concurrently and return whatever
+        # finished within the budget
+        usage_per_metric, incomplete_metrics = run_with_time_budget(
+            lambda metric: metric.get_daily_total_usage(
+                start_date=q_start, end_date=q_end, customer=None, top_n=top_n
+            ),
+            metrics,
+            max_workers=DASHBOARD_QUERY_WORKERS,
+            time_budget=DASHBOARD_QUERY_TIME_BUDGET,
+            statement_timeout=DASHBOARD_QUERY_TIME_BUDGET,
         )
         for metric in metrics:
+            if metric not in usage_per_metric:
+                continue
+            per_customer_usage = usage_per_metric[metric]
             metric_dict = {}
-            per_customer_usage = metric.get_daily_total_usage(
-                start_date=q_start, end_date=q_end, customer=None, top_n=top_n
-            )
             for customer, customer_dict in per_customer_usage.items():
                 for date, usage in customer_dict.items():
                     if date not in metric_dict:
@@ -261,13 +292,14 @@ class PeriodMetricUsageView(APIView):
                 )
             }
         serializer = PeriodMetricUsageResponseSerializer(
-            data={"metrics": final_results}
+            {
+                "metrics": final_results,
+                "incomplete_metrics": [
+                    metric.metric_id for metric in incomplete_metrics
+                ],
+            }
         )
-        serializer.is_valid(raise_exception=True)
-        ret = serializer.validated_data
-        ret = make_all_decimals_floats(ret)
-        ret = make_all_dates_times_strings(ret)
-        return Response(ret, status=status.HTTP_200_OK)
+        return Response(serializer.data, status=status.HTTP_200_OK)
 
 
 class SettingsView(APIView):
@@ -672,18 +704,21 @@ class NetsuiteInvoiceCSVView(APIView):
     permission_classes = [IsAuthenticated | ValidOrganization]
 
     @extend_schema(
-        request=OptionalPeriodRequestSerializer,
+        request=InvoiceCSVRequestSerializer,
         responses=URLResponseSerializer,
     )
     def get(self, request, format=None):
         organization = request.organization
-        serializer = OptionalPeriodRequestSerializer(
+        serializer = InvoiceCSVRequestSerializer(
             data=request.query_params, context={"organization": organization}
         )
         serializer.is_valid(raise_exception=True)
         start_date = serializer.validated_data.get("start_date")
         end_date = serializer.validated_data.get("end_date")
-        ret = get_invoices_csv_presigned_url(organization, start_date, end_date)
+        incremental = serializer.validated_data.get("incremental")
+        ret = get_invoices_csv_presigned_url(
+            organization, start_date, end_date, incremental=incremental
+        )
         return Response(
             URLResponseSerializer(ret).data,
             status=status.HTTP_200_OK,
@@ -1,12 +1,13 @@
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 
+import sentry_sdk
 from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
 from django.utils.text import slugify
-from metering_billing.utils import (
-    make_all_dates_times_strings,
-    make_all_decimals_floats,
-    now_utc,
-)
+from metering_billing.utils import make_all_json_serializable, now_utc
 from metering_billing.utils.enums import WEBHOOK_TRIGGER_EVENTS
 from svix.api import MessageIn
 
@@ -14,228 +15,310 @@ logger = logging.getLogger("django.server")
 
 
 SVIX_CONNECTOR = settings.SVIX_CONNECTOR
+WEBHOOK_OUTBOX_ENABLED = settings.WEBHOOK_OUTBOX_ENABLED
+WEBHOOK_DISPATCH_BATCH_SIZE = settings.WEBHOOK_DISPATCH_BATCH_SIZE
+WEBHOOK_DISPATCH_CONCURRENCY = settings.WEBHOOK_DISPATCH_CONCURRENCY
 
+WEBHOOK_TRIGGERS_CACHE_TIMEOUT = 5 * 60
+# bursts of webhooks within this many seconds are sent by the same dispatch
+WEBHOOK_DISPATCH_DELAY = 2
+WEBHOOK_MAX_ATTEMPTS = 8
+WEBHOOK_RETRY_BASE_DELAY = timedelta(seconds=30)
+WEBHOOK_RETRY_MAX_DELAY = timedelta(hours=1)
+WEBHOOK_OUTBOX_RETENTION = timedelta(days=7)
 
-def customer_created_webhook(customer, customer_data=None):
-    from api.serializers.model_serializers import CustomerSerializer
-    from metering_billing.models import WebhookEndpoint
 
-    if SVIX_CONNECTOR is not None:
-        endpoints = (
-            WebhookEndpoint.objects.prefetch_related("triggers")
-            .filter(triggers__trigger_name=WEBHOOK_TRIGGER_EVENTS.CUSTOMER_CREATED)
+def _webhook_triggers_key(organization_pk) -> str:
+    return f"webhook_triggers:{organization_pk}"
+
+
+def get_webhook_triggers(organization) -> set:
+    """
+    Returns the trigger names any of the organization's webhook endpoints listen to.
+    """
+    from metering_billing.models import WebhookTrigger
+
+    key = _webhook_triggers_key(organization.pk)
+    triggers = cache.get(key)
+    if triggers is None:
+        triggers = list(
+            WebhookTrigger.objects.filter(webhook_endpoint__organization=organization)
+            .values_list("trigger_name", flat=True)
             .distinct()
         )
-        if endpoints.count() > 0:
-            svix = SVIX_CONNECTOR
-            now = str(now_utc())
-            payload = (
-                customer_data if customer_data else CustomerSerializer(customer).data
-            )
-            payload = make_all_decimals_floats(payload)
-            payload = make_all_dates_times_strings(payload)
-            response = {
-                "event_type": WEBHOOK_TRIGGER_EVENTS.CUSTOMER_CREATED,
-                "payload": payload,
-            }
-            event_id = (
-                slugify(str(customer.customer_id))
-                + "_"
-                + slugify(str(customer.customer_name))
-                + "_"
-                + "created"
+        cache.set(key, triggers, WEBHOOK_TRIGGERS_CACHE_TIMEOUT)
+    return set(triggers)
+
+
+def invalidate_webhook_triggers(organization) -> None:
+    cache.delete(_webhook_triggers_key(organization.pk))
+
+
+def _has_webhook_trigger(organization, event_type) -> bool:
+    return SVIX_CONNECTOR is not None and event_type in get_webhook_triggers(
+        organization
+    )
+
+
+def schedule_webhook_dispatch():
+    from metering_billing.tasks import dispatch_webhooks
+
+    # a pending dispatch picks up everything enqueued before it runs
+    if cache.add("webhook_dispatch_scheduled", True, timeout=WEBHOOK_DISPATCH_DELAY):
+        try:
+            dispatch_webhooks.apply_async(countdown=WEBHOOK_DISPATCH_DELAY)
+        except Exception as e:
+            sentry_sdk.capture_exception(e)
+
+
+def _send_webhook(organization, event_type, event_id, properties):
+    """
+    Sends the webhook message. With the outbox enabled, the message is instead written to the outbox in the caller's transaction and sent by dispatch_webhooks once it commits. An unsent message for the same event is replaced by the newer one, unless it's being sent right now, in which case the newer one is queued after it.
+    """
+    from metering_billing.models import WebhookOutboxMessage
+
+    now = now_utc()
+    payload = {
+        "attempt": 5,
+        "created_at": str(now),
+        "properties": properties,
+    }
+    if WEBHOOK_OUTBOX_ENABLED:
+        with transaction.atomic():
+            # the dispatcher holds the lock of the messages it's sending
+            message = (
+                WebhookOutboxMessage.objects.select_for_update(skip_locked=True)
+                .filter(
+                    organization=organization,
+                    event_type=event_type,
+                    event_id=event_id,
+                    sent_at__isnull=True,
+                )
+                .first()
             )
-            try:
-                response = svix.message.create(
-                    customer.organization.organization_id.hex,
-                    MessageIn(
-                        event_type=WEBHOOK_TRIGGER_EVENTS.CUSTOMER_CREATED,
-                        event_id=event_id,
-                        payload={
-                            "attempt": 5,
-                            "created_at": now,
-                            "properties": response,
-                        },
-                    ),
+            if message is None:
+                message = WebhookOutboxMessage(
+                    organization=organization, event_type=event_type, event_id=event_id
                 )
-            except Exception as e:
-                logger.error(e)
+            message.payload = payload
+            message.attempts = 0
+            message.next_attempt_at = now
+            message.last_error = None
+            message.save()
+        transaction.on_commit(schedule_webhook_dispatch)
+        return
+    try:
+        SVIX_CONNECTOR.message.create(
+            organization.organization_id.hex,
+            MessageIn(event_type=event_type, event_id=event_id, payload=payload),
+        )
+    except Exception as e:
+        logger.error(e)
+
+
+def _dispatch_message(svix, message):
+    try:
+        svix.message.create(
+            message.organization.organization_id.hex,
+            MessageIn(
+                event_type=message.event_type,
+                event_id=message.event_id,
+                payload=message.payload,
+            ),
+        )
+    except Exception as e:
+        return e
+    return None
+
+
+def _superseded(message) -> bool:
+    from metering_billing.models import WebhookOutboxMessage
+
+    return WebhookOutboxMessage.objects.filter(
+        organization_id=message.organization_id,
+        event_type=message.event_type,
+        event_id=message.event_id,
+        pk__gt=message.pk,
+    ).exists()
+
+
+def dispatch_webhooks_inner(svix=None) -> int:
+    """
+    Sends the due outbox messages in batches of WEBHOOK_DISPATCH_BATCH_SIZE, at most WEBHOOK_DISPATCH_CONCURRENCY at a time. A batch stays locked while it's being sent, so other dispatchers skip it and newer messages for the same events are queued instead of replacing it. Failed messages are retried with exponential backoff until WEBHOOK_MAX_ATTEMPTS, unless a newer message for the same event was queued meanwhile. Returns the number of messages sent.
+    """
+    from metering_billing.models import WebhookOutboxMessage
+
+    if svix is None:
+        svix = SVIX_CONNECTOR
+    if svix is None:
+        return 0
+    sent = 0
+    with ThreadPoolExecutor(max_workers=WEBHOOK_DISPATCH_CONCURRENCY) as executor:
+        while True:
+            now = now_utc()
+            with transaction.atomic():
+                messages = list(
+                    WebhookOutboxMessage.objects.select_for_update(
+                        skip_locked=True, of=("self",)
+                    )
+                    .filter(sent_at__isnull=True, next_attempt_at__lte=now)
+                    .select_related("organization")
+                    .order_by("next_attempt_at")[:WEBHOOK_DISPATCH_BATCH_SIZE]
+                )
+                if len(messages) == 0:
+                    break
+                errors = list(
+                    executor.map(lambda x: _dispatch_message(svix, x), messages)
+                )
+                for message, error in zip(messages, errors):
+                    message.attempts += 1
+                    if error is None:
+                        message.sent_at = now_utc()
+                        message.last_error = None
+                        sent += 1
+                        continue
+                    logger.error(
+                        "Error sending webhook {}: {}".format(message.event_id, error)
+                    )
+                    message.last_error = str(error)
+                    if message.attempts >= WEBHOOK_MAX_ATTEMPTS or _superseded(message):
+                        # give up
+                        message.next_attempt_at = None
+                    else:
+                        message.next_attempt_at = now_utc() + min(
+                            WEBHOOK_RETRY_BASE_DELAY * 2 ** (message.attempts - 1),
+                            WEBHOOK_RETRY_MAX_DELAY,
+                        )
+                WebhookOutboxMessage.objects.bulk_update(
+                    messages, ["attempts", "sent_at", "last_error", "next_attempt_at"]
+                )
+    WebhookOutboxMessage.objects.filter(
+        sent_at__lt=now_utc() - WEBHOOK_OUTBOX_RETENTION
+    ).delete()
+    return sent
+
+
+def customer_created_webhook(customer, customer_data=None):
+    from api.serializers.model_serializers import CustomerSerializer
+
+    organization = customer.organization
+    if not _has_webhook_trigger(organization, WEBHOOK_TRIGGER_EVENTS.CUSTOMER_CREATED):
+        return
+    payload = customer_data if customer_data else CustomerSerializer(customer).data
+    payload = make_all_json_serializable(payload)
+    response = {
+        "event_type": WEBHOOK_TRIGGER_EVENTS.CUSTOMER_CREATED,
+        "payload": payload,
+    }
+    event_id = (
+        slugify(str(customer.customer_id))
+        + "_"
+        + slugify(str(customer.customer_name))
+        + "_"
+        + "created"
+    )
+    _send_webhook(
+        organization, WEBHOOK_TRIGGER_EVENTS.CUSTOMER_CREATED, event_id, response
+    )
 
 
 def invoice_created_webhook(invoice, organization):
     from api.serializers.model_serializers import InvoiceSerializer
-    from metering_billing.models import WebhookEndpoint
 
-    if SVIX_CONNECTOR is not None:
-        endpoints = (
-            WebhookEndpoint.objects.filter(organization=organization)
-            .prefetch_related("triggers")
-            .filter(triggers__trigger_name=WEBHOOK_TRIGGER_EVENTS.INVOICE_CREATED)
-            .distinct()
-        )
-        if endpoints.count() > 0:
-            svix = SVIX_CONNECTOR
-            now = str(now_utc())
-            invoice_data = InvoiceSerializer(invoice).data
-            invoice_data = make_all_decimals_floats(invoice_data)
-            invoice_data = make_all_dates_times_strings(invoice_data)
-            response = {
-                "event_type": WEBHOOK_TRIGGER_EVENTS.INVOICE_CREATED,
-                "payload": invoice_data,
-            }
-            try:
-                svix.message.create(
-                    organization.organization_id.hex,
-                    MessageIn(
-                        event_type=WEBHOOK_TRIGGER_EVENTS.INVOICE_CREATED,
-                        event_id=str(organization.organization_id.hex)
-                        + "_"
-                        + str(invoice_data["invoice_number"])
-                        + "_"
-                        + "created",
-                        payload={
-                            "attempt": 5,
-                            "created_at": now,
-                            "properties": response,
-                        },
-                    ),
-                )
-            except Exception as e:
-                logger.error(e)
+    if not _has_webhook_trigger(organization, WEBHOOK_TRIGGER_EVENTS.INVOICE_CREATED):
+        return
+    invoice_data = InvoiceSerializer(invoice).data
+    invoice_data = make_all_json_serializable(invoice_data)
+    response = {
+        "event_type": WEBHOOK_TRIGGER_EVENTS.INVOICE_CREATED,
+        "payload": invoice_data,
+    }
+    event_id = (
+        str(organization.organization_id.hex)
+        + "_"
+        + str(invoice_data["invoice_number"])
+        + "_"
+        + "created"
+    )
+    _send_webhook(
+        organization, WEBHOOK_TRIGGER_EVENTS.INVOICE_CREATED, event_id, response
+    )
 
 
 def invoice_paid_webhook(invoice, organization):
     from api.serializers.model_serializers import InvoiceSerializer
-    from metering_billing.models import WebhookEndpoint
 
-    if SVIX_CONNECTOR is not None:
-        endpoints = (
-            WebhookEndpoint.objects.filter(organization=organization)
-            .prefetch_related("triggers")
-            .filter(triggers__trigger_name=WEBHOOK_TRIGGER_EVENTS.INVOICE_PAID)
-            .distinct()
-        )
-        if endpoints.count() > 0:
-            svix = SVIX_CONNECTOR
-            now = str(now_utc())
-            invoice_data = InvoiceSerializer(invoice).data
-            invoice_data = make_all_decimals_floats(invoice_data)
-            invoice_data = make_all_dates_times_strings(invoice_data)
-            response = {
-                "event_type": WEBHOOK_TRIGGER_EVENTS.INVOICE_PAID,
-                "payload": invoice_data,
-            }
-            try:
-                svix.message.create(
-                    organization.organization_id.hex,
-                    MessageIn(
-                        event_type=WEBHOOK_TRIGGER_EVENTS.INVOICE_PAID,
-                        event_id=str(organization.organization_id.hex)
-                        + "_"
-                        + str(invoice_data["invoice_number"])
-                        + "_"
-                        + "paid",
-                        payload={
-                            "attempt": 5,
-                            "created_at": now,
-                            "properties": response,
-                        },
-                    ),
-                )
-            except Exception as e:
-                logger.error(e)
+    if not _has_webhook_trigger(organization, WEBHOOK_TRIGGER_EVENTS.INVOICE_PAID):
+        return
+    invoice_data = InvoiceSerializer(invoice).data
+    invoice_data = make_all_json_serializable(invoice_data)
+    response = {
+        "event_type": WEBHOOK_TRIGGER_EVENTS.INVOICE_PAID,
+        "payload": invoice_data,
+    }
+    event_id = (
+        str(organization.organization_id.hex)
+        + "_"
+        + str(invoice_data["invoice_number"])
+        + "_"
+        + "paid"
+    )
+    _send_webhook(organization, WEBHOOK_TRIGGER_EVENTS.INVOICE_PAID, event_id, response)
 
 
 def invoice_past_due_webhook(invoice, organization):
     from api.serializers.model_serializers import InvoiceSerializer
-    from metering_billing.models import WebhookEndpoint
 
-    if SVIX_CONNECTOR is not None:
-        endpoints = (
-            WebhookEndpoint.objects.filter(organization=organization)
-            .prefetch_related("triggers")
-            .filter(triggers__trigger_name=WEBHOOK_TRIGGER_EVENTS.INVOICE_PAST_DUE)
-            .distinct()
-        )
-        if endpoints.count() > 0:
-            svix = SVIX_CONNECTOR
-            now = str(now_utc())
-            invoice_data = InvoiceSerializer(invoice).data
-            invoice_data = make_all_decimals_floats(invoice_data)
-            invoice_data = make_all_dates_times_strings(invoice_data)
-            response = {
-                "event_type": WEBHOOK_TRIGGER_EVENTS.INVOICE_PAST_DUE,
-                "payload": invoice_data,
-            }
-            try:
-                svix.message.create(
-                    organization.organization_id.hex,
-                    MessageIn(
-                        event_type=WEBHOOK_TRIGGER_EVENTS.INVOICE_PAST_DUE,
-                        event_id=str(organization.organization_id.hex)
-                        + "_"
-                        + str(invoice_data["invoice_number"])
-                        + "_"
-                        + "paid",
-                        payload={
-                            "attempt": 5,
-                            "created_at": now,
-                            "properties": response,
-                        },
-                    ),
-                )
-            except Exception as e:
-                logger.error(e)
+    if not _has_webhook_trigger(organization, WEBHOOK_TRIGGER_EVENTS.INVOICE_PAST_DUE):
+        return
+    invoice_data = InvoiceSerializer(invoice).data
+    invoice_data = make_all_json_serializable(invoice_data)
+    response = {
+        "event_type": WEBHOOK_TRIGGER_EVENTS.INVOICE_PAST_DUE,
+        "payload": invoice_data,
+    }
+    event_id = (
+        str(organization.organization_id.hex)
+        + "_"
+        + str(invoice_data["invoice_number"])
+        + "_"
+        + "past_due"
+    )
+    _send_webhook(
+        organization, WEBHOOK_TRIGGER_EVENTS.INVOICE_PAST_DUE, event_id, response
+    )
 
 
 def subscription_created_webhook(subscription, subscription_data=None):
     from api.serializers.model_serializers import SubscriptionRecordSerializer
-    from metering_billing.models import WebhookEndpoint
 
-    if SVIX_CONNECTOR is not None:
-        endpoints = (
-            WebhookEndpoint.objects.prefetch_related("triggers")
-            .filter(triggers__trigger_name=WEBHOOK_TRIGGER_EVENTS.SUBSCRIPTION_CREATED)
-            .distinct()
-        )
-        if endpoints.count() > 0:
-            svix = SVIX_CONNECTOR
-            now = str(now_utc())
-            payload = (
-                subscription_data
-                if subscription_data
-                else SubscriptionRecordSerializer(subscription).data
-            )
-            payload = make_all_decimals_floats(payload)
-            payload = make_all_dates_times_strings(payload)
-            response = {
-                "event_type": WEBHOOK_TRIGGER_EVENTS.SUBSCRIPTION_CREATED,
-                "payload": payload,
-            }
-            event_id = (
-                slugify(str(subscription.customer))
-                + "_"
-                + slugify(str(subscription.billing_plan))
-                + "_"
-                + slugify(str(subscription.subscription_record_id.hex)[:50])
-                + "_"
-                + "created"
-            )
-            try:
-                svix.message.create(
-                    subscription.organization.organization_id.hex,
-                    MessageIn(
-                        event_type=WEBHOOK_TRIGGER_EVENTS.SUBSCRIPTION_CREATED,
-                        event_id=event_id,
-                        payload={
-                            "attempt": 5,
-                            "created_at": now,
-                            "properties": response,
-                        },
-                    ),
-                )
-            except Exception as e:
-                logger.error(e)
+    organization = subscription.organization
+    if not _has_webhook_trigger(
+        organization, WEBHOOK_TRIGGER_EVENTS.SUBSCRIPTION_CREATED
+    ):
+        return
+    payload = (
+        subscription_data
+        if subscription_data
+        else SubscriptionRecordSerializer(subscription).data
+    )
+    payload = make_all_json_serializable(payload)
+    response = {
+        "event_type": WEBHOOK_TRIGGER_EVENTS.SUBSCRIPTION_CREATED,
+        "payload": payload,
+    }
+    event_id = (
+        slugify(str(subscription.customer))
+        + "_"
+        + slugify(str(subscription.billing_plan))
+        + "_"
+        + slugify(str(subscription.subscription_record_id.hex)[:50])
+        + "_"
+        + "created"
+    )
+    _send_webhook(
+        organization, WEBHOOK_TRIGGER_EVENTS.SUBSCRIPTION_CREATED, event_id, response
+    )
 
 
 def usage_alert_webhook(usage_alert, alert_result, subscription_record, organization):
@@ -244,158 +327,101 @@ def usage_alert_webhook(usage_alert, alert_result, subscription_record, organiza
         UsageAlertSerializer,
     )
     from api.serializers.webhook_serializers import UsageAlertPayload
-    from metering_billing.models import WebhookEndpoint
 
-    if SVIX_CONNECTOR is not None:
-        endpoints = (
-            WebhookEndpoint.objects.filter(organization=organization)
-            .prefetch_related("triggers")
-            .filter(triggers__trigger_name=WEBHOOK_TRIGGER_EVENTS.USAGE_ALERT_TRIGGERED)
-            .distinct()
-        )
-        if endpoints.count() > 0:
-            svix = SVIX_CONNECTOR
-            now = str(now_utc())
-            alert_data = {
-                "subscription": LightweightSubscriptionRecordSerializer(
-                    subscription_record
-                ).data,
-                "usage_alert": UsageAlertSerializer(usage_alert).data,
-                "usage": alert_result.usage,
-                "time_triggered": alert_result.last_run_timestamp,
-            }
-            response = {
-                "event_type": WEBHOOK_TRIGGER_EVENTS.USAGE_ALERT_TRIGGERED,
-                "payload": UsageAlertPayload(alert_data).data,
-            }
-            event_id = (
-                str(organization.organization_id.hex)[:50]
-                + "_"
-                + str(usage_alert.usage_alert_id.hex)[:50]
-                + "_"
-                + str(subscription_record.subscription_record_id.hex)[:50]
-                + "_"
-                + str(alert_result.last_run_timestamp.timestamp())
-                + "_"
-                + "triggered"
-            )
-            try:
-                svix.message.create(
-                    organization.organization_id.hex,
-                    MessageIn(
-                        event_type=WEBHOOK_TRIGGER_EVENTS.USAGE_ALERT_TRIGGERED,
-                        event_id=event_id,
-                        payload={
-                            "attempt": 5,
-                            "created_at": now,
-                            "properties": response,
-                        },
-                    ),
-                )
-            except Exception as e:
-                logger.error(e)
+    if not _has_webhook_trigger(
+        organization, WEBHOOK_TRIGGER_EVENTS.USAGE_ALERT_TRIGGERED
+    ):
+        return
+    alert_data = {
+        "subscription": LightweightSubscriptionRecordSerializer(
+            subscription_record
+        ).data,
+        "usage_alert": UsageAlertSerializer(usage_alert).data,
+        "usage": alert_result.last_run_value,
+        "time_triggered": alert_result.last_run_timestamp,
+    }
+    response = {
+        "event_type": WEBHOOK_TRIGGER_EVENTS.USAGE_ALERT_TRIGGERED,
+        "payload": UsageAlertPayload(alert_data).data,
+    }
+    event_id = (
+        str(organization.organization_id.hex)[:50]
+        + "_"
+        + str(usage_alert.usage_alert_id.hex)[:50]
+        + "_"
+        + str(subscription_record.subscription_record_id.hex)[:50]
+        + "_"
+        + str(alert_result.last_run_timestamp.timestamp())
+        + "_"
+        + "triggered"
+    )
+    _send_webhook(
+        organization, WEBHOOK_TRIGGER_EVENTS.USAGE_ALERT_TRIGGERED, event_id, response
+    )
 
 
 def subscription_cancelled_webhook(subscription, subscription_data=None):
     from api.serializers.model_serializers import SubscriptionRecordSerializer
-    from metering_billing.models import WebhookEndpoint
-
-    if SVIX_CONNECTOR is not None:
-        endpoints = (
-            WebhookEndpoint.objects.prefetch_related("triggers")
-            .filter(
-                triggers__trigger_name=WEBHOOK_TRIGGER_EVENTS.SUBSCRIPTION_CANCELLED
-            )
-            .distinct()
-        )
 
-        if endpoints.count() > 0:
-            svix = SVIX_CONNECTOR
-            now = str(now_utc())
-            payload = (
-                subscription_data
-                if subscription_data
-                else SubscriptionRecordSerializer(subscription).data
-            )
-            payload = make_all_decimals_floats(payload)
-            payload = make_all_dates_times_strings(payload)
-            response = {
-                "event_type": WEBHOOK_TRIGGER_EVENTS.SUBSCRIPTION_CANCELLED,
-                "payload": payload,
-            }
-            event_id = (
-                slugify(str(subscription.customer))
-                + "_"
-                + slugify(str(subscription.billing_plan))
-                + "_"
-                + slugify(str(subscription.subscription_record_id.hex)[:50])
-                + "_"
-                + "cancelled"
-            )
-            try:
-                response = svix.message.create(
-                    subscription.organization.organization_id.hex,
-                    MessageIn(
-                        event_type=WEBHOOK_TRIGGER_EVENTS.SUBSCRIPTION_CANCELLED,
-                        event_id=event_id,
-                        payload={
-                            "attempt": 5,
-                            "created_at": now,
-                            "properties": response,
-                        },
-                    ),
-                )
-            except Exception as e:
-                logger.error(e)
+    organization = subscription.organization
+    if not _has_webhook_trigger(
+        organization, WEBHOOK_TRIGGER_EVENTS.SUBSCRIPTION_CANCELLED
+    ):
+        return
+    payload = (
+        subscription_data
+        if subscription_data
+        else SubscriptionRecordSerializer(subscription).data
+    )
+    payload = make_all_json_serializable(payload)
+    response = {
+        "event_type": WEBHOOK_TRIGGER_EVENTS.SUBSCRIPTION_CANCELLED,
+        "payload": payload,
+    }
+    event_id = (
+        slugify(str(subscription.customer))
+        + "_"
+        + slugify(str(subscription.billing_plan))
+        + "_"
+        + slugify(str(subscription.subscription_record_id.hex)[:50])
+        + "_"
+        + "cancelled"
+    )
+    _send_webhook(
+        organization,
+        WEBHOOK_TRIGGER_EVENTS.SUBSCRIPTION_CANCELLED,
+        event_id,
+        response,
+    )
 
 
 def subscription_renewed_webhook(subscription, subscription_data=None):
     from api.serializers.model_serializers import SubscriptionRecordSerializer
-    from metering_billing.models import WebhookEndpoint
-
-    if SVIX_CONNECTOR is not None:
-        endpoints = (
-            WebhookEndpoint.objects.prefetch_related("triggers")
-            .filter(triggers__trigger_name=WEBHOOK_TRIGGER_EVENTS.SUBSCRIPTION_RENEWED)
-            .distinct()
-        )
-        if endpoints.count() > 0:
-            svix = SVIX_CONNECTOR
-            now = str(now_utc())
-            payload = (
-                subscription_data
-                if subscription_data
-                else SubscriptionRecordSerializer(subscription).data
-            )
-            payload = make_all_decimals_floats(payload)
-            payload = make_all_dates_times_strings(payload)
-            response = {
-                "event_type": WEBHOOK_TRIGGER_EVENTS.SUBSCRIPTION_RENEWED,
-                "payload": payload,
-            }
-            event_id = (
-                slugify(str(subscription.customer))
-                + "_"
-                + slugify(str(subscription.billing_plan))
-                + "_"
-                + slugify(str(subscription.subscription_record_id.hex)[:50])
-                + "_"
-                + "created"
-            )
 
-            try:
-                response = svix.message.create(
-                    subscription.organization.organization_id.hex,
-                    MessageIn(
-                        event_type=WEBHOOK_TRIGGER_EVENTS.SUBSCRIPTION_RENEWED,
-                        event_id=event_id,
-                        payload={
-                            "attempt": 5,
-                            "created_at": now,
-                            "properties": response,
-                        },
-                    ),
-                )
-            except Exception as e:
-                logger.error(e)
-                logger.error(e)
+    organization = subscription.organization
+    if not _has_webhook_trigger(
+        organization, WEBHOOK_TRIGGER_EVENTS.SUBSCRIPTION_RENEWED
+    ):
+        return
+    payload = (
+        subscription_data
+        if subscription_data
+        else SubscriptionRecordSerializer(subscription).data
+    )
+    payload = make_all_json_serializable(payload)
+    response = {
+        "event_type": WEBHOOK_TRIGGER_EVENTS.SUBSCRIPTION_RENEWED,
+        "payload": payload,
+    }
+    event_id = (
+        slugify(str(subscription.customer))
+        + "_"
+        + slugify(str(subscription.billing_plan))
+        + "_"
+        + slugify(str(subscription.subscription_record_id.hex)[:50])
+        + "_"
+        + "created"
+    )
+    _send_webhook(
+        organization, WEBHOOK_TRIGGER_EVENTS.SUBSCRIPTION_RENEWED, event_id, response
+    )
@@ -28,9 +28,44 @@ type StreamEvents struct {
 }
 
 type insertBatch struct {
+	db              *sql.DB
 	tx              *sql.Tx
 	insertStatement *sql.Stmt
 	count           int
+	catalogEvents   []catalogEvent
+}
+
+// catalogEvent is the part of an event the event catalog is built from
+type catalogEvent struct {
+	OrganizationID int64           `json:"organization_id"`
+	EventName      string          `json:"event_name"`
+	TimeCreated    time.Time       `json:"time_created"`
+	Properties     json.RawMessage `json:"properties"`
+}
+
+// commit commits the transaction and then merges the batch into the event catalog
+func (b *insertBatch) commit() error {
+	if err := b.tx.Commit(); err != nil {
+		return err
+	}
+	b.updateEventCatalog()
+	return nil
+}
+
+// updateEventCatalog is best effort: the catalog can be backfilled, so it never holds up ingestion
+func (b *insertBatch) updateEventCatalog() {
+	defer func() { b.catalogEvents = b.catalogEvents[:0] }()
+	if len(b.catalogEvents) == 0 {
+		return
+	}
+	catalogJSON, err := json.Marshal(b.catalogEvents)
+	if err != nil {
+		log.Printf("Error encoding event catalog batch: %s\n", err)
+		return
+	}
+	if _, err := b.db.Exec("SELECT update_event_catalog($1::jsonb)", string(catalogJSON)); err != nil {
+		log.Printf("Error updating event catalog: %s\n", err)
+	}
 }
 
 func (b *insertBatch) addRecord(event *types.VerifiedEvent) (bool, error) {
@@ -52,9 +87,16 @@ func (b *insertBatch) addRecord(event *types.VerifiedEvent) (bool, error) {
 		return false, err
 	}
 
+	b.catalogEvents = append(b.catalogEvents, catalogEvent{
+		OrganizationID: event.OrganizationID,
+		EventName:      event.EventName,
+		TimeCreated:    event.TimeCreated,
+		Properties:     propertiesJSON,
+	})
+
 	b.count++
 	if b.count >= batchSize {
-		if err := b.tx.Commit(); err != nil {
+		if err := b.commit(); err != nil {
 			return false, err
 		}
 		b.count = 0
@@ -203,6 +245,7 @@ func main() {
 		}
 
 		batch := &insertBatch{
+			db:              db,
 			tx:              tx,
 			insertStatement: insertStatement,
 			count:           0,
@@ -257,7 +300,7 @@ func main() {
 		})
 
 		if batch.count > 0 {
-			if err := tx.Commit(); err != nil {
+			if err := batch.commit(); err != nil {
 				// again, this should be a fatal error
 				log.Printf("Error inserting events into database: %s\n", err)
 				panic(err)